@@ -8,13 +8,13 @@ from loguru import logger
 import websockets
 from utils.xianyu_utils import (
     decrypt, generate_mid, generate_uuid, trans_cookies,
-    generate_device_id, generate_sign
+    generate_device_id
 )
 from config import (
-    WEBSOCKET_URL, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT,
+    WEBSOCKET_URL, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, HEARTBEAT_MAX_MISSED,
     TOKEN_REFRESH_INTERVAL, TOKEN_RETRY_INTERVAL, COOKIES_STR,
     LOG_CONFIG, AUTO_REPLY, DEFAULT_HEADERS, WEBSOCKET_HEADERS,
-    APP_CONFIG, API_ENDPOINTS
+    APP_CONFIG, API_ENDPOINTS, SYNC_CONFIG
 )
 import sys
 import aiohttp
@@ -23,6 +23,29 @@ from collections import defaultdict
 # 导入增强的WebSocket工具和Token管理器
 from utils.ws_utils import WebSocketClient, ConnectionState
 from utils.token_manager import XianyuTokenManager
+from utils.item_detail_cache import create_item_detail_cache
+from utils.mtop_client import MtopClient, classify_mtop_response, RET_SUCCESS, RET_THROTTLED, RET_CAPTCHA, RET_AUTH
+from utils.metrics import (MESSAGE_STAGE_SECONDS, MESSAGE_HANDLE_SECONDS, MESSAGES_INFLIGHT, REPLIES_TOTAL,
+                           WS_RECONNECTS_TOTAL, TOKEN_REFRESHES_TOTAL, WS_HEARTBEAT_RTT_SECONDS,
+                           WS_HEARTBEAT_MISSED_TOTAL, WS_DEAD_DETECT_SECONDS, SYNC_BACKFILL_MESSAGES_TOTAL,
+                           SYNC_DUPLICATES_TOTAL)
+from utils.message_parser import (ParsedMessage, parse_message, KIND_SYSTEM, KIND_DELIVERY, KIND_CARD,
+                                  SYSTEM_MESSAGES, RED_REMINDER_STATES)
+from utils.sync_cursor import SyncCursor, SlidingWindowDedupe
+from utils.job_queue import JobDeferred, job_scheduler
+from utils.chat_state import chat_state_store
+from utils.ai_guard import ai_reply_guard, provider_key
+from utils.card_prefetch import card_prefetcher, parse_api_config, extract_card_content, request_api_card
+from utils.keyword_matcher import KeywordMatcher
+
+# 发货规则设置了延时时 _auto_delivery 返回的标记（后接延时秒数）
+DELAYED_DELIVERY_PREFIX = "__DELAYED_DELIVERY__"
+
+# 延时发货任务类型
+DELAYED_DELIVERY_JOB = 'delayed_delivery'
+
+# 回复来源对应的指标标签
+REPLY_SOURCE_LABELS = {'API': 'api', '关键词': 'keyword', 'AI': 'ai', '默认': 'default'}
 
 
 class AutoReplyPauseManager:
@@ -154,9 +177,9 @@ class XianyuLive:
     # 记录订单详情锁的使用时间
     _order_detail_lock_times = {}
 
-    # 商品详情缓存（24小时有效）
-    _item_detail_cache = {}  # {item_id: {'detail': str, 'timestamp': float}}
-    _item_detail_cache_lock = asyncio.Lock()
+    # 商品详情缓存（有界LRU，默认24小时有效，合并同一商品的并发获取）
+    _item_detail_cache = create_item_detail_cache()
+    _item_detail_cache_warmed = False
 
     # 类级别的实例管理字典，用于API调用
     _instances = {}  # {cookie_id: XianyuLive实例}
@@ -172,6 +195,25 @@ class XianyuLive:
             except:
                 return "未知错误"
 
+    @property
+    def cookies(self) -> dict:
+        """解析后的Cookie（与mtop客户端共享）"""
+        return self.mtop.jar
+
+    @cookies.setter
+    def cookies(self, value: dict):
+        self.mtop.jar.clear()
+        self.mtop.jar.update(value)
+
+    @property
+    def cookies_str(self) -> str:
+        """Cookie字符串（由CookieJar按需生成并缓存）"""
+        return self.mtop.cookies_str
+
+    @cookies_str.setter
+    def cookies_str(self, value: str):
+        self.mtop.jar.reset(value)
+
     def __init__(self, cookies_str=None, cookie_id: str = "default", user_id: int = None):
         """初始化闲鱼直播类"""
         logger.info(f"【{cookie_id}】开始初始化XianyuLive...")
@@ -182,11 +224,12 @@ class XianyuLive:
             raise ValueError("未提供cookies，请在global_config.yml中配置COOKIES_STR或通过参数传入")
 
         logger.info(f"【{cookie_id}】解析cookies...")
-        self.cookies = trans_cookies(cookies_str)
+        # mtop客户端持有解析后的Cookie，self.cookies/self.cookies_str 均读写其中的CookieJar
+        self.mtop = MtopClient(cookie_id, cookies_str, on_cookies_updated=self.update_config_cookies,
+                               headers=DEFAULT_HEADERS)
         logger.info(f"【{cookie_id}】cookies解析完成，包含字段: {list(self.cookies.keys())}")
 
         self.cookie_id = cookie_id  # 唯一账号标识
-        self.cookies_str = cookies_str  # 保存原始cookie字符串
         self.user_id = user_id  # 保存用户ID，用于token刷新时保持正确的所有者关系
         self.base_url = WEBSOCKET_URL
 
@@ -196,13 +239,31 @@ class XianyuLive:
         self.myid = self.cookies['unb']
         logger.info(f"【{cookie_id}】用户ID: {self.myid}")
         self.device_id = generate_device_id(self.myid)
+        self._warm_item_detail_cache()
 
         # 心跳相关配置
         self.heartbeat_interval = HEARTBEAT_INTERVAL
         self.heartbeat_timeout = HEARTBEAT_TIMEOUT
+        self.heartbeat_max_missed = HEARTBEAT_MAX_MISSED
         self.last_heartbeat_time = 0
         self.last_heartbeat_response = 0
         self.heartbeat_task = None
+        self.heartbeat_rtt = None  # 最近一次心跳往返时间（秒）
+        self._heartbeat_mid = None  # 等待响应的心跳mid
+        self._heartbeat_sent_at = 0.0  # 以下时间均为 time.monotonic()
+        self._heartbeat_acked_at = 0.0
+        self._heartbeat_ack = asyncio.Event()
+        self._connection_dead = False  # 心跳判定连接失效，主循环跳过重连等待
+
+        # 同步位置和已处理消息去重（断线重连后从上次的位置继续同步）
+        from db_manager import db_manager
+        self.sync_resume_enabled = SYNC_CONFIG.get('resume', True)
+        self.sync_cursor_flush_interval = SYNC_CONFIG.get('cursor_flush_interval', 1)
+        self.sync_cursor = SyncCursor(db_manager.get_sync_cursor(cookie_id) if self.sync_resume_enabled else 0,
+                                      SYNC_CONFIG.get('max_backfill_seconds', 3600),
+                                      SYNC_CONFIG.get('backfill_idle_timeout', 5))
+        self.message_dedupe = SlidingWindowDedupe(SYNC_CONFIG.get('dedupe_window', 5000))
+        self._sync_connected_pts = 0  # 本次连接注册时的pts，更早的消息为补收的断线期间消息
         self.ws = None
 
         # Token刷新相关配置
@@ -453,136 +514,7 @@ class XianyuLive:
 
     
 
-    def _is_auto_delivery_trigger(self, message: str) -> bool:
-        """检查消息是否为自动发货触发关键字"""
-        # 定义所有自动发货触发关键字
-        auto_delivery_keywords = [
-            # 系统消息
-            '[我已付款，等待你发货]',
-            '[已付款，待发货]',
-            '我已付款，等待你发货',
-            '[记得及时发货]',
-        ]
-
-        # 检查消息是否包含任何触发关键字
-        for keyword in auto_delivery_keywords:
-            if keyword in message:
-                return True
-
-        return False
-
-    def _extract_order_id(self, message: dict) -> str:
-        """从消息中提取订单ID"""
-        try:
-            order_id = None
-
-            # 先查看消息的完整结构
-            logger.debug(f"【{self.cookie_id}】🔍 完整消息结构: {message}")
-
-            # 检查message['1']的结构，处理可能是列表、字典或字符串的情况
-            message_1 = message.get('1', {})
-            content_json_str = ''
-
-            if isinstance(message_1, dict):
-                logger.debug(f"【{self.cookie_id}】🔍 message['1'] 是字典，keys: {list(message_1.keys())}")
-
-                # 检查message['1']['6']的结构
-                message_1_6 = message_1.get('6', {})
-                if isinstance(message_1_6, dict):
-                    logger.debug(f"【{self.cookie_id}】🔍 message['1']['6'] 是字典，keys: {list(message_1_6.keys())}")
-                    # 方法1: 从button的targetUrl中提取orderId
-                    content_json_str = message_1_6.get('3', {}).get('5', '') if isinstance(message_1_6.get('3', {}), dict) else ''
-                else:
-                    logger.debug(f"【{self.cookie_id}】🔍 message['1']['6'] 不是字典: {type(message_1_6)}")
-
-            elif isinstance(message_1, list):
-                logger.debug(f"【{self.cookie_id}】🔍 message['1'] 是列表，长度: {len(message_1)}")
-                # 如果message['1']是列表，跳过这种提取方式
-
-            elif isinstance(message_1, str):
-                logger.debug(f"【{self.cookie_id}】🔍 message['1'] 是字符串，长度: {len(message_1)}")
-                # 如果message['1']是字符串，跳过这种提取方式
-
-            else:
-                logger.debug(f"【{self.cookie_id}】🔍 message['1'] 未知类型: {type(message_1)}")
-                # 其他类型，跳过这种提取方式
-
-            if content_json_str:
-                try:
-                    content_data = json.loads(content_json_str)
-
-                    # 方法1a: 从button的targetUrl中提取orderId
-                    target_url = content_data.get('dxCard', {}).get('item', {}).get('main', {}).get('exContent', {}).get('button', {}).get('targetUrl', '')
-                    if target_url:
-                        # 从URL中提取orderId参数
-                        order_match = re.search(r'orderId=(\d+)', target_url)
-                        if order_match:
-                            order_id = order_match.group(1)
-                            logger.info(f'【{self.cookie_id}】✅ 从button提取到订单ID: {order_id}')
-
-                    # 方法1b: 从main的targetUrl中提取order_detail的id
-                    if not order_id:
-                        main_target_url = content_data.get('dxCard', {}).get('item', {}).get('main', {}).get('targetUrl', '')
-                        if main_target_url:
-                            order_match = re.search(r'order_detail\?id=(\d+)', main_target_url)
-                            if order_match:
-                                order_id = order_match.group(1)
-                                logger.info(f'【{self.cookie_id}】✅ 从main targetUrl提取到订单ID: {order_id}')
-
-                except Exception as parse_e:
-                    logger.debug(f"解析内容JSON失败: {parse_e}")
-
-            # 方法2: 从dynamicOperation中的order_detail URL提取orderId
-            if not order_id and content_json_str:
-                try:
-                    content_data = json.loads(content_json_str)
-                    dynamic_target_url = content_data.get('dynamicOperation', {}).get('changeContent', {}).get('dxCard', {}).get('item', {}).get('main', {}).get('exContent', {}).get('button', {}).get('targetUrl', '')
-                    if dynamic_target_url:
-                        # 从order_detail URL中提取id参数
-                        order_match = re.search(r'order_detail\?id=(\d+)', dynamic_target_url)
-                        if order_match:
-                            order_id = order_match.group(1)
-                            logger.info(f'【{self.cookie_id}】✅ 从order_detail提取到订单ID: {order_id}')
-                except Exception as parse_e:
-                    logger.debug(f"解析dynamicOperation JSON失败: {parse_e}")
-
-            # 方法3: 如果前面的方法都失败，尝试在整个消息中搜索订单ID模式
-            if not order_id:
-                try:
-                    # 将整个消息转换为字符串进行搜索
-                    message_str = str(message)
-
-                    # 搜索各种可能的订单ID模式
-                    patterns = [
-                        r'orderId[=:](\d{10,})',  # orderId=123456789 或 orderId:123456789
-                        r'order_detail\?id=(\d{10,})',  # order_detail?id=123456789
-                        r'"id"\s*:\s*"?(\d{10,})"?',  # "id":"123456789" 或 "id":123456789
-                        r'bizOrderId[=:](\d{10,})',  # bizOrderId=123456789
-                    ]
-
-                    for pattern in patterns:
-                        matches = re.findall(pattern, message_str)
-                        if matches:
-                            # 取第一个匹配的订单ID
-                            order_id = matches[0]
-                            logger.info(f'【{self.cookie_id}】✅ 从消息字符串中提取到订单ID: {order_id} (模式: {pattern})')
-                            break
-
-                except Exception as search_e:
-                    logger.debug(f"在消息字符串中搜索订单ID失败: {search_e}")
-
-            if order_id:
-                logger.info(f'【{self.cookie_id}】🎯 最终提取到订单ID: {order_id}')
-            else:
-                logger.debug(f'【{self.cookie_id}】❌ 未能从消息中提取到订单ID')
-
-            return order_id
-
-        except Exception as e:
-            logger.error(f"【{self.cookie_id}】提取订单ID失败: {self._safe_str(e)}")
-            return None
-
-    async def _handle_auto_delivery(self, websocket, message: dict, send_user_name: str, send_user_id: str,
+    async def _handle_auto_delivery(self, websocket, parsed: ParsedMessage, send_user_name: str, send_user_id: str,
                                    item_id: str, chat_id: str, msg_time: str):
         """统一处理自动发货逻辑"""
         try:
@@ -599,8 +531,7 @@ class XianyuLive:
                     logger.error(f'[{msg_time}] 【{self.cookie_id}】检查商品归属失败: {self._safe_str(e)}，跳过自动发货')
                     return
 
-            # 提取订单ID
-            order_id = self._extract_order_id(message)
+            order_id = parsed.order_id
 
             # 如果order_id不存在，直接返回
             if not order_id:
@@ -623,6 +554,11 @@ class XianyuLive:
                 logger.info(f'[{msg_time}] 【{self.cookie_id}】订单 {order_id} 在冷却期内，跳过发货')
                 return
 
+            # 已加入延时发货队列的订单等待到期执行
+            if job_scheduler.is_scheduled(self._delayed_delivery_key(order_id)):
+                logger.info(f'[{msg_time}] 【{self.cookie_id}】订单 {order_id} 已在延时发货队列中，跳过发货')
+                return
+
             # 获取或创建该订单的锁
             order_lock = self._order_locks[lock_key]
 
@@ -643,149 +579,236 @@ class XianyuLive:
                     logger.info(f'[{msg_time}] 【{self.cookie_id}】订单 {order_id} 在获取锁后检查发现仍在冷却期，跳过发货')
                     return
 
-                # 构造用户URL
-                user_url = f'https://www.goofish.com/personal?userId={send_user_id}'
+                await self._deliver_order(websocket, order_id, item_id, send_user_name, send_user_id, chat_id, msg_time)
 
-                # 自动发货逻辑
-                try:
-                    # 设置默认标题（将通过API获取真实商品信息）
-                    item_title = "待获取商品信息"
+                logger.info(f'[{msg_time}] 【{self.cookie_id}】订单锁释放: {lock_key}，自动发货处理完成')
+
+        except Exception as e:
+            logger.error(f"统一自动发货处理异常: {self._safe_str(e)}")
+
+    def _delayed_delivery_key(self, order_id: str) -> str:
+        return f"delivery:{self.cookie_id}:{order_id}"
+
+    def _schedule_delayed_delivery(self, order_id: str, item_id: str, send_user_name: str, send_user_id: str,
+                                   chat_id: str, delay_seconds: int):
+        """把延时发货写入定时任务队列（同一订单只排期一次）"""
+        payload = {
+            'order_id': order_id,
+            'item_id': item_id,
+            'send_user_name': send_user_name,
+            'send_user_id': send_user_id,
+            'chat_id': chat_id,
+        }
+        if job_scheduler.schedule(self.cookie_id, DELAYED_DELIVERY_JOB, self._delayed_delivery_key(order_id),
+                                  payload, delay_seconds):
+            logger.info(f"【{self.cookie_id}】订单 {order_id} 已加入延时发货队列，{delay_seconds} 秒后发货")
+        else:
+            logger.info(f"【{self.cookie_id}】订单 {order_id} 已在延时发货队列中")
 
-                    logger.info(f"【{self.cookie_id}】准备自动发货: item_id={item_id}, item_title={item_title}")
+    @staticmethod
+    async def _run_delayed_delivery(job: dict) -> bool:
+        """调度协程到期执行延时发货：确认发货并发送发货内容，账号未连接时稍后重试（不计入执行次数）
 
-                    # 检查是否需要多数量发货
-                    from db_manager import db_manager
-                    quantity_to_send = 1  # 默认发送1个
+        未获取到发货内容（卡券API失败等）且未开始发送时返回False，由调度器按退避重试
+        """
+        if job.get('sent_at'):
+            # 上次执行已开始发送，进程在删除任务前退出：不再重复发送
+            logger.warning(f"【{job['cookie_id']}】延时发货 {job['job_key']} 上次已发送，跳过")
+            return True
+        instance = XianyuLive.get_instance(job['cookie_id'])
+        if not instance or not instance.ws or getattr(instance.ws, 'closed', False):
+            raise JobDeferred('账号未连接')
+        payload = job['payload']
+        order_id = payload['order_id']
+        msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        instance._lock_usage_times[order_id] = time.time()
+        send_started = False
+
+        def before_send():
+            nonlocal send_started
+            send_started = True
+            job_scheduler.mark_sent(job)
+
+        async with instance._order_locks[order_id]:
+            logger.info(f'[{msg_time}] 【{instance.cookie_id}】延时发货到期，开始处理订单 {order_id}')
+            sent = await instance._deliver_order(instance.ws, order_id, payload['item_id'],
+                                                 payload['send_user_name'], payload['send_user_id'],
+                                                 payload['chat_id'], msg_time, allow_delay=False,
+                                                 before_send=before_send)
+        # 已开始发送时即使部分消息发送失败也不再重试，避免重复发出卡券
+        return sent or send_started
+
+    async def _deliver_order(self, websocket, order_id: str, item_id: str, send_user_name: str,
+                             send_user_id: str, chat_id: str, msg_time: str, allow_delay: bool = True,
+                             before_send=None) -> bool:
+        """获取发货内容并发送（调用方需持有订单锁）
+
+        发货规则设置了延时且 allow_delay 为True时，不在这里等待，而是加入延时发货队列，
+        到期后由调度协程以 allow_delay=False 再次调用；before_send 在获取到发货内容、开始发送前调用
+
+        Returns:
+            bool: 获取到发货内容且至少发出一条时返回True（加入延时发货队列时返回False）
+        """
+        lock_key = order_id
 
-                    # 检查商品是否开启了多数量发货
-                    multi_quantity_delivery = db_manager.get_item_multi_quantity_delivery_status(self.cookie_id, item_id)
+        # 构造用户URL
+        user_url = f'https://www.goofish.com/personal?userId={send_user_id}'
 
-                    if multi_quantity_delivery and order_id:
-                        logger.info(f"商品 {item_id} 开启了多数量发货，获取订单详情...")
+        # 自动发货逻辑
+        try:
+            # 设置默认标题（将通过API获取真实商品信息）
+            item_title = "待获取商品信息"
+
+            logger.info(f"【{self.cookie_id}】准备自动发货: item_id={item_id}, item_title={item_title}")
+
+            # 检查是否需要多数量发货
+            from db_manager import db_manager
+            quantity_to_send = 1  # 默认发送1个
+
+            # 检查商品是否开启了多数量发货
+            multi_quantity_delivery = db_manager.get_item_multi_quantity_delivery_status(self.cookie_id, item_id)
+
+            if multi_quantity_delivery and order_id:
+                logger.info(f"商品 {item_id} 开启了多数量发货，获取订单详情...")
+                try:
+                    # 使用现有方法获取订单详情
+                    order_detail = await self.fetch_order_detail_info(order_id, item_id, send_user_id)
+                    if order_detail and order_detail.get('quantity'):
                         try:
-                            # 使用现有方法获取订单详情
-                            order_detail = await self.fetch_order_detail_info(order_id, item_id, send_user_id)
-                            if order_detail and order_detail.get('quantity'):
-                                try:
-                                    order_quantity = int(order_detail['quantity'])
-                                    if order_quantity > 1:
-                                        quantity_to_send = order_quantity
-                                        logger.info(f"从订单详情获取数量: {order_quantity}，将发送 {quantity_to_send} 个卡券")
-                                    else:
-                                        logger.info(f"订单数量为 {order_quantity}，发送单个卡券")
-                                except (ValueError, TypeError):
-                                    logger.warning(f"订单数量格式无效: {order_detail.get('quantity')}，发送单个卡券")
+                            order_quantity = int(order_detail['quantity'])
+                            if order_quantity > 1:
+                                quantity_to_send = order_quantity
+                                logger.info(f"从订单详情获取数量: {order_quantity}，将发送 {quantity_to_send} 个卡券")
                             else:
-                                logger.info(f"未获取到订单数量信息，发送单个卡券")
-                        except Exception as e:
-                            logger.error(f"获取订单详情失败: {self._safe_str(e)}，发送单个卡券")
-                    elif not multi_quantity_delivery:
-                        logger.info(f"商品 {item_id} 未开启多数量发货，发送单个卡券")
+                                logger.info(f"订单数量为 {order_quantity}，发送单个卡券")
+                        except (ValueError, TypeError):
+                            logger.warning(f"订单数量格式无效: {order_detail.get('quantity')}，发送单个卡券")
                     else:
-                        logger.info(f"无订单ID，发送单个卡券")
+                        logger.info(f"未获取到订单数量信息，发送单个卡券")
+                except Exception as e:
+                    logger.error(f"获取订单详情失败: {self._safe_str(e)}，发送单个卡券")
+            elif not multi_quantity_delivery:
+                logger.info(f"商品 {item_id} 未开启多数量发货，发送单个卡券")
+            else:
+                logger.info(f"无订单ID，发送单个卡券")
 
-                    # 多次调用自动发货方法，每次获取不同的内容
-                    delivery_contents = []
-                    success_count = 0
+            # 多次调用自动发货方法，每次获取不同的内容
+            delivery_contents = []
+            success_count = 0
 
-                    for i in range(quantity_to_send):
-                        try:
-                            # 每次调用都可能获取不同的内容（API卡券、批量数据等）
-                            delivery_content = await self._auto_delivery(item_id, item_title, order_id, send_user_id)
-                            if delivery_content:
-                                delivery_contents.append(delivery_content)
-                                success_count += 1
-                                if quantity_to_send > 1:
-                                    logger.info(f"第 {i+1}/{quantity_to_send} 个卡券内容获取成功")
-                            else:
-                                logger.warning(f"第 {i+1}/{quantity_to_send} 个卡券内容获取失败")
-                        except Exception as e:
-                            logger.error(f"第 {i+1}/{quantity_to_send} 个卡券获取异常: {self._safe_str(e)}")
-
-                    if delivery_contents:
-                        # 标记已发货（防重复）- 基于订单ID
-                        self.mark_delivery_sent(order_id)
-
-                        # 标记锁为持有状态，并启动延迟释放任务
-                        self._lock_hold_info[lock_key] = {
-                            'locked': True,
-                            'lock_time': time.time(),
-                            'release_time': None,
-                            'task': None
-                        }
+            for i in range(quantity_to_send):
+                try:
+                    # 每次调用都可能获取不同的内容（API卡券、批量数据等）
+                    delivery_content = await self._auto_delivery(item_id, item_title, order_id, send_user_id,
+                                                                 allow_delay=allow_delay)
+                    if delivery_content and delivery_content.startswith(DELAYED_DELIVERY_PREFIX):
+                        delay_seconds = int(delivery_content[len(DELAYED_DELIVERY_PREFIX):])
+                        self._schedule_delayed_delivery(order_id, item_id, send_user_name, send_user_id, chat_id, delay_seconds)
+                        return False
+                    if delivery_content:
+                        delivery_contents.append(delivery_content)
+                        success_count += 1
+                        if quantity_to_send > 1:
+                            logger.info(f"第 {i+1}/{quantity_to_send} 个卡券内容获取成功")
+                    else:
+                        logger.warning(f"第 {i+1}/{quantity_to_send} 个卡券内容获取失败")
+                except Exception as e:
+                    logger.error(f"第 {i+1}/{quantity_to_send} 个卡券获取异常: {self._safe_str(e)}")
 
-                        # 启动延迟释放锁的异步任务（10分钟后释放）
-                        delay_task = asyncio.create_task(self._delayed_lock_release(lock_key, delay_minutes=10))
-                        self._lock_hold_info[lock_key]['task'] = delay_task
+            if delivery_contents:
+                if before_send is not None:
+                    before_send()
 
-                        # 发送所有获取到的发货内容
-                        for i, delivery_content in enumerate(delivery_contents):
-                            try:
-                                # 检查是否是图片发送标记
-                                if delivery_content.startswith("__IMAGE_SEND__"):
-                                    # 提取卡券ID和图片URL
-                                    image_data = delivery_content.replace("__IMAGE_SEND__", "")
-                                    if "|" in image_data:
-                                        card_id_str, image_url = image_data.split("|", 1)
-                                        try:
-                                            card_id = int(card_id_str)
-                                        except ValueError:
-                                            logger.error(f"无效的卡券ID: {card_id_str}")
-                                            card_id = None
-                                    else:
-                                        # 兼容旧格式（没有卡券ID）
-                                        card_id = None
-                                        image_url = image_data
-
-                                    # 发送图片消息
-                                    await self.send_image_msg(websocket, chat_id, send_user_id, image_url, card_id=card_id)
-                                    if len(delivery_contents) > 1:
-                                        logger.info(f'[{msg_time}] 【多数量自动发货图片】第 {i+1}/{len(delivery_contents)} 张已向 {user_url} 发送图片: {image_url}')
-                                    else:
-                                        logger.info(f'[{msg_time}] 【自动发货图片】已向 {user_url} 发送图片: {image_url}')
-
-                                    # 多数量发货时，消息间隔1秒
-                                    if len(delivery_contents) > 1 and i < len(delivery_contents) - 1:
-                                        await asyncio.sleep(1)
+                # 标记已发货（防重复）- 基于订单ID
+                self.mark_delivery_sent(order_id)
 
-                                else:
-                                    # 普通文本发货内容
-                                    await self.send_msg(websocket, chat_id, send_user_id, delivery_content)
-                                    if len(delivery_contents) > 1:
-                                        logger.info(f'[{msg_time}] 【多数量自动发货】第 {i+1}/{len(delivery_contents)} 条已向 {user_url} 发送发货内容')
-                                    else:
-                                        logger.info(f'[{msg_time}] 【自动发货】已向 {user_url} 发送发货内容')
+                # 标记锁为持有状态，并启动延迟释放任务
+                self._lock_hold_info[lock_key] = {
+                    'locked': True,
+                    'lock_time': time.time(),
+                    'release_time': None,
+                    'task': None
+                }
 
-                                    # 多数量发货时，消息间隔1秒
-                                    if len(delivery_contents) > 1 and i < len(delivery_contents) - 1:
-                                        await asyncio.sleep(1)
+                # 启动延迟释放锁的异步任务（10分钟后释放）
+                delay_task = asyncio.create_task(self._delayed_lock_release(lock_key, delay_minutes=10))
+                self._lock_hold_info[lock_key]['task'] = delay_task
 
-                            except Exception as e:
-                                logger.error(f"发送第 {i+1} 条消息失败: {self._safe_str(e)}")
+                # 发送所有获取到的发货内容
+                sent_count = 0
+                for i, delivery_content in enumerate(delivery_contents):
+                    try:
+                        # 检查是否是图片发送标记
+                        if delivery_content.startswith("__IMAGE_SEND__"):
+                            # 提取卡券ID和图片URL
+                            image_data = delivery_content.replace("__IMAGE_SEND__", "")
+                            if "|" in image_data:
+                                card_id_str, image_url = image_data.split("|", 1)
+                                try:
+                                    card_id = int(card_id_str)
+                                except ValueError:
+                                    logger.error(f"无效的卡券ID: {card_id_str}")
+                                    card_id = None
+                            else:
+                                # 兼容旧格式（没有卡券ID）
+                                card_id = None
+                                image_url = image_data
+
+                            # 发送图片消息
+                            await self.send_image_msg(websocket, chat_id, send_user_id, image_url, card_id=card_id)
+                            sent_count += 1
+                            if len(delivery_contents) > 1:
+                                logger.info(f'[{msg_time}] 【多数量自动发货图片】第 {i+1}/{len(delivery_contents)} 张已向 {user_url} 发送图片: {image_url}')
+                            else:
+                                logger.info(f'[{msg_time}] 【自动发货图片】已向 {user_url} 发送图片: {image_url}')
+
+                            # 多数量发货时，消息间隔1秒
+                            if len(delivery_contents) > 1 and i < len(delivery_contents) - 1:
+                                await asyncio.sleep(1)
 
-                        # 发送成功通知
-                        if len(delivery_contents) > 1:
-                            await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, f"多数量发货成功，共发送 {len(delivery_contents)} 个卡券", chat_id)
                         else:
-                            await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, "发货成功", chat_id)
-                    else:
-                        logger.warning(f'[{msg_time}] 【自动发货】未找到匹配的发货规则或获取发货内容失败')
-                        # 发送自动发货失败通知
-                        await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, "未找到匹配的发货规则或获取发货内容失败", chat_id)
+                            # 普通文本发货内容
+                            await self.send_msg(websocket, chat_id, send_user_id, delivery_content)
+                            sent_count += 1
+                            if len(delivery_contents) > 1:
+                                logger.info(f'[{msg_time}] 【多数量自动发货】第 {i+1}/{len(delivery_contents)} 条已向 {user_url} 发送发货内容')
+                            else:
+                                logger.info(f'[{msg_time}] 【自动发货】已向 {user_url} 发送发货内容')
 
-                except Exception as e:
-                    logger.error(f"自动发货处理异常: {self._safe_str(e)}")
-                    # 发送自动发货异常通知
-                    await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, f"自动发货处理异常: {str(e)}", chat_id)
+                            # 多数量发货时，消息间隔1秒
+                            if len(delivery_contents) > 1 and i < len(delivery_contents) - 1:
+                                await asyncio.sleep(1)
 
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】订单锁释放: {lock_key}，自动发货处理完成')
+                    except Exception as e:
+                        logger.error(f"发送第 {i+1} 条消息失败: {self._safe_str(e)}")
+
+                # 发送成功通知
+                if len(delivery_contents) > 1:
+                    await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, f"多数量发货成功，共发送 {len(delivery_contents)} 个卡券", chat_id)
+                else:
+                    await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, "发货成功", chat_id)
+                return sent_count > 0
+            else:
+                logger.warning(f'[{msg_time}] 【自动发货】未找到匹配的发货规则或获取发货内容失败')
+                # 发送自动发货失败通知
+                await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, "未找到匹配的发货规则或获取发货内容失败", chat_id)
+                return False
 
         except Exception as e:
-            logger.error(f"统一自动发货处理异常: {self._safe_str(e)}")
+            logger.error(f"自动发货处理异常: {self._safe_str(e)}")
+            # 发送自动发货异常通知
+            await self.send_delivery_failure_notification(send_user_name, send_user_id, item_id, f"自动发货处理异常: {str(e)}", chat_id)
+            return False
 
 
 
     async def refresh_token(self):
+        """刷新token并记录刷新结果"""
+        new_token = await self._refresh_token()
+        TOKEN_REFRESHES_TOTAL.inc(self.cookie_id, 'success' if new_token else 'failure')
+        return new_token
+
+    async def _refresh_token(self):
         """刷新token - 使用增强的Token管理器"""
         try:
             logger.info(f"【{self.cookie_id}】开始刷新token...")
@@ -823,21 +846,8 @@ class XianyuLive:
         """原始Token刷新方法（作为备用）"""
         try:
             logger.info(f"【{self.cookie_id}】使用原始方法刷新token...")
-            # 生成更精确的时间戳
-            timestamp = str(int(time.time() * 1000))
-
+            # 除公共参数外，登录token接口需要的额外参数
             params = {
-                'jsv': '2.7.2',
-                'appKey': '34839810',
-                't': timestamp,
-                'sign': '',
-                'v': '1.0',
-                'type': 'originaljson',
-                'accountSite': 'xianyu',
-                'dataType': 'json',
-                'timeout': '20000',
-                'api': 'mtop.taobao.idlemessage.pc.login.token',
-                'sessionOption': 'AutoLoginOnly',
                 'dangerouslySetWindvaneParams': '%5Bobject%20Object%5D',
                 'smToken': 'token',
                 'queryToken': 'sm',
@@ -847,18 +857,8 @@ class XianyuLive:
                 'log_id': '4c053da6vYwnmf'
             }
             data_val = '{"appKey":"444e9908a51d1cb236a27862abc769c9","deviceId":"' + self.device_id + '"}'
-            data = {
-                'data': data_val,
-            }
 
-            # 获取token
-            token = None
-            token = trans_cookies(self.cookies_str).get('_m_h5_tk', '').split('_')[0] if trans_cookies(self.cookies_str).get('_m_h5_tk') else ''
-
-            sign = generate_sign(params['t'], token, data_val)
-            params['sign'] = sign
-
-            # 发送请求 - 使用与浏览器完全一致的请求头
+            # 发送请求 - 使用与浏览器完全一致的请求头（cookie由mtop客户端填充）
             headers = {
                 'accept': 'application/json',
                 'accept-language': 'zh-CN,zh;q=0.9,en;q=0.8',
@@ -875,76 +875,41 @@ class XianyuLive:
                 'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36',
                 'referer': 'https://www.goofish.com/',
                 'origin': 'https://www.goofish.com',
-                'cookie': self.cookies_str
             }
 
-            # 创建SSL上下文，跳过证书验证
-            import ssl
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            
-            # 创建连接器，禁用SSL验证
-            connector = aiohttp.TCPConnector(ssl=ssl_context)
-            
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.post(
-                    API_ENDPOINTS.get('token'),
-                    params=params,
-                    data=data,
-                    headers=headers
-                ) as response:
-                    res_json = await response.json()
-
-                    # 检查并更新Cookie
-                    if 'set-cookie' in response.headers:
-                        new_cookies = {}
-                        for cookie in response.headers.getall('set-cookie', []):
-                            if '=' in cookie:
-                                name, value = cookie.split(';')[0].split('=', 1)
-                                new_cookies[name.strip()] = value.strip()
-
-                        # 更新cookies
-                        if new_cookies:
-                            self.cookies.update(new_cookies)
-                            # 生成新的cookie字符串
-                            self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                            # 更新数据库中的Cookie
-                            await self.update_config_cookies()
-                            logger.debug("已更新Cookie到数据库")
-
-                    if isinstance(res_json, dict):
-                        ret_value = res_json.get('ret', [])
-                        # 检查ret是否包含成功信息
-                        if any('SUCCESS::调用成功' in ret for ret in ret_value):
-                            if 'data' in res_json and 'accessToken' in res_json['data']:
-                                new_token = res_json['data']['accessToken']
-                                self.current_token = new_token
-                                self.last_token_refresh_time = time.time()
-
-                                logger.info(f"【{self.cookie_id}】Token刷新成功（原始方法）")
-                                return new_token
-
-                    # 检查是否是系统过载错误
-                    if isinstance(res_json, dict) and 'ret' in res_json:
-                        ret_list = res_json.get('ret', [])
-                        if any('RGV587_ERROR' in str(ret) for ret in ret_list):
-                            logger.warning(f"【{self.cookie_id}】系统过载，稍后重试: {res_json}")
-                            # 系统过载时等待更长时间再重试
-                            await asyncio.sleep(60)
-                            return None
-                        elif any('FAIL_SYS_USER_VALIDATE' in str(ret) for ret in ret_list):
-                            logger.warning(f"【{self.cookie_id}】用户验证失败，可能需要人工处理: {res_json}")
-                            return None
-                    
-                    logger.error(f"【{self.cookie_id}】Token刷新失败: {res_json}")
+            # token过期会由客户端重签重试；风控/验证类错误在下方单独处理，不在此处退避
+            res_json = await self.mtop.call(
+                'mtop.taobao.idlemessage.pc.login.token', data_val,
+                params=params, headers=headers, url=API_ENDPOINTS.get('token'),
+                max_retries=1, ssl=False  # 跳过证书验证
+            )
 
-                    # 清空当前token，确保下次重试时重新获取
-                    self.current_token = None
+            kind = classify_mtop_response(res_json)
+            if kind == RET_SUCCESS and 'accessToken' in res_json.get('data', {}):
+                new_token = res_json['data']['accessToken']
+                self.current_token = new_token
+                self.last_token_refresh_time = time.time()
 
-                    # 发送Token刷新失败通知
-                    await self.send_token_refresh_notification(f"Token刷新失败: {res_json}", "token_refresh_failed")
-                    return None
+                logger.info(f"【{self.cookie_id}】Token刷新成功（原始方法）")
+                return new_token
+
+            if kind in (RET_THROTTLED, RET_CAPTCHA):
+                logger.warning(f"【{self.cookie_id}】系统过载，稍后重试: {res_json}")
+                # 系统过载时等待更长时间再重试
+                await asyncio.sleep(60)
+                return None
+            if kind == RET_AUTH and 'FAIL_SYS_USER_VALIDATE' in str(res_json.get('ret')):
+                logger.warning(f"【{self.cookie_id}】用户验证失败，可能需要人工处理: {res_json}")
+                return None
+
+            logger.error(f"【{self.cookie_id}】Token刷新失败: {res_json}")
+
+            # 清空当前token，确保下次重试时重新获取
+            self.current_token = None
+
+            # 发送Token刷新失败通知
+            await self.send_token_refresh_notification(f"Token刷新失败: {res_json}", "token_refresh_failed")
+            return None
 
         except Exception as e:
             logger.error(f"原始Token刷新异常: {self._safe_str(e)}")
@@ -1047,6 +1012,7 @@ class XianyuLive:
             # 保存到数据库
             success = db_manager.save_item_info(self.cookie_id, item_id, item_data)
             if success:
+                self.invalidate_item_detail(item_id)
                 logger.info(f"商品信息已保存到数据库: {item_id}")
             else:
                 logger.warning(f"保存商品信息到数据库失败: {item_id}")
@@ -1063,6 +1029,7 @@ class XianyuLive:
             success = db_manager.update_item_detail(self.cookie_id, item_id, item_detail)
 
             if success:
+                self.invalidate_item_detail(item_id)
                 logger.info(f"商品详情已更新: {item_id}")
             else:
                 logger.warning(f"更新商品详情失败: {item_id}")
@@ -1091,54 +1058,56 @@ class XianyuLive:
                 logger.debug(f"自动获取商品详情功能已禁用: {item_id}")
                 return ""
 
-            # 1. 首先检查缓存（24小时有效）
-            async with self._item_detail_cache_lock:
-                if item_id in self._item_detail_cache:
-                    cache_data = self._item_detail_cache[item_id]
-                    cache_time = cache_data['timestamp']
-                    current_time = time.time()
-
-                    # 检查缓存是否在24小时内
-                    if current_time - cache_time < 24 * 60 * 60:  # 24小时
-                        logger.info(f"从缓存获取商品详情: {item_id}")
-                        return cache_data['detail']
-                    else:
-                        # 缓存过期，删除
-                        del self._item_detail_cache[item_id]
-                        logger.debug(f"缓存已过期，删除: {item_id}")
-
-            # 2. 尝试使用浏览器获取商品详情
-            detail_from_browser = await self._fetch_item_detail_from_browser(item_id)
-            if detail_from_browser:
-                # 保存到缓存
-                async with self._item_detail_cache_lock:
-                    self._item_detail_cache[item_id] = {
-                        'detail': detail_from_browser,
-                        'timestamp': time.time()
-                    }
-                logger.info(f"成功通过浏览器获取商品详情: {item_id}, 长度: {len(detail_from_browser)}")
-                return detail_from_browser
-
-            # 3. 浏览器获取失败，使用外部API作为备用
-            logger.warning(f"浏览器获取商品详情失败，尝试外部API: {item_id}")
-            detail_from_api = await self._fetch_item_detail_from_external_api(item_id)
-            if detail_from_api:
-                # 保存到缓存
-                async with self._item_detail_cache_lock:
-                    self._item_detail_cache[item_id] = {
-                        'detail': detail_from_api,
-                        'timestamp': time.time()
-                    }
-                logger.info(f"成功通过外部API获取商品详情: {item_id}, 长度: {len(detail_from_api)}")
-                return detail_from_api
-
-            logger.warning(f"所有方式都无法获取商品详情: {item_id}")
-            return ""
+            # 缓存命中直接返回；未命中时同一商品的并发请求只触发一次获取
+            return await self._item_detail_cache.get_or_fetch(item_id, self._fetch_item_detail_uncached)
 
         except Exception as e:
             logger.error(f"获取商品详情异常: {item_id}, 错误: {self._safe_str(e)}")
             return ""
 
+    async def _fetch_item_detail_uncached(self, item_id: str) -> str:
+        """不经缓存获取商品详情（优先使用浏览器，备用外部API）"""
+        # 1. 尝试使用浏览器获取商品详情
+        detail_from_browser = await self._fetch_item_detail_from_browser(item_id)
+        if detail_from_browser:
+            logger.info(f"成功通过浏览器获取商品详情: {item_id}, 长度: {len(detail_from_browser)}")
+            return detail_from_browser
+
+        # 2. 浏览器获取失败，使用外部API作为备用
+        logger.warning(f"浏览器获取商品详情失败，尝试外部API: {item_id}")
+        detail_from_api = await self._fetch_item_detail_from_external_api(item_id)
+        if detail_from_api:
+            logger.info(f"成功通过外部API获取商品详情: {item_id}, 长度: {len(detail_from_api)}")
+            return detail_from_api
+
+        logger.warning(f"所有方式都无法获取商品详情: {item_id}")
+        return ""
+
+    @classmethod
+    def _warm_item_detail_cache(cls):
+        """首次创建实例时从数据库 item_info.item_detail 预热商品详情缓存"""
+        if cls._item_detail_cache_warmed:
+            return
+        cls._item_detail_cache_warmed = True
+        try:
+            from db_manager import db_manager
+            rows = db_manager.get_recent_item_details(cls._item_detail_cache.max_size)
+            loaded = cls._item_detail_cache.warm_load(rows)
+            if loaded:
+                logger.info(f"商品详情缓存预热完成: {loaded} 条")
+        except Exception as e:
+            logger.error(f"商品详情缓存预热失败: {e}")
+
+    @classmethod
+    def invalidate_item_detail(cls, item_id: str):
+        """商品详情被保存或删除后删除缓存，下次查询重新获取"""
+        cls._item_detail_cache.invalidate(item_id)
+
+    @classmethod
+    def get_item_detail_cache_stats(cls) -> dict:
+        """获取商品详情缓存统计"""
+        return cls._item_detail_cache.stats()
+
     async def _fetch_item_detail_from_browser(self, item_id: str) -> str:
         """使用浏览器获取商品详情"""
         try:
@@ -1460,180 +1429,23 @@ class XianyuLive:
             return success_count
 
     async def get_item_info(self, item_id, retry_count=0):
-        """获取商品信息，自动处理token失效的情况"""
-        if retry_count >= 4:  # 最多重试3次
-            logger.error("获取商品信息失败，重试次数过多")
-            return {"error": "获取商品信息失败，重试次数过多"}
-
-        # 确保session已创建
-        if not self.session:
-            await self.create_session()
-
-        params = {
-            'jsv': '2.7.2',
-            'appKey': '34839810',
-            't': str(int(time.time()) * 1000),
-            'sign': '',
-            'v': '1.0',
-            'type': 'originaljson',
-            'accountSite': 'xianyu',
-            'dataType': 'json',
-            'timeout': '20000',
-            'api': 'mtop.taobao.idle.pc.detail',
-            'sessionOption': 'AutoLoginOnly',
-            'spm_cnt': 'a21ybx.im.0.0',
-        }
-
-        data_val = '{"itemId":"' + item_id + '"}'
-        data = {
-            'data': data_val,
-        }
-
-        # 始终从最新的cookies中获取_m_h5_tk token（刷新后cookies会被更新）
-        token = trans_cookies(self.cookies_str).get('_m_h5_tk', '').split('_')[0] if trans_cookies(self.cookies_str).get('_m_h5_tk') else ''
-
-        if token:
-            logger.debug(f"使用cookies中的_m_h5_tk token: {token}")
-        else:
-            logger.warning("cookies中没有找到_m_h5_tk token")
-
-        from utils.xianyu_utils import generate_sign
-        sign = generate_sign(params['t'], token, data_val)
-        params['sign'] = sign
-
+        """获取商品信息，token失效、风控等由mtop客户端统一重试"""
         try:
-            async with self.session.post(
-                'https://h5api.m.goofish.com/h5/mtop.taobao.idle.pc.detail/1.0/',
-                params=params,
-                data=data
-            ) as response:
-                res_json = await response.json()
-
-                # 检查并更新Cookie
-                if 'set-cookie' in response.headers:
-                    new_cookies = {}
-                    for cookie in response.headers.getall('set-cookie', []):
-                        if '=' in cookie:
-                            name, value = cookie.split(';')[0].split('=', 1)
-                            new_cookies[name.strip()] = value.strip()
-
-                    # 更新cookies
-                    if new_cookies:
-                        self.cookies.update(new_cookies)
-                        # 生成新的cookie字符串
-                        self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                        # 更新数据库中的Cookie
-                        await self.update_config_cookies()
-                        logger.debug("已更新Cookie到数据库")
-
-                logger.debug(f"商品信息获取成功: {res_json}")
-                # 检查返回状态
-                if isinstance(res_json, dict):
-                    ret_value = res_json.get('ret', [])
-                    # 检查ret是否包含成功信息
-                    if not any('SUCCESS::调用成功' in ret for ret in ret_value):
-                        logger.warning(f"商品信息API调用失败，错误信息: {ret_value}")
-
-                        await asyncio.sleep(0.5)
-                        return await self.get_item_info(item_id, retry_count + 1)
-                    else:
-                        logger.debug(f"商品信息获取成功: {item_id}")
-                        return res_json
-                else:
-                    logger.error(f"商品信息API返回格式异常: {res_json}")
-                    return await self.get_item_info(item_id, retry_count + 1)
-
+            res_json = await self.mtop.call(
+                'mtop.taobao.idle.pc.detail', {'itemId': item_id},
+                params={'spm_cnt': 'a21ybx.im.0.0'},
+                max_retries=max(0, self.mtop.max_retries - retry_count)
+            )
         except Exception as e:
             logger.error(f"商品信息API请求异常: {self._safe_str(e)}")
-            await asyncio.sleep(0.5)
-            return await self.get_item_info(item_id, retry_count + 1)
-
-    def extract_item_id_from_message(self, message):
-        """从消息中提取商品ID的辅助方法"""
-        try:
-            # 方法1: 从message["1"]中提取（如果是字符串格式）
-            message_1 = message.get('1')
-            if isinstance(message_1, str):
-                # 尝试从字符串中提取数字ID
-                id_match = re.search(r'(\d{10,})', message_1)
-                if id_match:
-                    logger.info(f"从message[1]字符串中提取商品ID: {id_match.group(1)}")
-                    return id_match.group(1)
-
-            # 方法2: 从message["3"]中提取
-            message_3 = message.get('3', {})
-            if isinstance(message_3, dict):
-
-                # 从extension中提取
-                if 'extension' in message_3:
-                    extension = message_3['extension']
-                    if isinstance(extension, dict):
-                        item_id = extension.get('itemId') or extension.get('item_id')
-                        if item_id:
-                            logger.info(f"从extension中提取商品ID: {item_id}")
-                            return item_id
-
-                # 从bizData中提取
-                if 'bizData' in message_3:
-                    biz_data = message_3['bizData']
-                    if isinstance(biz_data, dict):
-                        item_id = biz_data.get('itemId') or biz_data.get('item_id')
-                        if item_id:
-                            logger.info(f"从bizData中提取商品ID: {item_id}")
-                            return item_id
-
-                # 从其他可能的字段中提取
-                for key, value in message_3.items():
-                    if isinstance(value, dict):
-                        item_id = value.get('itemId') or value.get('item_id')
-                        if item_id:
-                            logger.info(f"从{key}字段中提取商品ID: {item_id}")
-                            return item_id
-
-                # 从消息内容中提取数字ID
-                content = message_3.get('content', '')
-                if isinstance(content, str) and content:
-                    id_match = re.search(r'(\d{10,})', content)
-                    if id_match:
-                        logger.info(f"【{self.cookie_id}】从消息内容中提取商品ID: {id_match.group(1)}")
-                        return id_match.group(1)
-
-            # 方法3: 遍历整个消息结构查找可能的商品ID
-            def find_item_id_recursive(obj, path=""):
-                if isinstance(obj, dict):
-                    # 直接查找itemId字段
-                    for key in ['itemId', 'item_id', 'id']:
-                        if key in obj and isinstance(obj[key], (str, int)):
-                            value = str(obj[key])
-                            if len(value) >= 10 and value.isdigit():
-                                logger.info(f"从{path}.{key}中提取商品ID: {value}")
-                                return value
-
-                    # 递归查找
-                    for key, value in obj.items():
-                        result = find_item_id_recursive(value, f"{path}.{key}" if path else key)
-                        if result:
-                            return result
-
-                elif isinstance(obj, str):
-                    # 从字符串中提取可能的商品ID
-                    id_match = re.search(r'(\d{10,})', obj)
-                    if id_match:
-                        logger.info(f"从{path}字符串中提取商品ID: {id_match.group(1)}")
-                        return id_match.group(1)
-
-                return None
-
-            result = find_item_id_recursive(message)
-            if result:
-                return result
+            return {"error": f"获取商品信息失败: {self._safe_str(e)}"}
 
-            logger.debug("所有方法都未能提取到商品ID")
-            return None
+        if classify_mtop_response(res_json) != RET_SUCCESS:
+            logger.error(f"获取商品信息失败: {res_json}")
+            return {"error": f"获取商品信息失败: {res_json.get('ret') if isinstance(res_json, dict) else res_json}"}
 
-        except Exception as e:
-            logger.error(f"提取商品ID失败: {self._safe_str(e)}")
-            return None
+        logger.debug(f"商品信息获取成功: {item_id}")
+        return res_json
 
     def debug_message_structure(self, message, context=""):
         """调试消息结构的辅助方法"""
@@ -1739,86 +1551,52 @@ class XianyuLive:
         try:
             from db_manager import db_manager
 
-            # 获取当前账号的关键词列表（包含类型信息）
-            keywords = db_manager.get_keywords_with_type(self.cookie_id)
+            # 当前账号的关键词编译成匹配器，缓存在会话状态缓存中，修改关键词时失效后重新构建
+            matcher = chat_state_store.account_value(
+                self.cookie_id, 'keywords',
+                lambda: KeywordMatcher(db_manager.get_keywords_with_type(self.cookie_id)))
 
-            if not keywords:
+            if not matcher.keywords:
                 logger.debug(f"账号 {self.cookie_id} 没有配置关键词")
                 return None
 
-            # 1. 如果有商品ID，优先匹配该商品ID对应的关键词
-            if item_id:
-                for keyword_data in keywords:
-                    keyword = keyword_data['keyword']
-                    reply = keyword_data['reply']
-                    keyword_item_id = keyword_data['item_id']
-                    keyword_type = keyword_data.get('type', 'text')
-                    image_url = keyword_data.get('image_url')
-
-                    if keyword_item_id == item_id and keyword.lower() in send_message.lower():
-                        logger.info(f"商品ID关键词匹配成功: 商品{item_id} '{keyword}' (类型: {keyword_type})")
-
-                        # 根据关键词类型处理
-                        if keyword_type == 'image' and image_url:
-                            # 图片类型关键词，发送图片
-                            return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
-                        else:
-                            # 文本类型关键词，检查回复内容是否为空
-                            if not reply or (reply and reply.strip() == ''):
-                                logger.info(f"商品ID关键词 '{keyword}' 回复内容为空，不进行回复")
-                                return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+            # 优先匹配该商品ID对应的关键词，其次匹配没有商品ID的通用关键词
+            keyword_data = matcher.match(send_message, item_id)
+            if not keyword_data:
+                logger.debug(f"未找到匹配的关键词: {send_message}")
+                return None
 
-                            # 进行变量替换
-                            try:
-                                formatted_reply = reply.format(
-                                    send_user_name=send_user_name,
-                                    send_user_id=send_user_id,
-                                    send_message=send_message
-                                )
-                                logger.info(f"商品ID文本关键词回复: {formatted_reply}")
-                                return formatted_reply
-                            except Exception as format_error:
-                                logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
-                                # 如果变量替换失败，返回原始内容
-                                return reply
-
-            # 2. 如果商品ID匹配失败或没有商品ID，匹配没有商品ID的通用关键词
-            for keyword_data in keywords:
-                keyword = keyword_data['keyword']
-                reply = keyword_data['reply']
-                keyword_item_id = keyword_data['item_id']
-                keyword_type = keyword_data.get('type', 'text')
-                image_url = keyword_data.get('image_url')
-
-                if not keyword_item_id and keyword.lower() in send_message.lower():
-                    logger.info(f"通用关键词匹配成功: '{keyword}' (类型: {keyword_type})")
-
-                    # 根据关键词类型处理
-                    if keyword_type == 'image' and image_url:
-                        # 图片类型关键词，发送图片
-                        return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
-                    else:
-                        # 文本类型关键词，检查回复内容是否为空
-                        if not reply or (reply and reply.strip() == ''):
-                            logger.info(f"通用关键词 '{keyword}' 回复内容为空，不进行回复")
-                            return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+            keyword = keyword_data['keyword']
+            reply = keyword_data['reply']
+            keyword_type = keyword_data.get('type', 'text')
+            image_url = keyword_data.get('image_url')
+            match_desc = f"商品ID关键词匹配成功: 商品{item_id}" if keyword_data['item_id'] else "通用关键词匹配成功:"
+            reply_desc = "商品ID" if keyword_data['item_id'] else "通用"
+            logger.info(f"{match_desc} '{keyword}' (类型: {keyword_type})")
 
-                        # 进行变量替换
-                        try:
-                            formatted_reply = reply.format(
-                                send_user_name=send_user_name,
-                                send_user_id=send_user_id,
-                                send_message=send_message
-                            )
-                            logger.info(f"通用文本关键词回复: {formatted_reply}")
-                            return formatted_reply
-                        except Exception as format_error:
-                            logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
-                            # 如果变量替换失败，返回原始内容
-                            return reply
-
-            logger.debug(f"未找到匹配的关键词: {send_message}")
-            return None
+            # 根据关键词类型处理
+            if keyword_type == 'image' and image_url:
+                # 图片类型关键词，发送图片
+                return await self._handle_image_keyword(keyword, image_url, send_user_name, send_user_id, send_message)
+
+            # 文本类型关键词，检查回复内容是否为空
+            if not reply or (reply and reply.strip() == ''):
+                logger.info(f"{reply_desc}关键词 '{keyword}' 回复内容为空，不进行回复")
+                return "EMPTY_REPLY"  # 返回特殊标记表示匹配到但不回复
+
+            # 进行变量替换
+            try:
+                formatted_reply = reply.format(
+                    send_user_name=send_user_name,
+                    send_user_id=send_user_id,
+                    send_message=send_message
+                )
+                logger.info(f"{reply_desc}文本关键词回复: {formatted_reply}")
+                return formatted_reply
+            except Exception as format_error:
+                logger.error(f"关键词回复变量替换失败: {self._safe_str(format_error)}")
+                # 如果变量替换失败，返回原始内容
+                return reply
 
         except Exception as e:
             logger.error(f"获取关键词回复失败: {self._safe_str(e)}")
@@ -1920,8 +1698,13 @@ class XianyuLive:
         except Exception as e:
             logger.error(f"更新卡券图片URL失败: {e}")
 
-    async def get_ai_reply(self, send_user_name: str, send_user_id: str, send_message: str, item_id: str, chat_id: str):
-        """获取AI回复"""
+    async def get_ai_reply(self, send_user_name: str, send_user_id: str, send_message: str, item_id: str, chat_id: str,
+                           on_late=None):
+        """获取AI回复
+
+        大模型调用在AI回复保护的线程池中执行，超出时间预算、熔断或并发已满时返回None（改用默认回复）；
+        on_late 为超时调用稍后完成时补发回复的协程函数
+        """
         try:
             from ai_reply_engine import ai_reply_engine
 
@@ -1950,14 +1733,13 @@ class XianyuLive:
                     'desc': item_info_raw.get('item_description', '暂无商品描述')
                 }
 
-            # 生成AI回复
-            reply = ai_reply_engine.generate_reply(
-                message=send_message,
-                item_info=item_info,
-                chat_id=chat_id,
-                cookie_id=self.cookie_id,
-                user_id=send_user_id,
-                item_id=item_id
+            # 生成AI回复（按AI服务地址和API Key分别限时、限并发和熔断）
+            settings = ai_reply_engine.get_settings(self.cookie_id)
+            provider = provider_key(settings.get('base_url'), settings.get('api_key'))
+            reply = await ai_reply_guard.call(
+                provider, ai_reply_engine.generate_reply_or_raise,
+                send_message, item_info, chat_id, self.cookie_id, send_user_id, item_id,
+                on_late=on_late
             )
 
             if reply:
@@ -2768,28 +2550,12 @@ class XianyuLive:
             # 导入解密后的确认发货模块
             from secure_confirm_decrypted import SecureConfirm
 
-            # 创建确认实例，传入主界面类实例
-            secure_confirm = SecureConfirm(self.session, self.cookies_str, self.cookie_id, self)
-
-            # 传递必要的属性
-            secure_confirm.current_token = self.current_token
-            secure_confirm.last_token_refresh_time = self.last_token_refresh_time
-            secure_confirm.token_refresh_interval = self.token_refresh_interval
+            # 创建确认实例，共享本账号的mtop客户端（Cookie与token随之同步）
+            secure_confirm = SecureConfirm(self.mtop, self.cookie_id, self)
 
             # 调用确认方法，传入item_id用于token刷新
             result = await secure_confirm.auto_confirm(order_id, item_id, retry_count)
 
-            # 同步更新后的cookies和token
-            if secure_confirm.cookies_str != self.cookies_str:
-                self.cookies_str = secure_confirm.cookies_str
-                self.cookies = secure_confirm.cookies
-                logger.debug(f"【{self.cookie_id}】已同步确认发货模块更新的cookies")
-
-            if secure_confirm.current_token != self.current_token:
-                self.current_token = secure_confirm.current_token
-                self.last_token_refresh_time = secure_confirm.last_token_refresh_time
-                logger.debug(f"【{self.cookie_id}】已同步确认发货模块更新的token")
-
             return result
 
         except Exception as e:
@@ -2804,13 +2570,8 @@ class XianyuLive:
             # 导入解密后的免拼发货模块
             from secure_freeshipping_decrypted import SecureFreeshipping
 
-            # 创建免拼发货实例
-            secure_freeshipping = SecureFreeshipping(self.session, self.cookies_str, self.cookie_id)
-
-            # 传递必要的属性
-            secure_freeshipping.current_token = self.current_token
-            secure_freeshipping.last_token_refresh_time = self.last_token_refresh_time
-            secure_freeshipping.token_refresh_interval = self.token_refresh_interval
+            # 创建免拼发货实例，共享本账号的mtop客户端
+            secure_freeshipping = SecureFreeshipping(self.mtop, self.cookie_id)
 
             # 调用免拼发货方法
             return await secure_freeshipping.auto_freeshipping(order_id, item_id, buyer_id, retry_count)
@@ -2904,7 +2665,8 @@ class XianyuLive:
                 logger.error(f"【{self.cookie_id}】获取订单详情异常: {self._safe_str(e)}")
                 return None
 
-    async def _auto_delivery(self, item_id: str, item_title: str = None, order_id: str = None, send_user_id: str = None):
+    async def _auto_delivery(self, item_id: str, item_title: str = None, order_id: str = None, send_user_id: str = None,
+                             allow_delay: bool = True):
         """自动发货功能 - 获取卡券规则，执行延时，确认发货，发送内容"""
         try:
             from db_manager import db_manager
@@ -3092,11 +2854,10 @@ class XianyuLive:
             # 获取延时设置
             delay_seconds = rule.get('card_delay_seconds', 0)
 
-            # 执行延时（不管是否确认发货，只要有延时设置就执行）
-            if delay_seconds and delay_seconds > 0:
-                logger.info(f"检测到发货延时设置: {delay_seconds}秒，开始延时...")
-                await asyncio.sleep(delay_seconds)
-                logger.info(f"延时完成")
+            # 有延时设置时不在这里等待：返回延时标记，由调用方加入延时发货队列，到期后再确认发货并发送内容
+            if delay_seconds and delay_seconds > 0 and allow_delay and order_id:
+                logger.info(f"检测到发货延时设置: {delay_seconds}秒，加入延时发货队列")
+                return f"{DELAYED_DELIVERY_PREFIX}{int(delay_seconds)}"
 
             # 如果有订单ID，执行确认发货
             if order_id:
@@ -3156,8 +2917,10 @@ class XianyuLive:
 
                 # 根据卡券类型处理发货内容
                 if rule['card_type'] == 'api':
-                    # API类型：调用API获取内容，传入订单和商品信息用于动态参数替换
-                    delivery_content = await self._get_api_card_content(rule, order_id, item_id, send_user_id, spec_name, spec_value)
+                    # API类型：开启预取的卡券优先从预取池取，池为空时调用API获取内容，传入订单和商品信息用于动态参数替换
+                    delivery_content = await card_prefetcher.take(rule)
+                    if not delivery_content:
+                        delivery_content = await self._get_api_card_content(rule, order_id, item_id, send_user_id, spec_name, spec_value)
 
                 elif rule['card_type'] == 'text':
                     # 固定文字类型：直接使用文字内容
@@ -3239,21 +3002,13 @@ class XianyuLive:
                 logger.debug(f"规则详情: {rule}")
                 return None
 
-            # 解析API配置
-            if isinstance(api_config, str):
-                api_config = json.loads(api_config)
-
+            # 解析API配置（含headers和params）
+            api_config = parse_api_config(api_config)
             url = api_config.get('url')
-            method = api_config.get('method', 'GET').upper()
+            method = api_config['method']
             timeout = api_config.get('timeout', 10)
-            headers = api_config.get('headers', '{}')
-            params = api_config.get('params', '{}')
-
-            # 解析headers和params
-            if isinstance(headers, str):
-                headers = json.loads(headers)
-            if isinstance(params, str):
-                params = json.loads(params)
+            headers = api_config['headers']
+            params = api_config['params']
 
             # 如果是POST请求且有动态参数，进行参数替换
             if method == 'POST' and params:
@@ -3269,31 +3024,14 @@ class XianyuLive:
                 await self.create_session()
 
             # 发起HTTP请求
-            timeout_obj = aiohttp.ClientTimeout(total=timeout)
-
-            if method == 'GET':
-                async with self.session.get(url, headers=headers, params=params, timeout=timeout_obj) as response:
-                    status_code = response.status
-                    response_text = await response.text()
-            elif method == 'POST':
-                async with self.session.post(url, headers=headers, json=params, timeout=timeout_obj) as response:
-                    status_code = response.status
-                    response_text = await response.text()
-            else:
+            if method not in ('GET', 'POST'):
                 logger.error(f"不支持的HTTP方法: {method}")
                 return None
+            status_code, response_text = await request_api_card(self.session, method, url, headers, params, timeout)
 
             if status_code == 200:
-                # 尝试解析JSON响应，如果失败则使用原始文本
-                try:
-                    result = json.loads(response_text)
-                    # 如果返回的是对象，尝试提取常见的内容字段
-                    if isinstance(result, dict):
-                        content = result.get('data') or result.get('content') or result.get('card') or str(result)
-                    else:
-                        content = str(result)
-                except:
-                    content = response_text
+                # 解析JSON响应并提取常见的内容字段，失败则使用原始文本
+                content = extract_card_content(response_text)
 
                 logger.info(f"API调用成功，返回内容长度: {len(content)}")
                 return content
@@ -3584,6 +3322,21 @@ class XianyuLive:
         await ws.send(json.dumps(msg))
         await asyncio.sleep(1)
         current_time = int(time.time() * 1000)
+        self._sync_connected_pts = current_time * 1000
+        pts = self._sync_connected_pts
+        if self.sync_resume_enabled:
+            # 从上次处理到的位置继续同步，服务端补发断线期间的消息
+            pts = self.sync_cursor.resume_pts(self._sync_connected_pts)
+            if pts < self._sync_connected_pts:
+                logger.info(f'【{self.cookie_id}】从上次同步位置继续，补收最近 {(self._sync_connected_pts - pts) / 1000000:.1f} 秒的消息')
+                self.sync_cursor.start_backfill()
+        await self.send_ack_diff(ws, pts, current_time)
+        logger.info(f'【{self.cookie_id}】连接注册完成')
+
+    async def send_ack_diff(self, ws, pts: int, current_time: int = None):
+        """确认同步位置，服务端从该位置之后下发消息"""
+        if current_time is None:
+            current_time = int(time.time() * 1000)
         msg = {
             "lwp": "/r/SyncStatus/ackDiff",
             "headers": {"mid": generate_mid()},
@@ -3594,31 +3347,54 @@ class XianyuLive:
                     "channel": "sync",
                     "topic": "sync",
                     "highPts": 0,
-                    "pts": current_time * 1000,
+                    "pts": pts,
                     "seq": 0,
                     "timestamp": current_time
                 }
             ]
         }
         await ws.send(json.dumps(msg))
-        logger.info(f'【{self.cookie_id}】连接注册完成')
+
+    def _save_sync_cursor(self, force: bool = False):
+        """把同步位置写入数据库（按 cursor_flush_interval 限频，断开连接时强制写入）"""
+        if not self.sync_resume_enabled:
+            return
+        if force and self.sync_cursor.pts == self.sync_cursor.saved_pts:
+            return
+        if force or self.sync_cursor.should_save(self.sync_cursor_flush_interval):
+            from db_manager import db_manager
+            pts = self.sync_cursor.pts
+            if db_manager.save_sync_cursor(self.cookie_id, pts):
+                self.sync_cursor.mark_saved(pts)
 
     async def send_heartbeat(self, ws):
         """发送心跳包"""
+        mid = generate_mid()
         msg = {
             "lwp": "/!",
             "headers": {
-                "mid": generate_mid()
+                "mid": mid
             }
         }
+        self._heartbeat_ack.clear()
+        self._heartbeat_mid = mid
+        self._heartbeat_sent_at = time.monotonic()
         await ws.send(json.dumps(msg))
         self.last_heartbeat_time = time.time()
         logger.debug(f"【{self.cookie_id}】心跳包已发送")
 
     async def heartbeat_loop(self, ws):
-        """心跳循环"""
+        """心跳循环
+
+        每次发送心跳后等待响应（最多等待 heartbeat_timeout，且不超过心跳间隔），
+        连续 heartbeat_max_missed 次无响应即判定连接失效（半开的TCP连接不会报错），
+        立即断开连接，由主循环马上重连。
+        """
         consecutive_failures = 0
         max_failures = 3  # 连续失败3次后停止心跳
+        missed = 0
+        self._heartbeat_mid = None
+        self._heartbeat_acked_at = time.monotonic()
 
         while True:
             try:
@@ -3634,9 +3410,25 @@ class XianyuLive:
                     break
 
                 await self.send_heartbeat(ws)
+                # 补发结束后同步位置越过补发窗口
+                if self.sync_cursor.expire_backfill():
+                    self._save_sync_cursor()
                 consecutive_failures = 0  # 重置失败计数
 
-                await asyncio.sleep(self.heartbeat_interval)
+                try:
+                    await asyncio.wait_for(self._heartbeat_ack.wait(),
+                                           timeout=min(self.heartbeat_timeout, self.heartbeat_interval))
+                    missed = 0
+                except asyncio.TimeoutError:
+                    missed += 1
+                    WS_HEARTBEAT_MISSED_TOTAL.inc(self.cookie_id)
+                    logger.warning(f"【{self.cookie_id}】心跳无响应 ({missed}/{self.heartbeat_max_missed})")
+                    if missed >= self.heartbeat_max_missed:
+                        await self._close_dead_connection(ws, missed)
+                        break
+
+                elapsed = time.monotonic() - self._heartbeat_sent_at
+                await asyncio.sleep(max(0.0, self.heartbeat_interval - elapsed))
 
             except Exception as e:
                 consecutive_failures += 1
@@ -3649,11 +3441,34 @@ class XianyuLive:
                 # 失败后短暂等待再重试
                 await asyncio.sleep(5)
 
+    async def _close_dead_connection(self, ws, missed: int):
+        """心跳判定连接失效：直接中止底层连接（半开连接上的关闭握手会一直等到超时）"""
+        detect_seconds = time.monotonic() - self._heartbeat_acked_at
+        WS_DEAD_DETECT_SECONDS.observe(detect_seconds, self.cookie_id)
+        logger.error(f"【{self.cookie_id}】连续{missed}次心跳无响应，距上次响应 {detect_seconds:.1f} 秒，判定连接失效，立即重连")
+        self._connection_dead = True
+        transport = getattr(ws, 'transport', None)
+        if transport is not None:
+            transport.abort()
+        else:
+            try:
+                await asyncio.wait_for(ws.close(), timeout=1)
+            except Exception as e:
+                logger.debug(f"【{self.cookie_id}】关闭失效连接出错: {self._safe_str(e)}")
+
     async def handle_heartbeat_response(self, message_data):
-        """处理心跳响应"""
+        """处理心跳响应（所有 code=200 的响应帧都在这里消费）"""
         try:
             if message_data.get("code") == 200:
                 self.last_heartbeat_response = time.time()
+                mid = (message_data.get("headers") or {}).get("mid")
+                if self._heartbeat_mid and (mid is None or mid == self._heartbeat_mid):
+                    now = time.monotonic()
+                    self.heartbeat_rtt = now - self._heartbeat_sent_at
+                    self._heartbeat_acked_at = now
+                    self._heartbeat_mid = None
+                    self._heartbeat_ack.set()
+                    WS_HEARTBEAT_RTT_SECONDS.observe(self.heartbeat_rtt, self.cookie_id)
                 logger.debug("心跳响应正常")
                 return True
         except Exception as e:
@@ -4469,6 +4284,10 @@ class XianyuLive:
         # 添加更多SSL配置以确保连接成功
         ssl_context.set_ciphers('DEFAULT@SECLEVEL=1')
         
+        # ws:// 地址（如本地回放基准的假服务器）不使用TLS，websockets 不接受为 ws:// 传入SSL上下文
+        if self.base_url.startswith('ws://'):
+            ssl_context = None
+
         logger.info(f"【{self.cookie_id}】使用SSL上下文连接WebSocket: {self.base_url}")
 
         try:
@@ -4563,20 +4382,6 @@ class XianyuLive:
             except Exception as e:
                 pass
 
-    def is_chat_message(self, message):
-        """判断是否为用户聊天消息"""
-        try:
-            return (
-                isinstance(message, dict)
-                and "1" in message
-                and isinstance(message["1"], dict)
-                and "10" in message["1"]
-                and isinstance(message["1"]["10"], dict)
-                and "reminderContent" in message["1"]["10"]
-            )
-        except Exception:
-            return False
-
     def is_sync_package(self, message_data):
         """判断是否为同步包消息"""
         try:
@@ -4603,10 +4408,11 @@ class XianyuLive:
             )
 
     async def close_session(self):
-        """关闭aiohttp session"""
+        """关闭aiohttp session及mtop客户端连接池"""
         if self.session:
             await self.session.close()
             self.session = None
+        await self.mtop.close()
 
     async def get_api_reply(self, msg_time, user_url, send_user_id, send_user_name, item_id, send_message, chat_id):
         """调用API获取回复消息"""
@@ -4660,6 +4466,16 @@ class XianyuLive:
             return None
 
     async def handle_message(self, message_data, websocket):
+        """处理所有类型的消息，记录进行中的任务数和整体耗时"""
+        MESSAGES_INFLIGHT.inc(self.cookie_id)
+        started = time.perf_counter()
+        try:
+            await self._handle_message(message_data, websocket)
+        finally:
+            MESSAGES_INFLIGHT.dec(self.cookie_id)
+            MESSAGE_HANDLE_SECONDS.observe(time.perf_counter() - started)
+
+    async def _handle_message(self, message_data, websocket):
         """处理所有类型的消息"""
         try:
             # 检查账号是否启用
@@ -4692,9 +4508,46 @@ class XianyuLive:
             if not self.is_sync_package(message_data):
                 return
 
-            # 获取并解密数据
-            sync_data = message_data["body"]["syncPushPackage"]["data"][0]
+            # 同步包中可能有多条消息（重连后补发的断线期间消息按批下发）；
+            # 同一批常有同一买家的多条消息，按 pts 顺序逐条处理，保证回复顺序、AI对话上下文和议价次数一致
+            sync_package = message_data["body"]["syncPushPackage"]
+            sync_items = sorted(sync_package["data"],
+                                key=lambda sync_data: (sync_data.get("pts") or 0) if isinstance(sync_data, dict) else 0)
+            for sync_data in sync_items:
+                await self._handle_sync_item(sync_data, websocket)
+
+            pts_list = [sync_data["pts"] for sync_data in sync_package["data"]
+                        if isinstance(sync_data, dict) and sync_data.get("pts")]
+            if pts_list:
+                # 整包处理完后才推进补发高水位
+                self.sync_cursor.package_done(min(pts_list), max(pts_list), bool(sync_package.get("hasMore")))
+                self._save_sync_cursor()
+                # 还有未下发的消息时，本批处理完后确认位置，服务端继续下发下一批
+                if sync_package.get("hasMore"):
+                    await self.send_ack_diff(websocket, max(pts_list))
+
+        except Exception as e:
+            logger.error(f"处理消息时发生错误: {self._safe_str(e)}")
+            logger.debug(f"原始消息: {message_data}")
+
+    async def _handle_sync_item(self, sync_data, websocket):
+        """处理同步包中的一条消息"""
+        pts = sync_data.get("pts") if isinstance(sync_data, dict) else None
+        if pts and pts <= self.sync_cursor.skip_pts:
+            # 该位置之前的消息都已处理完（重启后去重窗口为空时也能识别重发的消息）
+            SYNC_DUPLICATES_TOTAL.inc(self.cookie_id)
+            logger.debug(f"【{self.cookie_id}】跳过同步位置之前的消息: {pts}")
+            return
+        self.sync_cursor.begin(pts)
+        try:
+            await self._handle_sync_data(sync_data, websocket, pts)
+        finally:
+            self.sync_cursor.complete(pts)
+            self._save_sync_cursor()
 
+    async def _handle_sync_data(self, sync_data, websocket, pts):
+        """解密并处理一条同步数据"""
+        try:
             # 检查是否有必要的字段
             if "data" not in sync_data:
                 logger.debug("同步包中无data字段")
@@ -4702,6 +4555,7 @@ class XianyuLive:
 
             # 解密数据
             message = None
+            decrypt_started = time.perf_counter()
             try:
                 data = sync_data["data"]
                 try:
@@ -4732,6 +4586,7 @@ class XianyuLive:
             except Exception as e:
                 logger.error(f"消息解密失败: {self._safe_str(e)}")
                 return
+            MESSAGE_STAGE_SECONDS.observe(time.perf_counter() - decrypt_started, 'decrypt')
 
             # 确保message不为空
             if message is None:
@@ -4744,155 +4599,65 @@ class XianyuLive:
                 logger.debug(f"消息内容: {message}")
                 return
 
-            # 【优先处理】尝试获取订单ID并获取订单详情
-            order_id = None
-            try:
-                order_id = self._extract_order_id(message)
-                if order_id:
-                    msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-                    logger.info(f'[{msg_time}] 【{self.cookie_id}】✅ 检测到订单ID: {order_id}，开始获取订单详情')
-
-                    # 立即获取订单详情信息
-                    try:
-                        # 先尝试提取用户ID和商品ID用于订单详情获取
-                        temp_user_id = None
-                        temp_item_id = None
-
-                        # 提取用户ID
-                        try:
-                            message_1 = message.get("1")
-                            if isinstance(message_1, str) and '@' in message_1:
-                                temp_user_id = message_1.split('@')[0]
-                            elif isinstance(message_1, dict):
-                                # 从字典中提取用户ID
-                                if "10" in message_1 and isinstance(message_1["10"], dict):
-                                    temp_user_id = message_1["10"].get("senderUserId", "unknown_user")
-                                else:
-                                    temp_user_id = "unknown_user"
-                            else:
-                                temp_user_id = "unknown_user"
-                        except:
-                            temp_user_id = "unknown_user"
+            # 一次性解析消息字段，后续各阶段直接使用解析结果
+            with MESSAGE_STAGE_SECONDS.time('parse'):
+                parsed = parse_message(message)
 
-                        # 提取商品ID
-                        try:
-                            if "1" in message and isinstance(message["1"], dict) and "10" in message["1"] and isinstance(message["1"]["10"], dict):
-                                url_info = message["1"]["10"].get("reminderUrl", "")
-                                if isinstance(url_info, str) and "itemId=" in url_info:
-                                    temp_item_id = url_info.split("itemId=")[1].split("&")[0]
-
-                            if not temp_item_id:
-                                temp_item_id = self.extract_item_id_from_message(message)
-                        except:
-                            pass
-
-                        # 调用订单详情获取方法
-                        order_detail = await self.fetch_order_detail_info(order_id, temp_item_id, temp_user_id)
-                        if order_detail:
-                            logger.info(f'[{msg_time}] 【{self.cookie_id}】✅ 订单详情获取成功: {order_id}')
-                        else:
-                            logger.warning(f'[{msg_time}] 【{self.cookie_id}】⚠️ 订单详情获取失败: {order_id}')
+            # 补发的消息可能与实时推送重叠，已处理过的消息不再处理
+            dedupe_key = parsed.message_id or pts
+            if dedupe_key and not self.message_dedupe.first_seen(dedupe_key):
+                SYNC_DUPLICATES_TOTAL.inc(self.cookie_id)
+                logger.debug(f"【{self.cookie_id}】跳过已处理的消息: {dedupe_key}")
+                return
+            if pts and pts < self._sync_connected_pts:
+                SYNC_BACKFILL_MESSAGES_TOTAL.inc(self.cookie_id)
 
-                    except Exception as detail_e:
-                        logger.error(f'[{msg_time}] 【{self.cookie_id}】❌ 获取订单详情异常: {self._safe_str(detail_e)}')
-                else:
-                    logger.debug(f"【{self.cookie_id}】未检测到订单ID")
-            except Exception as e:
-                logger.error(f"【{self.cookie_id}】提取订单ID失败: {self._safe_str(e)}")
+            # 【优先处理】检测到订单ID时立即获取订单详情
+            order_id = parsed.order_id
+            if order_id:
+                msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+                logger.info(f'[{msg_time}] 【{self.cookie_id}】✅ 检测到订单ID: {order_id}，开始获取订单详情')
 
-            # 安全地获取用户ID
-            user_id = None
-            try:
-                message_1 = message.get("1")
-                if isinstance(message_1, str) and '@' in message_1:
-                    user_id = message_1.split('@')[0]
-                elif isinstance(message_1, dict):
-                    # 如果message['1']是字典，从message["1"]["10"]["senderUserId"]中提取user_id
-                    if "10" in message_1 and isinstance(message_1["10"], dict):
-                        user_id = message_1["10"].get("senderUserId", "unknown_user")
+                try:
+                    with MESSAGE_STAGE_SECONDS.time('order_detail'):
+                        order_detail = await self.fetch_order_detail_info(order_id, parsed.item_id, parsed.user_id)
+                    if order_detail:
+                        logger.info(f'[{msg_time}] 【{self.cookie_id}】✅ 订单详情获取成功: {order_id}')
                     else:
-                        user_id = "unknown_user"
-                else:
-                    user_id = "unknown_user"
-            except Exception as e:
-                logger.debug(f"提取用户ID失败: {self._safe_str(e)}")
-                user_id = "unknown_user"
-
-
-
-            # 安全地提取商品ID
-            item_id = None
-            try:
-                if "1" in message and isinstance(message["1"], dict) and "10" in message["1"] and isinstance(message["1"]["10"], dict):
-                    url_info = message["1"]["10"].get("reminderUrl", "")
-                    if isinstance(url_info, str) and "itemId=" in url_info:
-                        item_id = url_info.split("itemId=")[1].split("&")[0]
-
-                # 如果没有提取到，使用辅助方法
-                if not item_id:
-                    item_id = self.extract_item_id_from_message(message)
+                        logger.warning(f'[{msg_time}] 【{self.cookie_id}】⚠️ 订单详情获取失败: {order_id}')
 
-                if not item_id:
-                    item_id = f"auto_{user_id}_{int(time.time())}"
-                    logger.debug(f"无法提取商品ID，使用默认值: {item_id}")
+                except Exception as detail_e:
+                    logger.error(f'[{msg_time}] 【{self.cookie_id}】❌ 获取订单详情异常: {self._safe_str(detail_e)}')
+            else:
+                logger.debug(f"【{self.cookie_id}】未检测到订单ID")
 
-            except Exception as e:
-                logger.error(f"提取商品ID时发生错误: {self._safe_str(e)}")
+            user_id = parsed.user_id
+            item_id = parsed.item_id
+            if not item_id:
                 item_id = f"auto_{user_id}_{int(time.time())}"
-            # 处理订单状态消息
-            try:
-                logger.info(message)
-                msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-
-                # 安全地检查订单状态
-                red_reminder = None
-                if isinstance(message, dict) and "3" in message and isinstance(message["3"], dict):
-                    red_reminder = message["3"].get("redReminder")
+                logger.debug(f"无法提取商品ID，使用默认值: {item_id}")
 
-                if red_reminder == '等待买家付款':
-                    user_url = f'https://www.goofish.com/personal?userId={user_id}'
-                    logger.info(f'[{msg_time}] 【系统】等待买家 {user_url} 付款')
-                    return
-                elif red_reminder == '交易关闭':
-                    user_url = f'https://www.goofish.com/personal?userId={user_id}'
-                    logger.info(f'[{msg_time}] 【系统】买家 {user_url} 交易关闭')
+            # 处理订单状态消息
+            logger.info(message)
+            msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            red_reminder_state = RED_REMINDER_STATES.get(parsed.red_reminder)
+            if red_reminder_state:
+                description, stop = red_reminder_state
+                user_url = f'https://www.goofish.com/personal?userId={user_id}'
+                logger.info(f'[{msg_time}] 【系统】{description.format(user_url=user_url)}')
+                if stop:
                     return
-                elif red_reminder == '等待卖家发货':
-                    user_url = f'https://www.goofish.com/personal?userId={user_id}'
-                    logger.info(f'[{msg_time}] 【系统】交易成功 {user_url} 等待卖家发货')
-                    # return
-            except:
-                pass
 
             # 判断是否为聊天消息
-            if not self.is_chat_message(message):
+            if not parsed.is_chat:
                 logger.debug("非聊天消息")
                 return
 
-            # 处理聊天消息
-            try:
-                # 安全地提取聊天消息信息
-                if not (isinstance(message, dict) and "1" in message and isinstance(message["1"], dict)):
-                    logger.error("消息格式错误：缺少必要的字段结构")
-                    return
-
-                message_1 = message["1"]
-                if not isinstance(message_1.get("10"), dict):
-                    logger.error("消息格式错误：缺少消息详情字段")
-                    return
-
-                create_time = int(message_1.get("5", 0))
-                message_10 = message_1["10"]
-                send_user_name = message_10.get("senderNick", message_10.get("reminderTitle", "未知用户"))
-                send_user_id = message_10.get("senderUserId", "unknown")
-                send_message = message_10.get("reminderContent", "")
-
-                chat_id_raw = message_1.get("2", "")
-                chat_id = chat_id_raw.split('@')[0] if '@' in str(chat_id_raw) else str(chat_id_raw)
-
-            except Exception as e:
-                logger.error(f"提取聊天消息信息失败: {self._safe_str(e)}")
-                return
+            create_time = parsed.create_time
+            send_user_name = parsed.send_user_name
+            send_user_id = parsed.send_user_id
+            send_message = parsed.send_message
+            chat_id = parsed.chat_id
 
             # 格式化消息时间
             msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(create_time/1000))
@@ -4912,7 +4677,8 @@ class XianyuLive:
 
                 # 🔔 立即发送消息通知（独立于自动回复功能）
                 try:
-                    await self.send_notification(send_user_name, send_user_id, send_message, item_id, chat_id)
+                    with MESSAGE_STAGE_SECONDS.time('notification'):
+                        await self.send_notification(send_user_name, send_user_id, send_message, item_id, chat_id)
                 except Exception as notify_error:
                     logger.error(f"📱 发送消息通知失败: {self._safe_str(notify_error)}")
 
@@ -4920,63 +4686,21 @@ class XianyuLive:
 
 
             # 【优先处理】检查系统消息和自动发货触发消息（不受人工接入暂停影响）
-            if send_message == '[我已拍下，待付款]':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】系统消息不处理')
-                return
-            elif send_message == '[你关闭了订单，钱款已原路退返]':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】系统消息不处理')
-                return
-            elif send_message == '发来一条消息':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】系统通知消息不处理')
-                return
-            elif send_message == '发来一条新消息':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】系统通知消息不处理')
-                return
-            elif send_message == '[买家确认收货，交易成功]':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】交易完成消息不处理')
-                return
-            elif send_message == '快给ta一个评价吧~' or send_message == '快给ta一个评价吧～':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】评价提醒消息不处理')
-                return
-            elif send_message == '卖家人不错？送Ta闲鱼小红花':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】小红花提醒消息不处理')
-                return
-            elif send_message == '[你已确认收货，交易成功]':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】买家确认收货消息不处理')
-                return
-            elif send_message == '[你已发货]':
-                logger.info(f'[{msg_time}] 【{self.cookie_id}】发货确认消息不处理')
+            if parsed.kind == KIND_SYSTEM:
+                logger.info(f'[{msg_time}] 【{self.cookie_id}】{SYSTEM_MESSAGES[send_message]}')
                 return
             # 【重要】检查是否为自动发货触发消息 - 即使在人工接入暂停期间也要处理
-            elif self._is_auto_delivery_trigger(send_message):
+            elif parsed.kind == KIND_DELIVERY:
                 logger.info(f'[{msg_time}] 【{self.cookie_id}】检测到自动发货触发消息，即使在暂停期间也继续处理: {send_message}')
                 # 使用统一的自动发货处理方法
-                await self._handle_auto_delivery(websocket, message, send_user_name, send_user_id,
+                await self._handle_auto_delivery(websocket, parsed, send_user_name, send_user_id,
                                                item_id, chat_id, msg_time)
                 return
             # 【重要】检查是否为"我已小刀，待刀成"卡片消息 - 即使在人工接入暂停期间也要处理
-            elif send_message == '[卡片消息]':
+            elif parsed.kind == KIND_CARD:
                 # 检查是否为"我已小刀，待刀成"的卡片消息
                 try:
-                    # 从消息中提取卡片内容
-                    card_title = None
-                    if isinstance(message, dict) and "1" in message and isinstance(message["1"], dict):
-                        message_1 = message["1"]
-                        if "6" in message_1 and isinstance(message_1["6"], dict):
-                            message_6 = message_1["6"]
-                            if "3" in message_6 and isinstance(message_6["3"], dict):
-                                message_6_3 = message_6["3"]
-                                if "5" in message_6_3:
-                                    # 解析JSON内容
-                                    try:
-                                        card_content = json.loads(message_6_3["5"])
-                                        if "dxCard" in card_content and "item" in card_content["dxCard"]:
-                                            card_item = card_content["dxCard"]["item"]
-                                            if "main" in card_item and "exContent" in card_item["main"]:
-                                                ex_content = card_item["main"]["exContent"]
-                                                card_title = ex_content.get("title", "")
-                                    except (json.JSONDecodeError, KeyError) as e:
-                                        logger.debug(f"解析卡片消息失败: {e}")
+                    card_title = parsed.card_title
 
                     # 检查是否为"我已小刀，待刀成"
                     if card_title == "我已小刀，待刀成":
@@ -4995,8 +4719,7 @@ class XianyuLive:
                                 logger.error(f'[{msg_time}] 【{self.cookie_id}】检查商品归属失败: {self._safe_str(e)}，跳过免拼发货')
                                 return
 
-                        # 提取订单ID
-                        order_id = self._extract_order_id(message)
+                        order_id = parsed.order_id
                         if not order_id:
                             logger.warning(f'[{msg_time}] 【{self.cookie_id}】❌ 未能提取到订单ID，无法执行免拼发货')
                             return
@@ -5010,7 +4733,7 @@ class XianyuLive:
                             logger.info(f'[{msg_time}] 【{self.cookie_id}】✅ 自动免拼发货成功')
                         else:
                             logger.warning(f'[{msg_time}] 【{self.cookie_id}】❌ 自动免拼发货失败: {result.get("error", "未知错误")}')
-                        await self._handle_auto_delivery(websocket, message, send_user_name, send_user_id,
+                        await self._handle_auto_delivery(websocket, parsed, send_user_name, send_user_id,
                                                        item_id, chat_id, msg_time)
                         return
                     else:
@@ -5040,10 +4763,11 @@ class XianyuLive:
             reply = None
             # 判断是否启用API回复
             if AUTO_REPLY.get('api', {}).get('enabled', False):
-                reply = await self.get_api_reply(
-                    msg_time, user_url, send_user_id, send_user_name,
-                    item_id, send_message, chat_id
-                )
+                with MESSAGE_STAGE_SECONDS.time('reply_api'):
+                    reply = await self.get_api_reply(
+                        msg_time, user_url, send_user_id, send_user_name,
+                        item_id, send_message, chat_id
+                    )
                 if not reply:
                     logger.error(f"[{msg_time}] 【API调用失败】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): {send_message}")
 
@@ -5054,24 +4778,37 @@ class XianyuLive:
             # 如果API回复失败或未启用API，按新的优先级顺序处理
             if not reply:
                 # 1. 首先尝试关键词匹配（传入商品ID）
-                reply = await self.get_keyword_reply(send_user_name, send_user_id, send_message, item_id)
+                with MESSAGE_STAGE_SECONDS.time('reply_keyword'):
+                    reply = await self.get_keyword_reply(send_user_name, send_user_id, send_message, item_id)
                 if reply == "EMPTY_REPLY":
                     # 匹配到关键词但回复内容为空，不进行任何回复
                     logger.info(f"[{msg_time}] 【{self.cookie_id}】匹配到空回复关键词，跳过自动回复")
+                    REPLIES_TOTAL.inc('empty')
                     return
                 elif reply:
                     reply_source = '关键词'  # 标记为关键词回复
                 else:
                     # 2. 关键词匹配失败，如果AI开关打开，尝试AI回复
-                    reply = await self.get_ai_reply(send_user_name, send_user_id, send_message, item_id, chat_id)
+                    with MESSAGE_STAGE_SECONDS.time('reply_ai'):
+                        async def send_late_ai_reply(late_reply: str):
+                            try:
+                                await self.send_msg(websocket, chat_id, send_user_id, late_reply)
+                                logger.info(f"【{self.cookie_id}】【AI补发】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): {late_reply}")
+                            except Exception as e:
+                                logger.error(f"补发AI回复失败: {self._safe_str(e)}")
+
+                        reply = await self.get_ai_reply(send_user_name, send_user_id, send_message, item_id, chat_id,
+                                                        on_late=send_late_ai_reply)
                     if reply:
                         reply_source = 'AI'  # 标记为AI回复
                     else:
                         # 3. 最后使用默认回复
-                        reply = await self.get_default_reply(send_user_name, send_user_id, send_message, chat_id, item_id)
+                        with MESSAGE_STAGE_SECONDS.time('reply_default'):
+                            reply = await self.get_default_reply(send_user_name, send_user_id, send_message, chat_id, item_id)
                         if reply == "EMPTY_REPLY":
                             # 默认回复内容为空，不进行任何回复
                             logger.info(f"[{msg_time}] 【{self.cookie_id}】默认回复内容为空，跳过自动回复")
+                            REPLIES_TOTAL.inc('empty')
                             return
                         reply_source = '默认'  # 标记为默认回复
 
@@ -5080,6 +4817,7 @@ class XianyuLive:
             # 消息通知已在收到消息时立即发送，此处不再重复发送
 
             # 如果有回复内容，发送消息
+            REPLIES_TOTAL.inc(REPLY_SOURCE_LABELS.get(reply_source, reply_source) if reply else 'none')
             if reply:
                 # 检查是否是图片发送标记
                 if reply.startswith("__IMAGE_SEND__"):
@@ -5087,7 +4825,8 @@ class XianyuLive:
                     image_url = reply.replace("__IMAGE_SEND__", "")
                     # 发送图片消息
                     try:
-                        await self.send_image_msg(websocket, chat_id, send_user_id, image_url)
+                        with MESSAGE_STAGE_SECONDS.time('send_image'):
+                            await self.send_image_msg(websocket, chat_id, send_user_id, image_url)
                         # 记录发出的图片消息
                         msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
                         logger.info(f"[{msg_time}] 【{reply_source}图片发出】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): 图片 {image_url}")
@@ -5099,7 +4838,8 @@ class XianyuLive:
                         logger.error(f"[{msg_time}] 【{reply_source}图片发送失败】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id})")
                 else:
                     # 普通文本消息
-                    await self.send_msg(websocket, chat_id, send_user_id, reply)
+                    with MESSAGE_STAGE_SECONDS.time('send_msg'):
+                        await self.send_msg(websocket, chat_id, send_user_id, reply)
                     # 记录发出的消息
                     msg_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
                     logger.info(f"[{msg_time}] 【{reply_source}发出】用户: {send_user_name} (ID: {send_user_id}), 商品({item_id}): {reply}")
@@ -5109,7 +4849,7 @@ class XianyuLive:
 
         except Exception as e:
             logger.error(f"处理消息时发生错误: {self._safe_str(e)}")
-            logger.debug(f"原始消息: {message_data}")
+            logger.debug(f"原始消息: {sync_data}")
 
     async def main(self):
         """主程序入口"""
@@ -5118,6 +4858,13 @@ class XianyuLive:
             await self.create_session()  # 创建session
             logger.info(f"【{self.cookie_id}】Session创建完成，开始WebSocket连接循环...")
 
+            # 启动延时发货调度协程（所有账号共用一个，已启动时直接返回）
+            job_scheduler.register(DELAYED_DELIVERY_JOB, XianyuLive._run_delayed_delivery)
+            job_scheduler.start()
+            # 补充开启预取的API卡券的预取池（所有账号共用，已启动时直接返回）
+            card_prefetcher.start()
+
+            connect_attempted = False
             while True:
                 try:
                     # 检查账号是否启用
@@ -5132,12 +4879,17 @@ class XianyuLive:
                     logger.info(f"【{self.cookie_id}】准备建立WebSocket连接到: {self.base_url}")
                     logger.debug(f"【{self.cookie_id}】WebSocket headers: {headers}")
 
+                    if connect_attempted:
+                        WS_RECONNECTS_TOTAL.inc(self.cookie_id)
+                    connect_attempted = True
+
                     # 兼容不同版本的websockets库
                     websocket = await self._create_websocket_connection(headers)
                     if websocket and hasattr(websocket, 'closed'):
                         try:
                             logger.info(f"【{self.cookie_id}】WebSocket连接建立成功！")
                             self.ws = websocket
+                            self._connection_dead = False
 
                             # 更新连接状态
                             self.connection_failures = 0
@@ -5186,6 +4938,8 @@ class XianyuLive:
                                     logger.error(f"处理消息出错: {self._safe_str(e)}")
                                     continue
                         finally:
+                            # 断开前保存同步位置，重连（或重启）后从这里继续
+                            self._save_sync_cursor(force=True)
                             # 确保WebSocket连接被正确关闭
                             if websocket and hasattr(websocket, 'closed') and not websocket.closed:
                                 try:
@@ -5199,6 +4953,19 @@ class XianyuLive:
 
                 except Exception as e:
                     error_msg = self._safe_str(e)
+
+                    # 心跳判定失效的连接：连接本身刚建立成功过，不计入失败次数，跳过重连等待
+                    if self._connection_dead:
+                        self._connection_dead = False
+                        logger.warning(f"【{self.cookie_id}】失效连接已断开，立即重新连接: {error_msg}")
+                        if self.heartbeat_task:
+                            self.heartbeat_task.cancel()
+                            self.heartbeat_task = None
+                        if self.token_refresh_task:
+                            self.token_refresh_task.cancel()
+                            self.token_refresh_task = None
+                        continue
+
                     self.connection_failures += 1
                     self.total_retry_attempts += 1
 
@@ -5299,7 +5066,7 @@ class XianyuLive:
             logger.info(f"【{self.cookie_id}】XianyuLive主程序已完全退出")
 
     async def get_item_list_info(self, page_number=1, page_size=20, retry_count=0):
-        """获取商品信息，自动处理token失效的情况
+        """获取商品信息，token失效、风控等由mtop客户端统一重试
 
         Args:
             page_number (int): 页码，从1开始
@@ -5310,26 +5077,6 @@ class XianyuLive:
             logger.error("获取商品信息失败，重试次数过多")
             return {"error": "获取商品信息失败，重试次数过多"}
 
-        # 确保session已创建
-        if not self.session:
-            await self.create_session()
-
-        params = {
-            'jsv': '2.7.2',
-            'appKey': '34839810',
-            't': str(int(time.time()) * 1000),
-            'sign': '',
-            'v': '1.0',
-            'type': 'originaljson',
-            'accountSite': 'xianyu',
-            'dataType': 'json',
-            'timeout': '20000',
-            'api': 'mtop.idle.web.xyh.item.list',
-            'sessionOption': 'AutoLoginOnly',
-            'spm_cnt': 'a21ybx.im.0.0',
-            'spm_pre': 'a21ybx.collection.menu.1.272b5141NafCNK'
-        }
-
         data = {
             'needGroupInfo': False,
             'pageNumber': page_number,
@@ -5340,131 +5087,91 @@ class XianyuLive:
             "userId": self.myid
         }
 
-        # 始终从最新的cookies中获取_m_h5_tk token（刷新后cookies会被更新）
-        token = trans_cookies(self.cookies_str).get('_m_h5_tk', '').split('_')[0] if trans_cookies(self.cookies_str).get('_m_h5_tk') else ''
-
-        logger.warning(f"准备获取商品列表，token: {token}")
-        if token:
-            logger.debug(f"使用cookies中的_m_h5_tk token: {token}")
-        else:
-            logger.warning("cookies中没有找到_m_h5_tk token")
-
-        # 生成签名
-        data_val = json.dumps(data, separators=(',', ':'))
-        sign = generate_sign(params['t'], token, data_val)
-        params['sign'] = sign
-
         try:
-            async with self.session.post(
-                'https://h5api.m.goofish.com/h5/mtop.idle.web.xyh.item.list/1.0/',
-                params=params,
-                data={'data': data_val}
-            ) as response:
-                res_json = await response.json()
-
-                # 检查并更新Cookie
-                if 'set-cookie' in response.headers:
-                    new_cookies = {}
-                    for cookie in response.headers.getall('set-cookie', []):
-                        if '=' in cookie:
-                            name, value = cookie.split(';')[0].split('=', 1)
-                            new_cookies[name.strip()] = value.strip()
-
-                    # 更新cookies
-                    if new_cookies:
-                        self.cookies.update(new_cookies)
-                        # 生成新的cookie字符串
-                        self.cookies_str = '; '.join([f"{k}={v}" for k, v in self.cookies.items()])
-                        # 更新数据库中的Cookie
-                        await self.update_config_cookies()
-                        logger.debug("已更新Cookie到数据库")
-
-                logger.info(f"商品信息获取响应: {res_json}")
-
-                # 检查响应是否成功
-                if res_json.get('ret') and res_json['ret'][0] == 'SUCCESS::调用成功':
-                    items_data = res_json.get('data', {})
-                    # 从cardList中提取商品信息
-                    card_list = items_data.get('cardList', [])
-
-                    # 解析cardList中的商品信息
-                    items_list = []
-                    for card in card_list:
-                        card_data = card.get('cardData', {})
-                        if card_data:
-                            # 提取商品基本信息
-                            item_info = {
-                                'id': card_data.get('id', ''),
-                                'title': card_data.get('title', ''),
-                                'price': card_data.get('priceInfo', {}).get('price', ''),
-                                'price_text': card_data.get('priceInfo', {}).get('preText', '') + card_data.get('priceInfo', {}).get('price', ''),
-                                'category_id': card_data.get('categoryId', ''),
-                                'auction_type': card_data.get('auctionType', ''),
-                                'item_status': card_data.get('itemStatus', 0),
-                                'detail_url': card_data.get('detailUrl', ''),
-                                'pic_info': card_data.get('picInfo', {}),
-                                'detail_params': card_data.get('detailParams', {}),
-                                'track_params': card_data.get('trackParams', {}),
-                                'item_label_data': card_data.get('itemLabelDataVO', {}),
-                                'card_type': card.get('cardType', 0)
-                            }
-                            items_list.append(item_info)
-
-                    logger.info(f"成功获取到 {len(items_list)} 个商品")
-
-                    # 打印商品详细信息到控制台
-                    print("\n" + "="*80)
-                    print(f"📦 账号 {self.myid} 的商品列表 (第{page_number}页，{len(items_list)} 个商品)")
-                    print("="*80)
-
-                    for i, item in enumerate(items_list, 1):
-                        print(f"\n🔸 商品 {i}:")
-                        print(f"   商品ID: {item.get('id', 'N/A')}")
-                        print(f"   商品标题: {item.get('title', 'N/A')}")
-                        print(f"   价格: {item.get('price_text', 'N/A')}")
-                        print(f"   分类ID: {item.get('category_id', 'N/A')}")
-                        print(f"   商品状态: {item.get('item_status', 'N/A')}")
-                        print(f"   拍卖类型: {item.get('auction_type', 'N/A')}")
-                        print(f"   详情链接: {item.get('detail_url', 'N/A')}")
-                        if item.get('pic_info'):
-                            pic_info = item['pic_info']
-                            print(f"   图片信息: {pic_info.get('width', 'N/A')}x{pic_info.get('height', 'N/A')}")
-                            print(f"   图片链接: {pic_info.get('picUrl', 'N/A')}")
-                        print(f"   完整信息: {json.dumps(item, ensure_ascii=False, indent=2)}")
-
-                    print("\n" + "="*80)
-                    print("✅ 商品列表获取完成")
-                    print("="*80)
-
-                    # 自动保存商品信息到数据库
-                    if items_list:
-                        saved_count = await self.save_items_list_to_db(items_list)
-                        logger.info(f"已将 {saved_count} 个商品信息保存到数据库")
-
-                    return {
-                        "success": True,
-                        "page_number": page_number,
-                        "page_size": page_size,
-                        "current_count": len(items_list),
-                        "items": items_list,
-                        "saved_count": saved_count if items_list else 0,
-                        "raw_data": items_data  # 保留原始数据以备调试
-                    }
-                else:
-                    # 检查是否是token失效
-                    error_msg = res_json.get('ret', [''])[0] if res_json.get('ret') else ''
-                    if 'FAIL_SYS_TOKEN_EXOIRED' in error_msg or 'token' in error_msg.lower():
-                        logger.warning(f"Token失效，准备重试: {error_msg}")
-                        await asyncio.sleep(0.5)
-                        return await self.get_item_list_info(page_number, page_size, retry_count + 1)
-                    else:
-                        logger.error(f"获取商品信息失败: {res_json}")
-                        return {"error": f"获取商品信息失败: {error_msg}"}
-
+            res_json = await self.mtop.call(
+                'mtop.idle.web.xyh.item.list', data,
+                params={'spm_cnt': 'a21ybx.im.0.0', 'spm_pre': 'a21ybx.collection.menu.1.272b5141NafCNK'},
+                max_retries=max(0, self.mtop.max_retries - retry_count)
+            )
         except Exception as e:
             logger.error(f"商品信息API请求异常: {self._safe_str(e)}")
-            await asyncio.sleep(0.5)
-            return await self.get_item_list_info(page_number, page_size, retry_count + 1)
+            return {"error": f"商品信息API请求异常: {self._safe_str(e)}"}
+
+        logger.info(f"商品信息获取响应: {res_json}")
+
+        # 检查响应是否成功（token失效、风控等已由mtop客户端重试）
+        if classify_mtop_response(res_json) != RET_SUCCESS:
+            error_msg = res_json.get('ret', [''])[0] if isinstance(res_json, dict) and res_json.get('ret') else ''
+            logger.error(f"获取商品信息失败: {res_json}")
+            return {"error": f"获取商品信息失败: {error_msg}"}
+
+        items_data = res_json.get('data', {})
+        # 从cardList中提取商品信息
+        card_list = items_data.get('cardList', [])
+
+        # 解析cardList中的商品信息
+        items_list = []
+        for card in card_list:
+            card_data = card.get('cardData', {})
+            if card_data:
+                # 提取商品基本信息
+                item_info = {
+                    'id': card_data.get('id', ''),
+                    'title': card_data.get('title', ''),
+                    'price': card_data.get('priceInfo', {}).get('price', ''),
+                    'price_text': card_data.get('priceInfo', {}).get('preText', '') + card_data.get('priceInfo', {}).get('price', ''),
+                    'category_id': card_data.get('categoryId', ''),
+                    'auction_type': card_data.get('auctionType', ''),
+                    'item_status': card_data.get('itemStatus', 0),
+                    'detail_url': card_data.get('detailUrl', ''),
+                    'pic_info': card_data.get('picInfo', {}),
+                    'detail_params': card_data.get('detailParams', {}),
+                    'track_params': card_data.get('trackParams', {}),
+                    'item_label_data': card_data.get('itemLabelDataVO', {}),
+                    'card_type': card.get('cardType', 0)
+                }
+                items_list.append(item_info)
+
+        logger.info(f"成功获取到 {len(items_list)} 个商品")
+
+        # 打印商品详细信息到控制台
+        print("\n" + "="*80)
+        print(f"📦 账号 {self.myid} 的商品列表 (第{page_number}页，{len(items_list)} 个商品)")
+        print("="*80)
+
+        for i, item in enumerate(items_list, 1):
+            print(f"\n🔸 商品 {i}:")
+            print(f"   商品ID: {item.get('id', 'N/A')}")
+            print(f"   商品标题: {item.get('title', 'N/A')}")
+            print(f"   价格: {item.get('price_text', 'N/A')}")
+            print(f"   分类ID: {item.get('category_id', 'N/A')}")
+            print(f"   商品状态: {item.get('item_status', 'N/A')}")
+            print(f"   拍卖类型: {item.get('auction_type', 'N/A')}")
+            print(f"   详情链接: {item.get('detail_url', 'N/A')}")
+            if item.get('pic_info'):
+                pic_info = item['pic_info']
+                print(f"   图片信息: {pic_info.get('width', 'N/A')}x{pic_info.get('height', 'N/A')}")
+                print(f"   图片链接: {pic_info.get('picUrl', 'N/A')}")
+            print(f"   完整信息: {json.dumps(item, ensure_ascii=False, indent=2)}")
+
+        print("\n" + "="*80)
+        print("✅ 商品列表获取完成")
+        print("="*80)
+
+        # 自动保存商品信息到数据库
+        if items_list:
+            saved_count = await self.save_items_list_to_db(items_list)
+            logger.info(f"已将 {saved_count} 个商品信息保存到数据库")
+
+        return {
+            "success": True,
+            "page_number": page_number,
+            "page_size": page_size,
+            "current_count": len(items_list),
+            "items": items_list,
+            "saved_count": saved_count if items_list else 0,
+            "raw_data": items_data  # 保留原始数据以备调试
+        }
 
     async def get_all_items(self, page_size=20, max_pages=None):
         """获取所有商品信息（自动分页）
@@ -5661,12 +5368,9 @@ class XianyuLive:
             if image_url:
                 # 获取图片信息
                 from utils.image_utils import image_manager
-                try:
-                    from PIL import Image
-                    with Image.open(image_path) as img:
-                        width, height = img.size
-                except Exception as e:
-                    logger.warning(f"无法获取图片尺寸，使用默认值: {e}")
+                width, height = image_manager.get_image_size(image_path)
+                if not width or not height:
+                    logger.warning(f"无法获取图片尺寸，使用默认值: {image_path}")
                     width, height = 800, 600
 
                 # 发送图片消息
@@ -8,10 +8,15 @@ import json
 import time
 import sqlite3
 import requests
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, TYPE_CHECKING
 from loguru import logger
-from openai import OpenAI
 from db_manager import db_manager
+from utils.chat_state import chat_state_store
+from utils.ai_guard import AIConfigError, ai_reply_guard
+from utils.intent_classifier import intent_classifier
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 
 class AIReplyEngine:
@@ -54,9 +59,14 @@ class AIReplyEngine:
 注意：结合商品信息，给出实用建议。'''
         }
     
-    def get_client(self, cookie_id: str) -> Optional[OpenAI]:
+    def get_settings(self, cookie_id: str) -> dict:
+        """获取账号的AI回复设置（缓存在会话状态缓存中，修改设置时失效）"""
+        return chat_state_store.account_value(cookie_id, 'ai_settings',
+                                              lambda: db_manager.get_ai_reply_settings(cookie_id))
+
+    def get_client(self, cookie_id: str) -> Optional['OpenAI']:
         """获取指定账号的OpenAI客户端"""
-        settings = db_manager.get_ai_reply_settings(cookie_id)
+        settings = self.get_settings(cookie_id)
         if not settings['ai_enabled'] or not settings['api_key']:
             # 如果AI功能被禁用或没有API密钥，清理已存在的客户端
             if cookie_id in self.clients:
@@ -84,9 +94,13 @@ class AIReplyEngine:
             
             try:
                 logger.info(f"创建OpenAI客户端 {cookie_id}: base_url={settings['base_url']}, api_key={'***' + settings['api_key'][-4:] if settings['api_key'] else 'None'}")
+                from openai import OpenAI  # 按需加载，仅在启用AI回复的账号上导入
+
+                # 超出补发时间窗口的结果不会再发送，请求最多等待到窗口结束，避免长期占用AI调用的并发名额
                 self.clients[cookie_id] = OpenAI(
                     api_key=settings['api_key'],
-                    base_url=settings['base_url']
+                    base_url=settings['base_url'],
+                    timeout=max(ai_reply_guard.budget, ai_reply_guard.late_window)
                 )
                 # 保存当前配置用于变更检测
                 self.client_configs[cookie_id] = current_config
@@ -123,7 +137,7 @@ class AIReplyEngine:
         if '/apps/' in base_url:
             app_id = base_url.split('/apps/')[-1].split('/')[0]
         else:
-            raise ValueError("DashScope API URL中未找到app_id")
+            raise AIConfigError("DashScope API URL中未找到app_id")
 
         # 构建请求URL
         url = f"https://dashscope.aliyuncs.com/api/v1/apps/{app_id}/completion"
@@ -171,7 +185,8 @@ class AIReplyEngine:
 
         if response.status_code != 200:
             logger.error(f"DashScope API请求失败: {response.status_code} - {response.text}")
-            raise Exception(f"DashScope API请求失败: {response.status_code} - {response.text}")
+            raise requests.HTTPError(f"DashScope API请求失败: {response.status_code} - {response.text}",
+                                     response=response)
 
         result = response.json()
         logger.debug(f"DashScope API响应: {json.dumps(result, ensure_ascii=False)}")
@@ -182,7 +197,7 @@ class AIReplyEngine:
         else:
             raise Exception(f"DashScope API响应格式错误: {result}")
 
-    def _call_openai_api(self, client: OpenAI, settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
+    def _call_openai_api(self, client: 'OpenAI', settings: dict, messages: list, max_tokens: int = 100, temperature: float = 0.7) -> str:
         """调用OpenAI兼容API"""
         response = client.chat.completions.create(
             model=settings['model_name'],
@@ -194,17 +209,26 @@ class AIReplyEngine:
 
     def is_ai_enabled(self, cookie_id: str) -> bool:
         """检查指定账号是否启用AI回复"""
-        settings = db_manager.get_ai_reply_settings(cookie_id)
+        settings = self.get_settings(cookie_id)
         return settings['ai_enabled']
     
     def detect_intent(self, message: str, cookie_id: str) -> str:
         """检测用户消息意图"""
         try:
-            settings = db_manager.get_ai_reply_settings(cookie_id)
+            settings = self.get_settings(cookie_id)
             if not settings['ai_enabled'] or not settings['api_key']:
                 return 'default'
 
             custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
+
+            # 本地分类器有把握时不再调用大模型；自定义了分类提示词的账号按提示词判断，不使用本地分类
+            if 'classify' not in custom_prompts:
+                intent = intent_classifier.predict(
+                    message, lambda limit: self._load_intent_samples(limit, cookie_id), account=cookie_id)
+                if intent:
+                    logger.debug(f"本地意图分类: {intent} (账号: {cookie_id})")
+                    return intent
+
             classify_prompt = custom_prompts.get('classify', self.default_prompts['classify'])
 
             # 打印调试信息
@@ -245,53 +269,69 @@ class AIReplyEngine:
     def generate_reply(self, message: str, item_info: dict, chat_id: str,
                       cookie_id: str, user_id: str, item_id: str) -> Optional[str]:
         """生成AI回复"""
+        try:
+            return self.generate_reply_or_raise(message, item_info, chat_id, cookie_id, user_id, item_id)
+        except Exception as e:
+            logger.error(f"AI回复生成失败 {cookie_id}: {e}")
+            # 打印更详细的错误信息
+            if hasattr(e, 'response') and hasattr(e.response, 'url'):
+                logger.error(f"请求URL: {e.response.url}")
+            if hasattr(e, 'request') and hasattr(e.request, 'url'):
+                logger.error(f"请求URL: {e.request.url}")
+            return None
+
+    def generate_reply_or_raise(self, message: str, item_info: dict, chat_id: str,
+                                cookie_id: str, user_id: str, item_id: str) -> Optional[str]:
+        """生成AI回复，调用失败时抛出异常（供AI回复保护统计失败率）"""
         if not self.is_ai_enabled(cookie_id):
             return None
-        
+
+        # 1. 获取AI回复设置
+        settings = self.get_settings(cookie_id)
+
+        # 2. 检测意图
+        intent = self.detect_intent(message, cookie_id)
+        logger.info(f"检测到意图: {intent} (账号: {cookie_id})")
+
+        # 3. 获取对话历史
+        context = self.get_conversation_context(chat_id, cookie_id)
+
+        # 4. 获取议价次数
+        bargain_count = self.get_bargain_count(chat_id, cookie_id)
+
+        # 5. 检查议价轮数限制
+        if intent == "price":
+            max_bargain_rounds = settings.get('max_bargain_rounds', 3)
+            if bargain_count >= max_bargain_rounds:
+                logger.info(f"议价次数已达上限 ({bargain_count}/{max_bargain_rounds})，拒绝继续议价")
+                # 返回拒绝议价的回复
+                refuse_reply = f"抱歉，这个价格已经是最优惠的了，不能再便宜了哦！"
+                # 保存对话记录
+                self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
+                self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", refuse_reply, intent)
+                return refuse_reply
+
+        # 6. 构建提示词
         try:
-            # 1. 获取AI回复设置
-            settings = db_manager.get_ai_reply_settings(cookie_id)
-
-            # 2. 检测意图
-            intent = self.detect_intent(message, cookie_id)
-            logger.info(f"检测到意图: {intent} (账号: {cookie_id})")
-
-            # 3. 获取对话历史
-            context = self.get_conversation_context(chat_id, cookie_id)
-
-            # 4. 获取议价次数
-            bargain_count = self.get_bargain_count(chat_id, cookie_id)
-
-            # 5. 检查议价轮数限制
-            if intent == "price":
-                max_bargain_rounds = settings.get('max_bargain_rounds', 3)
-                if bargain_count >= max_bargain_rounds:
-                    logger.info(f"议价次数已达上限 ({bargain_count}/{max_bargain_rounds})，拒绝继续议价")
-                    # 返回拒绝议价的回复
-                    refuse_reply = f"抱歉，这个价格已经是最优惠的了，不能再便宜了哦！"
-                    # 保存对话记录
-                    self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
-                    self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", refuse_reply, intent)
-                    return refuse_reply
-
-            # 6. 构建提示词
             custom_prompts = json.loads(settings['custom_prompts']) if settings['custom_prompts'] else {}
-            system_prompt = custom_prompts.get(intent, self.default_prompts[intent])
+        except ValueError as e:
+            raise AIConfigError(f"自定义提示词不是有效的JSON: {e}") from e
+        system_prompt = custom_prompts.get(intent, self.default_prompts[intent])
 
-            # 7. 构建商品信息
-            item_desc = f"商品标题: {item_info.get('title', '未知')}\n"
-            item_desc += f"商品价格: {item_info.get('price', '未知')}元\n"
-            item_desc += f"商品描述: {item_info.get('desc', '无')}"
+        # 7. 构建商品信息
+        item_desc = f"商品标题: {item_info.get('title', '未知')}\n"
+        item_desc += f"商品价格: {item_info.get('price', '未知')}元\n"
+        item_desc += f"商品描述: {item_info.get('desc', '无')}"
 
-            # 8. 构建对话历史
-            context_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in context[-10:]])  # 最近10条
+        # 8. 构建对话历史
+        context_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in context[-10:]])  # 最近10条
 
-            # 9. 构建用户消息
-            max_bargain_rounds = settings.get('max_bargain_rounds', 3)
-            max_discount_percent = settings.get('max_discount_percent', 10)
-            max_discount_amount = settings.get('max_discount_amount', 100)
+        # 9. 构建用户消息
+        max_bargain_rounds = settings.get('max_bargain_rounds', 3)
+        max_discount_percent = settings.get('max_discount_percent', 10)
+        max_discount_amount = settings.get('max_discount_amount', 100)
 
-            user_prompt = f"""商品信息：
+        user_prompt = f"""商品信息：
 {item_desc}
 
 对话历史：
@@ -307,46 +347,38 @@ class AIReplyEngine:
 
 请根据以上信息生成回复："""
 
-            # 10. 调用AI生成回复
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+        # 10. 调用AI生成回复
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
-            # 根据API类型选择调用方式
-            if self._is_dashscope_api(settings):
-                logger.info(f"使用DashScope API生成回复")
-                reply = self._call_dashscope_api(settings, messages, max_tokens=100, temperature=0.7)
-            else:
-                logger.info(f"使用OpenAI兼容API生成回复")
-                client = self.get_client(cookie_id)
-                if not client:
-                    return None
-                reply = self._call_openai_api(client, settings, messages, max_tokens=100, temperature=0.7)
+        # 根据API类型选择调用方式
+        if self._is_dashscope_api(settings):
+            logger.info(f"使用DashScope API生成回复")
+            reply = self._call_dashscope_api(settings, messages, max_tokens=100, temperature=0.7)
+        else:
+            logger.info(f"使用OpenAI兼容API生成回复")
+            client = self.get_client(cookie_id)
+            if not client:
+                return None
+            reply = self._call_openai_api(client, settings, messages, max_tokens=100, temperature=0.7)
 
-            # 11. 保存对话记录
-            self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
-            self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", reply, intent)
+        # 11. 保存对话记录
+        self.save_conversation(chat_id, cookie_id, user_id, item_id, "user", message, intent)
+        self.save_conversation(chat_id, cookie_id, user_id, item_id, "assistant", reply, intent)
 
-            # 12. 更新议价次数
-            if intent == "price":
-                self.increment_bargain_count(chat_id, cookie_id)
-            
-            logger.info(f"AI回复生成成功 (账号: {cookie_id}): {reply}")
-            return reply
-            
-        except Exception as e:
-            logger.error(f"AI回复生成失败 {cookie_id}: {e}")
-            # 打印更详细的错误信息
-            if hasattr(e, 'response') and hasattr(e.response, 'url'):
-                logger.error(f"请求URL: {e.response.url}")
-            if hasattr(e, 'request') and hasattr(e.request, 'url'):
-                logger.error(f"请求URL: {e.request.url}")
-            return None
+        # 12. 更新议价次数
+        if intent == "price":
+            self.increment_bargain_count(chat_id, cookie_id)
+        
+        logger.info(f"AI回复生成成功 (账号: {cookie_id}): {reply}")
+        return reply
     
     def get_conversation_context(self, chat_id: str, cookie_id: str, limit: int = 20) -> List[Dict]:
         """获取对话上下文"""
         try:
+            db_manager.flush_writes('ai_conversations')
             with db_manager.lock:
                 cursor = db_manager.conn.cursor()
                 cursor.execute('''
@@ -365,22 +397,37 @@ class AIReplyEngine:
     
     def save_conversation(self, chat_id: str, cookie_id: str, user_id: str, 
                          item_id: str, role: str, content: str, intent: str = None):
-        """保存对话记录"""
+        """保存对话记录（经写后队列批量写入）"""
         try:
-            with db_manager.lock:
-                cursor = db_manager.conn.cursor()
-                cursor.execute('''
-                INSERT INTO ai_conversations 
-                (cookie_id, chat_id, user_id, item_id, role, content, intent)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (cookie_id, chat_id, user_id, item_id, role, content, intent))
-                db_manager.conn.commit()
+            db_manager.enqueue_write('ai_conversations', '''
+            INSERT INTO ai_conversations 
+            (cookie_id, chat_id, user_id, item_id, role, content, intent)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (cookie_id, chat_id, user_id, item_id, role, content, intent))
+            if role == 'user' and intent == 'price':
+                chat_state_store.add_bargain(cookie_id, chat_id)
         except Exception as e:
             logger.error(f"保存对话记录失败: {e}")
     
+    def _load_intent_samples(self, limit: int, cookie_id: str) -> List[tuple]:
+        """账号最近记录的用户消息及其意图，用于训练该账号的本地意图分类模型"""
+        db_manager.flush_writes('ai_conversations')
+        with db_manager.lock:
+            cursor = db_manager.conn.cursor()
+            cursor.execute('''
+            SELECT content, intent FROM ai_conversations
+            WHERE role = 'user' AND cookie_id = ? AND intent IN ('price', 'tech', 'default')
+            ORDER BY id DESC LIMIT ?
+            ''', (cookie_id, limit))
+            return cursor.fetchall()
+
     def get_bargain_count(self, chat_id: str, cookie_id: str) -> int:
-        """获取议价次数"""
+        """获取议价次数（首次从数据库统计，之后在会话状态中随保存的议价消息累加）"""
+        return chat_state_store.bargain_count(cookie_id, chat_id, lambda: self._load_bargain_count(chat_id, cookie_id))
+
+    def _load_bargain_count(self, chat_id: str, cookie_id: str) -> int:
         try:
+            db_manager.flush_writes('ai_conversations')
             with db_manager.lock:
                 cursor = db_manager.conn.cursor()
                 cursor.execute('''
@@ -396,7 +443,7 @@ class AIReplyEngine:
     
     def increment_bargain_count(self, chat_id: str, cookie_id: str):
         """增加议价次数（通过保存记录自动增加）"""
-        # 议价次数通过查询price意图的用户消息数量来计算，无需单独操作
+        # 议价次数在 save_conversation 保存用户的议价消息时累加，无需单独操作
         pass
     
     def clear_client_cache(self, cookie_id: str = None):
@@ -0,0 +1,159 @@
+"""
+访问日志中间件开销基准 - 直接调用 ASGI 应用（不经过网络），测量每个请求的中间件开销
+
+对比的中间件：
+    none:    无中间件（基线）
+    legacy:  改动前的 log_requests（@app.middleware("http")，每个请求查询会话 + 两条 INFO 日志）
+    access:  AccessLogMiddleware，按 global_config.yml 的 ACCESS_LOG 规则采样
+请求的路由：
+    /admin/logs  管理后台轮询的接口（默认规则不记录）
+    /cookies     普通接口（默认全部记录，写日志在后台线程）
+日志输出到临时目录中的文件（与 file_log_collector 的文件输出相同的配置），请求都携带有效的 Bearer token。
+access 中间件在两个路由上的开销均超出 legacy 的 --max-ratio 倍时以非零状态码退出。
+
+用法:
+    python benchmarks/access_log_bench.py
+    python benchmarks/access_log_bench.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from loguru import logger
+
+ROUTES = ['/admin/logs', '/cookies']
+TOKEN = 'bench-token'
+
+
+def build_app(mode: str):
+    from fastapi import FastAPI
+    from utils.access_log import AccessLogMiddleware, create_access_logger
+    from utils.session_store import session_store
+
+    app = FastAPI()
+
+    @app.get('/admin/logs')
+    async def admin_logs():
+        return {'logs': []}
+
+    @app.get('/cookies')
+    async def cookies():
+        return ['a', 'b']
+
+    def resolve_user(token: str):
+        token_data = session_store.get('token', token)
+        return f"{token_data['username']}#{token_data['user_id']}" if token_data else None
+
+    access_logger = None
+    if mode == 'legacy':
+        @app.middleware("http")
+        async def log_requests(request, call_next):
+            start_time = time.time()
+            user_info = "未登录"
+            try:
+                auth_header = request.headers.get("Authorization")
+                if auth_header and auth_header.startswith("Bearer "):
+                    token = auth_header.split(" ")[1]
+                    token_data = session_store.get('token', token)
+                    if token_data:
+                        user_info = f"【{token_data['username']}#{token_data['user_id']}】"
+            except Exception:
+                pass
+            logger.info(f"🌐 {user_info} API请求: {request.method} {request.url.path}")
+            response = await call_next(request)
+            process_time = time.time() - start_time
+            logger.info(f"✅ {user_info} API响应: {request.method} {request.url.path} - {response.status_code} ({process_time:.3f}s)")
+            return response
+    elif mode == 'access':
+        access_logger = create_access_logger(resolve_user=resolve_user)
+        app.add_middleware(AccessLogMiddleware, access_logger=access_logger)
+    return app, access_logger
+
+
+async def drive(app, path: str, requests: int) -> float:
+    """依次发送 requests 个请求，返回每个请求的平均耗时（微秒）"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'authorization', f'Bearer {TOKEN}'.encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('bench', 80),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    for _ in range(min(200, requests)):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1000000
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='访问日志中间件开销基准')
+    parser.add_argument('--requests', type=int, default=5000, help='每种组合的请求数')
+    parser.add_argument('--max-ratio', type=float, default=0.5, help='access 开销相对 legacy 的上限')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            from utils.session_store import session_store
+            session_store.set('token', TOKEN, {'user_id': 1, 'username': 'admin', 'timestamp': time.time()}, 3600)
+
+            logger.remove()
+            logger.add(os.path.join(work_dir, 'realtime.log'),
+                       format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {name}:{function}:{line} - {message}",
+                       level="DEBUG", enqueue=False, buffering=1)
+
+            results = {}
+            for mode in ('none', 'legacy', 'access'):
+                app, access_logger = build_app(mode)
+                for path in ROUTES:
+                    results[(mode, path)] = asyncio.run(drive(app, path, args.requests))
+                if access_logger:
+                    drain_started = time.perf_counter()
+                    access_logger.flush(timeout=60)
+                    results[('access', 'drain')] = time.perf_counter() - drain_started
+            with open(os.path.join(work_dir, 'realtime.log'), encoding='utf-8') as f:
+                log_lines = sum(1 for _ in f)
+            logger.remove()
+        finally:
+            os.chdir(ROOT_DIR)
+
+    print(f"{'mode':<8}{'route':<14}{'us/request':>12}{'overhead(us)':>14}")
+    overhead = {}
+    for mode in ('none', 'legacy', 'access'):
+        for path in ROUTES:
+            value = results[(mode, path)]
+            overhead[(mode, path)] = value - results[('none', path)]
+            print(f"{mode:<8}{path:<14}{value:>12.1f}{overhead[(mode, path)]:>14.1f}")
+    print(f"日志文件行数: {log_lines}（legacy 每请求2行，access 只记录采样到的请求），"
+          f"后台写入剩余记录耗时 {results[('access', 'drain')]:.2f}s")
+
+    failures = []
+    for path in ROUTES:
+        if overhead[('access', path)] > overhead[('legacy', path)] * args.max_ratio:
+            failures.append(f"{path} access 开销 {overhead[('access', path)]:.1f}us 超过 legacy "
+                            f"{overhead[('legacy', path)]:.1f}us 的 {args.max_ratio} 倍")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 访问日志中间件开销低于改动前")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+AI回复保护基准 - 在本地假的 OpenAI 兼容服务上注入延迟和错误，对比不加保护与加保护时的回复延迟
+
+假服务（独立线程的事件循环，aiohttp）实现 POST /v1/chat/completions，每个请求按概率：
+    --error-rate 返回 500，--slow-rate 延迟 --slow 秒，其余延迟 --fast 秒
+客户端使用真实的 ai_reply_engine（openai 客户端，临时目录中的独立数据库），买家消息按 --rate 条/秒到达，
+每条消息作为一个任务决定回复，统计 到达 -> 得到回复（AI回复或降级后的默认回复）的延迟：
+    unguarded - 原实现：在事件循环中同步调用 generate_reply，慢请求阻塞所有消息
+    guarded   - AIReplyGuard：线程池执行，超出 --budget 秒降级，补发在 late_window 内完成的AI回复
+    outage    - 加保护，前 --outage 秒假服务全部超时，之后恢复正常（不再注入慢请求和错误）：
+                统计熔断降级次数和恢复后的AI回复数
+    badkey    - 加保护，两个账号使用同一服务地址，其中一个的 API Key 已失效（假服务返回401），
+                消息交替到达两个账号：失效的 Key 不应打开熔断器，也不应影响另一个账号的AI回复
+输出各模式的延迟 p50/p90/p99/max、AI回复/降级/补发次数和事件循环延迟。
+guarded 的 p99 超过时间预算的 1.5 倍或不低于 unguarded，outage 中熔断未打开或恢复后没有AI回复，
+badkey 中熔断器打开或正常账号有降级时以非零状态码退出。
+另外检查错误分类：响应不是JSON（网关返回的HTML错误页）计入熔断失败率，AI回复配置错误（AIConfigError）不计入。
+
+用法:
+    python benchmarks/ai_guard_bench.py
+    python benchmarks/ai_guard_bench.py --messages 200 --rate 10 --slow-rate 0.2 --budget 1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from loguru import logger
+
+from chat_state_bench import AI_CONVERSATIONS_SCHEMA
+from replay_bench import monitor_loop_lag, percentile
+
+COOKIE_ID = 'ai_guard'
+BAD_KEY_COOKIE_ID = 'ai_guard_revoked'
+BAD_API_KEY = 'sk-revoked'
+FALLBACK_REASONS = ('timeout', 'error', 'circuit_open', 'saturated', 'client_error')
+DEFAULT_REPLY = '亲，稍后回复您哦'
+
+
+class FakeOpenAIServer:
+    """注入延迟和错误的 OpenAI 兼容接口"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.outage_until = 0.0
+        self.inject = True  # 是否按比例注入慢请求和错误
+        self.requests = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fake-openai', daemon=True)
+        self.base_url = None
+        self._runner = None
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1"
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests += 1
+        if request.headers.get('Authorization') == f'Bearer {BAD_API_KEY}':
+            return web.json_response({'error': {'message': 'Incorrect API key provided', 'type': 'invalid_request_error',
+                                                'code': 'invalid_api_key'}}, status=401)
+        if time.monotonic() < self.outage_until:
+            await asyncio.sleep(self.args.outage_delay)
+        elif self.inject:
+            draw = self.rng.random()
+            if draw < self.args.error_rate:
+                return web.json_response({'error': {'message': 'injected error', 'type': 'server_error'}}, status=500)
+            await asyncio.sleep(self.args.slow if draw < self.args.error_rate + self.args.slow_rate else self.args.fast)
+        else:
+            await asyncio.sleep(self.args.fast)
+        system = body['messages'][0]['content']
+        content = 'default' if '意图分类' in system else '亲，在的，可以直接拍哦'
+        return web.json_response({
+            'id': f'chatcmpl-{self.requests}', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model', 'bench'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15},
+        })
+
+
+async def check_error_classification(args) -> list:
+    """网关返回HTML错误页（响应不是JSON）计入熔断失败率，AI回复配置错误不计入"""
+    import requests
+    from utils.ai_guard import AIConfigError, AIReplyGuard, STATE_CLOSED, STATE_OPEN
+
+    def html_gateway_error():
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'<html><head><title>502 Bad Gateway</title></head></html>'
+        return response.json()
+
+    def config_error():
+        raise AIConfigError("DashScope API URL中未找到app_id")
+
+    guard = AIReplyGuard(budget=args.budget, breaker={'consecutive_failures': 3, 'open_seconds': 60})
+    failures = []
+    for _ in range(3):
+        await guard.call('config', config_error)
+        await guard.call('html', html_gateway_error)
+    if guard.state('html') != STATE_OPEN:
+        failures.append(f"非JSON响应（HTML错误页）未计入熔断失败率（{guard.state('html')}）")
+    if guard.state('config') != STATE_CLOSED:
+        failures.append(f"AI回复配置错误打开了熔断器（{guard.state('config')}）")
+    print(f"classify: html error page -> {guard.state('html')}, config error -> {guard.state('config')}")
+    return failures
+
+
+async def run_mode(mode: str, args, server: FakeOpenAIServer) -> dict:
+    from ai_reply_engine import ai_reply_engine
+    from utils.ai_guard import AIReplyGuard, STATE_CLOSED, provider_key
+
+    guard = AIReplyGuard(budget=args.budget, max_concurrent=args.max_concurrent, late_reply=True,
+                         late_window=args.late_window, breaker={'open_seconds': args.open_seconds})
+    item_info = {'title': '测试商品', 'price': 99, 'desc': '九成新'}
+    provider = provider_key(server.base_url, 'sk-bench')
+    bad_provider = provider_key(server.base_url, BAD_API_KEY)
+    latencies, sources = [], {'ai': 0, 'fallback': 0, 'late': 0, 'ai_after_outage': 0, 'bad_key_fallback': 0}
+    breaker_opened = [False]
+
+    async def send_late(reply: str):
+        sources['late'] += 1
+
+    async def handle(index: int, arrived: float):
+        chat_id = f'{mode}_{index}'
+        if mode == 'badkey' and index % 2:
+            reply = await guard.call(bad_provider, ai_reply_engine.generate_reply_or_raise,
+                                     '还在吗', item_info, chat_id, BAD_KEY_COOKIE_ID, 'buyer', 'item_1')
+            if guard.state(bad_provider) != STATE_CLOSED:
+                breaker_opened[0] = True
+            sources['bad_key_fallback'] += 0 if reply else 1
+            return
+        if mode == 'unguarded':
+            reply = ai_reply_engine.generate_reply('还在吗', item_info, chat_id, COOKIE_ID, 'buyer', 'item_1')
+        else:
+            reply = await guard.call(provider, ai_reply_engine.generate_reply_or_raise,
+                                     '还在吗', item_info, chat_id, COOKIE_ID, 'buyer', 'item_1', on_late=send_late)
+            if guard.state(provider) != STATE_CLOSED:
+                breaker_opened[0] = True
+        if reply:
+            sources['ai'] += 1
+            if mode == 'outage' and arrived >= outage_end:
+                sources['ai_after_outage'] += 1
+        else:
+            sources['fallback'] += 1
+            reply = DEFAULT_REPLY
+        latencies.append(time.monotonic() - arrived)
+
+    lag = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(0.01, lag, stop))
+    started = time.monotonic()
+    outage_end = started + args.outage if mode == 'outage' else 0.0
+    server.outage_until = outage_end
+    # outage 模式只注入故障，恢复后的请求全部正常，用于检查熔断器能否恢复；badkey 模式只看鉴权失败的影响
+    server.inject = mode not in ('outage', 'badkey')
+    # 恢复后继续发送消息，直到熔断器放行探测调用并恢复
+    count = args.messages + (int((args.outage + args.open_seconds) * args.rate) if mode == 'outage' else 0)
+    tasks = []
+    for index in range(count):
+        arrive_at = started + index / args.rate
+        delay = arrive_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(handle(index, arrive_at)))
+    await asyncio.gather(*tasks)
+    # 等待超出预算的调用结束（补发计数）
+    await asyncio.sleep(min(args.late_window, args.slow) + 0.2)
+    stop.set()
+    await monitor
+    fallback = {}
+    from utils.metrics import AI_REPLY_FALLBACK_TOTAL
+    for reason in FALLBACK_REASONS:
+        fallback[reason] = AI_REPLY_FALLBACK_TOTAL.get(provider, reason) + AI_REPLY_FALLBACK_TOTAL.get(bad_provider, reason)
+    return {'latencies': latencies, 'sources': sources, 'lag': lag, 'breaker_opened': breaker_opened[0],
+            'state': guard.state(provider), 'fallback_reasons': fallback}
+
+
+async def run(args) -> dict:
+    import ai_reply_engine as ai_reply_engine_module
+    from db_manager import db_manager
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    server = FakeOpenAIServer(args)
+    server.start()
+    try:
+        with db_manager.lock:
+            db_manager.conn.execute('DROP TABLE IF EXISTS ai_conversations')
+            db_manager.conn.execute(AI_CONVERSATIONS_SCHEMA)
+            db_manager.conn.commit()
+        db_manager.save_ai_reply_settings(COOKIE_ID, {
+            'ai_enabled': True, 'api_key': 'sk-bench', 'base_url': server.base_url, 'model_name': 'bench-model'})
+        db_manager.save_ai_reply_settings(BAD_KEY_COOKIE_ID, {
+            'ai_enabled': True, 'api_key': BAD_API_KEY, 'base_url': server.base_url, 'model_name': 'bench-model'})
+        # 预先导入 openai 并创建客户端（首次约1秒），不计入各模式的延迟；
+        # 请求失败时 openai 客户端默认重试2次，保持默认以反映线上行为
+        ai_reply_engine_module.ai_reply_engine.clear_client_cache()
+        ai_reply_engine_module.ai_reply_engine.get_client(COOKIE_ID)
+
+        results = {}
+        for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+            # 降级次数指标按服务累计，取每个模式前后的差值
+            from utils.ai_guard import provider_key
+            from utils.metrics import AI_REPLY_FALLBACK_TOTAL
+            providers = [provider_key(server.base_url, key) for key in ('sk-bench', BAD_API_KEY)]
+            before = {reason: sum(AI_REPLY_FALLBACK_TOTAL.get(provider, reason) for provider in providers)
+                      for reason in FALLBACK_REASONS}
+            results[mode] = await run_mode(mode, args, server)
+            results[mode]['fallback_reasons'] = {reason: value - before[reason]
+                                                 for reason, value in results[mode]['fallback_reasons'].items()}
+        return results
+    finally:
+        server.stop()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='AI回复保护基准')
+    parser.add_argument('--messages', type=int, default=60, help='每个模式的消息数')
+    parser.add_argument('--rate', type=float, default=3, help='消息到达速率(条/秒)')
+    parser.add_argument('--fast', type=float, default=0.05, help='正常请求延迟(秒)')
+    parser.add_argument('--slow', type=float, default=2.0, help='慢请求延迟(秒)')
+    parser.add_argument('--slow-rate', type=float, default=0.1, help='慢请求比例')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='返回500的比例')
+    parser.add_argument('--budget', type=float, default=1.0, help='AI回复时间预算(秒)')
+    parser.add_argument('--max-concurrent', type=int, default=4, help='每个AI服务同时进行的调用数上限')
+    parser.add_argument('--late-window', type=float, default=5, help='补发时间窗口(秒)')
+    parser.add_argument('--outage', type=float, default=10, help='outage 模式中假服务全部超时的时长(秒)')
+    parser.add_argument('--outage-delay', type=float, default=2, help='故障期间请求的延迟(秒)')
+    parser.add_argument('--open-seconds', type=float, default=2, help='熔断持续时间(秒)')
+    parser.add_argument('--modes', default='unguarded,guarded,outage,badkey', help='运行的模式，逗号分隔')
+    parser.add_argument('--seed', type=int, default=7, help='随机种子')
+    parser.add_argument('--log-level', default='CRITICAL', help='日志级别')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            results = asyncio.run(run(args))
+            failures = asyncio.run(check_error_classification(args))
+        finally:
+            os.chdir(ROOT_DIR)
+
+    print(f"rate={args.rate}/s fast={args.fast}s slow={args.slow}s@{args.slow_rate:.0%} "
+          f"errors={args.error_rate:.0%} budget={args.budget}s")
+    print(f"{'mode':<11}{'msgs':>6}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}"
+          f"{'ai':>6}{'fallback':>10}{'late':>6}{'lag p99(ms)':>13}  fallback reasons")
+    for mode, result in results.items():
+        ms = [value * 1000 for value in result['latencies']]
+        sources = result['sources']
+        reasons = ' '.join(f"{reason}={int(count)}" for reason, count in result['fallback_reasons'].items() if count)
+        print(f"{mode:<11}{len(ms):>6}{percentile(ms, 50):>10.1f}{percentile(ms, 90):>10.1f}"
+              f"{percentile(ms, 99):>10.1f}{max(ms):>10.1f}{sources['ai']:>6}{sources['fallback']:>10}"
+              f"{sources['late']:>6}{percentile(result['lag'], 99) * 1000:>13.1f}  {reasons}")
+
+    if 'guarded' in results:
+        guarded_p99 = percentile(results['guarded']['latencies'], 99)
+        if guarded_p99 > args.budget * 1.5:
+            failures.append(f"guarded p99 {guarded_p99 * 1000:.1f}ms 超过时间预算 {args.budget}s 的 1.5 倍")
+        if 'unguarded' in results and guarded_p99 >= percentile(results['unguarded']['latencies'], 99):
+            failures.append("guarded p99 未低于 unguarded")
+    if 'outage' in results:
+        outage = results['outage']
+        if not outage['breaker_opened'] or not outage['fallback_reasons'].get('circuit_open'):
+            failures.append("故障期间熔断器未打开")
+        if not outage['sources']['ai_after_outage'] or outage['state'] != 'closed':
+            failures.append(f"故障恢复后熔断器未关闭（{outage['state']}）或没有AI回复")
+
+    if 'badkey' in results:
+        badkey = results['badkey']
+        if badkey['breaker_opened'] or badkey['state'] != 'closed':
+            failures.append("API Key 失效（401）打开了熔断器")
+        if badkey['sources']['fallback'] or not badkey['sources']['ai']:
+            failures.append(f"API Key 失效影响了同一服务的其他账号（降级 {badkey['sources']['fallback']} 次）")
+        if not badkey['fallback_reasons'].get('client_error'):
+            failures.append("API Key 失效的调用未按 client_error 降级")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: AI回复延迟受时间预算约束，故障时熔断降级并在恢复后自动关闭，失效的 API Key 不影响其他账号")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
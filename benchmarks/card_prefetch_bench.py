@@ -0,0 +1,207 @@
+"""
+API卡券预取基准 - 对比发货时实时调用卡券API与从预取池取用的发货延迟
+
+在本地启动模拟卡券API（每次请求等待 --latency 秒（±20%抖动）后返回唯一卡密），
+在临时目录的独立数据库中创建API卡券，依次运行：
+    live      - 未开启预取，按 --interval 秒间隔发货 --deliveries 次，每次实时调用API（XianyuLive._get_api_card_content）
+    prefetch  - 开启预取（上限 --high / 下限 --low），预取池补满后按同样间隔发货，
+                与发货路径相同：先 card_prefetcher.take()，池为空时实时调用API
+    outage    - 预取池再次补满后模拟API故障（返回503），期间继续发货 --outage-deliveries 次，应全部从预取池取得
+每张卡券同时只有一个补充请求，发货间隔短于API延迟时预取池会逐渐耗尽（此时退回实时调用）。
+统计发货延迟 p50/p99（毫秒）和预取命中数。
+校验：所有发出的卡密互不重复；prefetch/outage 全部命中预取池且 p99 低于 API 延迟的十分之一；
+修改卡券API配置后旧配置预取的内容不再发出。任一校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/card_prefetch_bench.py
+    python benchmarks/card_prefetch_bench.py --latency 2 --deliveries 40 --interval 3 --high 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from loguru import logger
+
+from replay_bench import percentile
+
+
+class StubCardAPI:
+    """注入延迟和故障的卡券API，每次成功请求返回一个新卡密"""
+
+    def __init__(self, latency: float, seed: int):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.outage = False
+        self.requests = 0
+        self.issued = 0
+        self.url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/card', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/card"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency * self.rng.uniform(0.8, 1.2))
+        if self.outage:
+            return web.json_response({'error': 'service unavailable'}, status=503)
+        self.issued += 1
+        return web.json_response({'data': f"CODE-{request.query.get('sku', 'x')}-{self.issued:06d}"})
+
+
+async def deliver_all(live, prefetcher, rule: dict, count: int, interval: float) -> dict:
+    """按固定间隔发货（与 XianyuLive 发货路径中API卡券的处理相同）"""
+    latencies, contents, hits = [], [], 0
+    started = time.monotonic()
+    for index in range(count):
+        await asyncio.sleep(max(0.0, started + index * interval - time.monotonic()))
+        begin = time.perf_counter()
+        content = await prefetcher.take(rule)
+        if content:
+            hits += 1
+        else:
+            content = await live._get_api_card_content(rule, f'order{index}', 'item_1', 'buyer')
+        latencies.append(time.perf_counter() - begin)
+        contents.append(content)
+    return {'latencies': latencies, 'contents': contents, 'hits': hits, 'count': count}
+
+
+async def wait_for_pool(db_manager, card_id: int, config_hash: str, target: int, timeout: float) -> float:
+    started = time.monotonic()
+    while db_manager.count_prefetched_card_contents(card_id, config_hash) < target:
+        if time.monotonic() - started > timeout:
+            break
+        await asyncio.sleep(0.05)
+    return time.monotonic() - started
+
+
+async def run(args) -> tuple:
+    from XianyuAutoAsync import XianyuLive
+    from db_manager import db_manager
+    from utils.card_prefetch import CardPrefetcher, prefetch_settings
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    api = StubCardAPI(args.latency, args.seed)
+    await api.start()
+    cookies_str = 'unb=2200000000; cookie2=prefetch; t=prefetch'
+    db_manager.save_cookie('prefetch', cookies_str)
+    live = XianyuLive(cookies_str, cookie_id='prefetch')
+    prefetcher = CardPrefetcher(backoff_base=0.1, backoff_max=1.0, cooldown=1.0)
+
+    def make_rule(sku: str, prefetch: bool) -> dict:
+        api_config = {'url': api.url, 'method': 'GET', 'timeout': max(5, args.latency * 3),
+                      'headers': '{}', 'params': json.dumps({'sku': sku})}
+        if prefetch:
+            api_config.update({'prefetch_high': args.high, 'prefetch_low': args.low})
+        card_id = db_manager.create_card(f'卡券{sku}', 'api', api_config=api_config)
+        return {'id': card_id, 'card_id': card_id, 'card_type': 'api', 'card_name': f'卡券{sku}',
+                'api_config': json.dumps(api_config)}
+
+    results, failures = {}, []
+    try:
+        results['live'] = await deliver_all(live, prefetcher, make_rule('live', False), args.deliveries, args.interval)
+
+        rule = make_rule('pool', True)
+        settings = prefetch_settings(rule['api_config'])
+        prefetcher.start()
+        fill = await wait_for_pool(db_manager, rule['card_id'], settings['hash'], args.high,
+                                   args.high * args.latency * 3 + 5)
+        results['prefetch'] = await deliver_all(live, prefetcher, rule, args.deliveries, args.interval)
+
+        # 补满后模拟API故障
+        await wait_for_pool(db_manager, rule['card_id'], settings['hash'], args.high, args.high * args.latency * 3 + 5)
+        api.outage = True
+        results['outage'] = await deliver_all(live, prefetcher, rule, args.outage_deliveries, args.interval)
+        api.outage = False
+
+        # 修改API配置（参数变化）后，旧配置预取的内容不再发出
+        new_config = json.loads(rule['api_config'])
+        new_config['params'] = json.dumps({'sku': 'changed'})
+        db_manager.update_card(rule['card_id'], api_config=new_config)
+        changed = dict(rule, api_config=json.dumps(new_config))
+        stale = await prefetcher.take(changed)
+        if stale:
+            failures.append(f"修改API配置后仍发出旧配置预取的内容: {stale}")
+    finally:
+        await prefetcher.close()
+        await live.close_session()
+        await api.stop()
+
+    contents = [content for result in results.values() for content in result['contents'] if content]
+    missing = sum(result['count'] for result in results.values()) - len(contents)
+    if missing:
+        failures.append(f"{missing} 次发货未取得内容")
+    if len(set(contents)) != len(contents):
+        failures.append(f"有卡密被重复发出: {len(contents) - len(set(contents))} 条")
+    for mode in ('prefetch', 'outage'):
+        result = results.get(mode)
+        if not result:
+            continue
+        if result['hits'] != result['count']:
+            failures.append(f"{mode} 只有 {result['hits']}/{result['count']} 次命中预取池")
+        p99 = percentile(result['latencies'], 99)
+        if p99 >= args.latency / 10:
+            failures.append(f"{mode} 发货 p99 {p99 * 1000:.1f}ms 未与API延迟 {args.latency * 1000:.0f}ms 解耦")
+    return results, failures, fill, api.requests
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='API卡券预取基准')
+    parser.add_argument('--latency', type=float, default=0.4, help='模拟卡券API的响应延迟（秒）')
+    parser.add_argument('--deliveries', type=int, default=20, help='live/prefetch 各发货次数')
+    parser.add_argument('--outage-deliveries', type=int, default=5, help='API故障期间的发货次数')
+    parser.add_argument('--interval', type=float, default=0.5, help='发货间隔（秒）')
+    parser.add_argument('--high', type=int, default=15, help='预取池上限')
+    parser.add_argument('--low', type=int, default=8, help='预取池下限')
+    parser.add_argument('--seed', type=int, default=7, help='随机种子')
+    parser.add_argument('--log-level', default='CRITICAL', help='日志级别')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            results, failures, fill, requests = asyncio.run(run(args))
+        finally:
+            os.chdir(ROOT_DIR)
+
+    print(f"api_latency={args.latency * 1000:.0f}ms interval={args.interval * 1000:.0f}ms "
+          f"high={args.high} low={args.low} fill={fill:.1f}s api_requests={requests}")
+    print(f"{'mode':<10}{'deliveries':>11}{'hits':>6}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for mode, result in results.items():
+        latencies = result['latencies']
+        print(f"{mode:<10}{result['count']:>11}{result['hits']:>6}{percentile(latencies, 50) * 1000:>10.1f}"
+              f"{percentile(latencies, 99) * 1000:>10.1f}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print("OK: 发货从预取池取得内容，延迟与API延迟解耦，API故障期间照常发货，卡密不重复")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+会话状态缓存基准 - 对比每条消息查询数据库与使用会话状态缓存时的查询次数和决策延迟
+
+在临时目录的独立数据库中预置 --accounts 个账号（关键词 + AI回复设置），
+每个账号 --chats 个会话，按轮次为每个会话处理一条买家消息，走消息处理决定回复方式的路径：
+    关键词匹配（XianyuLive.get_keyword_reply）-> 未命中时检查AI回复开关（is_ai_enabled）
+    -> 议价消息统计议价次数（get_bargain_count）并保存用户消息和回复（save_conversation）
+不调用大模型接口，议价意图按消息内容直接判定。
+ai_conversations 表按 ai_reply_engine 使用的列重建（当前 init_db 的表结构与其不一致）。
+
+统计（sqlite trace 回调计数）：
+    select/msg - 每条消息执行的 SELECT 次数
+    stmts/msg  - 每条消息执行的全部语句次数（含写后队列的批量写入）
+    p50/p99    - 单条消息决策耗时（毫秒）
+结束后校验：通过 db_manager 修改AI回复设置和关键词（与后台接口相同的写入方法）后，
+下一条消息立即使用新设置；缓存的议价次数与数据库统计一致。
+缓存模式每条消息 SELECT 次数不低于直查模式或一致性校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/chat_state_bench.py
+    python benchmarks/chat_state_bench.py --accounts 10 --chats 200 --rounds 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger
+
+from replay_bench import KEYWORDS, percentile
+
+# 买家消息：(内容, 是否议价)，前两条命中关键词
+TEXTS = [('什么时候发货', False), ('包邮吗', False), ('最低多少钱出', True), ('成色怎么样', False)]
+
+AI_CONVERSATIONS_SCHEMA = '''
+CREATE TABLE ai_conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cookie_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    intent TEXT,
+    bargain_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+'''
+
+
+async def handle_message(live, ai_reply_engine, chat_id: str, text: str, is_price: bool) -> str:
+    """消息处理中决定回复方式的部分"""
+    reply = await live.get_keyword_reply('买家', 'buyer', text, 'item_1')
+    if reply:
+        return reply
+    if not ai_reply_engine.is_ai_enabled(live.cookie_id):
+        return None
+    intent = 'price' if is_price else 'default'
+    bargain_count = ai_reply_engine.get_bargain_count(chat_id, live.cookie_id)
+    reply = f'第{bargain_count + 1}次议价' if is_price else '亲，请看商品描述哦'
+    ai_reply_engine.save_conversation(chat_id, live.cookie_id, 'buyer', 'item_1', 'user', text, intent)
+    ai_reply_engine.save_conversation(chat_id, live.cookie_id, 'buyer', 'item_1', 'assistant', reply, intent)
+    return reply
+
+
+async def run_mode(mode: str, args, lives: list, counters: dict) -> dict:
+    from ai_reply_engine import ai_reply_engine
+    from utils.chat_state import chat_state_store
+
+    chat_state_store.enabled = mode == 'cached'
+    chat_state_store.invalidate_account()
+    chat_state_store.invalidate_chats()
+    counters['select'] = counters['stmts'] = 0
+
+    latencies = []
+    messages = 0
+    for round_index in range(args.rounds):
+        for live in lives:
+            for chat in range(args.chats):
+                text, is_price = TEXTS[(chat + round_index) % len(TEXTS)]
+                started = time.perf_counter()
+                await handle_message(live, ai_reply_engine, f'{mode}_{chat}', text, is_price)
+                latencies.append(time.perf_counter() - started)
+                messages += 1
+    return {'messages': messages, 'select': counters['select'], 'stmts': counters['stmts'], 'latencies': latencies}
+
+
+async def check_consistency(lives: list) -> list:
+    """修改设置后下一条消息立即生效，缓存的议价次数与数据库一致"""
+    from ai_reply_engine import ai_reply_engine
+    from db_manager import db_manager
+    from utils.chat_state import chat_state_store
+
+    failures = []
+    chat_state_store.enabled = True
+    live = lives[0]
+    cookie_id = live.cookie_id
+
+    cached = ai_reply_engine.get_bargain_count('cached_2', cookie_id)
+    stored = ai_reply_engine._load_bargain_count('cached_2', cookie_id)
+    if cached != stored:
+        failures.append(f"缓存的议价次数 {cached} 与数据库统计 {stored} 不一致")
+
+    db_manager.save_ai_reply_settings(cookie_id, {'ai_enabled': False})
+    if ai_reply_engine.is_ai_enabled(cookie_id):
+        failures.append("关闭AI回复后下一条消息仍按开启处理")
+
+    db_manager.save_text_keywords_only(cookie_id, KEYWORDS + [('成色', '九成新，无划痕', '')])
+    reply = await live.get_keyword_reply('买家', 'buyer', '成色怎么样', 'item_1')
+    if reply != '九成新，无划痕':
+        failures.append(f"新增关键词后下一条消息未命中: {reply!r}")
+
+    # 删除账号后丢弃该账号的缓存，下一条消息重新从数据库加载
+    db_manager.delete_cookie(cookie_id)
+    misses = chat_state_store.misses
+    await live.get_keyword_reply('买家', 'buyer', '什么时候发货', 'item_1')
+    if chat_state_store.misses != misses + 1:
+        failures.append("删除账号后仍使用缓存的关键词")
+    return failures
+
+
+async def run(args) -> tuple:
+    from XianyuAutoAsync import XianyuLive
+    from db_manager import db_manager
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    with db_manager.lock:
+        db_manager.conn.execute('DROP TABLE IF EXISTS ai_conversations')
+        db_manager.conn.execute(AI_CONVERSATIONS_SCHEMA)
+        db_manager.conn.commit()
+
+    lives = []
+    for account in range(args.accounts):
+        cookie_id = f'state{account}'
+        cookies_str = f'unb={2200000000 + account}; cookie2=state{account}; t=state'
+        db_manager.save_cookie(cookie_id, cookies_str)
+        db_manager.save_text_keywords_only(cookie_id, KEYWORDS)
+        db_manager.save_ai_reply_settings(cookie_id, {'ai_enabled': True, 'api_key': 'bench', 'max_bargain_rounds': 3})
+        lives.append(XianyuLive(cookies_str, cookie_id=cookie_id))
+
+    counters = {'select': 0, 'stmts': 0}
+
+    def trace(sql: str):
+        counters['stmts'] += 1
+        if sql.lstrip().upper().startswith('SELECT'):
+            counters['select'] += 1
+
+    db_manager.conn.set_trace_callback(trace)
+    results = {}
+    try:
+        for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+            results[mode] = await run_mode(mode, args, lives, counters)
+            db_manager.flush_writes()
+        failures = await check_consistency(lives)
+    finally:
+        db_manager.conn.set_trace_callback(None)
+        for live in lives:
+            await live.close_session()
+    return results, failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='会话状态缓存基准')
+    parser.add_argument('--accounts', type=int, default=5, help='账号数')
+    parser.add_argument('--chats', type=int, default=100, help='每个账号的会话数')
+    parser.add_argument('--rounds', type=int, default=4, help='每个会话处理的消息数')
+    parser.add_argument('--modes', default='direct,cached', help='运行的模式，逗号分隔')
+    parser.add_argument('--log-level', default='CRITICAL', help='日志级别')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            results, failures = asyncio.run(run(args))
+        finally:
+            os.chdir(ROOT_DIR)
+
+    print(f"accounts={args.accounts} chats={args.chats} rounds={args.rounds}")
+    print(f"{'mode':<10}{'messages':>10}{'select/msg':>12}{'stmts/msg':>11}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for mode, result in results.items():
+        latencies = result['latencies']
+        print(f"{mode:<10}{result['messages']:>10}{result['select'] / result['messages']:>12.3f}"
+              f"{result['stmts'] / result['messages']:>11.3f}{percentile(latencies, 50) * 1000:>10.3f}"
+              f"{percentile(latencies, 99) * 1000:>10.3f}")
+    if 'direct' in results and 'cached' in results:
+        direct = results['direct']['select'] / results['direct']['messages']
+        cached = results['cached']['select'] / results['cached']['messages']
+        if cached >= direct:
+            failures.append(f"缓存模式每条消息 {cached:.3f} 次查询，未低于直查模式 {direct:.3f} 次")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 会话状态缓存减少了每条消息的数据库查询，后台修改设置后立即生效")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+延时发货基准 - 大量待发货的延时订单下，对比在消息处理任务中 sleep（旧实现）与持久化任务队列的内存和任务数
+
+    legacy: 每个订单一个 handle_message 任务，持有订单锁和消息上下文 sleep 到延时结束
+    queued: XianyuLive._schedule_delayed_delivery 写入 scheduled_jobs 表后立即返回，
+            由单个调度协程到期执行（本基准把任务处理函数替换为记录执行时间的桩，真实发货依赖发货规则数据）
+另外测量：
+    - 到期执行的延迟（实际执行时间 - due_at）的 p50/p99 和全部执行完的耗时
+    - 重启恢复：排期后停止调度器，新建调度器（相当于进程重启）后任务是否全部执行
+    - 失败恢复：账号未连接（JobDeferred）多次后仍按第1次执行；超过重试次数失败的订单可以重新排期；
+      记录发送标记后进程退出的任务，重启后由 XianyuLive._run_delayed_delivery 跳过，不重复发送；
+      到期时卡券API一直失败（未获取到发货内容）的订单经 _run_delayed_delivery 按退避重试到上限后标记为failed，
+      不会被当作已完成删除
+queued 模式的任务数随订单数增长、到期任务未全部执行、重启后丢失任务或失败恢复校验不通过时以非零状态码退出。
+
+用法:
+    python benchmarks/delayed_delivery_bench.py
+    python benchmarks/delayed_delivery_bench.py --orders 10000 --delay 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger
+
+from replay_bench import build_message, build_order_card, percentile
+
+COOKIE_ID = 'delay_bench'
+
+
+def order_message(index: int) -> dict:
+    order_id = str(4200000000000 + index)
+    item_id = str(700000000000 + index % 20)
+    card = build_order_card(order_id, item_id, '我已付款，等待你发货')
+    return build_message(str(51000000000 + index), str(3300000000 + index % 50), '[我已付款，等待你发货]',
+                         item_id, card, '等待卖家发货')
+
+
+async def measure_legacy(orders: int, delay: float) -> dict:
+    """旧实现：每个订单的处理任务持有订单锁 sleep 到延时结束"""
+    from utils.message_parser import parse_message
+
+    locks = defaultdict(asyncio.Lock)
+
+    async def handle(message: dict):
+        parsed = parse_message(message)
+        async with locks[parsed.order_id]:
+            await asyncio.sleep(delay)
+        return parsed
+
+    tasks_before = len(asyncio.all_tasks())
+    tracemalloc.start()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(handle(order_message(index))) for index in range(orders)]
+    await asyncio.sleep(0.1)  # 所有任务都进入 sleep
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pending_tasks = len(asyncio.all_tasks()) - tasks_before
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {'memory': memory, 'tasks': pending_tasks, 'enqueue': elapsed}
+
+
+async def measure_queued(live, orders: int, delay: float) -> dict:
+    """新实现：写入定时任务队列，由单个调度协程到期执行"""
+    import XianyuAutoAsync
+    from utils.job_queue import job_scheduler
+    from utils.message_parser import parse_message
+
+    fired = {}
+
+    async def record(job: dict) -> bool:
+        fired[job['job_key']] = time.time() - job['due_at']
+        return True
+
+    job_scheduler.register(XianyuAutoAsync.DELAYED_DELIVERY_JOB, record)
+    job_scheduler.start()
+    await asyncio.sleep(0)
+
+    tasks_before = len(asyncio.all_tasks())
+    tracemalloc.start()
+    started = time.perf_counter()
+    for index in range(orders):
+        parsed = parse_message(order_message(index))
+        live._schedule_delayed_delivery(parsed.order_id, parsed.item_id, parsed.send_user_name,
+                                        parsed.send_user_id, parsed.chat_id, delay)
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pending_tasks = len(asyncio.all_tasks()) - tasks_before
+
+    deadline = time.perf_counter() + delay + 60
+    while len(fired) < orders and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    drained = time.perf_counter() - started
+    await job_scheduler.stop()
+    return {'memory': memory, 'tasks': pending_tasks, 'enqueue': elapsed, 'fired': len(fired),
+            'lateness': list(fired.values()), 'drained': drained}
+
+
+async def measure_restart(live, orders: int) -> dict:
+    """排期后停止调度器，新建调度器后任务仍应全部执行"""
+    import XianyuAutoAsync
+    from utils import job_queue
+
+    fired = set()
+
+    async def record(job: dict) -> bool:
+        fired.add(job['job_key'])
+        return True
+
+    first = job_queue.create_job_scheduler()
+    first.register(XianyuAutoAsync.DELAYED_DELIVERY_JOB, record)
+    first.start()
+    for index in range(orders):
+        parsed_order = str(4300000000000 + index)
+        first.schedule(COOKIE_ID, XianyuAutoAsync.DELAYED_DELIVERY_JOB, f'restart:{parsed_order}',
+                       {'order_id': parsed_order}, 1)
+    await first.stop()
+
+    second = job_queue.create_job_scheduler()
+    second.register(XianyuAutoAsync.DELAYED_DELIVERY_JOB, record)
+    second.start()
+    deadline = time.perf_counter() + 30
+    while len(fired) < orders and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    await second.stop()
+    return {'fired': len(fired)}
+
+
+async def measure_recovery(live) -> dict:
+    """账号未连接不计入执行次数、失败的任务可重新排期、已发送的任务重启后不重复发送"""
+    import XianyuAutoAsync
+    from db_manager import db_manager
+    from utils.job_queue import JobDeferred, JobScheduler
+
+    kind = XianyuAutoAsync.DELAYED_DELIVERY_JOB
+    result = {}
+
+    async def wait_until(condition, timeout: float = 10):
+        deadline = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.02)
+
+    def job_row(job_key: str):
+        with db_manager.lock:
+            return db_manager.conn.execute('SELECT status, attempts FROM scheduled_jobs WHERE job_key = ?',
+                                           (job_key,)).fetchone()
+
+    # 账号未连接5次后恢复：执行时 attempts 仍为1
+    deferrals, executed = [0], {}
+
+    async def offline_then_online(job: dict) -> bool:
+        if deferrals[0] < 5:
+            deferrals[0] += 1
+            raise JobDeferred('账号未连接')
+        executed[job['job_key']] = job['attempts']
+        return True
+
+    scheduler = JobScheduler(poll_interval=0.1, retry_delay=0.05, max_attempts=2)
+    scheduler.register(kind, offline_then_online)
+    scheduler.start()
+    scheduler.schedule(COOKIE_ID, kind, 'recovery:offline', {}, 0)
+    await wait_until(lambda: 'recovery:offline' in executed)
+    result['offline_attempts'] = executed.get('recovery:offline')
+    await scheduler.stop()
+
+    # 连续失败达到上限后标记为failed，同一订单重新排期后执行
+    outcomes = {'succeed': False}
+
+    async def flaky(job: dict) -> bool:
+        executed[job['job_key']] = job['attempts']
+        return outcomes['succeed']
+
+    scheduler = JobScheduler(poll_interval=0.1, retry_delay=0.05, max_attempts=2)
+    scheduler.register(kind, flaky)
+    scheduler.start()
+    scheduler.schedule(COOKIE_ID, kind, 'recovery:failed', {}, 0)
+    await wait_until(lambda: (job_row('recovery:failed') or ('',))[0] == 'failed')
+    result['failed_status'] = (job_row('recovery:failed') or ('',))[0]
+    outcomes['succeed'] = True
+    result['rescheduled'] = scheduler.schedule(COOKIE_ID, kind, 'recovery:failed', {}, 0)
+    await wait_until(lambda: job_row('recovery:failed') is None)
+    result['rescheduled_done'] = job_row('recovery:failed') is None
+    await scheduler.stop()
+
+    # 发送前记录标记后进程退出：重启后不再发送（此时账号未连接，若再次发送会被推迟而不是完成）
+    started_sending = asyncio.Event()
+
+    async def crash_after_mark(job: dict) -> bool:
+        scheduler.mark_sent(job)
+        started_sending.set()
+        await asyncio.sleep(3600)
+        return True
+
+    scheduler = JobScheduler(poll_interval=0.1, retry_delay=0.05)
+    scheduler.register(kind, crash_after_mark)
+    scheduler.start()
+    scheduler.schedule(COOKIE_ID, kind, 'recovery:sent', {'order_id': 'sent'}, 0)
+    await asyncio.wait_for(started_sending.wait(), 10)
+    await scheduler.stop()
+    scheduler = JobScheduler(poll_interval=0.1, retry_delay=0.05)
+    scheduler.register(kind, XianyuAutoAsync.XianyuLive._run_delayed_delivery)
+    scheduler.start()
+    await wait_until(lambda: job_row('recovery:sent') is None, timeout=3)
+    result['sent_skipped'] = job_row('recovery:sent') is None
+    await scheduler.stop()
+
+    # 到期时卡券API一直未返回内容：经 _run_delayed_delivery/_deliver_order 重试到上限，任务保留为failed
+    class ConnectedWebSocket:
+        closed = False
+
+    sent = []
+
+    async def failing_card_api(*args, **kwargs) -> str:
+        return ''
+
+    async def record_send(websocket, chat_id, to_user_id, content, *args, **kwargs):
+        sent.append(content)
+
+    async def no_notification(*args, **kwargs):
+        pass
+
+    live.ws = ConnectedWebSocket()
+    live._register_instance()
+    live._auto_delivery = failing_card_api
+    live.send_msg = record_send
+    live.send_delivery_failure_notification = no_notification
+    scheduler = JobScheduler(poll_interval=0.1, retry_delay=0.05, max_attempts=3)
+    scheduler.register(kind, XianyuAutoAsync.XianyuLive._run_delayed_delivery)
+    scheduler.start()
+    scheduler.schedule(COOKIE_ID, kind, 'recovery:card_api', {
+        'order_id': 'card_api', 'item_id': '1', 'send_user_name': 'buyer', 'send_user_id': '1', 'chat_id': '1',
+    }, 0)
+    await wait_until(lambda: (job_row('recovery:card_api') or ('',))[0] in ('', 'failed'))
+    result['card_api_row'] = job_row('recovery:card_api')
+    result['card_api_sent'] = len(sent)
+    await scheduler.stop()
+    live.ws = None
+    result['backoff'] = [scheduler.retry_delay_for(attempt) for attempt in range(1, 5)]
+    return result
+
+
+async def run(args) -> dict:
+    from XianyuAutoAsync import XianyuLive
+
+    # XianyuAutoAsync 导入时会按线上配置重设日志输出
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    cookies_str = ('unb=2200000088; cookie2=delay; t=delay; '
+                   '_m_h5_tk=0123456789abcdef0123456789abcdef_1700000000000; _m_h5_tk_enc=delay')
+    live = XianyuLive(cookies_str, cookie_id=COOKIE_ID)
+    try:
+        legacy = await measure_legacy(args.orders, args.delay)
+        queued = await measure_queued(live, args.orders, args.delay)
+        restart = await measure_restart(live, args.restart_orders)
+        recovery = await measure_recovery(live)
+    finally:
+        await live.close_session()
+    return {'legacy': legacy, 'queued': queued, 'restart': restart, 'recovery': recovery}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='延时发货内存/任务数基准')
+    parser.add_argument('--orders', type=int, default=5000, help='待发货的延时订单数')
+    parser.add_argument('--delay', type=float, default=3, help='发货延时(秒)')
+    parser.add_argument('--restart-orders', type=int, default=200, help='重启恢复测试的任务数')
+    parser.add_argument('--log-level', default='CRITICAL', help='日志级别')
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            result = asyncio.run(run(args))
+        finally:
+            os.chdir(ROOT_DIR)
+
+    legacy, queued, restart = result['legacy'], result['queued'], result['restart']
+    print(f"{'mode':<8}{'orders':>8}{'tasks':>8}{'python heap(MB)':>17}{'enqueue(s)':>12}")
+    for name, data in (('legacy', legacy), ('queued', queued)):
+        print(f"{name:<8}{args.orders:>8}{data['tasks']:>8}{data['memory'] / 1024 / 1024:>17.2f}{data['enqueue']:>12.2f}")
+    lateness = queued['lateness']
+    print(f"到期执行: {queued['fired']}/{args.orders}，延迟 p50={percentile(lateness, 50) * 1000:.0f} ms "
+          f"p99={percentile(lateness, 99) * 1000:.0f} ms，排期到全部执行 {queued['drained']:.2f} s")
+    print(f"重启恢复: {restart['fired']}/{args.restart_orders}")
+    recovery = result['recovery']
+    print(f"失败恢复: 未连接5次后执行时 attempts={recovery['offline_attempts']}，"
+          f"失败后重新排期={recovery['rescheduled']}/{recovery['rescheduled_done']}，"
+          f"已发送的任务重启后跳过={recovery['sent_skipped']}，退避间隔={recovery['backoff']}")
+    print(f"卡券API失败: 任务状态={recovery['card_api_row']}，发出 {recovery['card_api_sent']} 条")
+
+    failures = []
+    if queued['tasks'] > 1:
+        failures.append(f"queued 模式排期后新增了 {queued['tasks']} 个任务")
+    if queued['fired'] != args.orders:
+        failures.append(f"到期任务只执行了 {queued['fired']}/{args.orders}")
+    if restart['fired'] != args.restart_orders:
+        failures.append(f"重启后只执行了 {restart['fired']}/{args.restart_orders} 个任务")
+    if recovery['offline_attempts'] != 1:
+        failures.append(f"账号未连接计入了执行次数（attempts={recovery['offline_attempts']}）")
+    if recovery['failed_status'] != 'failed' or not recovery['rescheduled'] or not recovery['rescheduled_done']:
+        failures.append("失败的任务不能用同一 job_key 重新排期")
+    if not recovery['sent_skipped']:
+        failures.append("已记录发送标记的任务重启后没有跳过发送")
+    if recovery['card_api_row'] != ('failed', 3) or recovery['card_api_sent']:
+        failures.append(f"卡券API失败的延时发货没有按次数重试后标记为failed: {recovery['card_api_row']}")
+    if recovery['backoff'] != sorted(recovery['backoff']) or len(set(recovery['backoff'])) == 1:
+        failures.append(f"重试间隔没有指数增长: {recovery['backoff']}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 延时发货不再占用任务，到期全部执行，重启后不丢失也不重复发送，失败后可重新排期")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+健康检查延迟基准 - 并发轮询 /health/live、/ready、/health，测量探测延迟
+
+在临时目录中启动 reply_server（uvicorn，独立线程）和 CookieManager 的账号事件循环（独立线程），
+账号事件循环上运行 --loop-load 个模拟消息处理的协程（每 10ms 占用约 1ms CPU），
+轮询客户端运行在独立进程中；单个 uvicorn worker 下延迟随并发数线性增加（排队），默认模拟少量探测方同时轮询。
+每个端点由 --concurrency 个客户端持续轮询 --duration 秒，统计 p50/p99/max。
+另外以改动前的实现（psutil.cpu_percent(interval=1)）注册 /health/legacy 作对照。
+之后在占用数据库锁 --lock-hold 秒期间并发请求 /health 和 /ready，校验：
+/health（Docker健康检查）仍返回200、/ready 返回503，且期间至多启动一次数据库探测（超时的探测线程不堆积）。
+新端点 p99 超出 --budget-ms 或数据库锁校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/health_bench.py
+    python benchmarks/health_bench.py --concurrency 10 --loop-load 5 --budget-ms 50
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+from loguru import logger
+
+from replay_bench import percentile
+
+ENDPOINTS = ['/health/live', '/ready', '/health']
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_account_loop(loop_load: int) -> asyncio.AbstractEventLoop:
+    """在独立线程中运行账号事件循环并创建 CookieManager"""
+    import cookie_manager
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='account-loop', daemon=True).start()
+
+    async def busy():
+        # 模拟消息处理：每 10ms 占用约 1ms CPU
+        while True:
+            started = time.perf_counter()
+            while time.perf_counter() - started < 0.001:
+                pass
+            await asyncio.sleep(0.01)
+
+    async def setup():
+        cookie_manager.manager = cookie_manager.CookieManager(loop)
+        for _ in range(loop_load):
+            loop.create_task(busy())
+
+    asyncio.run_coroutine_threadsafe(setup(), loop).result(timeout=30)
+    return loop
+
+
+def start_api_server(port: int):
+    import uvicorn
+    import reply_server
+
+    @reply_server.app.get('/health/legacy')
+    async def legacy_health_check():
+        """改动前的实现：每次探测阻塞采样 1 秒 CPU"""
+        import psutil
+        reply_server.db_manager.get_all_cookies()
+        cpu_percent = psutil.cpu_percent(interval=1)
+        memory_info = psutil.virtual_memory()
+        return {"status": "healthy", "system": {"cpu_percent": cpu_percent, "memory_percent": memory_info.percent}}
+
+    server = uvicorn.Server(uvicorn.Config(reply_server.app, host='127.0.0.1', port=port, log_level='critical'))
+    threading.Thread(target=server.run, name='api-server', daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise TimeoutError('30秒内 Web 服务未启动')
+        time.sleep(0.05)
+    return server
+
+
+async def poll(base_url: str, path: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    statuses = {}
+
+    async def client(session: aiohttp.ClientSession, stop_at: float):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            async with session.get(base_url + path) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # 预热连接
+        async with session.get(base_url + path) as response:
+            await response.read()
+        stop_at = time.perf_counter() + duration
+        await asyncio.gather(*(client(session, stop_at) for _ in range(concurrency)))
+    return {'latencies': latencies, 'statuses': statuses}
+
+
+async def probe_while_locked(base_url: str, hold: float, concurrency: int) -> dict:
+    """占用数据库锁 hold 秒，期间每 0.2 秒并发请求 /health 和 /ready，统计状态码和数据库探测次数"""
+    from db_manager import db_manager
+
+    pings = 0
+    ping = db_manager.ping
+
+    def counting_ping():
+        nonlocal pings
+        pings += 1
+        return ping()
+
+    db_manager.ping = counting_ping
+    statuses = {'/health': {}, '/ready': {}}
+    released = threading.Event()
+
+    def hold_lock():
+        with db_manager.lock:
+            # 请求全部完成后才释放
+            released.wait()
+
+    holder = threading.Thread(target=hold_lock, daemon=True)
+    holder.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def request(path: str):
+                async with session.get(base_url + path) as response:
+                    await response.read()
+                    statuses[path][response.status] = statuses[path].get(response.status, 0) + 1
+
+            stop_at = time.perf_counter() + hold
+            while time.perf_counter() < stop_at:
+                await asyncio.gather(*(request(path) for path in statuses for _ in range(concurrency)))
+                await asyncio.sleep(0.2)
+    finally:
+        released.set()
+        holder.join()
+        db_manager.ping = ping
+    return {'statuses': statuses, 'pings': pings}
+
+
+def run_poll(base_url: str, path: str, concurrency: int, duration: float) -> dict:
+    """在独立进程中执行，避免客户端与服务争用 GIL"""
+    return asyncio.run(poll(base_url, path, concurrency, duration))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='健康检查探测延迟基准')
+    parser.add_argument('--concurrency', type=int, default=4, help='每个端点的并发轮询客户端数')
+    parser.add_argument('--duration', type=float, default=5, help='每个端点的轮询时长(秒)')
+    parser.add_argument('--loop-load', type=int, default=2, help='账号事件循环上的模拟负载协程数')
+    parser.add_argument('--budget-ms', type=float, default=25, help='新端点 p99 延迟预算(毫秒)')
+    parser.add_argument('--lock-hold', type=float, default=3, help='数据库锁校验中占用锁的时长(秒)')
+    parser.add_argument('--skip-legacy', action='store_true', help='不测量改动前的 /health 实现')
+    parser.add_argument('--log-level', default='CRITICAL', help='日志级别')
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            start_account_loop(args.loop_load)
+            port = free_port()
+            server = start_api_server(port)
+            # reply_server 导入时会按线上配置重设日志输出
+            logger.remove()
+            logger.add(sys.stderr, level=args.log_level)
+
+            base_url = f'http://127.0.0.1:{port}'
+            paths = ENDPOINTS + ([] if args.skip_legacy else ['/health/legacy'])
+            print(f"{'endpoint':<16}{'requests':>10}{'status':>14}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+            for path in paths:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(run_poll, base_url, path, args.concurrency, args.duration).result()
+                latencies = result['latencies']
+                statuses = ','.join(f'{code}x{count}' for code, count in sorted(result['statuses'].items()))
+                p99 = percentile(latencies, 99) * 1000
+                print(f"{path:<16}{len(latencies):>10}{statuses:>14}{percentile(latencies, 50) * 1000:>10.2f}"
+                      f"{p99:>10.2f}{max(latencies) * 1000:>10.2f}")
+                if path in ENDPOINTS:
+                    if p99 > args.budget_ms:
+                        failures.append(f"{path} p99={p99:.2f}ms 超出预算 {args.budget_ms}ms")
+                    if set(result['statuses']) != {200}:
+                        failures.append(f"{path} 返回了非200状态: {statuses}")
+
+            locked = asyncio.run(probe_while_locked(base_url, args.lock_hold, args.concurrency))
+            summary = {path: ','.join(f'{code}x{count}' for code, count in sorted(counts.items()))
+                       for path, counts in locked['statuses'].items()}
+            print(f"数据库锁占用 {args.lock_hold}s 期间: /health {summary['/health']}, /ready {summary['/ready']}, "
+                  f"数据库探测 {locked['pings']} 次")
+            if set(locked['statuses']['/health']) != {200}:
+                failures.append(f"数据库锁被占用时 /health 返回了非200状态: {summary['/health']}")
+            if set(locked['statuses']['/ready']) != {503}:
+                failures.append(f"数据库锁被占用时 /ready 应返回503: {summary['/ready']}")
+            if locked['pings'] > 1:
+                failures.append(f"数据库锁被占用期间启动了 {locked['pings']} 次数据库探测，应至多 1 次")
+            server.should_exit = True
+        finally:
+            os.chdir(ROOT_DIR)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: 健康检查 p99 均在 {args.budget_ms}ms 以内，数据库锁被占用时 /health 仍健康")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+心跳看门狗基准 - 本地WebSocket服务停止应答心跳（模拟半开连接）后，测量 XianyuLive 判定连接失效和重连的耗时
+
+流程：
+    1. 启动假 goofish 服务（复用 replay_bench.FakeGoofishServer 的 mtop 接口），XianyuLive 正常连接、注册、收到心跳响应
+    2. 服务对当前连接停止应答任何请求，但不断开TCP连接
+    3. 等待客户端连续 --max-missed 次心跳无响应后中止连接并立即重连，新连接上心跳恢复正常
+输出心跳往返时间、判定失效耗时（xianyu_ws_dead_detect_seconds）和从停止应答到重新注册完成的耗时。
+未能重连、重连计入了连接失败次数，或重连耗时超过 心跳间隔*max_missed+响应超时+--slack 时以非零状态码退出。
+
+用法:
+    python benchmarks/heartbeat_bench.py
+    python benchmarks/heartbeat_bench.py --interval 1 --timeout 0.5 --max-missed 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websockets
+from loguru import logger
+
+from replay_bench import FakeGoofishServer, install_order_detail_stub
+
+COOKIE_ID = 'heartbeat0'
+
+
+class SilentServer(FakeGoofishServer):
+    """在 silence() 之后对此前建立的连接不再应答任何请求（不断开连接）"""
+
+    def __init__(self):
+        super().__init__([], 0, 0)
+        self.silence_at = None
+        self.connected_at = []
+        self.registered_at = []
+        self.dropped = 0
+
+    def silence(self):
+        self.silence_at = time.perf_counter()
+
+    async def handle_ws(self, websocket, path=None):
+        connected_at = time.perf_counter()
+        self.connected_at.append(connected_at)
+        try:
+            async for raw in websocket:
+                if self.silence_at is not None and connected_at < self.silence_at:
+                    self.dropped += 1
+                    continue
+                message = json.loads(raw)
+                lwp = message.get('lwp')
+                if lwp == '/r/SyncStatus/ackDiff':
+                    self.registered_at.append(time.perf_counter())
+                if lwp is not None:
+                    mid = message.get('headers', {}).get('mid', '')
+                    await websocket.send(json.dumps({'code': 200, 'headers': {'mid': mid}}))
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def wait_until(predicate, timeout: float, what: str):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"{timeout}秒内未{what}")
+        await asyncio.sleep(0.01)
+
+
+async def run(args, server: SilentServer) -> dict:
+    import XianyuAutoAsync
+    import utils.mtop_client
+    from XianyuAutoAsync import XianyuLive
+    from db_manager import db_manager
+    from utils.metrics import WS_DEAD_DETECT_SECONDS, WS_HEARTBEAT_RTT_SECONDS, WS_RECONNECTS_TOTAL
+
+    # XianyuAutoAsync 导入时会按线上配置重设日志输出
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    utils.mtop_client.MTOP_BASE_URL = server.mtop_base
+    XianyuAutoAsync.API_ENDPOINTS['token'] = f"{server.mtop_base}/mtop.taobao.idlemessage.pc.login.token/1.0/"
+
+    cookies_str = ('unb=2200000000; cookie2=heartbeat; t=heartbeat; '
+                   '_m_h5_tk=0123456789abcdef0123456789abcdef_1700000000000; _m_h5_tk_enc=heartbeat')
+    db_manager.save_cookie(COOKIE_ID, cookies_str)
+    live = XianyuLive(cookies_str, cookie_id=COOKIE_ID)
+    live.base_url = server.ws_url
+    live.cookie_refresh_enabled = False
+    live.heartbeat_interval = args.interval
+    live.heartbeat_timeout = args.timeout
+    live.heartbeat_max_missed = args.max_missed
+
+    task = asyncio.create_task(live.main())
+    try:
+        await wait_until(lambda: server.registered_at and live.heartbeat_rtt is not None, 30, '完成首次连接和心跳')
+        server.silence()
+        await wait_until(lambda: len(server.registered_at) >= 2, args.wait, '重新连接')
+        reconnected_at = server.registered_at[1]
+        rtt_before = WS_HEARTBEAT_RTT_SECONDS.snapshot(COOKIE_ID)['count']
+        await wait_until(lambda: WS_HEARTBEAT_RTT_SECONDS.snapshot(COOKIE_ID)['count'] > rtt_before,
+                         args.interval * 2 + 5, '在新连接上收到心跳响应')
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await live.close_session()
+
+    rtt = WS_HEARTBEAT_RTT_SECONDS.snapshot(COOKIE_ID)
+    return {
+        'rtt_mean': rtt['sum'] / rtt['count'],
+        'detect': WS_DEAD_DETECT_SECONDS.snapshot(COOKIE_ID),
+        'reconnect': reconnected_at - server.silence_at,
+        'reconnects': WS_RECONNECTS_TOTAL.get(COOKIE_ID),
+        'connection_failures': live.connection_failures,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='心跳看门狗失效检测/重连耗时基准')
+    parser.add_argument('--interval', type=float, default=0.5, help='心跳间隔(秒)')
+    parser.add_argument('--timeout', type=float, default=0.3, help='心跳响应超时(秒)')
+    parser.add_argument('--max-missed', type=int, default=2, help='连续几次无响应判定失效')
+    parser.add_argument('--slack', type=float, default=2.0, help='重连耗时预算中除检测时间外的余量(秒)')
+    parser.add_argument('--wait', type=float, default=60, help='停止应答后等待重连的最长时间(秒)')
+    parser.add_argument('--log-level', default='CRITICAL', help='客户端日志级别')
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    install_order_detail_stub(0)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        server = SilentServer()
+        server.start()
+        try:
+            result = asyncio.run(run(args, server))
+        finally:
+            server.stop()
+            os.chdir(ROOT_DIR)
+
+    detect = result['detect']
+    budget = args.interval * args.max_missed + min(args.timeout, args.interval) + args.slack
+    print(f"心跳往返时间(均值):   {result['rtt_mean'] * 1000:.2f} ms")
+    print(f"判定失效耗时:         {detect['sum']:.2f} s (判定 {detect['count']} 次)")
+    print(f"停止应答 -> 重新注册: {result['reconnect']:.2f} s (预算 {budget:.2f} s)")
+    print(f"丢弃的请求数:         {server.dropped}")
+
+    failures = []
+    if detect['count'] != 1 or result['reconnects'] != 1:
+        failures.append(f"应判定失效并重连1次，实际判定{detect['count']}次、重连{result['reconnects']:.0f}次")
+    if result['connection_failures']:
+        failures.append(f"心跳判定的重连不应计入连接失败次数，实际 {result['connection_failures']}")
+    if result['reconnect'] > budget:
+        failures.append(f"重连耗时 {result['reconnect']:.2f} s 超过预算 {budget:.2f} s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 半开连接已被心跳看门狗检测并立即重连")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+图片存储基准 - 批量上传吞吐、去重效果和引用计数删除检查
+
+在临时目录中（独立的数据库和上传目录）生成一批随机图片，其中一部分重复上传，分别测量：
+    legacy:     旧实现的保存方式（校验/取扩展名/压缩各解码一次，文件名带随机uuid不去重）
+    store_async: ImageManager.save_image_async 并发保存（解码压缩在线程池中进行）
+    store:      ImageManager.save_image 逐张保存（单次解码、按sha256去重），随后做去重与删除检查
+输出每种方式的吞吐（张/秒）、磁盘文件数和占用空间，并检查：
+    - 重复上传只保存一份文件，引用计数等于上传次数
+    - 删除时按引用计数释放，最后一次删除才移除原图和缩略图
+检查失败时以非零状态码退出。
+
+用法:
+    python benchmarks/image_store_bench.py --images 100 --duplicates 3
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from io import BytesIO
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def make_images(count: int, size: int, seed: int = 42) -> list:
+    """生成内容互不相同的PNG图片"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        img = Image.new('RGB', (size, size), tuple(rng.randrange(256) for _ in range(3)))
+        # 随机色块保证每张图片内容不同且有一定压缩成本
+        for _ in range(20):
+            x, y = rng.randrange(size), rng.randrange(size)
+            img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, min(size, x + 64), min(size, y + 64)))
+        output = BytesIO()
+        img.save(output, format='PNG')
+        images.append(output.getvalue())
+    return images
+
+
+def legacy_save(upload_dir: str, image_data: bytes) -> str:
+    """旧实现：三次解码，md5+随机uuid命名"""
+    from PIL import Image
+
+    with Image.open(BytesIO(image_data)) as img:
+        img.verify()
+    with Image.open(BytesIO(image_data)) as img:
+        ext = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}.get(img.format, 'jpg')
+    with Image.open(BytesIO(image_data)) as img:
+        img = img.convert('RGB')
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=85, optimize=True)
+    file_path = os.path.join(upload_dir, f"{hashlib.md5(image_data).hexdigest()}_{uuid.uuid4().hex[:8]}.{ext}")
+    with open(file_path, 'wb') as f:
+        f.write(output.getvalue())
+    return file_path
+
+
+def dir_usage(path: str) -> tuple:
+    files, total = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return files, total
+
+
+def report(name: str, uploads: int, elapsed: float, upload_dir: str):
+    files, total = dir_usage(upload_dir)
+    print(f"{name:<12}{uploads:>8}{elapsed:>10.2f}{uploads / elapsed:>10.1f}{files:>8}{total / 1024:>10.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='图片存储吞吐/去重基准')
+    parser.add_argument('--images', type=int, default=100, help='不同图片数量')
+    parser.add_argument('--duplicates', type=int, default=3, help='每张图片的上传次数')
+    parser.add_argument('--size', type=int, default=800, help='图片边长(像素)')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发保存数')
+    args = parser.parse_args(argv)
+
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    images = make_images(args.images, args.size)
+    uploads = [data for data in images for _ in range(args.duplicates)]
+    random.Random(7).shuffle(uploads)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库和上传目录都使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        from utils.image_utils import ImageManager
+
+        print(f"{'mode':<12}{'uploads':>8}{'time(s)':>10}{'img/s':>10}{'files':>8}{'disk(KB)':>10}")
+
+        legacy_dir = os.path.join(work_dir, 'legacy')
+        os.makedirs(legacy_dir)
+        started = time.perf_counter()
+        for data in uploads:
+            legacy_save(legacy_dir, data)
+        report('legacy', len(uploads), time.perf_counter() - started, legacy_dir)
+
+        async_manager = ImageManager('static/uploads/async_images')
+
+        async def save_all():
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def save(data):
+                async with semaphore:
+                    return await async_manager.save_image_async(data)
+
+            return await asyncio.gather(*(save(data) for data in uploads))
+
+        started = time.perf_counter()
+        asyncio.run(save_all())
+        report('store_async', len(uploads), time.perf_counter() - started, async_manager.upload_dir)
+
+        # 两种方式共用同一个数据库，清空图片记录后再测逐张保存
+        from db_manager import db_manager
+        with db_manager.lock:
+            db_manager.conn.execute('DELETE FROM image_store')
+            db_manager.conn.commit()
+
+        manager = ImageManager('static/uploads/images')
+        started = time.perf_counter()
+        paths = [manager.save_image(data) for data in uploads]
+        report('store', len(uploads), time.perf_counter() - started, manager.upload_dir)
+
+        failures = []
+        unique_paths = set(paths)
+        if None in unique_paths:
+            failures.append("存在保存失败的图片")
+        if len(unique_paths) != args.images:
+            failures.append(f"去重失败: {args.images} 张不同图片保存为 {len(unique_paths)} 个文件")
+
+        # 引用计数删除：前 duplicates-1 次删除应保留文件，最后一次删除原图和缩略图
+        sample = next(iter(unique_paths))
+        info = manager.get_image_info(sample)
+        if not info or info['ref_count'] != args.duplicates:
+            failures.append(f"引用计数错误: 期望 {args.duplicates}，实际 {info and info['ref_count']}")
+        else:
+            thumb_path = info['thumb_path']
+            for _ in range(args.duplicates - 1):
+                manager.delete_image(sample)
+            if not os.path.exists(sample) or not os.path.exists(thumb_path):
+                failures.append("仍有引用时图片被删除")
+            manager.delete_image(sample)
+            if os.path.exists(sample) or os.path.exists(thumb_path):
+                failures.append("最后一个引用释放后图片未被删除")
+            if manager.save_image(images[0]) is None:
+                failures.append("删除后重新上传失败")
+
+        os.chdir(ROOT_DIR)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 去重与引用计数删除检查通过")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+本地意图分类离线评估 - 用已记录的意图评估规则 + 朴素贝叶斯分类器的准确率和可省去的大模型调用比例
+
+数据来源（任选其一）：
+    --db      数据库文件，读取 ai_conversations 中用户消息的 content/intent（即线上大模型判断的意图）
+    --corpus  JSONL 文件，每行 {"text": "...", "intent": "price|tech|default"}
+    都不指定时使用按模板合成的语料（测试集只用训练集中没有的模板；仅用于冒烟检查，数值不代表线上效果）
+样本打乱后按 --test-ratio 划分，训练集训练模型，在测试集上分别评估 rules（只用规则）和 rules+nb：
+    decided   - 本地判定的比例，即省去的大模型意图调用比例
+    accuracy  - 本地判定部分与记录意图一致的比例
+    overall   - 其余交给大模型（按记录意图计为正确）后的整体准确率
+    us/msg    - 单条分类耗时（微秒）
+另外用 RULE_CASES 检查规则的已知误判（如“这把刀锋利吗”不应判为议价）。
+rules+nb 本地判定部分准确率低于 --min-accuracy 或规则检查不通过时以非零状态码退出。
+
+用法:
+    python benchmarks/intent_eval.py
+    python benchmarks/intent_eval.py --db data/xianyu_auto_reply.db --threshold 0.9
+    python benchmarks/intent_eval.py --corpus intents.jsonl --test-ratio 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from utils.intent_classifier import INTENTS, IntentClassifier
+
+# 合成语料模板，{n} 替换为价格，{x} 替换为配件/型号
+TEMPLATES = {
+    'price': ['能便宜点吗', '{n}出吗', '最低多少', '{n}块行不行', '可以优惠吗', '包邮{n}卖吗', '诚心要，少点呗',
+              '刀一下', '价格能再低点吗', '{n}元可以的话我就拍了', '再让点呗', '贵了', '{n}包邮可以吗', '有没有折扣'],
+    'tech': ['这个怎么用', '电池健康多少', '支持{x}吗', '内存多大', '屏幕有没有划痕', '能连{x}吗', '尺寸是多少',
+             '是国行吗', '坏了能修吗', '兼容{x}吗', '有拆修过吗', '续航怎么样', '充电发热吗', '系统是最新的吗'],
+    'default': ['在吗', '你好', '还在吗', '什么时候发货', '发什么快递', '可以自提吗', '拍了', '好的谢谢',
+                '已付款', '几天能到', '能发顺丰吗', '人呢', '收到了', '东西还有吗'],
+}
+# (消息, 规则应给出的意图，None 表示规则不应判为议价)
+RULE_CASES = [('这把刀锋利吗', None), ('刀具套装几把', None), ('50刀出吗', 'price'), ('能少两刀吗', 'price'),
+              ('刀一下', 'price'), ('可以刀吗', 'price')]
+PREFIXES = ['', '', '亲，', '老板', '你好，', '请问']
+SUFFIXES = ['', '', '？', '呀', '哈', '~']
+FILLERS = {'n': ['50', '80', '120', '199', '300'], 'x': ['蓝牙', '快充', 'type-c', '5G', '无线充电']}
+
+
+def synthesize(count: int, rng: random.Random, held_out: bool) -> list:
+    """按模板合成 [(消息, 意图)]；held_out 为 True 时只用每类中每隔三个的模板（训练集未见过的说法）"""
+    samples = []
+    for _ in range(count):
+        intent = rng.choices(INTENTS, weights=(0.35, 0.25, 0.4))[0]
+        templates = [template for index, template in enumerate(TEMPLATES[intent]) if (index % 3 == 0) == held_out]
+        text = rng.choice(templates).format(n=rng.choice(FILLERS['n']), x=rng.choice(FILLERS['x']))
+        samples.append((rng.choice(PREFIXES) + text + rng.choice(SUFFIXES), intent))
+    return samples
+
+
+def load_db(path: str) -> list:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT content, intent FROM ai_conversations "
+                            "WHERE role = 'user' AND intent IN ('price', 'tech', 'default')").fetchall()
+    finally:
+        conn.close()
+    return [(text, intent) for text, intent in rows if text]
+
+
+def load_corpus(path: str) -> list:
+    samples = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                if record.get('intent') in INTENTS:
+                    samples.append((record['text'], record['intent']))
+    return samples
+
+
+def evaluate(classifier: IntentClassifier, samples: list) -> dict:
+    decided = correct = 0
+    per_intent = {intent: [0, 0, 0] for intent in INTENTS}  # [样本数, 本地判定数, 判定正确数]
+    started = time.perf_counter()
+    for text, intent in samples:
+        predicted = classifier.predict(text)
+        per_intent[intent][0] += 1
+        if predicted is not None:
+            decided += 1
+            per_intent[intent][1] += 1
+            if predicted == intent:
+                correct += 1
+                per_intent[intent][2] += 1
+    elapsed = time.perf_counter() - started
+    total = len(samples)
+    return {
+        'decided': decided / total, 'accuracy': correct / decided if decided else float('nan'),
+        'overall': (correct + total - decided) / total, 'us': elapsed / total * 1e6, 'per_intent': per_intent,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='本地意图分类离线评估')
+    parser.add_argument('--db', help='数据库文件（读取 ai_conversations 中记录的意图）')
+    parser.add_argument('--corpus', help='JSONL 语料文件')
+    parser.add_argument('--samples', type=int, default=2000, help='合成语料条数')
+    parser.add_argument('--test-ratio', type=float, default=0.3, help='测试集比例')
+    parser.add_argument('--threshold', type=float, default=0.8, help='本地判定的置信度阈值')
+    parser.add_argument('--min-samples', type=int, default=50, help='使用模型所需的最少训练样本数')
+    parser.add_argument('--min-accuracy', type=float, default=0.9, help='本地判定部分的最低准确率')
+    parser.add_argument('--seed', type=int, default=7, help='随机种子')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.db or args.corpus:
+        samples = load_db(args.db) if args.db else load_corpus(args.corpus)
+        source = args.db or args.corpus
+        if len(samples) < 10:
+            print(f"FAIL: 样本过少（{len(samples)} 条）: {source}")
+            return 1
+        rng.shuffle(samples)
+        split = int(len(samples) * (1 - args.test_ratio))
+        train, test = samples[:split], samples[split:]
+    else:
+        # 测试集只用训练集中没有的模板，避免按模板记忆
+        source = '合成语料'
+        test_count = int(args.samples * args.test_ratio)
+        train, test = synthesize(args.samples - test_count, rng, False), synthesize(test_count, rng, True)
+        samples = train + test
+
+    counts = {intent: sum(1 for _, label in samples if label == intent) for intent in INTENTS}
+    print(f"source={source} samples={len(samples)} train={len(train)} test={len(test)} "
+          f"threshold={args.threshold} " + ' '.join(f"{intent}={count}" for intent, count in counts.items()))
+    print(f"{'mode':<10}{'decided':>9}{'accuracy':>10}{'overall':>9}{'us/msg':>8}  per intent (本地判定/样本, 正确)")
+
+    results = {}
+    for mode in ('rules', 'rules+nb'):
+        classifier = IntentClassifier(threshold=args.threshold, min_samples=args.min_samples)
+        if mode == 'rules+nb':
+            classifier.train(train)
+        result = results[mode] = evaluate(classifier, test)
+        details = ' '.join(f"{intent}={decided}/{total},{correct}"
+                           for intent, (total, decided, correct) in result['per_intent'].items())
+        print(f"{mode:<10}{result['decided']:>9.1%}{result['accuracy']:>10.1%}{result['overall']:>9.1%}"
+              f"{result['us']:>8.1f}  {details}")
+
+    failures = []
+    rules_only = IntentClassifier(threshold=args.threshold, min_samples=args.min_samples)
+    for text, expected in RULE_CASES:
+        predicted, _ = rules_only.classify(text)
+        if (expected is None and predicted == 'price') or (expected is not None and predicted != expected):
+            failures.append(f"规则把“{text}”判为 {predicted}，应为 {expected or '非议价'}")
+
+    accuracy = results['rules+nb']['accuracy']
+    if not accuracy >= args.min_accuracy:
+        failures.append(f"本地判定准确率 {accuracy:.1%} 低于 {args.min_accuracy:.0%}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print(f"OK: 本地判定 {results['rules+nb']['decided']:.1%} 的消息（省去同等比例的大模型意图调用），"
+          f"准确率 {accuracy:.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
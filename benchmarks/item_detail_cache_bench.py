@@ -0,0 +1,116 @@
+"""
+商品详情缓存基准 - 校验同一商品的并发查询只触发一次上游获取，以及保存详情后缓存失效
+
+上游获取函数等待 --fetch-delay 秒后返回详情并计数，依次检查：
+    coalesce   - --concurrency 个并发查询同一商品，上游只获取一次，所有查询拿到相同详情
+    hit        - 随后的查询直接命中缓存，不再获取
+    invalidate - XianyuLive.invalidate_item_detail（保存/删除商品详情时调用）后再次查询重新获取一次
+    inflight   - 获取进行中时失效，旧的获取结果不写入缓存，之后的查询重新获取
+另外输出并发查询的总耗时。任一校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/item_detail_cache_bench.py
+    python benchmarks/item_detail_cache_bench.py --concurrency 1000 --fetch-delay 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from loguru import logger
+
+
+class CountingFetcher:
+    """记录上游获取次数，每次获取返回带版本号的详情"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, item_id: str) -> str:
+        self.calls += 1
+        version = self.calls
+        await asyncio.sleep(self.delay)
+        return f'商品 {item_id} 详情 v{version}'
+
+
+async def run(args) -> list:
+    from XianyuAutoAsync import XianyuLive
+
+    cache = XianyuLive._item_detail_cache
+    fetcher = CountingFetcher(args.fetch_delay)
+    failures = []
+    item_id = '800000000001'
+
+    started = time.perf_counter()
+    details = await asyncio.gather(*(cache.get_or_fetch(item_id, fetcher) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    print(f"coalesce:   {args.concurrency} 个并发查询，上游获取 {fetcher.calls} 次，耗时 {elapsed * 1000:.1f} ms")
+    if fetcher.calls != 1:
+        failures.append(f"{args.concurrency} 个并发查询触发了 {fetcher.calls} 次上游获取，应为 1 次")
+    if len(set(details)) != 1 or not details[0]:
+        failures.append(f"并发查询返回了不同或空的详情: {sorted(set(details))[:3]}")
+
+    await cache.get_or_fetch(item_id, fetcher)
+    print(f"hit:        再次查询后上游获取共 {fetcher.calls} 次")
+    if fetcher.calls != 1:
+        failures.append("缓存命中后仍触发了上游获取")
+
+    XianyuLive.invalidate_item_detail(item_id)
+    detail = await cache.get_or_fetch(item_id, fetcher)
+    print(f"invalidate: 失效后查询得到 {detail!r}，上游获取共 {fetcher.calls} 次")
+    if fetcher.calls != 2:
+        failures.append(f"失效后查询应重新获取一次，实际上游获取共 {fetcher.calls} 次")
+
+    # 获取进行中时保存了新的详情：旧的获取结果不应写入缓存
+    other_id = '800000000002'
+    pending = asyncio.ensure_future(cache.get_or_fetch(other_id, fetcher))
+    await asyncio.sleep(args.fetch_delay / 2)
+    XianyuLive.invalidate_item_detail(other_id)
+    await pending
+    cached = cache.get(other_id)
+    calls_before = fetcher.calls
+    await cache.get_or_fetch(other_id, fetcher)
+    print(f"inflight:   获取中失效后缓存为 {cached!r}，之后的查询上游获取 {fetcher.calls - calls_before} 次")
+    if cached is not None:
+        failures.append(f"获取中失效后旧结果仍写入了缓存: {cached!r}")
+    if fetcher.calls - calls_before != 1:
+        failures.append("获取中失效后的查询没有重新获取")
+
+    print(f"stats:      {cache.stats()}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='商品详情缓存并发合并/失效基准')
+    parser.add_argument('--concurrency', type=int, default=100, help='同一商品的并发查询数')
+    parser.add_argument('--fetch-delay', type=float, default=0.1, help='模拟上游获取耗时(秒)')
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            failures = asyncio.run(run(args))
+        finally:
+            os.chdir(ROOT_DIR)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print("OK: 并发查询只获取一次，保存详情后缓存失效")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+商品搜索基准 - 在本地假搜索接口上测量接口搜索后端的单次查询延迟与吞吐
+
+本地启动一个假的 mtop.taobao.idlemtopsearch.pc.search 服务（aiohttp.web），每页按
+--page-delay 模拟上游耗时并返回 --rows 条商品，分别测量：
+    sequential: 逐页顺序请求、不使用缓存（等价于浏览器逐页翻页的请求模式，不含浏览器本身的固定等待）
+    concurrent: MtopSearchBackend 并发请求各页、不使用缓存
+    cached:     MtopSearchBackend 开启结果缓存后重复同一查询
+输出每次查询的平均/P95耗时和每秒查询数。
+搜索账号写入临时目录中的独立数据库，由 MtopSearchBackend._get_client 从数据库选择；
+假接口第一次响应时下发新的 _m_h5_tk，校验刷新后的Cookie被写回数据库。校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/item_search_bench.py --queries 20 --pages 5 --page-delay 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from aiohttp import web
+from loguru import logger
+
+from utils.item_search_api import MtopSearchBackend, SEARCH_API
+
+COOKIES_STR = 'unb=2200000000; cookie2=abc123; _m_h5_tk=0123456789abcdef0123456789abcdef_1700000000000; _m_h5_tk_enc=xyz; t=foo'
+REFRESHED_TOKEN = 'fedcba9876543210fedcba9876543210_1800000000000'
+
+
+def build_result_item(page: int, index: int) -> dict:
+    """构造与真实搜索接口结构一致的单条结果"""
+    item_id = f'{page:03d}{index:04d}'
+    return {
+        'data': {'item': {'main': {
+            'exContent': {
+                'title': f'测试商品 {item_id}',
+                'price': [{'text': '¥'}, {'text': str(100 + index)}],
+                'fishTags': {'r3': {'tagList': [{'data': {'content': f'{index * 3}人想要'}}]}},
+                'area': '杭州',
+                'userNickName': f'卖家{index}',
+                'picUrl': f'//img.example.com/{item_id}.jpg',
+            },
+            'clickParam': {'args': {'item_id': item_id, 'publishTime': '1700000000000'}},
+            'targetUrl': f'fleamarket://item?id={item_id}',
+        }}}
+    }
+
+
+class FakeSearchServer:
+    """按页返回固定结果的搜索接口"""
+
+    def __init__(self, page_delay: float, rows: int):
+        self.page_delay = page_delay
+        self.rows = rows
+        self.requests = 0
+        self.refreshed = False
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        self.requests += 1
+        form = await request.post()
+        data = json.loads(form['data'])
+        page = int(data['pageNumber'])
+        await asyncio.sleep(self.page_delay)
+        response = web.json_response({
+            'ret': ['SUCCESS::调用成功'],
+            'data': {'resultList': [build_result_item(page, i) for i in range(self.rows)]},
+        })
+        if not self.refreshed:
+            # 与线上一致：响应中下发新的 _m_h5_tk
+            self.refreshed = True
+            response.headers.add('Set-Cookie', f'_m_h5_tk={REFRESHED_TOKEN}; Path=/; Domain=.taobao.com')
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/h5/{api}/{version}/', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/h5/{SEARCH_API}/1.0/'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def seed_account():
+    """在临时数据库中写入搜索账号"""
+    from db_manager import db_manager
+    with db_manager.lock:
+        db_manager.conn.execute("INSERT OR REPLACE INTO cookies (id, value, user_id) VALUES (?, ?, 1)",
+                                ('bench', COOKIES_STR))
+        db_manager.conn.commit()
+
+
+def create_backend(url: str, cache_ttl: float, max_concurrent_pages: int, page_size: int) -> MtopSearchBackend:
+    backend = MtopSearchBackend(cache_ttl=cache_ttl, max_concurrent_pages=max_concurrent_pages,
+                                page_size=page_size, url=url)
+    # 与线上相同，从数据库中选择账号
+    client = backend._get_client()
+    if client is None:
+        raise RuntimeError('_get_client 未从数据库中选出搜索账号')
+    client.limiter.rate = 0  # 基准测试不限流
+    return backend
+
+
+async def run_mode(name: str, backend: MtopSearchBackend, queries: int, pages: int,
+                   server: FakeSearchServer) -> dict:
+    server.requests = 0
+    latencies = []
+    items = 0
+    started = time.perf_counter()
+    for _ in range(queries):
+        query_started = time.perf_counter()
+        result = await backend.search_multiple_pages('测试', pages)
+        latencies.append((time.perf_counter() - query_started) * 1000)
+        items = len(result['items'])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'mode': name,
+        'queries': queries,
+        'items': items,
+        'mean_ms': statistics.mean(latencies),
+        'p95_ms': latencies[max(0, int(len(latencies) * 0.95) - 1)],
+        'qps': queries / elapsed,
+        'upstream': server.requests,
+    }
+
+
+async def main_async(args) -> list:
+    from db_manager import db_manager
+
+    seed_account()
+    server = FakeSearchServer(args.page_delay, args.rows)
+    await server.start()
+    results = []
+    failures = []
+    try:
+        for name, cache_ttl, concurrency in (('sequential', 0, 1),
+                                             ('concurrent', 0, args.concurrency),
+                                             ('cached', 60, args.concurrency)):
+            backend = create_backend(server.url, cache_ttl, concurrency, args.rows)
+            try:
+                results.append(await run_mode(name, backend, args.queries, args.pages, server))
+            finally:
+                await backend.close()
+    finally:
+        await server.stop()
+
+    stored = next((cookie['cookie'] for cookie in db_manager.get_all_cookies() if cookie['id'] == 'bench'), '')
+    if f'_m_h5_tk={REFRESHED_TOKEN}' not in stored:
+        failures.append("响应刷新的 _m_h5_tk 未写回数据库")
+    if any(result['items'] == 0 for result in results):
+        failures.append("有搜索方式未返回商品")
+
+    print(f"{'mode':<12}{'queries':>8}{'items':>7}{'mean(ms)':>10}{'p95(ms)':>10}{'qps':>8}{'upstream':>10}")
+    for result in results:
+        print(f"{result['mode']:<12}{result['queries']:>8}{result['items']:>7}{result['mean_ms']:>10.1f}"
+              f"{result['p95_ms']:>10.1f}{result['qps']:>8.1f}{result['upstream']:>10}")
+    return failures
+
+
+def main(argv=None) -> int:
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    parser = argparse.ArgumentParser(description='接口搜索后端延迟/吞吐基准')
+    parser.add_argument('--queries', type=int, default=20, help='每种方式的查询次数')
+    parser.add_argument('--pages', type=int, default=5, help='每次查询的页数')
+    parser.add_argument('--rows', type=int, default=30, help='每页商品数')
+    parser.add_argument('--page-delay', type=float, default=0.15, help='假接口每页的响应延迟(秒)')
+    parser.add_argument('--concurrency', type=int, default=3, help='并发页数')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            failures = asyncio.run(main_async(args))
+        finally:
+            os.chdir(ROOT_DIR)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print("OK: 搜索账号从数据库选择，刷新后的Cookie已写回数据库")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
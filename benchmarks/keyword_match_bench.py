@@ -0,0 +1,167 @@
+"""
+关键词匹配基准 - 对比原有的逐个关键词子串扫描与编译后的关键词匹配器
+
+生成 --keywords 个关键词（其中 --regex-share 为 re: 正则、--fuzzy-share 为 fuzzy: 模糊关键词，
+--item-share 绑定商品ID），--messages 条随机买家消息（约一半包含某个关键词），统计：
+    build      - 匹配器构建耗时（关键词修改后才重新构建）
+    p50/p99    - 单条消息匹配耗时（微秒）
+    legacy     - 原实现：按列表顺序逐个 keyword.lower() in message.lower()，先商品关键词再通用关键词
+校验：
+    - 只有普通关键词时，匹配器与原实现的结果逐条一致
+    - 会灾难性回溯的正则在保存时被拒绝；超长消息只用前 MAX_REGEX_INPUT 个字符匹配正则
+匹配器 p99 超过 --budget-us 微秒或校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/keyword_match_bench.py
+    python benchmarks/keyword_match_bench.py --keywords 10000 --messages 5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from replay_bench import percentile
+from utils.keyword_matcher import MAX_REGEX_INPUT, KeywordMatcher, compile_regex
+
+CHARS = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理府研质'
+ITEM_IDS = ['800001', '800002', '800003']
+DANGEROUS = [r'(a+)+$', r'(.*)*x', r'(\w+\s?)+$', r'((ab)*)+c', r'(x+x+)+y', r'(a|a)*b', r'(a|ab)*c',
+             r'(\w+|\d)+x', r'.*.*.*.*x', r'\d*\d*\d*x']
+
+
+def random_text(rng: random.Random, low: int, high: int) -> str:
+    return ''.join(rng.choice(CHARS) for _ in range(rng.randint(low, high)))
+
+
+def build_keywords(args, rng: random.Random) -> list:
+    keywords = []
+    for index in range(args.keywords):
+        draw = rng.random()
+        if draw < args.regex_share:
+            keyword = f're:^{random_text(rng, 1, 2)}\\d+(元|块)?{random_text(rng, 1, 2)}$'
+        elif draw < args.regex_share + args.fuzzy_share:
+            keyword = f'fuzzy:{random_text(rng, 3, 8)}'
+        else:
+            keyword = random_text(rng, 2, 6)
+        item_id = rng.choice(ITEM_IDS) if rng.random() < args.item_share else None
+        keywords.append({'keyword': keyword, 'reply': f'回复{index}', 'item_id': item_id, 'type': 'text',
+                         'image_url': None})
+    return keywords
+
+
+def build_messages(args, keywords: list, rng: random.Random) -> list:
+    plain = [data['keyword'] for data in keywords if ':' not in data['keyword']]
+    messages = []
+    for _ in range(args.messages):
+        text = random_text(rng, 5, 40)
+        if rng.random() < 0.5 and plain:
+            position = rng.randint(0, len(text))
+            text = text[:position] + rng.choice(plain) + text[position:]
+        messages.append((text, rng.choice(ITEM_IDS + [None])))
+    return messages
+
+
+def legacy_match(keywords: list, message: str, item_id: str = None):
+    """原 get_keyword_reply 的匹配顺序"""
+    if item_id:
+        for data in keywords:
+            if data['item_id'] == item_id and data['keyword'].lower() in message.lower():
+                return data
+    for data in keywords:
+        if not data['item_id'] and data['keyword'].lower() in message.lower():
+            return data
+    return None
+
+
+def time_calls(func, messages: list) -> list:
+    samples = []
+    for message, item_id in messages:
+        started = time.perf_counter()
+        func(message, item_id)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='关键词匹配基准')
+    parser.add_argument('--keywords', type=int, default=3000, help='关键词数')
+    parser.add_argument('--messages', type=int, default=2000, help='消息数')
+    parser.add_argument('--regex-share', type=float, default=0.05, help='正则关键词比例')
+    parser.add_argument('--fuzzy-share', type=float, default=0.1, help='模糊关键词比例')
+    parser.add_argument('--item-share', type=float, default=0.3, help='绑定商品ID的关键词比例')
+    parser.add_argument('--budget-us', type=float, default=1000, help='匹配器单条消息 p99 预算(微秒)')
+    parser.add_argument('--seed', type=int, default=7, help='随机种子')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    keywords = build_keywords(args, rng)
+    messages = build_messages(args, keywords, rng)
+    failures = []
+
+    started = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    build = time.perf_counter() - started
+
+    legacy = time_calls(lambda message, item_id: legacy_match(keywords, message, item_id), messages)
+    compiled = time_calls(matcher.match, messages)
+    hits = sum(1 for message, item_id in messages if matcher.match(message, item_id))
+
+    # 只有普通关键词时与原实现逐条一致
+    plain = [data for data in keywords if ':' not in data['keyword']]
+    plain_matcher = KeywordMatcher(plain)
+    mismatches = sum(1 for message, item_id in messages
+                     if plain_matcher.match(message, item_id) is not legacy_match(plain, message, item_id))
+    if mismatches:
+        failures.append(f"{mismatches} 条消息的匹配结果与原实现不一致")
+
+    accepted = []
+    for pattern in DANGEROUS:
+        try:
+            compile_regex(pattern)
+            accepted.append(pattern)
+        except ValueError:
+            pass
+    if accepted:
+        failures.append(f"未拒绝可能灾难性回溯的正则: {accepted}")
+
+    # 超长消息：正则只看前 MAX_REGEX_INPUT 个字符
+    long_message = 'a' * 100000
+    started = time.perf_counter()
+    matcher.match(long_message)
+    long_elapsed = time.perf_counter() - started
+    tail = '尾部标记'
+    tail_matcher = KeywordMatcher([{'keyword': f're:{tail}', 'reply': '尾部', 'item_id': None, 'type': 'text',
+                                    'image_url': None}])
+    if not tail_matcher.match('a' * (MAX_REGEX_INPUT - len(tail)) + tail):
+        failures.append(f"前 {MAX_REGEX_INPUT} 个字符内的正则关键词没有命中")
+    if tail_matcher.match('a' * MAX_REGEX_INPUT + tail):
+        failures.append(f"正则匹配了前 {MAX_REGEX_INPUT} 个字符之外的内容")
+
+    print(f"keywords={args.keywords} messages={args.messages} hits={hits} build={build * 1000:.1f}ms "
+          f"long-message={long_elapsed * 1000:.1f}ms")
+    print(f"{'mode':<10}{'p50(us)':>10}{'p99(us)':>10}{'max(us)':>10}")
+    for mode, samples in (('legacy', legacy), ('compiled', compiled)):
+        us = [value * 1e6 for value in samples]
+        print(f"{mode:<10}{percentile(us, 50):>10.1f}{percentile(us, 99):>10.1f}{max(us):>10.1f}")
+    print(f"rejected {len(DANGEROUS) - len(accepted)}/{len(DANGEROUS)} dangerous patterns, "
+          f"{len(plain)} plain keywords checked against legacy order")
+
+    compiled_p99 = percentile(compiled, 99) * 1e6
+    if compiled_p99 > args.budget_us:
+        failures.append(f"匹配器 p99 {compiled_p99:.1f}us 超过预算 {args.budget_us:.0f}us")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 关键词匹配在预算内，结果与原实现一致")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""
+消息解析基准 - 对比旧的逐字段提取方式与 parse_message 单次解析的每条消息耗时
+
+语料覆盖线上推送解密后的主要结构：
+    chat:      普通聊天（reminderUrl 带商品ID）
+    chat_noid: 聊天消息但链接中没有商品ID（走全消息遍历兜底）
+    order:     付款卡片（自动发货触发，按钮链接带订单ID）
+    dynamic:   dynamicOperation 中带订单详情链接的卡片
+    card:      普通卡片消息
+    system:    系统提示（我已拍下，待付款 等）
+    status:    message['1'] 为字符串的状态消息
+    legacy:    旧实现（handle_message 中的各段提取 + _extract_order_id + 卡片分支重复解析）
+    parsed:    parse_message（一次解析 + 查表分类）
+并逐条检查两种方式提取的字段一致，不一致时以非零状态码退出。
+
+用法:
+    python benchmarks/message_parse_bench.py
+    python benchmarks/message_parse_bench.py --iterations 20000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger
+
+from replay_bench import build_message, build_order_card
+from utils.message_parser import parse_message, KIND_OTHER
+
+COOKIE_ID = 'bench'
+
+
+def build_corpus() -> dict:
+    """各类消息各一条（结构与线上一致）"""
+    chat_noid = build_message('50000000002', '3300000002', '还在吗', '')
+    chat_noid['1']['10']['reminderUrl'] = 'fleamarket://message_chat?peerUserId=3300000002&sid=50000000002'
+
+    dynamic_card = {'dynamicOperation': {'changeContent': {'dxCard': {'item': {'main': {'exContent': {
+        'title': '买家已付款', 'button': {'targetUrl': 'fleamarket://order_detail?id=4100000000001&role=seller'}}}}}}}}
+
+    return {
+        'chat': build_message('50000000001', '3300000001', '包邮吗', '700000000001'),
+        'chat_noid': chat_noid,
+        'order': build_message('50000000003', '3300000003', '[我已付款，等待你发货]', '700000000003',
+                               build_order_card('4100000000003', '700000000003', '我已付款，等待你发货'), '等待卖家发货'),
+        'dynamic': build_message('50000000004', '3300000004', '[卡片消息]', '700000000004', dynamic_card),
+        'card': build_message('50000000005', '3300000005', '[卡片消息]', '700000000005',
+                              build_order_card('4100000000005', '700000000005', '交易提醒')),
+        'system': build_message('50000000006', '3300000006', '[我已拍下，待付款]', '700000000006',
+                                red_reminder='等待买家付款'),
+        'status': {'1': '3300000007@goofish', '2': 1, '3': {'redReminder': '交易关闭', 'content': '订单已关闭'}},
+    }
+
+
+# ---- 旧实现（改造前 XianyuLive 中的提取逻辑，保留用于对比） ----
+
+def legacy_extract_item_id(message):
+    try:
+        message_1 = message.get('1')
+        if isinstance(message_1, str):
+            id_match = re.search(r'(\d{10,})', message_1)
+            if id_match:
+                logger.info(f"从message[1]字符串中提取商品ID: {id_match.group(1)}")
+                return id_match.group(1)
+
+        message_3 = message.get('3', {})
+        if isinstance(message_3, dict):
+            if 'extension' in message_3:
+                extension = message_3['extension']
+                if isinstance(extension, dict):
+                    item_id = extension.get('itemId') or extension.get('item_id')
+                    if item_id:
+                        return item_id
+            if 'bizData' in message_3:
+                biz_data = message_3['bizData']
+                if isinstance(biz_data, dict):
+                    item_id = biz_data.get('itemId') or biz_data.get('item_id')
+                    if item_id:
+                        return item_id
+            for key, value in message_3.items():
+                if isinstance(value, dict):
+                    item_id = value.get('itemId') or value.get('item_id')
+                    if item_id:
+                        return item_id
+            content = message_3.get('content', '')
+            if isinstance(content, str) and content:
+                id_match = re.search(r'(\d{10,})', content)
+                if id_match:
+                    logger.info(f"【{COOKIE_ID}】从消息内容中提取商品ID: {id_match.group(1)}")
+                    return id_match.group(1)
+
+        def find_item_id_recursive(obj, path=""):
+            if isinstance(obj, dict):
+                for key in ['itemId', 'item_id', 'id']:
+                    if key in obj and isinstance(obj[key], (str, int)):
+                        value = str(obj[key])
+                        if len(value) >= 10 and value.isdigit():
+                            logger.info(f"从{path}.{key}中提取商品ID: {value}")
+                            return value
+                for key, value in obj.items():
+                    result = find_item_id_recursive(value, f"{path}.{key}" if path else key)
+                    if result:
+                        return result
+            elif isinstance(obj, str):
+                id_match = re.search(r'(\d{10,})', obj)
+                if id_match:
+                    logger.info(f"从{path}字符串中提取商品ID: {id_match.group(1)}")
+                    return id_match.group(1)
+            return None
+
+        result = find_item_id_recursive(message)
+        if result:
+            return result
+        logger.debug("所有方法都未能提取到商品ID")
+        return None
+    except Exception as e:
+        logger.error(f"提取商品ID失败: {e}")
+        return None
+
+
+def legacy_extract_order_id(message):
+    try:
+        order_id = None
+        logger.debug(f"【{COOKIE_ID}】🔍 完整消息结构: {message}")
+        message_1 = message.get('1', {})
+        content_json_str = ''
+        if isinstance(message_1, dict):
+            logger.debug(f"【{COOKIE_ID}】🔍 message['1'] 是字典，keys: {list(message_1.keys())}")
+            message_1_6 = message_1.get('6', {})
+            if isinstance(message_1_6, dict):
+                logger.debug(f"【{COOKIE_ID}】🔍 message['1']['6'] 是字典，keys: {list(message_1_6.keys())}")
+                content_json_str = message_1_6.get('3', {}).get('5', '') if isinstance(message_1_6.get('3', {}), dict) else ''
+            else:
+                logger.debug(f"【{COOKIE_ID}】🔍 message['1']['6'] 不是字典: {type(message_1_6)}")
+        elif isinstance(message_1, str):
+            logger.debug(f"【{COOKIE_ID}】🔍 message['1'] 是字符串，长度: {len(message_1)}")
+
+        if content_json_str:
+            try:
+                content_data = json.loads(content_json_str)
+                target_url = content_data.get('dxCard', {}).get('item', {}).get('main', {}).get('exContent', {}).get('button', {}).get('targetUrl', '')
+                if target_url:
+                    order_match = re.search(r'orderId=(\d+)', target_url)
+                    if order_match:
+                        order_id = order_match.group(1)
+                        logger.info(f'【{COOKIE_ID}】✅ 从button提取到订单ID: {order_id}')
+                if not order_id:
+                    main_target_url = content_data.get('dxCard', {}).get('item', {}).get('main', {}).get('targetUrl', '')
+                    if main_target_url:
+                        order_match = re.search(r'order_detail\?id=(\d+)', main_target_url)
+                        if order_match:
+                            order_id = order_match.group(1)
+                            logger.info(f'【{COOKIE_ID}】✅ 从main targetUrl提取到订单ID: {order_id}')
+            except Exception as parse_e:
+                logger.debug(f"解析内容JSON失败: {parse_e}")
+
+        if not order_id and content_json_str:
+            try:
+                content_data = json.loads(content_json_str)
+                dynamic_target_url = content_data.get('dynamicOperation', {}).get('changeContent', {}).get('dxCard', {}).get('item', {}).get('main', {}).get('exContent', {}).get('button', {}).get('targetUrl', '')
+                if dynamic_target_url:
+                    order_match = re.search(r'order_detail\?id=(\d+)', dynamic_target_url)
+                    if order_match:
+                        order_id = order_match.group(1)
+                        logger.info(f'【{COOKIE_ID}】✅ 从order_detail提取到订单ID: {order_id}')
+            except Exception as parse_e:
+                logger.debug(f"解析dynamicOperation JSON失败: {parse_e}")
+
+        if not order_id:
+            message_str = str(message)
+            patterns = [
+                r'orderId[=:](\d{10,})',
+                r'order_detail\?id=(\d{10,})',
+                r'"id"\s*:\s*"?(\d{10,})"?',
+                r'bizOrderId[=:](\d{10,})',
+            ]
+            for pattern in patterns:
+                matches = re.findall(pattern, message_str)
+                if matches:
+                    order_id = matches[0]
+                    logger.info(f'【{COOKIE_ID}】✅ 从消息字符串中提取到订单ID: {order_id} (模式: {pattern})')
+                    break
+
+        if order_id:
+            logger.info(f'【{COOKIE_ID}】🎯 最终提取到订单ID: {order_id}')
+        else:
+            logger.debug(f'【{COOKIE_ID}】❌ 未能从消息中提取到订单ID')
+        return order_id
+    except Exception as e:
+        logger.error(f"【{COOKIE_ID}】提取订单ID失败: {e}")
+        return None
+
+
+def legacy_is_chat_message(message):
+    return (
+        isinstance(message, dict)
+        and "1" in message
+        and isinstance(message["1"], dict)
+        and "10" in message["1"]
+        and isinstance(message["1"]["10"], dict)
+        and "reminderContent" in message["1"]["10"]
+    )
+
+
+def legacy_is_auto_delivery_trigger(text):
+    for keyword in ['[我已付款，等待你发货]', '[已付款，待发货]', '我已付款，等待你发货', '[记得及时发货]']:
+        if keyword in text:
+            return True
+    return False
+
+
+def legacy_user_id(message):
+    try:
+        message_1 = message.get("1")
+        if isinstance(message_1, str) and '@' in message_1:
+            return message_1.split('@')[0]
+        elif isinstance(message_1, dict):
+            if "10" in message_1 and isinstance(message_1["10"], dict):
+                return message_1["10"].get("senderUserId", "unknown_user")
+            return "unknown_user"
+        return "unknown_user"
+    except Exception:
+        return "unknown_user"
+
+
+def legacy_item_id(message):
+    item_id = None
+    if "1" in message and isinstance(message["1"], dict) and "10" in message["1"] and isinstance(message["1"]["10"], dict):
+        url_info = message["1"]["10"].get("reminderUrl", "")
+        if isinstance(url_info, str) and "itemId=" in url_info:
+            item_id = url_info.split("itemId=")[1].split("&")[0]
+    if not item_id:
+        item_id = legacy_extract_item_id(message)
+    return item_id
+
+
+def legacy_parse(message: dict) -> dict:
+    """改造前 handle_message 对同一条消息的全部提取步骤"""
+    result = {'order_id': legacy_extract_order_id(message)}
+    if result['order_id']:
+        # 获取订单详情前单独提取一次用户ID和商品ID
+        legacy_user_id(message)
+        legacy_item_id(message)
+    result['user_id'] = legacy_user_id(message)
+    result['item_id'] = legacy_item_id(message)
+
+    red_reminder = None
+    if isinstance(message, dict) and "3" in message and isinstance(message["3"], dict):
+        red_reminder = message["3"].get("redReminder")
+    result['red_reminder'] = red_reminder
+
+    if not legacy_is_chat_message(message):
+        result['kind'] = KIND_OTHER
+        return result
+
+    message_1 = message["1"]
+    message_10 = message_1["10"]
+    result['create_time'] = int(message_1.get("5", 0))
+    result['send_user_name'] = message_10.get("senderNick", message_10.get("reminderTitle", "未知用户"))
+    result['send_user_id'] = message_10.get("senderUserId", "unknown")
+    send_message = result['send_message'] = message_10.get("reminderContent", "")
+    chat_id_raw = message_1.get("2", "")
+    result['chat_id'] = chat_id_raw.split('@')[0] if '@' in str(chat_id_raw) else str(chat_id_raw)
+
+    if send_message in ('[我已拍下，待付款]', '[你关闭了订单，钱款已原路退返]', '发来一条消息', '发来一条新消息',
+                        '[买家确认收货，交易成功]', '快给ta一个评价吧~', '快给ta一个评价吧～',
+                        '卖家人不错？送Ta闲鱼小红花', '[你已确认收货，交易成功]', '[你已发货]'):
+        result['kind'] = 'system'
+    elif legacy_is_auto_delivery_trigger(send_message):
+        result['kind'] = 'delivery'
+        # 自动发货处理中再次提取订单ID
+        legacy_extract_order_id(message)
+    elif send_message == '[卡片消息]':
+        result['kind'] = 'card'
+        card_title = None
+        message_6_3 = message_1.get("6", {}).get("3", {})
+        if "5" in message_6_3:
+            try:
+                card_content = json.loads(message_6_3["5"])
+                if "dxCard" in card_content and "item" in card_content["dxCard"]:
+                    card_item = card_content["dxCard"]["item"]
+                    if "main" in card_item and "exContent" in card_item["main"]:
+                        card_title = card_item["main"]["exContent"].get("title", "")
+            except (json.JSONDecodeError, KeyError):
+                pass
+        result['card_title'] = card_title
+    else:
+        result['kind'] = 'chat'
+    return result
+
+
+def check_equivalent(name: str, message: dict) -> list:
+    """新旧两种方式提取的字段应一致"""
+    expected = legacy_parse(message)
+    parsed = parse_message(message)
+    failures = []
+    for field, value in expected.items():
+        actual = getattr(parsed, field)
+        if actual != value:
+            failures.append(f"{name}.{field}: 旧={value!r} 新={actual!r}")
+    return failures
+
+
+def measure(func, messages: list, iterations: int) -> float:
+    """返回每条消息的平均耗时（微秒）"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - started) / (iterations * len(messages)) * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='消息解析耗时对比基准')
+    parser.add_argument('--iterations', type=int, default=5000, help='每类消息的解析次数')
+    args = parser.parse_args(argv)
+
+    # 与线上一致：INFO 以下的日志不输出，但 f-string 参数仍会求值
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    corpus = build_corpus()
+    failures = []
+    for name, message in corpus.items():
+        failures.extend(check_equivalent(name, message))
+
+    print(f"{'kind':<12}{'legacy(us)':>12}{'parsed(us)':>12}{'speedup':>10}")
+    for name, message in list(corpus.items()) + [('all', None)]:
+        messages = list(corpus.values()) if message is None else [message]
+        iterations = args.iterations if message is not None else max(1, args.iterations // len(corpus))
+        legacy_us = measure(legacy_parse, messages, iterations)
+        parsed_us = measure(parse_message, messages, iterations)
+        print(f"{name:<12}{legacy_us:>12.2f}{parsed_us:>12.2f}{legacy_us / parsed_us:>9.1f}x")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 新旧解析结果一致")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
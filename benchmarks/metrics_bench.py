@@ -0,0 +1,112 @@
+"""
+指标记录开销基准 - 测量每次观测的耗时，确保埋点不拖慢消息处理
+
+分别测量以下操作的单次平均耗时（纳秒）：
+    counter_inc:     带标签的计数器 +1
+    histogram:       带标签的直方图 observe
+    timer:           with histogram.time(...) 计时一个空代码块（含两次 perf_counter）
+    lock_plain:      threading.Lock 获取+释放（对照）
+    lock_instrumented: InstrumentedLock 获取+释放（含等待/持有两次观测）
+以及导出全部指标（render）的耗时。任一观测类操作超出预算时以非零状态码退出。
+
+用法:
+    python benchmarks/metrics_bench.py
+    python benchmarks/metrics_bench.py --iterations 500000 --budget-us 2
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from utils.metrics import MetricsRegistry, InstrumentedLock, LOCK_BUCKETS
+
+DEFAULT_BUDGET_US = float(os.getenv('METRICS_BUDGET_US', '5'))
+
+
+def measure(func, iterations: int) -> float:
+    """返回单次调用的平均耗时（纳秒），已扣除空循环开销"""
+    def empty():
+        pass
+
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        empty()
+    baseline = time.perf_counter_ns() - started
+
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter_ns() - started
+    return max(0.0, (elapsed - baseline) / iterations)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='指标记录开销基准')
+    parser.add_argument('--iterations', type=int, default=200000, help='每项操作的执行次数')
+    parser.add_argument('--budget-us', type=float, default=DEFAULT_BUDGET_US, help='单次观测的耗时预算(微秒)')
+    args = parser.parse_args(argv)
+
+    registry = MetricsRegistry()
+    counter = registry.counter('bench_total', '基准计数器', ('source',))
+    histogram = registry.histogram('bench_stage_seconds', '基准直方图', ('stage',))
+    lock_wait = registry.histogram('bench_lock_wait_seconds', '锁等待', buckets=LOCK_BUCKETS)
+    lock_hold = registry.histogram('bench_lock_hold_seconds', '锁持有', buckets=LOCK_BUCKETS)
+    plain_lock = threading.Lock()
+    instrumented_lock = InstrumentedLock(lock_wait, lock_hold)
+
+    def timed_block():
+        with histogram.time('send_msg'):
+            pass
+
+    def plain_lock_cycle():
+        with plain_lock:
+            pass
+
+    def instrumented_lock_cycle():
+        with instrumented_lock:
+            pass
+
+    results = {
+        'counter_inc': measure(lambda: counter.inc('keyword'), args.iterations),
+        'histogram': measure(lambda: histogram.observe(0.0123, 'decrypt'), args.iterations),
+        'timer': measure(timed_block, args.iterations),
+        'lock_plain': measure(plain_lock_cycle, args.iterations),
+        'lock_instrumented': measure(instrumented_lock_cycle, args.iterations),
+    }
+
+    # 按消息处理的实际阶段数填充序列后测量导出耗时
+    for stage in ('decrypt', 'parse', 'order_detail', 'notification', 'reply_api', 'reply_keyword',
+                  'reply_ai', 'reply_default', 'send_msg', 'send_image'):
+        histogram.observe(0.01, stage)
+    started = time.perf_counter()
+    output = registry.render()
+    render_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{'operation':<20}{'ns/op':>10}")
+    for name, ns in results.items():
+        print(f"{name:<20}{ns:>10.0f}")
+    print(f"render: {render_ms:.2f} ms, {len(output.splitlines())} 行")
+
+    # 仪表化锁的额外开销 = 两次观测
+    overhead = {
+        'counter_inc': results['counter_inc'],
+        'histogram': results['histogram'],
+        'timer': results['timer'],
+        'lock_instrumented': results['lock_instrumented'] - results['lock_plain'],
+    }
+    failures = [f"{name} 单次开销 {ns / 1000:.2f} us 超出预算 {args.budget_us} us"
+                for name, ns in overhead.items() if ns / 1000 > args.budget_us]
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: 单次观测开销在 {args.budget_us} us 预算内")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+mtop客户端基准 - 对比旧的逐次建会话调用方式与 MtopClient 的单次调用开销和连接数
+
+在本地启动一个假的mtop服务（aiohttp.web），返回成功响应并周期性下发 Set-Cookie，
+分别以两种方式发起相同数量的请求：
+    legacy: 每次请求新建 ClientSession，两次 trans_cookies 解析Cookie后签名（旧代码路径）
+    client: 复用 MtopClient 的连接池与预解析Cookie
+输出每次调用的平均/P95耗时以及服务端看到的TCP连接数。
+另外校验重试策略（按服务端收到的请求数）：
+    captcha    - 返回 RGV587 时只请求一次，不重试
+    timeout    - 幂等接口超时后按 max_retries 重试
+    non-idempotent timeout - idempotent=False 的接口超时后不重试
+重试策略校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/mtop_client_bench.py --calls 500 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import aiohttp
+from aiohttp import web
+from loguru import logger
+
+from utils.mtop_client import MtopClient
+from utils.xianyu_utils import generate_sign, trans_cookies
+
+COOKIES_STR = 'unb=2200000000; cookie2=abc123; _m_h5_tk=0123456789abcdef0123456789abcdef_1700000000000; _m_h5_tk_enc=xyz; t=foo'
+API = 'mtop.taobao.idle.pc.detail'
+
+
+class FakeMtopServer:
+    """返回固定成功响应的mtop服务，记录连接数"""
+
+    def __init__(self, set_cookie_every: int = 50):
+        self.set_cookie_every = set_cookie_every
+        self.behavior = 'ok'  # ok / captcha（返回RGV587）/ slow（响应超过客户端超时）
+        self.slow_delay = 1.0
+        self.requests = 0
+        self.peers = set()
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info('peername'))
+        await request.post()
+        if self.behavior == 'captcha':
+            return web.json_response({'ret': ['RGV587_ERROR::SM::哎哟喂,被挤爆啦,请稍后重试'], 'data': {}})
+        if self.behavior == 'slow':
+            await asyncio.sleep(self.slow_delay)
+        response = web.json_response({'ret': ['SUCCESS::调用成功'], 'data': {'itemId': '1'}})
+        if self.set_cookie_every and self.requests % self.set_cookie_every == 0:
+            response.headers.add('Set-Cookie', f'_m_h5_tk=fedcba9876543210_{self.requests}; Path=/')
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/h5/{api}/{version}/', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/h5/{API}/1.0/'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def reset(self):
+        self.requests = 0
+        self.peers = set()
+
+
+async def legacy_call(url: str, state: dict):
+    """旧代码路径：每次调用都重新解析Cookie、新建会话"""
+    params = {
+        'jsv': '2.7.2', 'appKey': '34839810', 't': str(int(time.time()) * 1000), 'sign': '', 'v': '1.0',
+        'type': 'originaljson', 'accountSite': 'xianyu', 'dataType': 'json', 'timeout': '20000',
+        'api': API, 'sessionOption': 'AutoLoginOnly', 'spm_cnt': 'a21ybx.im.0.0',
+    }
+    data_val = '{"itemId":"1"}'
+    token = trans_cookies(state['cookies_str']).get('_m_h5_tk', '').split('_')[0] if trans_cookies(state['cookies_str']).get('_m_h5_tk') else ''
+    params['sign'] = generate_sign(params['t'], token, data_val)
+    async with aiohttp.ClientSession(headers={'cookie': state['cookies_str']}) as session:
+        async with session.post(url, params=params, data={'data': data_val}) as response:
+            res_json = await response.json()
+            if 'set-cookie' in response.headers:
+                cookies = trans_cookies(state['cookies_str'])
+                for cookie in response.headers.getall('set-cookie', []):
+                    if '=' in cookie:
+                        name, value = cookie.split(';')[0].split('=', 1)
+                        cookies[name.strip()] = value.strip()
+                state['cookies_str'] = '; '.join(f"{k}={v}" for k, v in cookies.items())
+            return res_json
+
+
+async def run_mode(name: str, call, calls: int, concurrency: int, server: FakeMtopServer) -> dict:
+    server.reset()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'mode': name,
+        'calls': calls,
+        'total_s': elapsed,
+        'mean_ms': statistics.mean(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+        'connections': len(server.peers),
+    }
+
+
+async def check_retry_policy(server: FakeMtopServer) -> list:
+    """按服务端收到的请求数校验验证码和超时的重试策略"""
+    failures = []
+    client = MtopClient('bench-retry', COOKIES_STR)
+    client.limiter.rate = 0
+    client.backoff_base = 0.01
+    client.request_timeout = server.slow_delay / 5
+    retries = 2
+    try:
+        cases = [('captcha', 'captcha', True, 1), ('timeout', 'slow', True, retries + 1),
+                 ('non-idempotent timeout', 'slow', False, 1)]
+        for name, behavior, idempotent, expected in cases:
+            server.reset()
+            server.behavior = behavior
+            try:
+                await client.call(API, {'itemId': '1'}, url=server.url, max_retries=retries, idempotent=idempotent)
+            except asyncio.TimeoutError:
+                pass
+            print(f"{name:<24}请求 {server.requests} 次（应为 {expected} 次）")
+            if server.requests != expected:
+                failures.append(f"{name}: 服务端收到 {server.requests} 次请求，应为 {expected} 次")
+    finally:
+        server.behavior = 'ok'
+        await client.close()
+    return failures
+
+
+async def main_async(args):
+    server = FakeMtopServer(set_cookie_every=args.set_cookie_every)
+    await server.start()
+    try:
+        state = {'cookies_str': COOKIES_STR}
+        legacy = await run_mode('legacy', lambda: legacy_call(server.url, state), args.calls, args.concurrency, server)
+
+        client = MtopClient('bench', COOKIES_STR)
+        client.limiter.rate = 0  # 基准测试不限流
+        try:
+            pooled = await run_mode('client', lambda: client.call(API, {'itemId': '1'}, url=server.url),
+                                    args.calls, args.concurrency, server)
+        finally:
+            await client.close()
+        failures = await check_retry_policy(server)
+    finally:
+        await server.stop()
+
+    print(f"{'mode':<8}{'calls':>8}{'total(s)':>10}{'mean(ms)':>10}{'p95(ms)':>10}{'sockets':>9}")
+    for result in (legacy, pooled):
+        print(f"{result['mode']:<8}{result['calls']:>8}{result['total_s']:>10.2f}{result['mean_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['connections']:>9}")
+    return failures
+
+
+def main(argv=None) -> int:
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    parser = argparse.ArgumentParser(description='mtop客户端开销基准')
+    parser.add_argument('--calls', type=int, default=500, help='每种方式的调用次数')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发数')
+    parser.add_argument('--set-cookie-every', type=int, default=50, help='每N次响应下发一次Set-Cookie')
+    failures = asyncio.run(main_async(parser.parse_args(argv)))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print("OK: 验证码不重试，非幂等接口超时不重试")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,528 @@
+"""
+消息回放基准 - 在本地假闲鱼WebSocket服务上回放推送消息，测量 XianyuLive 消息热路径的吞吐与回复延迟
+
+在独立线程的事件循环中启动：
+    - 假的 goofish WebSocket 服务：应答 /reg、/r/SyncStatus/ackDiff 和心跳，所有账号注册完成后
+      按 --rate 向每个连接推送 syncPushPackage 帧，并记录客户端回执(ack)和
+      /r/MessageSend/sendByReceiverScope 回复到达的时间
+    - 假的 mtop 接口：登录token、商品详情、确认发货等调用一律返回成功（可用 --mtop-delay 模拟上游耗时）
+在当前事件循环中启动 --accounts 个 XianyuLive（临时目录中的独立数据库，预置关键词），
+订单详情的浏览器抓取替换为本地桩函数，不访问任何外部服务。
+
+推送载荷与线上一致：解密后的消息字典经 MessagePack 编码再 base64，客户端走 decrypt 解密路径。
+语料默认合成 chat/order/card/system 四类消息（按 --mix 配比），也可用 --corpus 指定录制的
+JSONL 文件，每行 {"kind": "...", "message": {...}}，message 即日志中打印的解密后消息字典；
+回放时会替换会话ID以便把回复对应到推送帧。
+
+输出：
+    - 吞吐：每秒处理的帧数（收到回执）和每秒回复数
+    - 按消息类别统计 推送 -> 回执、推送 -> send_msg 回复 的 p50/p99/max 延迟（毫秒）
+    - 客户端事件循环延迟（定时器唤醒滞后）的 p50/p99/max
+有帧未被处理、期望的回复缺失或回复 p99 超过 --max-p99-ms 时以非零状态码退出。
+
+用法:
+    python benchmarks/replay_bench.py --accounts 5 --rate 20 --messages 200
+    python benchmarks/replay_bench.py --corpus recorded.jsonl --accounts 2 --max-p99-ms 50
+    python benchmarks/replay_bench.py --log-level default   # 含线上日志配置的开销
+"""
+
+import argparse
+import asyncio
+import base64
+import copy
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import websockets
+from aiohttp import web
+from loguru import logger
+
+# 每个账号预置的文本关键词 (关键词, 回复, 商品ID)
+KEYWORDS = [
+    ('在吗', '在的，亲~ 有什么可以帮您？', ''),
+    ('包邮', '默认包邮哦，拍下即可', ''),
+    ('发货', '付款后24小时内发货', ''),
+    ('便宜', '价格已经是最低了哦', ''),
+]
+
+# 合成语料中的买家消息，部分命中关键词
+CHAT_TEXTS = ['在吗', '包邮吗', '什么时候发货', '能便宜点吗', '成色怎么样', '还有货吗']
+
+DEFAULT_MIX = 'chat=0.7,order=0.1,card=0.1,system=0.1'
+
+
+def msgpack_encode(value) -> bytes:
+    """最小的 MessagePack 编码，覆盖推送消息中出现的类型（与 MessagePackDecoder 对应）
+
+    数字形式的字典键按整数编码，与线上消息一致（解密后经 json 序列化又变回字符串键）。
+    """
+    if value is None:
+        return b'\xc0'
+    if value is True:
+        return b'\xc3'
+    if value is False:
+        return b'\xc2'
+    if isinstance(value, int):
+        if 0 <= value <= 0x7f:
+            return bytes([value])
+        if -32 <= value < 0:
+            return struct.pack('>b', value)
+        if 0 <= value <= 0xffffffff:
+            return b'\xce' + struct.pack('>I', value)
+        if value > 0:
+            return b'\xcf' + struct.pack('>Q', value)
+        return b'\xd3' + struct.pack('>q', value)
+    if isinstance(value, float):
+        return b'\xcb' + struct.pack('>d', value)
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        size = len(data)
+        if size <= 31:
+            return bytes([0xa0 | size]) + data
+        if size <= 0xff:
+            return b'\xd9' + bytes([size]) + data
+        if size <= 0xffff:
+            return b'\xda' + struct.pack('>H', size) + data
+        return b'\xdb' + struct.pack('>I', size) + data
+    if isinstance(value, (list, tuple)):
+        size = len(value)
+        if size <= 15:
+            head = bytes([0x90 | size])
+        elif size <= 0xffff:
+            head = b'\xdc' + struct.pack('>H', size)
+        else:
+            head = b'\xdd' + struct.pack('>I', size)
+        return head + b''.join(msgpack_encode(item) for item in value)
+    if isinstance(value, dict):
+        size = len(value)
+        if size <= 15:
+            head = bytes([0x80 | size])
+        elif size <= 0xffff:
+            head = b'\xde' + struct.pack('>H', size)
+        else:
+            head = b'\xdf' + struct.pack('>I', size)
+        parts = [head]
+        for key, item in value.items():
+            parts.append(msgpack_encode(int(key) if isinstance(key, str) and key.isdigit() else key))
+            parts.append(msgpack_encode(item))
+        return b''.join(parts)
+    raise TypeError(f"不支持的类型: {type(value)}")
+
+
+def build_order_card(order_id: str, item_id: str, title: str) -> dict:
+    """订单/系统卡片内容（message['1']['6']['3']['5'] 中的JSON）"""
+    return {
+        'dxCard': {'item': {'main': {
+            'exContent': {
+                'title': title,
+                'button': {'text': '去发货', 'targetUrl': f'fleamarket://order_detail?id={order_id}&orderId={order_id}&role=seller'},
+            },
+            'targetUrl': f'fleamarket://order_detail?id={order_id}&role=seller',
+        }}},
+    }
+
+
+def build_message(chat_id: str, sender_id: str, content: str, item_id: str,
+                  card: dict = None, red_reminder: str = None) -> dict:
+    """构造与线上推送解密后结构一致的消息字典"""
+    nick = f'买家{sender_id[-4:]}'
+    message = {
+        '1': {
+            '1': f'{chat_id}.PNM',
+            '2': f'{chat_id}@goofish',
+            '3': {'redPointPolicy': 0},
+            '5': int(time.time() * 1000),
+            '10': {
+                'bizTag': '{"sourceId":"S:1"}',
+                'reminderContent': content,
+                'reminderNotice': '发来一条新消息',
+                'reminderTitle': nick,
+                'reminderUrl': f'fleamarket://message_chat?itemId={item_id}&peerUserId={sender_id}&sid={chat_id}',
+                'senderNick': nick,
+                'senderUserId': sender_id,
+                'sessionType': '1',
+            },
+        },
+    }
+    if card is not None:
+        message['1']['6'] = {'3': {'4': 14, '5': json.dumps(card, ensure_ascii=False)}}
+    if red_reminder is not None:
+        message['3'] = {'redReminder': red_reminder}
+    return message
+
+
+def synthesize_message(kind: str, chat_id: str, rng: random.Random) -> tuple:
+    """合成一条指定类别的消息，返回 (消息字典, 是否期望回复)"""
+    sender_id = str(3300000000 + rng.randrange(50))
+    item_id = str(700000000000 + rng.randrange(20))
+    if kind == 'chat':
+        text = rng.choice(CHAT_TEXTS)
+        expect_reply = any(keyword in text for keyword, _, _ in KEYWORDS)
+        return build_message(chat_id, sender_id, text, item_id), expect_reply
+    if kind == 'order':
+        card = build_order_card(chat_id, item_id, '我已付款，等待你发货')
+        return build_message(chat_id, sender_id, '[我已付款，等待你发货]', item_id, card, '等待卖家发货'), False
+    if kind == 'card':
+        card = build_order_card(chat_id, item_id, '交易提醒')
+        return build_message(chat_id, sender_id, '[卡片消息]', item_id, card), False
+    if kind == 'system':
+        return build_message(chat_id, sender_id, '[我已拍下，待付款]', item_id, red_reminder='等待买家付款'), False
+    raise ValueError(f"未知的消息类别: {kind}")
+
+
+def parse_mix(text: str) -> list:
+    mix = []
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix.append((kind.strip(), float(weight)))
+    return mix
+
+
+def load_corpus(path: str) -> list:
+    """读取录制语料 [(类别, 消息字典), ...]"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                entries.append((record.get('kind', 'recorded'), record['message']))
+    if not entries:
+        raise ValueError(f"语料为空: {path}")
+    return entries
+
+
+def build_frame(chat_id: str, message: dict) -> str:
+    """把消息字典编码为 syncPushPackage 推送帧"""
+    data = base64.b64encode(msgpack_encode(message)).decode('ascii')
+    return json.dumps({
+        'lwp': '/s/para',
+        'headers': {'mid': f'{chat_id} 0', 'sid': f'sid-{chat_id}', 'app-key': '444e9908a51d1cb236a27862abc769c9',
+                    'ua': 'replay-bench', 'dt': 'j'},
+        'body': {'syncPushPackage': {'data': [{'bizType': 370, 'data': data, 'objectType': 40000,
+                                               'pts': int(time.time() * 1000000)}], 'hasMore': 0}},
+    })
+
+
+def build_schedule(args) -> list:
+    """为每个账号生成待推送的帧 [[(chat_id, 类别, 帧, 是否期望回复), ...], ...]"""
+    rng = random.Random(args.seed)
+    corpus = load_corpus(args.corpus) if args.corpus else None
+    mix = parse_mix(args.mix)
+    kinds, weights = [kind for kind, _ in mix], [weight for _, weight in mix]
+
+    schedule = []
+    for account in range(args.accounts):
+        frames = []
+        for seq in range(args.messages):
+            chat_id = str(50000000000 + account * 1000000 + seq)
+            if corpus:
+                kind, message = corpus[(account * args.messages + seq) % len(corpus)]
+                message = copy.deepcopy(message)
+                if isinstance(message.get('1'), dict):
+                    message['1']['2'] = f'{chat_id}@goofish'
+                expect_reply = None  # 录制语料无法预知是否应回复
+            else:
+                kind = rng.choices(kinds, weights)[0]
+                message, expect_reply = synthesize_message(kind, chat_id, rng)
+            frames.append((chat_id, kind, build_frame(chat_id, message), expect_reply))
+        schedule.append(frames)
+    return schedule
+
+
+class FakeGoofishServer:
+    """在独立线程的事件循环中运行的假 WebSocket 服务和 mtop 接口"""
+
+    def __init__(self, schedule: list, rate: float, mtop_delay: float):
+        self.schedule = schedule
+        self.rate = rate
+        self.mtop_delay = mtop_delay
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fake-goofish', daemon=True)
+        self.ws_url = None
+        self.mtop_base = None
+        self.registered = 0
+        self.pushed = 0
+        self.push_started_at = None
+        self.push_finished_at = None
+        self.mtop_calls = {}
+        # {chat_id: 时间}，时间均为 time.perf_counter()（与客户端同进程，可直接相减）
+        self.sent_at = {}
+        self.acked_at = {}
+        self.replied_at = {}
+        self._start_event = None
+        self._ws_server = None
+        self._runner = None
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+    async def _start(self):
+        self._start_event = asyncio.Event()
+        self._ws_server = await websockets.serve(self.handle_ws, '127.0.0.1', 0, max_size=2 ** 20)
+        self.ws_url = f"ws://127.0.0.1:{self._ws_server.sockets[0].getsockname()[1]}/"
+
+        app = web.Application()
+        app.router.add_post('/h5/{api}/{version}/', self.handle_mtop)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.mtop_base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/h5"
+
+    async def _stop(self):
+        self._ws_server.close()
+        await self._ws_server.wait_closed()
+        await self._runner.cleanup()
+
+    async def handle_mtop(self, request):
+        api = request.match_info['api']
+        self.mtop_calls[api] = self.mtop_calls.get(api, 0) + 1
+        if self.mtop_delay:
+            await asyncio.sleep(self.mtop_delay)
+        data = {}
+        if api == 'mtop.taobao.idlemessage.pc.login.token':
+            data = {'accessToken': f'replay-token-{self.mtop_calls[api]}'}
+        elif api == 'mtop.taobao.idle.pc.detail':
+            share_info = {'contentParams': {'mainParams': {'content': '回放基准测试商品'}}}
+            data = {'itemDO': {'title': '回放基准测试商品',
+                               'shareData': {'shareInfoJsonString': json.dumps(share_info, ensure_ascii=False)}}}
+        return web.json_response({'api': api, 'ret': ['SUCCESS::调用成功'], 'data': data})
+
+    async def handle_ws(self, websocket, path=None):
+        pusher = None
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                lwp = message.get('lwp')
+                mid = message.get('headers', {}).get('mid', '')
+                if lwp == '/r/MessageSend/sendByReceiverScope':
+                    chat_id = message['body'][0]['cid'].split('@')[0]
+                    self.replied_at.setdefault(chat_id, time.perf_counter())
+                elif lwp is None and message.get('code') == 200:
+                    # 客户端对推送帧的回执
+                    self.acked_at.setdefault(mid.split(' ')[0], time.perf_counter())
+                    continue
+
+                if lwp is not None:
+                    await websocket.send(json.dumps({'code': 200, 'headers': {'mid': mid}}))
+                if lwp == '/r/SyncStatus/ackDiff' and pusher is None and self.registered < len(self.schedule):
+                    frames = self.schedule[self.registered]
+                    self.registered += 1
+                    if self.registered == len(self.schedule):
+                        self.push_started_at = time.perf_counter()
+                        self._start_event.set()
+                    pusher = asyncio.create_task(self.push_frames(websocket, frames))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if pusher:
+                pusher.cancel()
+
+    async def push_frames(self, websocket, frames: list):
+        """所有账号注册完成后按固定速率推送，按绝对时间排期避免累积漂移"""
+        await self._start_event.wait()
+        interval = 1.0 / self.rate if self.rate > 0 else 0
+        for index, (chat_id, _, frame, _) in enumerate(frames):
+            delay = self.push_started_at + index * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.sent_at[chat_id] = time.perf_counter()
+            await websocket.send(frame)
+            self.pushed += 1
+        if self.pushed == sum(len(account_frames) for account_frames in self.schedule):
+            self.push_finished_at = time.perf_counter()
+
+
+def install_order_detail_stub(delay: float):
+    """用本地桩替换订单详情抓取（线上通过浏览器打开订单页）"""
+    async def fetch_order_detail_simple(order_id: str, cookie_string: str = None, headless: bool = True):
+        if delay:
+            await asyncio.sleep(delay)
+        return {'order_id': order_id, 'title': '订单详情', 'spec_name': '颜色', 'spec_value': '黑色',
+                'quantity': '1', 'amount': '9.90'}
+
+    module = types.ModuleType('utils.order_detail_fetcher')
+    module.fetch_order_detail_simple = fetch_order_detail_simple
+    sys.modules['utils.order_detail_fetcher'] = module
+
+
+async def monitor_loop_lag(interval: float, samples: list, stop: asyncio.Event):
+    """定时器唤醒滞后即事件循环延迟"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run_replay(args, schedule: list, server: FakeGoofishServer) -> dict:
+    import XianyuAutoAsync
+    import utils.mtop_client
+    from XianyuAutoAsync import XianyuLive
+    from db_manager import db_manager
+
+    # XianyuAutoAsync 导入时会按线上配置重设日志输出（日志文件+标准输出）
+    if args.log_level != 'default':
+        logger.remove()
+        logger.add(sys.stderr, level=args.log_level)
+
+    # mtop 与登录token接口指向本地假服务
+    utils.mtop_client.MTOP_BASE_URL = server.mtop_base
+    XianyuAutoAsync.API_ENDPOINTS['token'] = f"{server.mtop_base}/mtop.taobao.idlemessage.pc.login.token/1.0/"
+
+    lives = []
+    for account in range(args.accounts):
+        cookie_id = f'replay{account}'
+        cookies_str = (f'unb={2200000000 + account}; cookie2=replay{account}; t=replay; '
+                       f'_m_h5_tk=0123456789abcdef0123456789abcdef_1700000000000; _m_h5_tk_enc=replay')
+        db_manager.save_cookie(cookie_id, cookies_str)
+        db_manager.save_text_keywords_only(cookie_id, KEYWORDS)
+        live = XianyuLive(cookies_str, cookie_id=cookie_id)
+        live.base_url = server.ws_url
+        live.cookie_refresh_enabled = False
+        lives.append(live)
+
+    tasks = [asyncio.create_task(live.main()) for live in lives]
+    lag_samples = []
+    stop = asyncio.Event()
+    monitor = None
+    total = sum(len(frames) for frames in schedule)
+    expected_replies = {chat_id for frames in schedule for chat_id, _, _, expect in frames if expect}
+    try:
+        deadline = time.perf_counter() + args.connect_timeout
+        while server.registered < args.accounts:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"{args.connect_timeout}秒内只有 {server.registered}/{args.accounts} 个账号完成注册")
+            await asyncio.sleep(0.05)
+
+        monitor = asyncio.create_task(monitor_loop_lag(args.lag_interval, lag_samples, stop))
+        # 推送结束后等待回执和期望的回复到齐，最多等待 --drain-timeout 秒
+        while True:
+            await asyncio.sleep(0.05)
+            if server.push_finished_at is None:
+                continue
+            done = len(server.acked_at) >= total and expected_replies.issubset(server.replied_at.keys())
+            if done or time.perf_counter() - server.push_finished_at > args.drain_timeout:
+                break
+        finished_at = time.perf_counter()
+    finally:
+        stop.set()
+        if monitor:
+            await monitor
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for live in lives:
+            await live.close_session()
+
+    return {'lag': lag_samples, 'elapsed': finished_at - server.push_started_at, 'expected_replies': expected_replies}
+
+
+def report(args, schedule: list, server: FakeGoofishServer, result: dict) -> list:
+    by_kind = {}
+    for frames in schedule:
+        for chat_id, kind, _, _ in frames:
+            by_kind.setdefault(kind, []).append(chat_id)
+    by_kind['all'] = [chat_id for chat_ids in by_kind.values() for chat_id in chat_ids]
+
+    elapsed = result['elapsed']
+    acked = len(server.acked_at)
+    replies = len(server.replied_at)
+    print(f"accounts={args.accounts} rate={args.rate}/s/账号 frames={len(by_kind['all'])} "
+          f"elapsed={elapsed:.2f}s mtop={sum(server.mtop_calls.values())}")
+    print(f"throughput: {acked / elapsed:.1f} 帧/s, {replies / elapsed:.1f} 回复/s")
+    print(f"{'kind':<10}{'frames':>8}{'acked':>7}{'replies':>8}{'ack_p50':>9}{'ack_p99':>9}"
+          f"{'reply_p50':>11}{'reply_p99':>11}{'reply_max':>11}")
+    reply_p99 = float('nan')
+    for kind, chat_ids in by_kind.items():
+        ack_ms = [(server.acked_at[c] - server.sent_at[c]) * 1000 for c in chat_ids if c in server.acked_at]
+        reply_ms = [(server.replied_at[c] - server.sent_at[c]) * 1000 for c in chat_ids if c in server.replied_at]
+        if kind == 'all':
+            reply_p99 = percentile(reply_ms, 99)
+        print(f"{kind:<10}{len(chat_ids):>8}{len(ack_ms):>7}{len(reply_ms):>8}"
+              f"{percentile(ack_ms, 50):>9.2f}{percentile(ack_ms, 99):>9.2f}"
+              f"{percentile(reply_ms, 50):>11.2f}{percentile(reply_ms, 99):>11.2f}"
+              f"{max(reply_ms) if reply_ms else float('nan'):>11.2f}")
+    lag_ms = [lag * 1000 for lag in result['lag']]
+    print(f"event loop lag (ms): p50={percentile(lag_ms, 50):.2f} p99={percentile(lag_ms, 99):.2f} "
+          f"max={max(lag_ms) if lag_ms else float('nan'):.2f} samples={len(lag_ms)}")
+
+    failures = []
+    if acked < len(by_kind['all']):
+        failures.append(f"{len(by_kind['all']) - acked} 帧未收到回执")
+    missing = result['expected_replies'] - server.replied_at.keys()
+    if missing:
+        failures.append(f"{len(missing)} 条命中关键词的消息未收到回复")
+    if args.max_p99_ms and reply_p99 > args.max_p99_ms:
+        failures.append(f"回复延迟 p99 {reply_p99:.2f} ms 超出预算 {args.max_p99_ms} ms")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='XianyuLive 消息回放吞吐/延迟基准')
+    parser.add_argument('--accounts', type=int, default=3, help='模拟账号数')
+    parser.add_argument('--rate', type=float, default=20, help='每个账号每秒推送的帧数，0表示不限速')
+    parser.add_argument('--messages', type=int, default=100, help='每个账号推送的帧数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='合成语料的类别配比')
+    parser.add_argument('--corpus', help='录制语料(JSONL)，指定后不再合成')
+    parser.add_argument('--seed', type=int, default=42, help='合成语料的随机种子')
+    parser.add_argument('--mtop-delay', type=float, default=0.02, help='假mtop接口的响应延迟(秒)')
+    parser.add_argument('--order-detail-delay', type=float, default=0.05, help='订单详情桩函数的耗时(秒)')
+    parser.add_argument('--lag-interval', type=float, default=0.01, help='事件循环延迟采样间隔(秒)')
+    parser.add_argument('--connect-timeout', type=float, default=30, help='等待所有账号完成注册的超时(秒)')
+    parser.add_argument('--drain-timeout', type=float, default=10, help='推送结束后等待回执和回复的超时(秒)')
+    parser.add_argument('--max-p99-ms', type=float, default=0, help='回复延迟p99预算(毫秒)，0表示不检查')
+    parser.add_argument('--log-level', default='CRITICAL', help='客户端日志级别，default 表示保持线上配置（日志输出本身计入热路径开销）')
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    schedule = build_schedule(args)
+    install_order_detail_stub(args.order_detail_delay)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        server = FakeGoofishServer(schedule, args.rate, args.mtop_delay)
+        server.start()
+        try:
+            result = asyncio.run(run_replay(args, schedule, server))
+        finally:
+            server.stop()
+            os.chdir(ROOT_DIR)
+
+    failures = report(args, schedule, server, result)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 全部帧已处理，命中关键词的消息均已回复")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+启动开销基准 - 统计冷启动导入耗时与内存，并检查重依赖是否被提前加载
+
+在独立子进程中以 `python -X importtime` 导入启动路径上的模块（Start 及 uvicorn
+随后加载的 reply_server），解析 importtime 输出得到总耗时和最慢的模块，
+读取子进程峰值RSS，并确认 pandas/playwright/openai 等按需依赖没有在启动时被导入。
+超出预算时以非零状态码退出，可直接用于CI回归检查。
+
+用法:
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --budget-ms 1500 --budget-rss-mb 120 --top 15
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动路径上需要导入的模块
+STARTUP_MODULES = ['Start', 'reply_server']
+
+# 只应在首次使用时加载的重依赖
+LAZY_MODULES = ['pandas', 'playwright', 'openai', 'blackboxprotobuf', 'PIL', 'execjs']
+
+# 默认预算，可通过参数或环境变量覆盖
+DEFAULT_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', '2000'))
+DEFAULT_BUDGET_RSS_MB = float(os.getenv('STARTUP_BUDGET_RSS_MB', '150'))
+
+# 子进程中执行的脚本：导入模块后输出已加载的重依赖和峰值RSS
+PROBE_SCRIPT = '''
+import json, resource, sys
+for name in {modules!r}:
+    __import__(name)
+loaded = sorted({{m.split('.')[0] for m in sys.modules}} & set({lazy!r}))
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024
+print('STARTUP_BENCH ' + json.dumps({{'loaded': loaded, 'rss_kb': rss_kb}}))
+'''
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 [(模块名, 自身耗时us, 累计耗时us, 嵌套层级), ...]"""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def run_probe(modules):
+    """在干净的临时工作目录中运行一次导入探测，避免污染项目数据目录"""
+    script = PROBE_SCRIPT.format(modules=modules, lazy=LAZY_MODULES)
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''),
+               PYTHONDONTWRITEBYTECODE='1')
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                cwd=work_dir, env=env, capture_output=True, text=True)
+
+    probe = None
+    for line in result.stdout.splitlines():
+        if line.startswith('STARTUP_BENCH '):
+            probe = json.loads(line[len('STARTUP_BENCH '):])
+
+    if result.returncode != 0 or probe is None:
+        tail = '\n'.join(line for line in result.stderr.splitlines() if not line.startswith('import time:'))
+        raise RuntimeError(f"导入探测失败 (exit={result.returncode}):\n{tail[-2000:]}")
+
+    return parse_importtime(result.stderr), probe
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='启动导入耗时/内存基准')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='导入总耗时预算(毫秒)')
+    parser.add_argument('--budget-rss-mb', type=float, default=DEFAULT_BUDGET_RSS_MB, help='峰值RSS预算(MB)')
+    parser.add_argument('--top', type=int, default=10, help='显示最慢的N个顶层模块')
+    parser.add_argument('--modules', nargs='+', default=STARTUP_MODULES, help='要导入的模块')
+    args = parser.parse_args(argv)
+
+    entries, probe = run_probe(args.modules)
+
+    # 顶层模块（层级0）的累计耗时之和即为整体导入耗时
+    top_level = [entry for entry in entries if entry[3] == 0]
+    total_ms = sum(entry[2] for entry in top_level) / 1000
+    rss_mb = probe['rss_kb'] / 1024
+
+    print(f"导入模块: {', '.join(args.modules)}")
+    print(f"导入总耗时: {total_ms:.1f} ms (预算 {args.budget_ms:.0f} ms)")
+    print(f"峰值RSS: {rss_mb:.1f} MB (预算 {args.budget_rss_mb:.0f} MB)")
+    print(f"最慢的 {args.top} 个顶层模块:")
+    for name, _, cumulative_us, _ in sorted(top_level, key=lambda e: e[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"导入耗时超出预算: {total_ms:.1f} ms > {args.budget_ms:.0f} ms")
+    if rss_mb > args.budget_rss_mb:
+        failures.append(f"峰值RSS超出预算: {rss_mb:.1f} MB > {args.budget_rss_mb:.0f} MB")
+    if probe['loaded']:
+        failures.append(f"启动时加载了应按需导入的依赖: {', '.join(probe['loaded'])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 启动开销在预算内")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
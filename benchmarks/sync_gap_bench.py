@@ -0,0 +1,289 @@
+"""
+同步补收基准 - 强制断线/重启后，测量 XianyuLive 补收断线期间消息的恢复时间和消息丢失
+
+本地假 goofish 服务持续以 --rate 条/秒"收到"买家消息（每条消息一个会话，均命中关键词、期望回复），
+每条消息带递增的 pts：
+    - 客户端 ackDiff 的 pts 之后的消息按 --batch 条一批下发，未发完时 hasMore=1，
+      等客户端再次 ackDiff 才下发下一批；积压不超过一批时逐条实时推送
+    - 补发期间最新的消息同时以实时推送下发（与线上一样，实时推送不等补发结束），
+      检验补发未完成时同步位置不会越过尚未下发的补发消息
+    - 每次重新注册时额外重发 ackDiff 位置之前的 --overlap 条消息，检验去重
+    - 每隔 --disconnect-every 秒制造一次断线：依次交替为服务端中止连接（客户端按原有退避重连）
+      和客户端重启（取消 main 并新建 XianyuLive，同步位置从数据库读取）
+结束后等待回复到齐，统计：
+    丢失   - 生成了但始终未收到回复的消息数
+    重复   - 同一消息收到多于一次回复
+    恢复   - 每次重新注册后，断线期间积压的消息全部回复完所需的时间
+默认先后运行 resume（本次改动）和 legacy（注册时以当前时间 ackDiff，即改动前的行为）两种模式。
+resume 模式有丢失或重复回复时以非零状态码退出。
+
+用法:
+    python benchmarks/sync_gap_bench.py
+    python benchmarks/sync_gap_bench.py --duration 30 --rate 50 --batch 50 --modes resume
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websockets
+from loguru import logger
+
+from replay_bench import (FakeGoofishServer, KEYWORDS, build_message, build_frame, install_order_detail_stub,
+                          percentile)
+
+
+class GapServer(FakeGoofishServer):
+    """按 pts 记录全部消息，从客户端 ackDiff 的位置开始分批补发"""
+
+    def __init__(self, batch: int, overlap: int):
+        super().__init__([], 0, 0)
+        self.batch = batch
+        self.overlap = overlap
+        self.log = []            # [(pts, chat_id, 帧中的同步数据)]
+        self.created_at = {}     # {chat_id: 生成时间}
+        self.reply_counts = {}   # {chat_id: 回复次数}
+        self.registrations = []  # 每次 ackDiff 注册的时间
+        self.connections = set()
+        self.new_message = None
+
+    async def _start(self):
+        await super()._start()
+        self.new_message = asyncio.Event()
+
+    def add_message(self):
+        """在服务端线程中调用：生成一条买家消息"""
+        index = len(self.log)
+        chat_id = str(60000000000 + index)
+        message = build_message(chat_id, str(3300000000 + index % 50), '在吗', str(700000000000 + index % 20))
+        sync_data = json.loads(build_frame(chat_id, message))['body']['syncPushPackage']['data'][0]
+        last_pts = self.log[-1][0] if self.log else 0
+        sync_data['pts'] = max(int(time.time() * 1000000), last_pts + 1)
+        self.log.append((sync_data['pts'], chat_id, sync_data))
+        self.created_at[chat_id] = time.perf_counter()
+        self.new_message.set()
+
+    def abort_all(self):
+        for websocket in list(self.connections):
+            websocket.transport.abort()
+
+    async def handle_ws(self, websocket, path=None):
+        self.connections.add(websocket)
+        acked = asyncio.Queue()
+        pusher = None
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                lwp = message.get('lwp')
+                mid = message.get('headers', {}).get('mid', '')
+                if lwp == '/r/MessageSend/sendByReceiverScope':
+                    chat_id = message['body'][0]['cid'].split('@')[0]
+                    self.reply_counts[chat_id] = self.reply_counts.get(chat_id, 0) + 1
+                    self.replied_at.setdefault(chat_id, time.perf_counter())
+                elif lwp is None:
+                    continue
+                await websocket.send(json.dumps({'code': 200, 'headers': {'mid': mid}}))
+                if lwp == '/r/SyncStatus/ackDiff':
+                    pts = message['body'][0]['pts']
+                    if pusher is None:
+                        self.registrations.append(time.perf_counter())
+                        pusher = asyncio.create_task(self.push(websocket, pts, acked))
+                    else:
+                        acked.put_nowait(pts)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(websocket)
+            if pusher:
+                pusher.cancel()
+
+    async def push(self, websocket, pts: int, acked: asyncio.Queue):
+        # 模拟服务端重发确认位置之前的少量消息
+        position = max(0, self._index_after(pts) - self.overlap)
+        while True:
+            pending = len(self.log) - position
+            if pending == 0:
+                self.new_message.clear()
+                await self.new_message.wait()
+                continue
+            if pending > self.batch:
+                # 积压较多时分批下发，等客户端确认后再发下一批
+                items = [entry[2] for entry in self.log[position:position + self.batch]]
+                position += self.batch
+                await websocket.send(self._frame(items, has_more=True))
+                # 补发未完成时实时推送最新的消息
+                await websocket.send(self._frame([self.log[-1][2]], has_more=False))
+                await acked.get()
+            else:
+                for entry in self.log[position:]:
+                    await websocket.send(self._frame([entry[2]], has_more=False))
+                position += pending
+
+    def _index_after(self, pts: int) -> int:
+        for index, entry in enumerate(self.log):
+            if entry[0] > pts:
+                return index
+        return len(self.log)
+
+    @staticmethod
+    def _frame(items: list, has_more: bool) -> str:
+        return json.dumps({
+            'lwp': '/s/para',
+            'headers': {'mid': f'sync-{items[0]["pts"]} 0', 'sid': 'sync-bench', 'dt': 'j'},
+            'body': {'syncPushPackage': {'data': items, 'hasMore': 1 if has_more else 0}},
+        })
+
+
+async def run_mode(args, server: GapServer, mode: str) -> dict:
+    import XianyuAutoAsync
+    import utils.mtop_client
+    from XianyuAutoAsync import XianyuLive
+    from db_manager import db_manager
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    utils.mtop_client.MTOP_BASE_URL = server.mtop_base
+    XianyuAutoAsync.API_ENDPOINTS['token'] = f"{server.mtop_base}/mtop.taobao.idlemessage.pc.login.token/1.0/"
+
+    cookie_id = f'sync_{mode}'
+    cookies_str = (f'unb=2200000099; cookie2={cookie_id}; t=sync; '
+                   f'_m_h5_tk=0123456789abcdef0123456789abcdef_1700000000000; _m_h5_tk_enc=sync')
+    db_manager.save_cookie(cookie_id, cookies_str)
+    db_manager.save_text_keywords_only(cookie_id, KEYWORDS)
+
+    def start_live():
+        live = XianyuLive(cookies_str, cookie_id=cookie_id)
+        live.base_url = server.ws_url
+        live.cookie_refresh_enabled = False
+        live.sync_resume_enabled = mode == 'resume'
+        return live, asyncio.create_task(live.main())
+
+    async def generate(stop: asyncio.Event):
+        index = 0
+        started = time.perf_counter()
+        while not stop.is_set():
+            due = int((time.perf_counter() - started) * args.rate)
+            while index < due:
+                server.loop.call_soon_threadsafe(server.add_message)
+                index += 1
+            await asyncio.sleep(0.01)
+
+    live, task = start_live()
+    deadline = time.perf_counter() + 30
+    while not server.registrations:
+        if time.perf_counter() > deadline:
+            raise TimeoutError('30秒内未完成首次注册')
+        await asyncio.sleep(0.05)
+
+    registrations_before = len(server.registrations)
+    stop = asyncio.Event()
+    generator = asyncio.create_task(generate(stop))
+    disconnects = []
+    started = time.perf_counter()
+    try:
+        number = 0
+        while time.perf_counter() - started < args.duration:
+            await asyncio.sleep(args.disconnect_every)
+            number += 1
+            kind = 'drop' if number % 2 else 'restart'
+            disconnects.append((kind, time.perf_counter()))
+            if kind == 'drop':
+                server.loop.call_soon_threadsafe(server.abort_all)
+            else:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await live.close_session()
+                live, task = start_live()
+        stop.set()
+        await generator
+        # 等待积压处理完、回复到齐
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while time.perf_counter() < drain_deadline:
+            if set(server.created_at).issubset(server.replied_at):
+                break
+            await asyncio.sleep(0.1)
+    finally:
+        stop.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await live.close_session()
+
+    # 每次断线后的首次重新注册时间，以及此前生成的消息全部回复完的时间
+    registrations = server.registrations[registrations_before:]
+    recoveries = []
+    for _, disconnected_at in disconnects:
+        reconnected = [at for at in registrations if at > disconnected_at]
+        if not reconnected:
+            continue
+        reconnected_at = reconnected[0]
+        backlog = [chat_id for chat_id, at in server.created_at.items() if disconnected_at <= at < reconnected_at]
+        if backlog and all(chat_id in server.replied_at for chat_id in backlog):
+            recoveries.append(max(server.replied_at[chat_id] for chat_id in backlog) - reconnected_at)
+
+    return {
+        'generated': len(server.created_at),
+        'lost': sorted(set(server.created_at) - set(server.replied_at)),
+        'duplicated': sorted(chat_id for chat_id, count in server.reply_counts.items() if count > 1),
+        'disconnects': len(disconnects),
+        'recoveries': recoveries,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='断线补收恢复时间/消息丢失基准')
+    parser.add_argument('--duration', type=float, default=24, help='生成消息的时长(秒)')
+    parser.add_argument('--rate', type=float, default=20, help='每秒生成的买家消息数')
+    parser.add_argument('--disconnect-every', type=float, default=6, help='强制断线间隔(秒)')
+    parser.add_argument('--batch', type=int, default=20, help='补发时每批的消息数')
+    parser.add_argument('--overlap', type=int, default=5, help='重新注册时重发的已确认消息数')
+    parser.add_argument('--drain-timeout', type=float, default=30, help='结束后等待回复到齐的超时(秒)')
+    parser.add_argument('--modes', default='resume,legacy', help='运行的模式，逗号分隔')
+    parser.add_argument('--log-level', default='CRITICAL', help='客户端日志级别')
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    install_order_detail_stub(0)
+
+    failures = []
+    print(f"{'mode':<8}{'generated':>10}{'lost':>7}{'dup':>6}{'disc':>6}{'recovery p50(s)':>17}{'max(s)':>9}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+                server = GapServer(args.batch, args.overlap)
+                server.start()
+                try:
+                    result = asyncio.run(run_mode(args, server, mode))
+                finally:
+                    server.stop()
+                recoveries = result['recoveries']
+                print(f"{mode:<8}{result['generated']:>10}{len(result['lost']):>7}{len(result['duplicated']):>6}"
+                      f"{result['disconnects']:>6}{percentile(recoveries, 50):>17.2f}"
+                      f"{max(recoveries) if recoveries else float('nan'):>9.2f}")
+                if mode == 'resume':
+                    if result['lost']:
+                        failures.append(f"resume 模式丢失 {len(result['lost'])} 条消息，例如 {result['lost'][:5]}")
+                    if result['duplicated']:
+                        failures.append(f"resume 模式重复回复 {len(result['duplicated'])} 条消息，例如 {result['duplicated'][:5]}")
+        finally:
+            os.chdir(ROOT_DIR)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 断线期间的消息均已补收且没有重复回复")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Web 准入控制基准 - 重查询压满时测量登录等交互接口的延迟，对比关闭/开启准入控制
+
+在临时目录中启动 reply_server（uvicorn，独立线程）和 CookieManager 的账号事件循环（独立线程），
+注册模拟重查询的同步接口 /admin/data/bench/heavy（归入 heavy 类别）：占用一个线程 --heavy-seconds 秒，
+期间每 50ms 短暂持有一次数据库锁（与逐批读取的导出相同）。
+压测客户端运行在独立进程中：--heavy-clients 个客户端持续请求重查询接口（收到503后等待 50ms 再请求），
+同时 --probe-clients 个客户端轮流请求 POST /login、GET /verify（async）和 GET /cards（同步接口，默认线程池），
+持续 --duration 秒，分别在关闭（off）和开启（on）准入控制时各运行一次，统计各接口 p50/p99 和状态码。
+校验：开启准入控制时探测接口全部返回200且 p99 低于 --budget-ms，重查询被拒绝时返回503和 Retry-After。
+任一校验失败时以非零状态码退出。
+
+用法:
+    python benchmarks/web_admission_bench.py
+    python benchmarks/web_admission_bench.py --heavy-clients 120 --heavy-seconds 2 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+from loguru import logger
+
+from health_bench import free_port, start_account_loop
+from replay_bench import percentile
+
+HEAVY_PATH = '/admin/data/bench/heavy'
+PROBES = ['/login', '/verify', '/cards']
+
+
+def register_heavy_route(heavy_seconds: float):
+    import reply_server
+    from db_manager import db_manager
+
+    @reply_server.app.get(HEAVY_PATH)
+    def bench_heavy_query():
+        """模拟重查询：占用线程 heavy_seconds 秒，每批短暂持有数据库锁"""
+        deadline = time.monotonic() + heavy_seconds
+        batches = 0
+        while time.monotonic() < deadline:
+            with db_manager.lock:
+                db_manager.conn.execute('SELECT COUNT(*) FROM users').fetchone()
+            batches += 1
+            time.sleep(0.05)
+        return {'batches': batches}
+
+    # 新注册的路由需排在 /admin/data/{table_name}/{record_id} 之前
+    reply_server.app.router.routes.insert(0, reply_server.app.router.routes.pop())
+
+
+def start_api_server(port: int):
+    import threading
+    import uvicorn
+    import reply_server
+
+    server = uvicorn.Server(uvicorn.Config(reply_server.app, host='127.0.0.1', port=port, log_level='critical'))
+    threading.Thread(target=server.run, name='api-server', daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise TimeoutError('30秒内 Web 服务未启动')
+        time.sleep(0.05)
+    return server
+
+
+async def load(base_url: str, password: str, heavy_clients: int, probe_clients: int, duration: float) -> dict:
+    latencies = {path: [] for path in PROBES}
+    statuses = {path: {} for path in PROBES + [HEAVY_PATH]}
+    retry_after = set()
+
+    async def login(session: aiohttp.ClientSession):
+        async with session.post(base_url + '/login', json={'username': 'admin', 'password': password}) as response:
+            body = await response.json(content_type=None)
+            return response.status, (body or {}).get('token') if response.status == 200 else None
+
+    def count(path: str, status: int):
+        statuses[path][status] = statuses[path].get(status, 0) + 1
+
+    async def heavy(session: aiohttp.ClientSession, headers: dict, stop_at: float):
+        while time.perf_counter() < stop_at:
+            try:
+                async with session.get(base_url + HEAVY_PATH, headers=headers) as response:
+                    await response.read()
+                    count(HEAVY_PATH, response.status)
+                    if response.status == 503:
+                        retry_after.add(response.headers.get('Retry-After'))
+                        await asyncio.sleep(0.05)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                count(HEAVY_PATH, 'error')
+
+    async def probe(session: aiohttp.ClientSession, headers: dict, offset: int, stop_at: float):
+        index = offset
+        while time.perf_counter() < stop_at:
+            path = PROBES[index % len(PROBES)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                if path == '/login':
+                    status, _ = await login(session)
+                else:
+                    async with session.get(base_url + path, headers=headers) as response:
+                        await response.read()
+                        status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = 'error'
+            latencies[path].append(time.perf_counter() - started)
+            count(path, status)
+            await asyncio.sleep(0.02)
+
+    timeout = aiohttp.ClientTimeout(total=120)
+    # 重查询与探测使用各自的会话，探测不复用重查询的连接
+    heavy_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=heavy_clients), timeout=timeout)
+    probe_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=probe_clients, force_close=True),
+                                          timeout=timeout)
+    try:
+        _, token = await login(probe_session)
+        headers = {'Authorization': f'Bearer {token}'}
+        stop_at = time.perf_counter() + duration
+        heavy_tasks = [asyncio.ensure_future(heavy(heavy_session, headers, stop_at)) for _ in range(heavy_clients)]
+        # 等重查询压满线程池后再开始探测
+        await asyncio.sleep(0.5)
+        await asyncio.gather(*(probe(probe_session, headers, offset, stop_at) for offset in range(probe_clients)))
+        await asyncio.gather(*heavy_tasks)
+    finally:
+        await heavy_session.close()
+        await probe_session.close()
+    return {'latencies': latencies, 'statuses': statuses, 'retry_after': sorted(r for r in retry_after if r)}
+
+
+def run_load(base_url: str, password: str, heavy_clients: int, probe_clients: int, duration: float) -> dict:
+    """在独立进程中执行，避免客户端与服务争用 GIL"""
+    return asyncio.run(load(base_url, password, heavy_clients, probe_clients, duration))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Web 准入控制基准')
+    parser.add_argument('--heavy-clients', type=int, default=60, help='持续请求重查询接口的客户端数')
+    parser.add_argument('--heavy-seconds', type=float, default=1.0, help='单次重查询占用线程的时长(秒)')
+    parser.add_argument('--probe-clients', type=int, default=4, help='探测交互接口的客户端数')
+    parser.add_argument('--duration', type=float, default=6, help='每种模式的压测时长(秒)')
+    parser.add_argument('--budget-ms', type=float, default=250, help='开启准入控制时探测接口 p99 预算(毫秒)')
+    parser.add_argument('--log-level', default='CRITICAL', help='日志级别')
+    args = parser.parse_args(argv)
+
+    password = os.getenv('ADMIN_PASSWORD', 'admin123')
+    failures = []
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            start_account_loop(0)
+            register_heavy_route(args.heavy_seconds)
+            port = free_port()
+            server = start_api_server(port)
+            # reply_server 导入时会按线上配置重设日志输出
+            logger.remove()
+            logger.add(sys.stderr, level=args.log_level)
+
+            from utils.admission import admission_controller
+            base_url = f'http://127.0.0.1:{port}'
+            for mode, enabled in (('off', False), ('on', True)):
+                admission_controller.enabled = enabled
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results[mode] = executor.submit(run_load, base_url, password, args.heavy_clients,
+                                                    args.probe_clients, args.duration).result()
+                # 等待上一轮残留的重查询结束
+                time.sleep(args.heavy_seconds + 0.5)
+            snapshot = admission_controller.snapshot()
+            server.should_exit = True
+        finally:
+            os.chdir(ROOT_DIR)
+
+    print(f"heavy_clients={args.heavy_clients} heavy_seconds={args.heavy_seconds} "
+          f"probe_clients={args.probe_clients} duration={args.duration}s")
+    print(f"{'mode':<6}{'endpoint':<26}{'requests':>9}{'status':>20}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for mode, result in results.items():
+        for path in PROBES + [HEAVY_PATH]:
+            statuses = ','.join(f'{code}x{number}' for code, number in sorted(result['statuses'][path].items(),
+                                                                           key=lambda item: str(item[0])))
+            samples = result['latencies'].get(path)
+            if samples:
+                timing = f"{percentile(samples, 50) * 1000:>10.1f}{percentile(samples, 99) * 1000:>10.1f}"
+            else:
+                timing = f"{'-':>10}{'-':>10}"
+            total = sum(result['statuses'][path].values())
+            print(f"{mode:<6}{path:<26}{total:>9}{statuses:>20}{timing}")
+    print(f"heavy class: {snapshot.get('heavy')}")
+
+    result = results.get('on')
+    if result:
+        for path in PROBES:
+            samples = result['latencies'][path]
+            if not samples:
+                failures.append(f"{path} 没有完成任何请求")
+                continue
+            if set(result['statuses'][path]) != {200}:
+                failures.append(f"{path} 返回了非200状态: {result['statuses'][path]}")
+            p99 = percentile(samples, 99) * 1000
+            if p99 > args.budget_ms:
+                failures.append(f"{path} p99={p99:.1f}ms 超出预算 {args.budget_ms}ms")
+        if not result['statuses'][HEAVY_PATH].get(503):
+            failures.append("重查询压满时没有返回503")
+        elif not result['retry_after']:
+            failures.append("503响应缺少 Retry-After")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print(f"OK: 重查询压满时交互接口 p99 在 {args.budget_ms}ms 以内，超出的重查询返回503")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+写后队列基准 - 模拟订单高峰的热路径写入，对比逐条提交与写后队列批量提交
+
+每个订单产生 2 条对话记录（save_conversation）和 1 次同步位置保存（save_sync_cursor），
+由 --writers 个线程（模拟多个账号的消息处理）以合计 --rate 单/秒并发写入 --orders 个订单
+（逐条提交时每单 3 次 commit，默认速率超出逐条提交的上限）；同时一个读线程持续
+调用 ping（与热路径写入争用同一把数据库锁的其他请求），统计：
+    commits/s  - 每秒 COMMIT 次数（sqlite trace 回调计数）
+    lock hold  - 数据库锁单次持有时间 p50/p99/max
+    read p99   - 读请求耗时（含等锁）
+    写入耗时   - 所有写入调用返回所用时间（写后队列模式下另计刷新完成时间）
+结束后校验写后队列模式下全部写入均已落库（读己之写 + 刷新）。
+write_behind 模式的读请求 p99 不低于 direct 模式或有写入丢失时以非零状态码退出。
+
+用法:
+    python benchmarks/write_behind_bench.py
+    python benchmarks/write_behind_bench.py --orders 5000 --writers 8 --rate 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from replay_bench import percentile
+
+
+class RecordingLock:
+    """记录每次等待/持有时间的互斥锁（替换 DatabaseManager.lock）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acquired_at = 0.0
+        self.holds = []
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquired_at = time.perf_counter()
+        return acquired
+
+    def release(self):
+        self.holds.append(time.perf_counter() - self._acquired_at)
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def run_mode(mode: str, args, work_dir: str) -> dict:
+    from db_manager import DatabaseManager
+    from utils.write_behind import WriteBehindQueue
+
+    db = DatabaseManager(os.path.join(work_dir, f'{mode}.db'))
+    db.write_behind = WriteBehindQueue(db, flush_interval=args.flush_interval) if mode == 'write_behind' else None
+    db.lock = RecordingLock()
+    commits = [0]
+    db.conn.set_trace_callback(lambda sql: sql == 'COMMIT' and commits.__setitem__(0, commits[0] + 1))
+
+    stop = threading.Event()
+    reads = []
+
+    def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            db.ping()
+            reads.append(time.perf_counter() - started)
+            time.sleep(0.001)
+
+    def writer(index: int):
+        cookie_id = f'account_{index}'
+        interval = args.writers / args.rate
+        for number, order in enumerate(range(index, args.orders, args.writers)):
+            # 按到达时间写入，处理落后时不再等待
+            delay = started + number * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            chat_id = f'chat_{order}'
+            db.save_conversation(cookie_id, chat_id, '我已付款，等待你发货', '亲，已为您发货~')
+            db.save_conversation(cookie_id, chat_id, '收到了吗', '已发货，请查收')
+            db.save_sync_cursor(cookie_id, 1700000000000000 + order)
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    started = time.perf_counter()
+    writers = [threading.Thread(target=writer, args=(index,)) for index in range(args.writers)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    written_at = time.perf_counter() - started
+    # 读己之写：读取前刷新队列
+    history = db.get_conversation_history('account_0', 'chat_0')
+    db.flush_writes()
+    flushed_at = time.perf_counter() - started
+    stop.set()
+    reader_thread.join()
+
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM ai_conversations')
+    conversations = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM sync_cursors')
+    cursors = cursor.fetchone()[0]
+    db.conn.set_trace_callback(None)
+    if db.write_behind is not None:
+        db.write_behind.close()
+    db.conn.close()
+    return {
+        'written_at': written_at, 'flushed_at': flushed_at, 'commits': commits[0],
+        'holds': db.lock.holds, 'reads': reads, 'conversations': conversations, 'cursors': cursors,
+        'history': len(history),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='写后队列批量提交基准')
+    parser.add_argument('--orders', type=int, default=3000, help='突发订单数')
+    parser.add_argument('--writers', type=int, default=4, help='并发写入线程数')
+    parser.add_argument('--rate', type=float, default=1000, help='订单到达速率(单/秒)')
+    parser.add_argument('--flush-interval', type=float, default=0.2, help='写后队列刷新间隔(秒)')
+    parser.add_argument('--modes', default='direct,write_behind', help='运行的模式，逗号分隔')
+    args = parser.parse_args(argv)
+
+    failures = []
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 数据库使用相对路径，切换到临时目录避免污染项目数据
+        os.chdir(work_dir)
+        try:
+            for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+                results[mode] = run_mode(mode, args, work_dir)
+        finally:
+            os.chdir(ROOT_DIR)
+
+    print(f"{'mode':<14}{'commits':>9}{'commits/s':>11}{'hold p50(ms)':>14}{'hold p99(ms)':>14}{'hold max(ms)':>14}"
+          f"{'read p99(ms)':>14}{'write(s)':>10}{'durable(s)':>12}")
+    for mode, result in results.items():
+        holds, reads = result['holds'], result['reads']
+        print(f"{mode:<14}{result['commits']:>9}{result['commits'] / result['flushed_at']:>11.0f}"
+              f"{percentile(holds, 50) * 1000:>14.3f}{percentile(holds, 99) * 1000:>14.3f}{max(holds) * 1000:>14.3f}"
+              f"{percentile(reads, 99) * 1000:>14.3f}{result['written_at']:>10.2f}{result['flushed_at']:>12.2f}")
+        if result['conversations'] != args.orders * 2 or result['cursors'] != args.writers or result['history'] != 2:
+            failures.append(f"{mode} 写入丢失: 对话 {result['conversations']}/{args.orders * 2}，"
+                            f"同步位置 {result['cursors']}/{args.writers}，读己之写 {result['history']}/2")
+    if 'direct' in results and 'write_behind' in results:
+        direct_p99 = percentile(results['direct']['reads'], 99)
+        queued_p99 = percentile(results['write_behind']['reads'], 99)
+        if queued_p99 >= direct_p99:
+            failures.append(f"write_behind 读请求 p99 {queued_p99 * 1000:.3f}ms 未低于 direct {direct_p99 * 1000:.3f}ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: 热路径写入已合并提交且全部落库")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -98,6 +98,7 @@ COOKIES_LAST_UPDATE = config.get('COOKIES.last_update_time', '')
 WEBSOCKET_URL = config.get('WEBSOCKET_URL', 'wss://wss-goofish.dingtalk.com/')
 HEARTBEAT_INTERVAL = config.get('HEARTBEAT_INTERVAL', 15)
 HEARTBEAT_TIMEOUT = config.get('HEARTBEAT_TIMEOUT', 5)
+HEARTBEAT_MAX_MISSED = config.get('HEARTBEAT_MAX_MISSED', 2)
 TOKEN_REFRESH_INTERVAL = config.get('TOKEN_REFRESH_INTERVAL', 3600)
 TOKEN_RETRY_INTERVAL = config.get('TOKEN_RETRY_INTERVAL', 300)
 MESSAGE_EXPIRE_TIME = config.get('MESSAGE_EXPIRE_TIME', 300000)
@@ -115,6 +116,13 @@ AUTO_REPLY = config.get('AUTO_REPLY', {
     }
 })
 MANUAL_MODE = config.get('MANUAL_MODE', {})
+SYNC_CONFIG = config.get('SYNC', {
+    'resume': True,
+    'max_backfill_seconds': 3600,
+    'dedupe_window': 5000,
+    'cursor_flush_interval': 1,
+    'backfill_idle_timeout': 5
+})
 LOG_CONFIG = config.get('LOG_CONFIG', {}) 
 _cookies_raw = config.get('COOKIES', [])
 if isinstance(_cookies_raw, list):
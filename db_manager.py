@@ -1,16 +1,20 @@
 import sqlite3
-import threading
 import os
 import logging
 import json
 import hashlib
 import secrets
 import string
+import time
 from datetime import datetime, timedelta
-from PIL import Image, ImageDraw, ImageFont
 import io
 import base64
 
+from utils.metrics import InstrumentedLock, DB_LOCK_WAIT_SECONDS, DB_LOCK_HOLD_SECONDS
+from utils.write_behind import create_write_behind_queue
+from utils.chat_state import chat_state_store
+from utils.keyword_matcher import validate_keyword
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
@@ -24,7 +28,8 @@ class DatabaseManager:
             sql_log_level: SQL日志级别 ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
         """
         self.db_path = db_path
-        self.lock = threading.Lock()
+        # 全局锁，记录等待/持有时间到 /metrics
+        self.lock = InstrumentedLock(DB_LOCK_WAIT_SECONDS, DB_LOCK_HOLD_SECONDS)
         self.conn = None
         self.sql_log_level = getattr(logging, sql_log_level.upper(), logging.INFO)
         
@@ -52,6 +57,8 @@ class DatabaseManager:
         logger.info(f"SQL日志已启用，日志级别: {self.sql_log_level}")
 
         self.init_db()
+        # 非关键写入（对话记录、同步位置等）的写后队列，未启用时为None
+        self.write_behind = create_write_behind_queue(self)
     
     def init_db(self):
         """初始化数据库表结构"""
@@ -106,6 +113,7 @@ class DatabaseManager:
                     remark TEXT DEFAULT '',
                     pause_duration INTEGER DEFAULT 10,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 )
                 ''')
@@ -119,6 +127,7 @@ class DatabaseManager:
                     item_id TEXT,
                     type TEXT DEFAULT 'text',
                     image_url TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (cookie_id) REFERENCES cookies(id) ON DELETE CASCADE
                 )
                 ''')
@@ -203,6 +212,7 @@ class DatabaseManager:
                     intent_type TEXT DEFAULT 'default',
                     bargain_round INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (cookie_id) REFERENCES cookies(id) ON DELETE CASCADE
                 )
                 ''')
@@ -339,6 +349,71 @@ class DatabaseManager:
                 )
                 ''')
 
+                # 创建会话存储表（登录token、扫码登录处理状态等临时数据，多进程共享）
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_store (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (namespace, key)
+                )
+                ''')
+
+                # 创建图片存储表（按内容sha256去重，记录尺寸、缩略图和引用计数）
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS image_store (
+                    sha256 TEXT PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    thumb_path TEXT DEFAULT '',
+                    format TEXT DEFAULT '',
+                    width INTEGER DEFAULT 0,
+                    height INTEGER DEFAULT 0,
+                    size INTEGER DEFAULT 0,
+                    ref_count INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+
+                # 创建同步位置表（每个账号已处理到的同步pts，重连后从该位置继续同步）
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_cursors (
+                    cookie_id TEXT PRIMARY KEY,
+                    pts INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+
+                # 创建定时任务表（延时发货等到期执行的任务，按到期时间建索引，重启后继续执行）
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cookie_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    job_key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL DEFAULT '{}',
+                    due_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT DEFAULT '',
+                    sent_at REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+
+                # 创建API卡券预取池表（提前从卡券API取好的内容，config_hash 为取内容时API配置的摘要）
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS card_prefetch_pool (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    card_id INTEGER NOT NULL,
+                    config_hash TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+
                 # 创建索引以提高查询性能
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_cookies_user_id ON cookies(user_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_keywords_cookie_id ON keywords(cookie_id)')
@@ -349,6 +424,20 @@ class DatabaseManager:
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_logs_chat_id ON message_logs(chat_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_cookie_id ON orders(cookie_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_cookie_created ON orders(cookie_id, created_at, id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_cards_user_id ON cards(user_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_store_expires_at ON session_store(expires_at)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_status_due ON scheduled_jobs(status, due_at)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_card_prefetch_pool_card ON card_prefetch_pool(card_id, config_hash, id)')
+
+                # 备份表的updated_at列和维护触发器（增量备份按updated_at过滤）
+                self._ensure_backup_watermarks(cursor)
+
+                # 旧版本的定时任务表没有发送标记列
+                cursor.execute("PRAGMA table_info(scheduled_jobs)")
+                if 'sent_at' not in [col[1] for col in cursor.fetchall()]:
+                    cursor.execute("ALTER TABLE scheduled_jobs ADD COLUMN sent_at REAL")
+                    logger.info("已为 scheduled_jobs 表添加 sent_at 列")
 
                 # 检查并创建默认管理员用户
                 self._create_default_admin_user(cursor)
@@ -376,6 +465,47 @@ class DatabaseManager:
         else:
             return cursor.execute(sql)
 
+    def enqueue_write(self, table: str, sql: str, params: tuple = ()) -> bool:
+        """非关键写入：启用写后队列时合并到批量事务中稍后写入，否则立即写入（调用方不能持有数据库锁）"""
+        if self.write_behind is not None:
+            self.write_behind.submit(table, sql, params)
+            return True
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, sql, params)
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"写入{table}失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def flush_writes(self, table: str = None):
+        """写入写后队列中的数据；指定 table 时只在该表有待写入数据时写入（读取前调用，保证读己之写）"""
+        if self.write_behind is None:
+            return
+        if table is None:
+            self.write_behind.flush()
+        else:
+            self.write_behind.flush_table(table)
+
+    def ping(self) -> bool:
+        """检查数据库连接是否可用（就绪检查使用，只执行 SELECT 1）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                cursor.execute("SELECT 1")
+                return cursor.fetchone() is not None
+            except Exception as e:
+                logger.error(f"数据库连接检查失败: {e}")
+                return False
+
     def save_cookie(self, cookie_id, cookie_value, user_id=1):
         """保存Cookie"""
         with self.lock:
@@ -394,6 +524,22 @@ class DatabaseManager:
                 logger.error(f"Cookie保存失败: {e}")
                 return False
 
+    def update_cookie_value(self, cookie_id: str, cookie_value: str) -> bool:
+        """只更新Cookie值（保留所属用户和账号设置），用于接口响应刷新了 _m_h5_tk 等Cookie"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute("PRAGMA table_info(cookies)")
+                cookie_column = 'cookie' if 'cookie' in {col[1] for col in cursor.fetchall()} else 'value'
+                self._execute_sql(cursor, f"UPDATE cookies SET {cookie_column} = ? WHERE id = ?",
+                                  (cookie_value, cookie_id))
+                self.conn.commit()
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"更新Cookie值失败: {e}")
+                self.conn.rollback()
+                return False
+
     def get_cookie(self, cookie_id):
         """获取Cookie"""
         with self.lock:
@@ -470,11 +616,17 @@ class DatabaseManager:
 
     def delete_cookie(self, cookie_id):
         """删除Cookie"""
+        # 先写入该账号排队中的同步位置等数据，避免删除后又被写回
+        self.flush_writes()
         with self.lock:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, 'DELETE FROM cookies WHERE id = ?', (cookie_id,))
+                self._execute_sql(cursor, 'DELETE FROM sync_cursors WHERE cookie_id = ?', (cookie_id,))
+                self._execute_sql(cursor, 'DELETE FROM scheduled_jobs WHERE cookie_id = ?', (cookie_id,))
                 self.conn.commit()
+                chat_state_store.invalidate_account(cookie_id)
+                chat_state_store.invalidate_chats(cookie_id)
                 logger.info(f"Cookie删除成功: {cookie_id}")
                 return True
             except Exception as e:
@@ -627,6 +779,45 @@ class DatabaseManager:
                 logger.error(f"获取Cookie详细信息失败: {e}")
                 return None
 
+    def get_cookies_details_by_user(self, user_id: int = None) -> list:
+        """一次查询获取用户所有Cookie的详细信息（避免逐个账号查询）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                # 兼容不同数据库结构的cookie值列名
+                cursor.execute("PRAGMA table_info(cookies)")
+                column_names = [col[1] for col in cursor.fetchall()]
+                cookie_column = 'cookie' if 'cookie' in column_names else 'value'
+
+                query = f"""
+                    SELECT id, {cookie_column}, user_id, auto_confirm, remark, pause_duration, created_at
+                    FROM cookies
+                """
+                if user_id is not None:
+                    self._execute_sql(cursor, query + " WHERE user_id = ?", (user_id,))
+                else:
+                    self._execute_sql(cursor, query)
+
+                details = []
+                for row in cursor.fetchall():
+                    details.append({
+                        'id': row[0],
+                        'value': row[1],
+                        'user_id': row[2],
+                        'auto_confirm': bool(row[3]),
+                        'remark': row[4] or '',
+                        'pause_duration': row[5] if row[5] is not None else 10,
+                        'created_at': row[6]
+                    })
+
+                return details
+            except Exception as e:
+                logger.error(f"批量获取Cookie详细信息失败: {e}")
+                return []
+
     def get_user_settings(self, user_id: int):
         """获取用户的所有设置"""
         with self.lock:
@@ -784,6 +975,7 @@ class DatabaseManager:
                 ))
                 
                 self.conn.commit()
+                chat_state_store.invalidate_account(cookie_id, 'ai_settings')
                 logger.info(f"AI回复设置保存成功: {cookie_id}")
                 return True
             except Exception as e:
@@ -901,29 +1093,17 @@ class DatabaseManager:
 
     def save_conversation(self, cookie_id: str, chat_id: str, user_message: str, 
                          ai_response: str, intent_type: str = 'default', bargain_round: int = 0) -> bool:
-        """保存AI对话记录"""
-        with self.lock:
-            try:
-                if not self.conn:
-                    self.init_db()
-                cursor = self.conn.cursor()
-                
-                self._execute_sql(cursor, '''
-                    INSERT INTO ai_conversations 
-                    (cookie_id, chat_id, user_message, ai_response, intent_type, bargain_round, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (cookie_id, chat_id, user_message, ai_response, intent_type, bargain_round))
-                
-                self.conn.commit()
-                return True
-            except Exception as e:
-                logger.error(f"保存对话记录失败: {e}")
-                if self.conn:
-                    self.conn.rollback()
-                return False
+        """保存AI对话记录（经写后队列批量写入，created_at 取调用时间）"""
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        return self.enqueue_write('ai_conversations', '''
+            INSERT INTO ai_conversations 
+            (cookie_id, chat_id, user_message, ai_response, intent_type, bargain_round, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (cookie_id, chat_id, user_message, ai_response, intent_type, bargain_round, created_at))
 
     def get_conversation_history(self, cookie_id: str, chat_id: str, limit: int = 10) -> list:
         """获取对话历史"""
+        self.flush_writes('ai_conversations')
         with self.lock:
             try:
                 if not self.conn:
@@ -953,6 +1133,73 @@ class DatabaseManager:
                 logger.error(f"获取对话历史失败: {e}")
                 return []
 
+    def get_all_users_with_stats(self) -> list:
+        """获取所有用户及其Cookie/卡券数量（管理员专用，单次查询）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    SELECT u.id, u.username, u.email, u.is_active, u.created_at, u.updated_at,
+                           COALESCE(ck.cnt, 0) AS cookie_count,
+                           COALESCE(cd.cnt, 0) AS card_count
+                    FROM users u
+                    LEFT JOIN (SELECT user_id, COUNT(*) AS cnt FROM cookies GROUP BY user_id) ck
+                        ON ck.user_id = u.id
+                    LEFT JOIN (SELECT user_id, COUNT(*) AS cnt FROM cards GROUP BY user_id) cd
+                        ON cd.user_id = u.id
+                    ORDER BY u.created_at DESC
+                ''')
+
+                users = []
+                for row in cursor.fetchall():
+                    users.append({
+                        'id': row[0],
+                        'username': row[1],
+                        'email': row[2],
+                        'is_active': bool(row[3]),
+                        'created_at': row[4],
+                        'updated_at': row[5],
+                        'cookie_count': row[6],
+                        'card_count': row[7]
+                    })
+
+                return users
+            except Exception as e:
+                logger.error(f"获取用户统计列表失败: {e}")
+                return []
+
+    def get_system_counts(self) -> dict:
+        """使用COUNT(*)获取系统统计数量（管理员专用）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    SELECT
+                        (SELECT COUNT(*) FROM users),
+                        (SELECT COUNT(*) FROM cookies),
+                        (SELECT COUNT(*) FROM cards),
+                        (SELECT COUNT(*) FROM cards WHERE enabled = 1),
+                        (SELECT COUNT(*) FROM orders)
+                ''')
+
+                row = cursor.fetchone()
+                return {
+                    'users': row[0],
+                    'cookies': row[1],
+                    'cards': row[2],
+                    'cards_enabled': row[3],
+                    'orders': row[4]
+                }
+            except Exception as e:
+                logger.error(f"获取系统统计数量失败: {e}")
+                return {'users': 0, 'cookies': 0, 'cards': 0, 'cards_enabled': 0, 'orders': 0}
+
     def check_database_integrity(self) -> bool:
         """检查数据库完整性"""
         with self.lock:
@@ -1301,6 +1548,21 @@ class DatabaseManager:
                     self.conn.rollback()
                 return False
 
+    def get_card_image_url(self, card_id: int) -> str:
+        """获取卡券当前的图片地址（用于替换或删除卡券时释放图片引用）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, 'SELECT image_url FROM cards WHERE id = ?', (card_id,))
+                row = cursor.fetchone()
+                return (row[0] or '') if row else ''
+            except Exception as e:
+                logger.error(f"获取卡券图片失败: {e}")
+                return ''
+
     def delete_card(self, card_id: int) -> bool:
         """删除卡券"""
         with self.lock:
@@ -1312,6 +1574,7 @@ class DatabaseManager:
                 self._execute_sql(cursor, 'DELETE FROM cards WHERE id = ?', (card_id,))
                 
                 success = cursor.rowcount > 0
+                self._execute_sql(cursor, 'DELETE FROM card_prefetch_pool WHERE card_id = ?', (card_id,))
                 self.conn.commit()
                 return success
             except Exception as e:
@@ -1320,6 +1583,93 @@ class DatabaseManager:
                     self.conn.rollback()
                 return False
 
+    def get_prefetch_api_cards(self) -> list:
+        """获取所有启用的API卡券 [{'id', 'api_config'}]（用于启动时补充预取池）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, "SELECT id, api_config FROM cards WHERE type = 'api' AND enabled = 1")
+                return [{'id': row[0], 'api_config': row[1]} for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"获取API卡券失败: {e}")
+                return []
+
+    def add_prefetched_card_content(self, card_id: int, config_hash: str, content: str) -> int:
+        """向预取池加入一条卡券内容，返回池中该配置的内容数"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    INSERT INTO card_prefetch_pool (card_id, config_hash, content) VALUES (?, ?, ?)
+                ''', (card_id, config_hash, content))
+                self._execute_sql(cursor, '''
+                    SELECT COUNT(*) FROM card_prefetch_pool WHERE card_id = ? AND config_hash = ?
+                ''', (card_id, config_hash))
+                count = cursor.fetchone()[0]
+                self.conn.commit()
+                return count
+            except Exception as e:
+                logger.error(f"保存预取卡券内容失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                raise
+
+    def take_prefetched_card_content(self, card_id: int, config_hash: str):
+        """从预取池取出（并删除）最早的一条卡券内容，池为空时返回None"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    SELECT id, content FROM card_prefetch_pool
+                    WHERE card_id = ? AND config_hash = ?
+                    ORDER BY id LIMIT 1
+                ''', (card_id, config_hash))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                self._execute_sql(cursor, 'DELETE FROM card_prefetch_pool WHERE id = ?', (row[0],))
+                self.conn.commit()
+                return row[1]
+            except Exception as e:
+                logger.error(f"取出预取卡券内容失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return None
+
+    def count_prefetched_card_contents(self, card_id: int, config_hash: str) -> int:
+        """预取池中该卡券当前配置的内容数，并清除按旧API配置取到的内容"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    DELETE FROM card_prefetch_pool WHERE card_id = ? AND config_hash != ?
+                ''', (card_id, config_hash))
+                if cursor.rowcount > 0:
+                    logger.info(f"卡券 {card_id} 的API配置已修改，清除旧配置预取的 {cursor.rowcount} 条内容")
+                self._execute_sql(cursor, '''
+                    SELECT COUNT(*) FROM card_prefetch_pool WHERE card_id = ? AND config_hash = ?
+                ''', (card_id, config_hash))
+                count = cursor.fetchone()[0]
+                self.conn.commit()
+                return count
+            except Exception as e:
+                logger.error(f"统计预取卡券内容失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return 0
+
     # ==================== 自动发货规则管理方法 ====================
     
     def get_all_delivery_rules(self, user_id: int) -> list:
@@ -1660,85 +2010,1062 @@ class DatabaseManager:
                 logger.error(f"获取所有系统设置失败: {e}")
                 return {}
 
-    def get_table_data(self, table_name: str) -> tuple:
-        """获取指定表的所有数据和列名（管理员专用）"""
+    # ==================== 同步位置方法 ====================
+
+    def get_sync_cursor(self, cookie_id: str) -> int:
+        """获取账号保存的同步位置(pts)，没有记录返回0"""
+        self.flush_writes('sync_cursors')
         with self.lock:
             try:
                 if not self.conn:
                     self.init_db()
                 cursor = self.conn.cursor()
-                
-                # 获取表的列信息
-                self._execute_sql(cursor, f"PRAGMA table_info({table_name})")
-                columns_info = cursor.fetchall()
-                columns = [col[1] for col in columns_info]  # col[1] 是列名
-                
-                # 获取表数据
-                self._execute_sql(cursor, f"SELECT * FROM {table_name}")
-                rows = cursor.fetchall()
-                
-                # 将数据转换为字典列表
-                data = []
-                for row in rows:
-                    row_dict = {}
-                    for i, value in enumerate(row):
-                        if i < len(columns):
-                            row_dict[columns[i]] = value
-                    data.append(row_dict)
-                
-                logger.info(f"获取表 {table_name} 数据成功，共 {len(data)} 条记录")
-                return data, columns
-                
+                self._execute_sql(cursor, 'SELECT pts FROM sync_cursors WHERE cookie_id = ?', (cookie_id,))
+                row = cursor.fetchone()
+                return int(row[0]) if row else 0
             except Exception as e:
-                logger.error(f"获取表 {table_name} 数据失败: {e}")
-                return [], []
+                logger.error(f"获取同步位置失败: {cookie_id}, {e}")
+                return 0
 
-    def get_keywords(self, cookie_id: str):
-        """获取关键词列表"""
+    def save_sync_cursor(self, cookie_id: str, pts: int) -> bool:
+        """保存账号的同步位置，只会向前推进（经写后队列批量写入）"""
+        return self.enqueue_write('sync_cursors', '''
+            INSERT INTO sync_cursors (cookie_id, pts, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(cookie_id) DO UPDATE SET pts = excluded.pts, updated_at = CURRENT_TIMESTAMP
+            WHERE excluded.pts > sync_cursors.pts
+        ''', (cookie_id, int(pts)))
+
+    # ==================== 定时任务方法 ====================
+
+    def add_scheduled_job(self, cookie_id: str, kind: str, job_key: str, payload: dict, due_at: float) -> bool:
+        """添加定时任务，job_key 已有未完成的任务时不重复添加，返回是否添加成功
+
+        已失败的任务可以重新排期（执行次数和发送标记清零）；执行成功的任务记录已删除，可以直接添加
+        """
         with self.lock:
             try:
                 if not self.conn:
                     self.init_db()
                 cursor = self.conn.cursor()
-                
-                # 从keywords表获取关键词数据
-                cursor.execute('''
-                    SELECT keyword 
-                    FROM keywords 
-                    WHERE cookie_id = ?
-                    ORDER BY keyword
-                ''', (cookie_id,))
-                
-                results = cursor.fetchall()
-                return [row[0] for row in results] if results else []
-                
-            except sqlite3.Error as e:
-                logger.error(f"获取关键词失败: {e}")
-                return []
+                self._execute_sql(cursor, '''
+                    INSERT INTO scheduled_jobs (cookie_id, kind, job_key, payload, due_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(job_key) DO UPDATE SET
+                        cookie_id = excluded.cookie_id, kind = excluded.kind, payload = excluded.payload,
+                        due_at = excluded.due_at, status = 'pending', attempts = 0, last_error = '', sent_at = NULL
+                    WHERE scheduled_jobs.status = 'failed'
+                ''', (cookie_id, kind, job_key, json.dumps(payload, ensure_ascii=False), due_at))
+                self.conn.commit()
+                return cursor.rowcount > 0
+            except Exception as e:
+                logger.error(f"添加定时任务失败: {job_key}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
 
-    def get_keywords_with_item_id(self, cookie_id: str):
-        """获取包含商品ID的关键词列表"""
+    def has_scheduled_job(self, job_key: str) -> bool:
+        """是否存在未完成的定时任务"""
         with self.lock:
             try:
                 if not self.conn:
                     self.init_db()
                 cursor = self.conn.cursor()
-                
-                # 从keywords表获取关键词数据
-                cursor.execute('''
-                    SELECT keyword, reply, item_id 
-                    FROM keywords 
+                self._execute_sql(cursor, '''
+                    SELECT 1 FROM scheduled_jobs WHERE job_key = ? AND status IN ('pending', 'running')
+                ''', (job_key,))
+                return cursor.fetchone() is not None
+            except Exception as e:
+                logger.error(f"查询定时任务失败: {job_key}, {e}")
+                return False
+
+    def claim_due_jobs(self, now: float, limit: int = 50) -> list:
+        """取出已到期的任务并标记为执行中（attempts 加1）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                    SELECT id, cookie_id, kind, job_key, payload, due_at, attempts, sent_at FROM scheduled_jobs
+                    WHERE status = 'pending' AND due_at <= ?
+                    ORDER BY due_at LIMIT ?
+                ''', (now, limit))
+                jobs = [{
+                    'id': row[0], 'cookie_id': row[1], 'kind': row[2], 'job_key': row[3],
+                    'payload': json.loads(row[4]), 'due_at': row[5], 'attempts': row[6] + 1, 'sent_at': row[7]
+                } for row in cursor.fetchall()]
+                if jobs:
+                    cursor.executemany('''
+                        UPDATE scheduled_jobs SET status = 'running', attempts = attempts + 1 WHERE id = ?
+                    ''', [(job['id'],) for job in jobs])
+                    self.conn.commit()
+                return jobs
+            except Exception as e:
+                logger.error(f"获取到期任务失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return []
+
+    def get_next_job_due_at(self):
+        """最早的待执行任务的到期时间，没有任务返回None"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "SELECT MIN(due_at) FROM scheduled_jobs WHERE status = 'pending'")
+                row = cursor.fetchone()
+                return row[0] if row else None
+            except Exception as e:
+                logger.error(f"获取下一个任务到期时间失败: {e}")
+                return None
+
+    def finish_scheduled_job(self, job_id: int) -> bool:
+        """任务执行成功，删除记录"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, 'DELETE FROM scheduled_jobs WHERE id = ?', (job_id,))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"删除定时任务失败: {job_id}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def retry_scheduled_job(self, job_id: int, due_at: float, error: str = '', failed: bool = False) -> bool:
+        """任务执行失败：重新排期，或超过重试次数后标记为failed（保留记录以便排查）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                    UPDATE scheduled_jobs SET status = ?, due_at = ?, last_error = ? WHERE id = ?
+                ''', ('failed' if failed else 'pending', due_at, error[:500], job_id))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"更新定时任务失败: {job_id}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def defer_scheduled_job(self, job_id: int, due_at: float, reason: str = '') -> bool:
+        """任务暂时无法执行（如账号未连接）：重新排期，本次不计入执行次数"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, '''
+                    UPDATE scheduled_jobs SET status = 'pending', due_at = ?, last_error = ?,
+                        attempts = MAX(attempts - 1, 0)
+                    WHERE id = ?
+                ''', (due_at, reason[:500], job_id))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"推迟定时任务失败: {job_id}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def mark_scheduled_job_sent(self, job_id: int) -> bool:
+        """任务发送消息前记录发送标记：发送后、删除任务前进程退出时，重新执行不会重复发送"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, 'UPDATE scheduled_jobs SET sent_at = ? WHERE id = ?', (time.time(), job_id))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"记录定时任务发送标记失败: {job_id}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def reset_running_jobs(self) -> int:
+        """进程启动时把上次未执行完的任务恢复为待执行，返回恢复条数"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "UPDATE scheduled_jobs SET status = 'pending' WHERE status = 'running'")
+                self.conn.commit()
+                return cursor.rowcount
+            except Exception as e:
+                logger.error(f"恢复执行中的定时任务失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return 0
+
+    # ==================== 会话存储方法 ====================
+
+    def get_session_value(self, namespace: str, key: str):
+        """获取未过期的会话值（JSON反序列化后返回），不存在或已过期返回None"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    SELECT value FROM session_store
+                    WHERE namespace = ? AND key = ? AND expires_at > ?
+                ''', (namespace, key, time.time()))
+
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+            except Exception as e:
+                logger.error(f"获取会话值失败: {namespace}/{key}, {e}")
+                return None
+
+    def set_session_value(self, namespace: str, key: str, value, ttl: float) -> bool:
+        """写入会话值，覆盖已有记录"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    INSERT OR REPLACE INTO session_store (namespace, key, value, expires_at, created_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl))
+
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"写入会话值失败: {namespace}/{key}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def add_session_value(self, namespace: str, key: str, value, ttl: float) -> bool:
+        """仅当键不存在（或已过期）时写入会话值，返回是否写入成功，可用作跨进程互斥"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                now = time.time()
+
+                # 先清理该键的过期记录，再尝试插入
+                self._execute_sql(cursor, '''
+                    DELETE FROM session_store WHERE namespace = ? AND key = ? AND expires_at <= ?
+                ''', (namespace, key, now))
+                self._execute_sql(cursor, '''
+                    INSERT OR IGNORE INTO session_store (namespace, key, value, expires_at, created_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl))
+
+                added = cursor.rowcount > 0
+                self.conn.commit()
+                return added
+            except Exception as e:
+                logger.error(f"写入会话值失败: {namespace}/{key}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def delete_session_value(self, namespace: str, key: str) -> bool:
+        """删除会话值"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, 'DELETE FROM session_store WHERE namespace = ? AND key = ?', (namespace, key))
+
+                success = cursor.rowcount > 0
+                self.conn.commit()
+                return success
+            except Exception as e:
+                logger.error(f"删除会话值失败: {namespace}/{key}, {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def cleanup_expired_session_values(self) -> int:
+        """清理所有已过期的会话值，返回清理条数"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, 'DELETE FROM session_store WHERE expires_at <= ?', (time.time(),))
+
+                deleted = cursor.rowcount
+                self.conn.commit()
+                return deleted
+            except Exception as e:
+                logger.error(f"清理过期会话值失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return 0
+
+    def get_table_data(self, table_name: str) -> tuple:
+        """获取指定表的所有数据和列名（管理员专用）"""
+        self.flush_writes()
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                
+                # 获取表的列信息
+                self._execute_sql(cursor, f"PRAGMA table_info({table_name})")
+                columns_info = cursor.fetchall()
+                columns = [col[1] for col in columns_info]  # col[1] 是列名
+                
+                # 获取表数据
+                self._execute_sql(cursor, f"SELECT * FROM {table_name}")
+                rows = cursor.fetchall()
+                
+                # 将数据转换为字典列表
+                data = []
+                for row in rows:
+                    row_dict = {}
+                    for i, value in enumerate(row):
+                        if i < len(columns):
+                            row_dict[columns[i]] = value
+                    data.append(row_dict)
+                
+                logger.info(f"获取表 {table_name} 数据成功，共 {len(data)} 条记录")
+                return data, columns
+                
+            except Exception as e:
+                logger.error(f"获取表 {table_name} 数据失败: {e}")
+                return [], []
+
+    # ==================== 备份与恢复方法 ====================
+
+    # 参与逻辑备份的表（按导入顺序排列）
+    BACKUP_TABLES = [
+        'cookies', 'keywords', 'cookie_status', 'cards',
+        'delivery_rules', 'default_replies', 'notification_channels',
+        'message_notifications', 'system_settings', 'item_info',
+        'ai_reply_settings', 'ai_conversations', 'ai_item_cache'
+    ]
+
+    # 备份格式版本（2.0为NDJSON流式格式）
+    BACKUP_FORMAT_VERSION = '2.0'
+
+    def backup_database(self, dest_path: str, pages: int = 1024) -> bool:
+        """在线备份整个数据库到指定文件（sqlite3 backup API，逐页复制）
+
+        使用独立的只读连接作为源，不持有全局锁，备份期间其他线程可以继续读写；
+        源库在备份过程中被修改时SQLite会自动重新复制，保证结果是一致的快照。
+        """
+        self.flush_writes()
+        source = None
+        dest = None
+        try:
+            source = sqlite3.connect(self.db_path, timeout=30)
+            dest = sqlite3.connect(dest_path)
+
+            def progress(status, remaining, total):
+                logger.debug(f"数据库备份进度: {total - remaining}/{total} 页")
+
+            source.backup(dest, pages=pages, progress=progress)
+            logger.info(f"数据库在线备份完成: {dest_path}")
+            return True
+        except Exception as e:
+            logger.error(f"数据库在线备份失败: {e}")
+            return False
+        finally:
+            if dest:
+                dest.close()
+            if source:
+                source.close()
+
+    def restore_database(self, source_path: str, pages: int = 1024) -> bool:
+        """从备份文件恢复数据库（sqlite3 backup API，直接写入当前连接，无需替换文件）"""
+        source = None
+        try:
+            source = sqlite3.connect(source_path)
+            with self.lock:
+                if not self.conn:
+                    self.init_db()
+                source.backup(self.conn, pages=pages)
+            logger.info(f"数据库恢复完成: {source_path}")
+        except Exception as e:
+            logger.error(f"数据库恢复失败: {e}")
+            return False
+        finally:
+            if source:
+                source.close()
+
+        # 补齐备份文件中可能缺少的表和默认数据
+        self.init_db()
+        chat_state_store.invalidate_account()
+        chat_state_store.invalidate_chats()
+        return True
+
+    def get_database_watermark(self) -> str:
+        """获取数据库当前时间，作为增量备份的水位线"""
+        with self.lock:
+            if not self.conn:
+                self.init_db()
+            cursor = self.conn.cursor()
+            self._execute_sql(cursor, "SELECT CURRENT_TIMESTAMP")
+            return cursor.fetchone()[0]
+
+    def _ensure_backup_watermarks(self, cursor):
+        """确保参与备份的表都有updated_at列，并用触发器在插入和修改时维护
+
+        旧版本的cookies、keywords、ai_conversations没有updated_at，增量备份会漏掉修改过的行；
+        ALTER TABLE 不能使用 CURRENT_TIMESTAMP 默认值，新列先按created_at补齐，之后插入的行由触发器填写。
+        """
+        self._execute_sql(cursor, "SELECT name FROM sqlite_master WHERE type='table'")
+        existing_tables = {row[0] for row in cursor.fetchall()}
+        for table in self.BACKUP_TABLES:
+            if table not in existing_tables:
+                continue
+            self._execute_sql(cursor, f"PRAGMA table_info({table})")
+            columns = [col[1] for col in cursor.fetchall()]
+            if 'updated_at' not in columns:
+                self._execute_sql(cursor, f"ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP")
+                backfill = 'COALESCE(created_at, CURRENT_TIMESTAMP)' if 'created_at' in columns else 'CURRENT_TIMESTAMP'
+                self._execute_sql(cursor, f"UPDATE {table} SET updated_at = {backfill}")
+                logger.info(f"已为 {table} 表添加 updated_at 列")
+            # 插入时未提供updated_at、修改时未修改updated_at，都写入当前时间（递归触发器默认关闭，不会循环触发）
+            self._execute_sql(cursor, f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_updated_at_insert AFTER INSERT ON {table}
+                FOR EACH ROW WHEN NEW.updated_at IS NULL
+                BEGIN UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid; END
+            """)
+            self._execute_sql(cursor, f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_updated_at_update AFTER UPDATE ON {table}
+                FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+                BEGIN UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid; END
+            """)
+
+    @staticmethod
+    def _backup_table_scope(columns) -> str:
+        """备份表的归属：user（按user_id）、cookie（按cookie_id）或 global（系统全局数据）"""
+        if 'user_id' in columns:
+            return 'user'
+        if 'cookie_id' in columns:
+            return 'cookie'
+        return 'global'
+
+    def _get_backup_table_plan(self, cursor, user_id: int = None, since: str = None,
+                               include_global: bool = False) -> list:
+        """计算每个备份表的列和过滤条件
+
+        Args:
+            include_global: 用户级备份是否包含system_settings等全局表（仅管理员）
+
+        Returns:
+            [(表名, 列名列表, where子句, 参数)]，不存在的表和与用户无关的表会被跳过
+        """
+        self._execute_sql(cursor, "SELECT name FROM sqlite_master WHERE type='table'")
+        existing_tables = {row[0] for row in cursor.fetchall()}
+
+        plan = []
+        for table in self.BACKUP_TABLES:
+            if table not in existing_tables:
+                continue
+
+            self._execute_sql(cursor, f"PRAGMA table_info({table})")
+            columns = [col[1] for col in cursor.fetchall()]
+
+            conditions = []
+            params = []
+            if user_id is not None:
+                # 用户级备份：只包含该用户的数据（cookies、卡券等按user_id，账号关联数据按cookie_id）
+                scope = self._backup_table_scope(columns)
+                if scope == 'user':
+                    conditions.append("user_id = ?")
+                    params.append(user_id)
+                elif scope == 'cookie':
+                    conditions.append("cookie_id IN (SELECT id FROM cookies WHERE user_id = ?)")
+                    params.append(user_id)
+                elif not include_global:
+                    continue
+
+            if since and 'updated_at' in columns:
+                # 增量备份：按updated_at过滤（由 _ensure_backup_watermarks 维护）
+                conditions.append("updated_at >= ?")
+                params.append(since)
+
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            plan.append((table, columns, where, params))
+
+        return plan
+
+    def iter_backup_records(self, user_id: int = None, since: str = None, batch_size: int = 500,
+                            include_global: bool = False):
+        """流式生成备份记录（NDJSON的每一行），按rowid分批读取，批次之间释放锁
+
+        记录类型：
+            header: {'type': 'header', 'version', 'timestamp', 'user_id', 'since', 'watermark'}
+            table:  {'type': 'table', 'table', 'columns'}
+            row:    {'type': 'row', 'table', 'values'}
+            end:    {'type': 'end', 'counts': {表名: 行数}}
+        """
+        self.flush_writes()
+        watermark = self.get_database_watermark()
+        with self.lock:
+            if not self.conn:
+                self.init_db()
+            plan = self._get_backup_table_plan(self.conn.cursor(), user_id, since, include_global)
+
+        yield {
+            'type': 'header',
+            'version': self.BACKUP_FORMAT_VERSION,
+            'timestamp': time.time(),
+            'user_id': user_id,
+            'since': since,
+            'watermark': watermark
+        }
+
+        counts = {}
+        for table, columns, where, params in plan:
+            yield {'type': 'table', 'table': table, 'columns': columns}
+
+            select_list = ', '.join(f'"{col}"' for col in columns)
+            rowid_condition = " AND rowid > ?" if where else " WHERE rowid > ?"
+            last_rowid = 0
+            count = 0
+            while True:
+                with self.lock:
+                    cursor = self.conn.cursor()
+                    self._execute_sql(cursor, f"""
+                        SELECT rowid, {select_list} FROM {table}{where}{rowid_condition}
+                        ORDER BY rowid LIMIT ?
+                    """, params + [last_rowid, batch_size])
+                    rows = cursor.fetchall()
+
+                for row in rows:
+                    yield {'type': 'row', 'table': table, 'values': list(row[1:])}
+                count += len(rows)
+
+                if len(rows) < batch_size:
+                    break
+                last_rowid = rows[-1][0]
+
+            counts[table] = count
+
+        logger.info(f"导出备份完成，用户ID: {user_id}, 增量起点: {since}, 行数: {sum(counts.values())}")
+        yield {'type': 'end', 'counts': counts}
+
+    def export_backup(self, user_id: int = None, include_global: bool = False) -> dict:
+        """导出系统备份数据（旧版JSON格式，支持用户隔离）"""
+        backup_data = {
+            'version': '1.0',
+            'timestamp': time.time(),
+            'user_id': user_id,
+            'data': {}
+        }
+
+        for record in self.iter_backup_records(user_id, include_global=include_global):
+            if record['type'] == 'table':
+                backup_data['data'][record['table']] = {'columns': record['columns'], 'rows': []}
+            elif record['type'] == 'row':
+                backup_data['data'][record['table']]['rows'].append(record['values'])
+
+        return backup_data
+
+    def _clear_backup_scope(self, cursor, user_id: int = None, include_global: bool = False):
+        """全量导入前清空导入范围内的数据（user_id为None时为系统级导入，清空所有数据）"""
+        for table, columns, where, params in reversed(self._get_backup_table_plan(cursor, user_id,
+                                                                                  include_global=include_global)):
+            if table == 'system_settings':
+                # 保留管理员密码
+                self._execute_sql(cursor, "DELETE FROM system_settings WHERE key != 'admin_password_hash'")
+            else:
+                self._execute_sql(cursor, f"DELETE FROM {table}{where}", params)
+
+    # 用户级导入时必须引用该用户自己数据的列 {列名: 被引用的表}
+    BACKUP_USER_REFERENCES = {'card_id': 'cards', 'channel_id': 'notification_channels'}
+
+    def import_backup_records(self, records, user_id: int = None, batch_size: int = 500,
+                              include_global: bool = False) -> dict:
+        """导入备份记录（iter_backup_records产生的记录流）
+
+        先逐行校验并暂存到临时数据库（不持有锁），再在一个事务内清空导入范围（全量备份）并分批写入，
+        任一批失败整体回滚，原有数据保持不变。增量备份（header中since不为空）使用INSERT OR REPLACE合并。
+
+        用户级导入（user_id不为None）只能写入该用户自己的数据：
+            - 带user_id列的行（cookies、卡券、发货规则、通知渠道）强制写为该用户
+            - 带cookie_id列的行只接受该用户已有的或本次导入的账号
+            - 主键已属于其他用户的行、引用其他用户卡券/通知渠道的行跳过
+            - system_settings等全局表只在 include_global（管理员）时导入
+
+        Returns:
+            {表名: 导入行数}
+        """
+        allowed_tables = set(self.BACKUP_TABLES)
+        with self.lock:
+            if not self.conn:
+                self.init_db()
+            cursor = self.conn.cursor()
+            plan_tables = {table: columns for table, columns, _, _ in
+                           self._get_backup_table_plan(cursor, user_id, include_global=include_global)}
+            schema = {}
+            for table in plan_tables:
+                self._execute_sql(cursor, f"PRAGMA table_info({table})")
+                # {表名: ([列名], 单列主键或None)}
+                info = cursor.fetchall()
+                primary_keys = [col[1] for col in info if col[5]]
+                schema[table] = ([col[1] for col in info], primary_keys[0] if len(primary_keys) == 1 else None)
+
+        # 第一步：校验并暂存（'' 为SQLite私有临时数据库，关闭后自动删除）
+        stage = sqlite3.connect('')
+        stage.execute("CREATE TABLE staged (seq INTEGER PRIMARY KEY, section INTEGER NOT NULL, vals TEXT NOT NULL)")
+        sections = []  # [(表名, 写入的列)]
+        pending = []
+        incremental = False
+        table = None
+        columns = []
+        target_columns = []
+
+        def stage_pending():
+            stage.executemany("INSERT INTO staged (section, vals) VALUES (?, ?)", pending)
+            pending.clear()
+
+        try:
+            for record in records:
+                record_type = record.get('type')
+
+                if record_type == 'header':
+                    incremental = bool(record.get('since'))
+
+                elif record_type == 'table':
+                    table = record['table']
+                    columns = record['columns']
+                    if table not in allowed_tables or table not in plan_tables:
+                        logger.warning(f"跳过不支持或无权导入的备份表: {table}")
+                        table = None
+                        continue
+                    # 只导入当前表结构中存在的列，兼容新旧版本表结构
+                    target_columns = [col for col in columns if col in schema[table][0]]
+                    if user_id is not None and 'user_id' in schema[table][0] and 'user_id' not in target_columns:
+                        target_columns.append('user_id')
+                    sections.append((table, target_columns))
+
+                elif record_type == 'row' and table and record.get('table') == table:
+                    row = dict(zip(columns, record['values']))
+                    if user_id is not None and 'user_id' in schema[table][0]:
+                        row['user_id'] = user_id
+                    if table == 'system_settings' and row.get('key') == 'admin_password_hash':
+                        continue
+                    pending.append((len(sections) - 1, json.dumps([row.get(col) for col in target_columns],
+                                                                  ensure_ascii=False, default=str)))
+                    if len(pending) >= batch_size:
+                        stage_pending()
+            stage_pending()
+
+            # 第二步：一个事务内清空并写入
+            counts = {}
+            skipped = 0
+            with self.lock:
+                cursor = self.conn.cursor()
+                try:
+                    allowed_cookies = set()
+                    if user_id is not None:
+                        self._execute_sql(cursor, "SELECT id FROM cookies WHERE user_id = ?", (user_id,))
+                        allowed_cookies = {row[0] for row in cursor.fetchall()}
+
+                    def owned(table_name: str, key_column: str, key) -> bool:
+                        """key对应的已有行不存在或属于当前用户"""
+                        if key is None:
+                            return True
+                        scope = self._backup_table_scope(schema[table_name][0])
+                        owner_column = 'user_id' if scope == 'user' else 'cookie_id'
+                        self._execute_sql(cursor, f'SELECT "{owner_column}" FROM {table_name} WHERE "{key_column}" = ?',
+                                          (key,))
+                        existing = cursor.fetchone()
+                        if existing is None:
+                            return True
+                        return existing[0] == user_id if scope == 'user' else existing[0] in allowed_cookies
+
+                    def accept(table_name: str, row: dict) -> bool:
+                        if user_id is None:
+                            return True
+                        if 'cookie_id' in row and row['cookie_id'] not in allowed_cookies:
+                            return False
+                        for column, referenced in self.BACKUP_USER_REFERENCES.items():
+                            if column in row:
+                                self._execute_sql(cursor, f"SELECT user_id FROM {referenced} WHERE id = ?",
+                                                  (row[column],))
+                                existing = cursor.fetchone()
+                                if existing is None or existing[0] != user_id:
+                                    return False
+                        key_column = schema[table_name][1]
+                        if key_column and self._backup_table_scope(schema[table_name][0]) != 'global':
+                            if not owned(table_name, key_column, row.get(key_column)):
+                                return False
+                        if table_name == 'cookies':
+                            allowed_cookies.add(row.get('id'))
+                        return True
+
+                    if not incremental:
+                        self._clear_backup_scope(cursor, user_id, include_global)
+
+                    for section, (table_name, section_columns) in enumerate(sections):
+                        placeholders = ','.join(['?' for _ in section_columns])
+                        column_list = ','.join(f'"{col}"' for col in section_columns)
+                        verb = "INSERT OR REPLACE" if incremental or table_name == 'system_settings' else "INSERT"
+                        sql = f"{verb} INTO {table_name} ({column_list}) VALUES ({placeholders})"
+                        last_seq = 0
+                        while True:
+                            staged = stage.execute(
+                                "SELECT seq, vals FROM staged WHERE section = ? AND seq > ? ORDER BY seq LIMIT ?",
+                                (section, last_seq, batch_size)).fetchall()
+                            if not staged:
+                                break
+                            last_seq = staged[-1][0]
+                            batch = []
+                            for _, vals in staged:
+                                values = json.loads(vals)
+                                if accept(table_name, dict(zip(section_columns, values))):
+                                    batch.append(values)
+                                else:
+                                    skipped += 1
+                            if batch:
+                                cursor.executemany(sql, batch)
+                                counts[table_name] = counts.get(table_name, 0) + len(batch)
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+        finally:
+            stage.close()
+
+        if skipped:
+            logger.warning(f"导入备份跳过 {skipped} 行不属于用户 {user_id} 的数据")
+        # 关键词、AI设置和会话记录可能已被覆盖，丢弃会话状态缓存
+        chat_state_store.invalidate_account()
+        chat_state_store.invalidate_chats()
+        logger.info(f"导入备份完成，用户ID: {user_id}, 增量: {incremental}, 行数: {sum(counts.values())}")
+        return counts
+
+    def import_backup(self, backup_data: dict, user_id: int = None, include_global: bool = False) -> bool:
+        """导入系统备份数据（旧版JSON格式，支持用户隔离）"""
+        try:
+            if not isinstance(backup_data, dict) or 'data' not in backup_data:
+                raise ValueError("备份数据格式无效")
+
+            def records():
+                yield {'type': 'header', 'version': backup_data.get('version'), 'since': None}
+                for table_name, table_data in backup_data['data'].items():
+                    yield {'type': 'table', 'table': table_name, 'columns': table_data['columns']}
+                    for values in table_data['rows']:
+                        yield {'type': 'row', 'table': table_name, 'values': values}
+
+            self.import_backup_records(records(), user_id, include_global=include_global)
+            return True
+        except Exception as e:
+            logger.error(f"导入备份失败: {e}")
+            return False
+
+    # 表浏览支持的过滤操作符
+    TABLE_FILTER_OPERATORS = {
+        'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=', 'like': 'LIKE'
+    }
+
+    def _build_table_page_query(self, cursor, table_name: str, columns: list = None, filters: list = None,
+                                sort: str = None, order: str = 'asc', page_cursor: str = None, limit: int = 200):
+        """构建表分页查询语句（列名、排序列和过滤列都按表结构校验，值全部参数化）
+
+        Returns:
+            (sql, params, 返回的列, 实际查询的列)
+        """
+        self._execute_sql(cursor, f"PRAGMA table_info({table_name})")
+        table_columns = [col[1] for col in cursor.fetchall()]
+        if not table_columns:
+            raise ValueError(f"表不存在: {table_name}")
+
+        selected = table_columns
+        if columns:
+            unknown = [col for col in columns if col not in table_columns]
+            if unknown:
+                raise ValueError(f"未知的列: {', '.join(unknown)}")
+            selected = columns
+
+        if sort and sort not in table_columns:
+            raise ValueError(f"未知的排序列: {sort}")
+        descending = (order or 'asc').lower() == 'desc'
+        direction = 'DESC' if descending else 'ASC'
+        comparator = '<' if descending else '>'
+
+        conditions = []
+        params = []
+        for column, op, value in filters or []:
+            if column not in table_columns:
+                raise ValueError(f"未知的过滤列: {column}")
+            if op not in self.TABLE_FILTER_OPERATORS:
+                raise ValueError(f"未知的过滤操作符: {op}")
+            conditions.append(f'"{column}" {self.TABLE_FILTER_OPERATORS[op]} ?')
+            params.append(f"%{value}%" if op == 'like' else value)
+
+        # 键集分页：按rowid（或 排序列+rowid）定位上一页最后一行
+        if page_cursor:
+            cursor_data = json.loads(page_cursor)
+            if sort:
+                # SQLite 中 NULL 最小：升序排在最前，降序排在最后
+                if cursor_data['v'] is None and descending:
+                    conditions.append(f'("{sort}" IS NULL AND rowid < ?)')
+                    params.append(cursor_data['r'])
+                elif cursor_data['v'] is None:
+                    conditions.append(f'(("{sort}" IS NULL AND rowid > ?) OR "{sort}" IS NOT NULL)')
+                    params.append(cursor_data['r'])
+                else:
+                    tail = f' OR "{sort}" IS NULL' if descending else ''
+                    conditions.append(f'("{sort}" {comparator} ? OR ("{sort}" = ? AND rowid {comparator} ?){tail})')
+                    params.extend([cursor_data['v'], cursor_data['v'], cursor_data['r']])
+            else:
+                conditions.append(f"rowid {comparator} ?")
+                params.append(cursor_data['r'])
+
+        # 排序列不在投影中时也需要查询出来，用于生成下一页游标
+        fetch_columns = selected + [sort] if sort and sort not in selected else selected
+        select_list = ', '.join(f'"{col}"' for col in fetch_columns)
+        sql = f"SELECT rowid, {select_list} FROM {table_name}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if sort:
+            sql += f' ORDER BY "{sort}" {direction}, rowid {direction}'
+        else:
+            sql += f" ORDER BY rowid {direction}"
+        sql += " LIMIT ?"
+        params.append(limit)
+
+        return sql, params, selected, fetch_columns
+
+    def get_table_page(self, table_name: str, limit: int = 200, cursor: str = None, columns: list = None,
+                       filters: list = None, sort: str = None, order: str = 'asc') -> tuple:
+        """分页获取表数据（管理员专用），只在取一页数据期间持有锁
+
+        Args:
+            table_name: 表名（调用方需校验白名单）
+            limit: 每页行数
+            cursor: 上一页返回的游标，为空表示第一页
+            columns: 需要返回的列，为空返回所有列
+            filters: 过滤条件列表 [(列名, 操作符, 值)]，操作符见 TABLE_FILTER_OPERATORS
+            sort: 排序列，为空按rowid排序
+            order: 'asc' 或 'desc'
+
+        Returns:
+            (数据列表, 列名列表, 下一页游标)，没有更多数据时游标为None
+        """
+        self.flush_writes(table_name)
+        with self.lock:
+            if not self.conn:
+                self.init_db()
+            db_cursor = self.conn.cursor()
+
+            # 多取一条用于判断是否还有下一页
+            sql, params, selected, fetch_columns = self._build_table_page_query(
+                db_cursor, table_name, columns, filters, sort, order, cursor, limit + 1)
+            self._execute_sql(db_cursor, sql, params)
+            rows = db_cursor.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        data = [dict(zip(selected, row[1:])) for row in rows]
+
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            cursor_data = {'r': last[0]}
+            if sort:
+                cursor_data['v'] = last[1 + fetch_columns.index(sort)]
+            next_cursor = json.dumps(cursor_data, ensure_ascii=False)
+
+        return data, selected, next_cursor
+
+    def iter_table_rows(self, table_name: str, columns: list = None, filters: list = None,
+                        sort: str = None, order: str = 'asc', batch_size: int = 500):
+        """逐批迭代表数据（用于流式导出），每批之间释放锁，不会一次性加载整张表"""
+        page_cursor = None
+        while True:
+            data, _, page_cursor = self.get_table_page(
+                table_name, limit=batch_size, cursor=page_cursor, columns=columns,
+                filters=filters, sort=sort, order=order)
+            for row in data:
+                yield row
+            if not page_cursor:
+                break
+
+    def get_keywords(self, cookie_id: str):
+        """获取关键词列表"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                
+                # 从keywords表获取关键词数据
+                cursor.execute('''
+                    SELECT keyword 
+                    FROM keywords 
                     WHERE cookie_id = ?
                     ORDER BY keyword
                 ''', (cookie_id,))
                 
                 results = cursor.fetchall()
-                return results if results else []
+                return [row[0] for row in results] if results else []
                 
             except sqlite3.Error as e:
                 logger.error(f"获取关键词失败: {e}")
                 return []
 
+    def get_keywords_with_item_id(self, cookie_id: str):
+        """获取包含商品ID的关键词列表"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                
+                # 从keywords表获取关键词数据
+                cursor.execute('''
+                    SELECT keyword, reply, item_id 
+                    FROM keywords 
+                    WHERE cookie_id = ?
+                    ORDER BY keyword
+                ''', (cookie_id,))
+                
+                results = cursor.fetchall()
+                return results if results else []
+
+            except sqlite3.Error as e:
+                logger.error(f"获取关键词失败: {e}")
+                return []
+
+    def get_keywords_with_type(self, cookie_id: str):
+        """获取指定Cookie的关键字列表（包含类型信息）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor,
+                    "SELECT keyword, reply, item_id, type, image_url FROM keywords WHERE cookie_id = ?",
+                    (cookie_id,))
+
+                return [{
+                    'keyword': row[0],
+                    'reply': row[1],
+                    'item_id': row[2],
+                    'type': row[3] or 'text',  # 默认为text类型
+                    'image_url': row[4]
+                } for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"获取关键字失败: {e}")
+                return []
+
+    def replace_text_keywords(self, cookie_id: str, keywords, dry_run: bool = False):
+        """批量替换文本关键词（保留图片关键词）
+
+        以 (关键词, 商品ID) 为键，与库中现有文本关键词做集合比较，
+        只删除/写入有变化的行，并在同一事务中用 executemany 完成。
+
+        Args:
+            cookie_id: 账号ID
+            keywords: [(keyword, reply, item_id), ...]，后出现的同键数据覆盖先出现的
+            dry_run: 只计算差异，不写库
+
+        Returns:
+            dict: {'total', 'added', 'updated', 'unchanged', 'removed'}
+
+        Raises:
+            ValueError: 与同名图片关键词冲突，或正则/模糊关键词格式错误
+        """
+        incoming = {}
+        for keyword, reply, item_id in keywords:
+            validate_keyword(keyword)
+            incoming[(keyword, (item_id or '').strip())] = reply or ''
+
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor,
+                    "SELECT keyword, COALESCE(item_id, ''), reply, type FROM keywords WHERE cookie_id = ?",
+                    (cookie_id,))
+
+                existing = {}
+                image_keys = set()
+                for keyword, item_id, reply, kw_type in cursor.fetchall():
+                    if kw_type == 'image':
+                        image_keys.add((keyword, item_id))
+                    else:
+                        existing[(keyword, item_id)] = reply or ''
+
+                conflicts = image_keys & incoming.keys()
+                if conflicts:
+                    keyword, item_id = sorted(conflicts)[0]
+                    item_desc = f"商品ID: {item_id}" if item_id else "通用关键词"
+                    logger.warning(f"文本关键词与图片关键词冲突: Cookie={cookie_id}, 关键词='{keyword}', {item_desc}")
+                    raise ValueError(f"关键词 '{keyword}' （{item_desc}） 已存在（图片关键词），无法保存为文本关键词")
+
+                common = incoming.keys() & existing.keys()
+                added = incoming.keys() - existing.keys()
+                removed = existing.keys() - incoming.keys()
+                updated = {key for key in common if incoming[key] != existing[key]}
+
+                stats = {
+                    'total': len(incoming),
+                    'added': len(added),
+                    'updated': len(updated),
+                    'unchanged': len(common) - len(updated),
+                    'removed': len(removed)
+                }
+                if dry_run:
+                    return stats
+
+                delete_keys = removed | updated
+                if delete_keys:
+                    cursor.executemany(
+                        "DELETE FROM keywords WHERE cookie_id = ? AND keyword = ? AND COALESCE(item_id, '') = ? "
+                        "AND (type IS NULL OR type = 'text')",
+                        [(cookie_id, keyword, item_id) for keyword, item_id in delete_keys])
+
+                insert_keys = added | updated
+                if insert_keys:
+                    cursor.executemany(
+                        "INSERT INTO keywords (cookie_id, keyword, reply, item_id, type) VALUES (?, ?, ?, ?, 'text')",
+                        [(cookie_id, keyword, incoming[(keyword, item_id)], item_id or None)
+                         for keyword, item_id in insert_keys])
+
+                self.conn.commit()
+                chat_state_store.invalidate_account(cookie_id, 'keywords')
+                logger.info(f"文本关键字批量保存成功: {cookie_id}, {stats}")
+                return stats
+            except ValueError:
+                raise
+            except Exception as e:
+                logger.error(f"文本关键字批量保存失败: {e}")
+                self.conn.rollback()
+                raise
+
+    def save_text_keywords_only(self, cookie_id: str, keywords) -> bool:
+        """保存文本关键字列表，只替换文本类型的关键词，保留图片关键词"""
+        try:
+            self.replace_text_keywords(cookie_id, keywords)
+            return True
+        except ValueError:
+            # 重新抛出友好的错误信息
+            raise
+        except Exception:
+            return False
+
     def get_orders_by_cookie(self, cookie_id: str, limit: int = 100):
         """根据Cookie ID获取订单列表"""
         with self.lock:
@@ -1780,5 +3107,300 @@ class DatabaseManager:
                 logger.error(f"获取订单失败: {e}")
                 return []
 
+    def get_orders_by_user(self, user_id: int, limit: int = 1000, cursor: str = None,
+                           cookie_id: str = None) -> tuple:
+        """获取用户所有账号的订单（JOIN cookies表，按创建时间倒序的键集分页）
+
+        Args:
+            user_id: 用户ID
+            limit: 每页数量
+            cursor: 上一页返回的游标（"created_at|id"，created_at 为空时是 "|id"），为空表示第一页
+            cookie_id: 可选，只查询指定账号的订单
+
+        Returns:
+            (订单列表, 下一页游标)，没有更多数据时游标为None
+
+        Raises:
+            ValueError: 游标格式错误
+        """
+        cursor_created_at = cursor_id = None
+        if cursor:
+            cursor_created_at, separator, cursor_id_text = cursor.rpartition('|')
+            if not separator or not cursor_id_text.isdigit():
+                raise ValueError(f"无效的分页游标: {cursor}")
+            cursor_id = int(cursor_id_text)
+
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                db_cursor = self.conn.cursor()
+
+                conditions = ["c.user_id = ?"]
+                params = [user_id]
+
+                if cookie_id:
+                    conditions.append("o.cookie_id = ?")
+                    params.append(cookie_id)
+
+                if cursor_id is not None:
+                    # SQLite 中 NULL 最小，倒序时 created_at 为空的订单排在最后
+                    if cursor_created_at:
+                        conditions.append("(o.created_at < ? OR (o.created_at = ? AND o.id < ?) OR o.created_at IS NULL)")
+                        params.extend([cursor_created_at, cursor_created_at, cursor_id])
+                    else:
+                        conditions.append("(o.created_at IS NULL AND o.id < ?)")
+                        params.append(cursor_id)
+
+                # 多取一条用于判断是否还有下一页
+                params.append(limit + 1)
+
+                self._execute_sql(db_cursor, f'''
+                    SELECT o.id, o.order_id, o.cookie_id, o.buyer_id, o.item_id, o.item_title, o.price,
+                           o.quantity, o.status, o.auto_confirm, o.created_at, o.updated_at
+                    FROM orders o
+                    JOIN cookies c ON c.id = o.cookie_id
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY o.created_at DESC, o.id DESC
+                    LIMIT ?
+                ''', params)
+
+                rows = db_cursor.fetchall()
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+
+                orders = []
+                for row in rows:
+                    orders.append({
+                        "order_id": row[1],
+                        "cookie_id": row[2],
+                        "buyer_id": row[3],
+                        "item_id": row[4],
+                        "item_title": row[5],
+                        "price": row[6],
+                        "quantity": row[7],
+                        "status": row[8],
+                        "auto_confirm": bool(row[9]),
+                        "created_at": row[10],
+                        "updated_at": row[11]
+                    })
+
+                next_cursor = f"{rows[-1][10] or ''}|{rows[-1][0]}" if has_more and rows else None
+                return orders, next_cursor
+
+            except sqlite3.Error as e:
+                logger.error(f"获取用户订单失败: {e}")
+                return [], None
+
+    def count_orders_by_user(self, user_id: int, cookie_id: str = None) -> int:
+        """统计用户所有账号（或指定账号）的订单数"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                db_cursor = self.conn.cursor()
+
+                conditions = ["c.user_id = ?"]
+                params = [user_id]
+                if cookie_id:
+                    conditions.append("o.cookie_id = ?")
+                    params.append(cookie_id)
+
+                self._execute_sql(db_cursor, f'''
+                    SELECT COUNT(*) FROM orders o
+                    JOIN cookies c ON c.id = o.cookie_id
+                    WHERE {' AND '.join(conditions)}
+                ''', params)
+                return db_cursor.fetchone()[0]
+
+            except sqlite3.Error as e:
+                logger.error(f"统计用户订单失败: {e}")
+                return 0
+
+    def get_order_cookie_ids(self, user_id: int) -> list:
+        """获取用户有订单的账号ID（订单页账号筛选下拉框使用，不加载订单数据）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                db_cursor = self.conn.cursor()
+                self._execute_sql(db_cursor, '''
+                    SELECT DISTINCT o.cookie_id FROM orders o
+                    JOIN cookies c ON c.id = o.cookie_id
+                    WHERE c.user_id = ?
+                    ORDER BY o.cookie_id
+                ''', (user_id,))
+                return [row[0] for row in db_cursor.fetchall()]
+
+            except sqlite3.Error as e:
+                logger.error(f"获取用户订单账号失败: {e}")
+                return []
+
+    def get_recent_item_details(self, limit: int = 2000):
+        """获取最近更新的商品详情，用于预热商品详情缓存
+
+        Returns:
+            list: [(item_id, item_detail, updated_at时间戳), ...]，按更新时间从新到旧；
+                  旧版item_info表没有item_detail列时返回空列表
+        """
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, "PRAGMA table_info(item_info)")
+                if 'item_detail' not in [col[1] for col in cursor.fetchall()]:
+                    return []
+
+                self._execute_sql(cursor, '''
+                    SELECT item_id, item_detail, CAST(strftime('%s', MAX(updated_at)) AS REAL) AS updated_ts
+                    FROM item_info
+                    WHERE item_detail IS NOT NULL AND TRIM(item_detail) != ''
+                    GROUP BY item_id
+                    ORDER BY updated_ts DESC
+                    LIMIT ?
+                ''', (limit,))
+                return cursor.fetchall()
+
+            except sqlite3.Error as e:
+                logger.error(f"获取商品详情失败: {e}")
+                return []
+
+    # ==================== 图片存储方法 ====================
+
+    IMAGE_STORE_COLUMNS = ('sha256', 'path', 'thumb_path', 'format', 'width', 'height', 'size', 'ref_count')
+
+    def _image_row_to_dict(self, row) -> dict:
+        return dict(zip(self.IMAGE_STORE_COLUMNS, row)) if row else None
+
+    def acquire_image(self, sha256: str):
+        """相同内容的图片已存在时引用计数+1并返回图片记录，不存在返回None"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    UPDATE image_store SET ref_count = ref_count + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE sha256 = ?
+                ''', (sha256,))
+                if cursor.rowcount == 0:
+                    return None
+
+                self._execute_sql(cursor, f"SELECT {', '.join(self.IMAGE_STORE_COLUMNS)} FROM image_store WHERE sha256 = ?",
+                                  (sha256,))
+                row = cursor.fetchone()
+                self.conn.commit()
+                return self._image_row_to_dict(row)
+            except Exception as e:
+                logger.error(f"增加图片引用失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return None
+
+    def add_image(self, sha256: str, path: str, thumb_path: str = '', image_format: str = '',
+                  width: int = 0, height: int = 0, size: int = 0) -> bool:
+        """登记新保存的图片，引用计数为1"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    INSERT INTO image_store (sha256, path, thumb_path, format, width, height, size, ref_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+                ''', (sha256, path, thumb_path, image_format, width, height, size))
+                self.conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"登记图片失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return False
+
+    def release_image(self, path: str):
+        """图片引用计数-1，计数归零时删除记录
+
+        Returns:
+            dict: 释放后的图片记录（ref_count为剩余引用数）；图片不在图片库中返回None
+        """
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, f"SELECT {', '.join(self.IMAGE_STORE_COLUMNS)} FROM image_store WHERE path = ?",
+                                  (path,))
+                record = self._image_row_to_dict(cursor.fetchone())
+                if record is None:
+                    return None
+
+                record['ref_count'] = max(0, record['ref_count'] - 1)
+                if record['ref_count'] == 0:
+                    self._execute_sql(cursor, "DELETE FROM image_store WHERE sha256 = ?", (record['sha256'],))
+                else:
+                    self._execute_sql(cursor, '''
+                        UPDATE image_store SET ref_count = ?, updated_at = CURRENT_TIMESTAMP WHERE sha256 = ?
+                    ''', (record['ref_count'], record['sha256']))
+                self.conn.commit()
+                return record
+            except Exception as e:
+                logger.error(f"释放图片引用失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return None
+
+    def get_image_by_path(self, path: str):
+        """根据存储路径获取图片记录（尺寸、缩略图、引用计数）"""
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, f"SELECT {', '.join(self.IMAGE_STORE_COLUMNS)} FROM image_store WHERE path = ?",
+                                  (path,))
+                return self._image_row_to_dict(cursor.fetchone())
+            except Exception as e:
+                logger.error(f"获取图片记录失败: {e}")
+                return None
+
+    def sync_image_ref_counts(self) -> int:
+        """按关键词、卡券中实际引用的图片重新计算引用计数，修正历史遗留的计数偏差
+
+        Returns:
+            int: 计数被修正的图片数量
+        """
+        with self.lock:
+            try:
+                if not self.conn:
+                    self.init_db()
+                cursor = self.conn.cursor()
+
+                self._execute_sql(cursor, '''
+                    UPDATE image_store SET ref_count = (
+                        SELECT COUNT(*) FROM keywords WHERE LTRIM(keywords.image_url, '/') = image_store.path
+                    ) + (
+                        SELECT COUNT(*) FROM cards WHERE LTRIM(cards.image_url, '/') = image_store.path
+                    )
+                    WHERE ref_count != (
+                        SELECT COUNT(*) FROM keywords WHERE LTRIM(keywords.image_url, '/') = image_store.path
+                    ) + (
+                        SELECT COUNT(*) FROM cards WHERE LTRIM(cards.image_url, '/') = image_store.path
+                    )
+                ''')
+                updated = cursor.rowcount
+                self.conn.commit()
+                return updated
+            except Exception as e:
+                logger.error(f"同步图片引用计数失败: {e}")
+                if self.conn:
+                    self.conn.rollback()
+                return 0
+
 # 创建全局数据库管理器实例
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = DatabaseManager()
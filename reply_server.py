@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -13,10 +13,8 @@ import time
 import json
 import os
 import uvicorn
-import pandas as pd
 import io
 import asyncio
-from collections import defaultdict
 
 import cookie_manager
 from db_manager import db_manager
@@ -25,6 +23,15 @@ from ai_reply_engine import ai_reply_engine
 from utils.qr_login import qr_login_manager
 from utils.xianyu_utils import trans_cookies
 from utils.image_utils import image_manager
+from utils.session_store import session_store
+from utils.system_stats import system_stats
+from utils.access_log import AccessLogMiddleware, create_access_logger
+from utils.admission import AdmissionMiddleware, admission_controller, db_executor
+from utils.keyword_io import (
+    parse_keyword_file, build_keyword_export,
+    IMPORT_EXTENSIONS as KEYWORD_IMPORT_EXTENSIONS, EXPORT_FORMATS as KEYWORD_EXPORT_FORMATS
+)
+from utils.keyword_matcher import validate_keyword
 
 from loguru import logger
 
@@ -34,36 +41,21 @@ KEYWORDS_FILE = Path(__file__).parent / "回复关键字.txt"
 # 简单的用户认证配置
 ADMIN_USERNAME = "admin"
 DEFAULT_ADMIN_PASSWORD = "admin123"  # 系统初始化时的默认密码
-SESSION_TOKENS = {}  # 存储会话token: {token: {'user_id': int, 'username': str, 'timestamp': float}}
 TOKEN_EXPIRE_TIME = 24 * 60 * 60  # token过期时间：24小时
 
+# 会话存储命名空间（会话数据保存在共享存储中，支持多worker和重启后保持登录）
+SESSION_NS_TOKEN = 'token'  # 会话token: {'user_id': int, 'username': str, 'timestamp': float}
+SESSION_NS_QR_PROCESSED = 'qr_processed'  # 已处理的扫码session: {'processed': bool, 'timestamp': float}
+SESSION_NS_QR_LOCK = 'qr_lock'  # 扫码检查锁 - 防止并发处理同一个session（跨进程）
+QR_PROCESSED_EXPIRE_TIME = 3600  # 扫码处理记录保留1小时
+QR_LOCK_EXPIRE_TIME = 300  # 扫码检查锁最长持有5分钟，防止进程异常退出后死锁
+
 # HTTP Bearer认证
 security = HTTPBearer(auto_error=False)
 
-# 扫码登录检查锁 - 防止并发处理同一个session
-qr_check_locks = defaultdict(lambda: asyncio.Lock())
-qr_check_processed = {}  # 记录已处理的session: {session_id: {'processed': bool, 'timestamp': float}}
-
 # 不再需要单独的密码初始化，由数据库初始化时处理
 
 
-def cleanup_qr_check_records():
-    """清理过期的扫码检查记录"""
-    current_time = time.time()
-    expired_sessions = []
-
-    for session_id, record in qr_check_processed.items():
-        # 清理超过1小时的记录
-        if current_time - record['timestamp'] > 3600:
-            expired_sessions.append(session_id)
-
-    for session_id in expired_sessions:
-        if session_id in qr_check_processed:
-            del qr_check_processed[session_id]
-        if session_id in qr_check_locks:
-            del qr_check_locks[session_id]
-
-
 def load_keywords() -> List[Tuple[str, str]]:
     """读取关键字→回复映射表
 
@@ -168,28 +160,29 @@ def generate_token() -> str:
     return secrets.token_urlsafe(32)
 
 
-def verify_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[Dict[str, Any]]:
-    """验证token并返回用户信息"""
-    if not credentials:
-        return None
-
-    token = credentials.credentials
-    if token not in SESSION_TOKENS:
-        return None
+def create_session(user: Dict[str, Any]) -> str:
+    """为用户创建会话token并写入会话存储"""
+    token = generate_token()
+    session_store.set(SESSION_NS_TOKEN, token, {
+        'user_id': user['id'],
+        'username': user['username'],
+        'timestamp': time.time()
+    }, TOKEN_EXPIRE_TIME)
+    return token
 
-    token_data = SESSION_TOKENS[token]
 
-    # 检查token是否过期
-    if time.time() - token_data['timestamp'] > TOKEN_EXPIRE_TIME:
-        del SESSION_TOKENS[token]
+async def verify_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[Dict[str, Any]]:
+    """验证token并返回用户信息（会话查询在数据库线程池中执行）"""
+    if not credentials:
         return None
 
-    return token_data
+    # 会话存储只返回未过期的token
+    return await db_executor.run(session_store.get, SESSION_NS_TOKEN, credentials.credentials)
 
 
-def verify_admin_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Dict[str, Any]:
+async def verify_admin_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Dict[str, Any]:
     """验证管理员token"""
-    user_info = verify_token(credentials)
+    user_info = await verify_token(credentials)
     if not user_info:
         raise HTTPException(status_code=401, detail="未授权访问")
 
@@ -200,19 +193,19 @@ def verify_admin_token(credentials: Optional[HTTPAuthorizationCredentials] = Dep
     return user_info
 
 
-def require_auth(user_info: Optional[Dict[str, Any]] = Depends(verify_token)):
+async def require_auth(user_info: Optional[Dict[str, Any]] = Depends(verify_token)):
     """需要认证的依赖，返回用户信息"""
     if not user_info:
         raise HTTPException(status_code=401, detail="未授权访问")
     return user_info
 
 
-def get_current_user(user_info: Dict[str, Any] = Depends(require_auth)) -> Dict[str, Any]:
+async def get_current_user(user_info: Dict[str, Any] = Depends(require_auth)) -> Dict[str, Any]:
     """获取当前登录用户信息"""
     return user_info
 
 
-def get_current_user_optional(user_info: Optional[Dict[str, Any]] = Depends(verify_token)) -> Optional[Dict[str, Any]]:
+async def get_current_user_optional(user_info: Optional[Dict[str, Any]] = Depends(verify_token)) -> Optional[Dict[str, Any]]:
     """获取当前用户信息（可选，不强制要求登录）"""
     return user_info
 
@@ -224,7 +217,7 @@ def get_user_log_prefix(user_info: Dict[str, Any] = None) -> str:
     return "【系统】"
 
 
-def require_admin(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+async def require_admin(current_user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
     """要求管理员权限"""
     if current_user['username'] != 'admin':
         raise HTTPException(status_code=403, detail="需要管理员权限")
@@ -317,34 +310,33 @@ setup_file_logging()
 from loguru import logger
 logger.info("Web服务器启动，文件日志收集器已初始化")
 
-# 添加请求日志中间件
-@app.middleware("http")
-async def log_requests(request, call_next):
-    start_time = time.time()
-
-    # 获取用户信息
-    user_info = "未登录"
-    try:
-        # 从请求头中获取Authorization
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            if token in SESSION_TOKENS:
-                token_data = SESSION_TOKENS[token]
-                # 检查token是否过期
-                if time.time() - token_data['timestamp'] <= TOKEN_EXPIRE_TIME:
-                    user_info = f"【{token_data['username']}#{token_data['user_id']}】"
-    except Exception:
-        pass
+# 添加准入控制中间件（按路由类别限制并发，排队已满或超时返回503；在访问日志之内，503也会被记录）
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# 添加访问日志中间件（按路由采样，后台线程写日志）
+# 访问日志线程解析过的token: {token: (用户, 过期时间)}，避免每条日志都查询会话存储
+_access_log_users: Dict[str, Tuple[Optional[str], float]] = {}
+ACCESS_LOG_USER_CACHE_TTL = 60
+ACCESS_LOG_USER_CACHE_SIZE = 1024
+
 
-    logger.info(f"🌐 {user_info} API请求: {request.method} {request.url.path}")
+def _access_log_user(token: str) -> Optional[str]:
+    """在访问日志线程中按token解析用户，结果缓存 ACCESS_LOG_USER_CACHE_TTL 秒"""
+    now = time.time()
+    cached = _access_log_users.get(token)
+    if cached and cached[1] > now:
+        return cached[0]
 
-    response = await call_next(request)
+    token_data = session_store.get(SESSION_NS_TOKEN, token)
+    user = f"{token_data['username']}#{token_data['user_id']}" if token_data else None
+    if len(_access_log_users) >= ACCESS_LOG_USER_CACHE_SIZE:
+        _access_log_users.clear()
+    _access_log_users[token] = (user, now + ACCESS_LOG_USER_CACHE_TTL)
+    return user
 
-    process_time = time.time() - start_time
-    logger.info(f"✅ {user_info} API响应: {request.method} {request.url.path} - {response.status_code} ({process_time:.3f}s)")
 
-    return response
+access_logger = create_access_logger(resolve_user=_access_log_user)
+app.add_middleware(AccessLogMiddleware, access_logger=access_logger)
 
 # 提供前端静态文件
 import os
@@ -361,51 +353,107 @@ if not os.path.exists(uploads_dir):
     logger.info(f"创建图片上传目录: {uploads_dir}")
 
 # 健康检查端点
-@app.get('/health')
-async def health_check():
-    """健康检查端点，用于Docker健康检查和负载均衡器"""
+# {探测名: 进行中的探测}，同一探测同时只有一个在执行
+_readiness_probes: Dict[str, asyncio.Future] = {}
+
+
+async def _run_probe(name: str, factory, timeout: float):
+    """执行就绪探测，上一次探测超时后仍未结束时等待同一个探测，不再新开线程（数据库锁被占用时线程不会堆积）"""
+    probe = _readiness_probes.get(name)
+    if probe is None or probe.done():
+        probe = asyncio.ensure_future(factory())
+        # 超时的等待者已离开，探测最终失败时由这里取走异常
+        probe.add_done_callback(lambda f: f.cancelled() or f.exception())
+        _readiness_probes[name] = probe
+    return await asyncio.wait_for(asyncio.shield(probe), timeout=timeout)
+
+
+async def _probe_manager_loop(loop: asyncio.AbstractEventLoop) -> float:
+    """在账号事件循环上调度一个空协程，返回调度延迟（毫秒）"""
+    started = time.perf_counter()
+    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop))
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+async def _check_readiness() -> dict:
+    """就绪检查：数据库 SELECT 1 和账号事件循环响应，均有超时，不阻塞 Web 事件循环"""
+    from config import config
+    timeout = (config.get('HEALTH', {}) or {}).get('ready_timeout', 1)
+
+    # 检查数据库连接（在线程中执行，数据库锁被长时间占用时按超时判定失败）
     try:
-        # 检查Cookie管理器状态
-        manager_status = "ok" if cookie_manager.manager is not None else "error"
+        db_ok = await _run_probe('database', lambda: asyncio.to_thread(db_manager.ping), timeout)
+        db_status = "ok" if db_ok else "error"
+    except asyncio.TimeoutError:
+        db_status = "timeout"
+    except Exception:
+        db_status = "error"
 
-        # 检查数据库连接
-        from db_manager import db_manager
+    # 检查Cookie管理器的事件循环能否及时调度
+    manager = cookie_manager.manager
+    loop_lag_ms = None
+    if manager is None or not manager.loop.is_running():
+        manager_status = "error"
+    else:
         try:
-            db_manager.get_all_cookies()
-            db_status = "ok"
+            loop_lag_ms = await _run_probe('cookie_manager', lambda: _probe_manager_loop(manager.loop), timeout)
+            manager_status = "ok"
+        except asyncio.TimeoutError:
+            manager_status = "timeout"
         except Exception:
-            db_status = "error"
-
-        # 获取系统状态
-        import psutil
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory_info = psutil.virtual_memory()
-
-        status = {
-            "status": "healthy" if manager_status == "ok" and db_status == "ok" else "unhealthy",
-            "timestamp": time.time(),
-            "services": {
-                "cookie_manager": manager_status,
-                "database": db_status
-            },
-            "system": {
-                "cpu_percent": cpu_percent,
-                "memory_percent": memory_info.percent,
-                "memory_available": memory_info.available
-            }
-        }
+            manager_status = "error"
 
-        if status["status"] == "unhealthy":
-            raise HTTPException(status_code=503, detail=status)
+    return {
+        "status": "healthy" if manager_status == "ok" and db_status == "ok" else "unhealthy",
+        "timestamp": time.time(),
+        "services": {
+            "cookie_manager": manager_status,
+            "database": db_status
+        },
+        "loop_lag_ms": loop_lag_ms
+    }
 
-        return status
 
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "timestamp": time.time(),
-            "error": str(e)
-        }
+@app.on_event('startup')
+async def start_system_stats():
+    system_stats.start()
+
+
+@app.get('/health/live')
+async def liveness_check():
+    """存活检查：只要 Web 服务能响应即返回 ok，不访问数据库和其他服务"""
+    return {"status": "ok", "timestamp": time.time()}
+
+
+@app.get('/ready')
+@app.get('/health/ready')
+async def readiness_check():
+    """就绪检查：数据库和Cookie管理器均可用时返回200，否则返回503"""
+    status = await _check_readiness()
+    return JSONResponse(status, status_code=200 if status["status"] == "healthy" else 503)
+
+
+@app.get('/health')
+async def health_check():
+    """健康检查端点，用于Docker健康检查（存活检查 + 后台采样的系统状态）
+
+    不访问数据库：数据库锁被长时间占用（如批量导入）时容器不会被判定为不健康而重启，
+    依赖数据库的就绪状态见 /ready
+    """
+    return {"status": "healthy", "timestamp": time.time(), "system": system_stats.snapshot()}
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus 指标端点；配置了 METRICS.token（或环境变量 METRICS_TOKEN）时需携带 Bearer token"""
+    from config import config
+    from utils.metrics import registry
+
+    token = os.getenv('METRICS_TOKEN') or (config.get('METRICS', {}) or {}).get('token', '')
+    if token and request.headers.get('authorization', '') != f'Bearer {token}':
+        raise HTTPException(status_code=401, detail="未授权访问")
+
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # 重定向根路径到登录页面
@@ -493,8 +541,8 @@ async def admin_page():
 
 
 # 登录接口
-@app.post('/login')
-async def login(request: LoginRequest):
+def _login(request: LoginRequest) -> LoginResponse:
+    """校验登录信息并创建会话（在数据库线程池中执行）"""
     from db_manager import db_manager
 
     # 判断登录方式
@@ -507,12 +555,7 @@ async def login(request: LoginRequest):
             user = db_manager.get_user_by_username(request.username)
             if user:
                 # 生成token
-                token = generate_token()
-                SESSION_TOKENS[token] = {
-                    'user_id': user['id'],
-                    'username': user['username'],
-                    'timestamp': time.time()
-                }
+                token = create_session(user)
 
                 # 区分管理员和普通用户的日志
                 if user['username'] == ADMIN_USERNAME:
@@ -542,12 +585,7 @@ async def login(request: LoginRequest):
         user = db_manager.get_user_by_email(request.email)
         if user and db_manager.verify_user_password(user['username'], request.password):
             # 生成token
-            token = generate_token()
-            SESSION_TOKENS[token] = {
-                'user_id': user['id'],
-                'username': user['username'],
-                'timestamp': time.time()
-            }
+            token = create_session(user)
 
             logger.info(f"【{user['username']}#{user['id']}】邮箱登录成功")
 
@@ -588,12 +626,7 @@ async def login(request: LoginRequest):
             )
 
         # 生成token
-        token = generate_token()
-        SESSION_TOKENS[token] = {
-            'user_id': user['id'],
-            'username': user['username'],
-            'timestamp': time.time()
-        }
+        token = create_session(user)
 
         logger.info(f"【{user['username']}#{user['id']}】验证码登录成功")
 
@@ -613,6 +646,11 @@ async def login(request: LoginRequest):
         )
 
 
+@app.post('/login')
+async def login(request: LoginRequest):
+    return await db_executor.run(_login, request)
+
+
 # 验证token接口
 @app.get('/verify')
 async def verify(user_info: Optional[Dict[str, Any]] = Depends(verify_token)):
@@ -629,14 +667,14 @@ async def verify(user_info: Optional[Dict[str, Any]] = Depends(verify_token)):
 # 登出接口
 @app.post('/logout')
 async def logout(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
-    if credentials and credentials.credentials in SESSION_TOKENS:
-        del SESSION_TOKENS[credentials.credentials]
+    if credentials:
+        await db_executor.run(session_store.delete, SESSION_NS_TOKEN, credentials.credentials)
     return {"message": "已登出"}
 
 
 # 修改管理员密码接口
-@app.post('/change-admin-password')
-async def change_admin_password(request: ChangePasswordRequest, admin_user: Dict[str, Any] = Depends(verify_admin_token)):
+def _change_admin_password(request: ChangePasswordRequest, admin_user: Dict[str, Any]):
+    """校验当前密码并修改管理员密码（在数据库线程池中执行）"""
     from db_manager import db_manager
 
     try:
@@ -658,9 +696,14 @@ async def change_admin_password(request: ChangePasswordRequest, admin_user: Dict
         return {"success": False, "message": "系统错误"}
 
 
+@app.post('/change-admin-password')
+async def change_admin_password(request: ChangePasswordRequest, admin_user: Dict[str, Any] = Depends(verify_admin_token)):
+    return await db_executor.run(_change_admin_password, request, admin_user)
+
+
 # 生成图形验证码接口
-@app.post('/generate-captcha')
-async def generate_captcha(request: CaptchaRequest):
+def _generate_captcha(request: CaptchaRequest) -> CaptchaResponse:
+    """生成并保存图形验证码（在数据库线程池中执行）"""
     from db_manager import db_manager
 
     try:
@@ -701,9 +744,14 @@ async def generate_captcha(request: CaptchaRequest):
         )
 
 
+@app.post('/generate-captcha')
+async def generate_captcha(request: CaptchaRequest):
+    return await db_executor.run(_generate_captcha, request)
+
+
 # 验证图形验证码接口
-@app.post('/verify-captcha')
-async def verify_captcha(request: VerifyCaptchaRequest):
+def _verify_captcha(request: VerifyCaptchaRequest) -> VerifyCaptchaResponse:
+    """校验图形验证码（在数据库线程池中执行）"""
     from db_manager import db_manager
 
     try:
@@ -726,30 +774,23 @@ async def verify_captcha(request: VerifyCaptchaRequest):
         )
 
 
+@app.post('/verify-captcha')
+async def verify_captcha(request: VerifyCaptchaRequest):
+    return await db_executor.run(_verify_captcha, request)
+
+
 # 发送验证码接口（需要先验证图形验证码）
 @app.post('/send-verification-code')
 async def send_verification_code(request: SendCodeRequest):
     from db_manager import db_manager
 
     try:
-        # 检查是否已验证图形验证码
-        # 通过检查数据库中是否存在已验证的图形验证码记录
-        with db_manager.lock:
-            cursor = db_manager.conn.cursor()
-            current_time = time.time()
-
-            # 查找最近5分钟内该session_id的验证记录
-            # 由于验证成功后验证码会被删除，我们需要另一种方式来跟踪验证状态
-            # 这里我们检查该session_id是否在最近验证过（通过检查是否有已删除的记录）
+        # 图形验证码由前端在验证成功后立即发送邮件验证码保证，这里不再重复检查
 
-            # 为了简化，我们要求前端在验证图形验证码成功后立即发送邮件验证码
-            # 或者我们可以在验证成功后设置一个临时标记
-            pass
-
-        # 根据验证码类型进行不同的检查
+        # 根据验证码类型进行不同的检查（数据库调用在数据库线程池中执行）
         if request.type == 'register':
             # 注册验证码：检查邮箱是否已注册
-            existing_user = db_manager.get_user_by_email(request.email)
+            existing_user = await db_executor.run(db_manager.get_user_by_email, request.email)
             if existing_user:
                 return SendCodeResponse(
                     success=False,
@@ -757,7 +798,7 @@ async def send_verification_code(request: SendCodeRequest):
                 )
         elif request.type == 'login':
             # 登录验证码：检查邮箱是否存在
-            existing_user = db_manager.get_user_by_email(request.email)
+            existing_user = await db_executor.run(db_manager.get_user_by_email, request.email)
             if not existing_user:
                 return SendCodeResponse(
                     success=False,
@@ -768,7 +809,7 @@ async def send_verification_code(request: SendCodeRequest):
         code = db_manager.generate_verification_code()
 
         # 保存验证码到数据库
-        if not db_manager.save_verification_code(request.email, code, request.type):
+        if not await db_executor.run(db_manager.save_verification_code, request.email, code, request.type):
             return SendCodeResponse(
                 success=False,
                 message="验证码保存失败，请稍后重试"
@@ -795,8 +836,8 @@ async def send_verification_code(request: SendCodeRequest):
 
 
 # 用户注册接口
-@app.post('/register')
-async def register(request: RegisterRequest):
+def _register(request: RegisterRequest) -> RegisterResponse:
+    """校验验证码并创建用户（在数据库线程池中执行）"""
     from db_manager import db_manager
 
     # 检查注册是否开启
@@ -859,6 +900,11 @@ async def register(request: RegisterRequest):
         )
 
 
+@app.post('/register')
+async def register(request: RegisterRequest):
+    return await db_executor.run(_register, request)
+
+
 # ------------------------- 发送消息接口 -------------------------
 
 # 固定的API秘钥（生产环境中应该从配置文件或环境变量读取）
@@ -1154,43 +1200,19 @@ def get_cookies_details(current_user: Dict[str, Any] = Depends(get_current_user)
         
         logger.info(f"开始获取Cookie详情: 用户ID={user_id}, 用户名={current_user.get('username', 'unknown')}")
         
-        # 确保user_id是字符串类型，因为数据库中存储的是字符串
-        user_id_str = str(user_id)
-        
-        # 先尝试用字符串类型的user_id查询
-        user_cookies = db_manager.get_all_cookies(user_id_str)
-        
-        # 如果没有找到，再尝试用整数类型查询
-        if len(user_cookies) == 0 and isinstance(user_id, str) and user_id.isdigit():
-            user_cookies = db_manager.get_all_cookies(int(user_id))
-        
-        # 如果还是没有找到，查询所有cookies（兼容性处理）
+        # 一次查询取回所有账号的值、自动确认、备注和暂停时长，避免逐个账号查询
+        user_cookies = db_manager.get_cookies_details_by_user(user_id)
+
+        # 如果没有找到，查询所有cookies（兼容性处理）
         if len(user_cookies) == 0:
             logger.warning(f"用户{user_id}没有找到cookies，尝试查询所有cookies")
-            user_cookies = db_manager.get_all_cookies()
-        
-        logger.info(f"从数据库获取到{len(user_cookies)}个Cookie (类型: {type(user_cookies)})")
-        
-        # 处理不同的数据格式
-        cookie_items = []
-        if isinstance(user_cookies, list):
-            # 新格式：列表包含字典 [{'id': 'xxx', 'cookie': 'xxx', 'user_id': xxx}, ...]
-            for cookie_info in user_cookies:
-                if isinstance(cookie_info, dict) and 'id' in cookie_info:
-                    cookie_id = cookie_info['id']
-                    cookie_value = cookie_info.get('cookie', '') or cookie_info.get('value', '')
-                    cookie_items.append((cookie_id, cookie_value))
-        elif isinstance(user_cookies, dict):
-            # 旧格式：字典格式 {'id': 'cookie_value', ...}
-            cookie_items = list(user_cookies.items())
-        else:
-            logger.warning(f"未知的cookies数据格式: {type(user_cookies)}")
-            cookie_items = []
-        
-        logger.info(f"处理后得到{len(cookie_items)}个Cookie项目")
+            user_cookies = db_manager.get_cookies_details_by_user()
+
+        logger.info(f"从数据库获取到{len(user_cookies)}个Cookie")
 
         result = []
-        for cookie_id, cookie_value in cookie_items:
+        for cookie_details in user_cookies:
+            cookie_id = cookie_details['id']
             try:
                 # 如果cookie_manager.manager存在，使用它获取状态，否则默认为启用
                 if cookie_manager.manager is not None:
@@ -1198,30 +1220,21 @@ def get_cookies_details(current_user: Dict[str, Any] = Depends(get_current_user)
                 else:
                     # CookieManager未初始化时，默认为启用状态
                     cookie_enabled = True
-                
-                auto_confirm = db_manager.get_auto_confirm(cookie_id)
-                
-                # 获取备注信息
-                cookie_details = db_manager.get_cookie_details(cookie_id)
-                remark = cookie_details.get('remark', '') if cookie_details else ''
-
-                cookie_info = {
+
+                result.append({
                     'id': cookie_id,
-                    'value': cookie_value,
+                    'value': cookie_details['value'],
                     'enabled': cookie_enabled,
-                    'auto_confirm': auto_confirm,
-                    'remark': remark,
-                    'pause_duration': cookie_details.get('pause_duration', 10) if cookie_details else 10
-                }
-                
-                result.append(cookie_info)
-                logger.debug(f"添加Cookie信息: {cookie_id}, enabled={cookie_enabled}, remark='{remark}'")
-                
+                    'auto_confirm': cookie_details['auto_confirm'],
+                    'remark': cookie_details['remark'],
+                    'pause_duration': cookie_details['pause_duration']
+                })
+
             except Exception as cookie_error:
                 logger.error(f"处理Cookie {cookie_id} 时出错: {cookie_error}")
                 # 即使单个Cookie处理失败，也继续处理其他Cookie
                 continue
-        
+
         logger.info(f"获取Cookie详情完成: 用户ID={user_id}, 返回{len(result)}个Cookie")
         return result
         
@@ -1325,28 +1338,23 @@ async def generate_qr_code(current_user: Dict[str, Any] = Depends(get_current_us
 async def check_qr_code_status(session_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
     """检查扫码登录状态"""
     try:
-        # 清理过期记录
-        cleanup_qr_check_records()
-
-        # 检查是否已经处理过
-        if session_id in qr_check_processed:
-            record = qr_check_processed[session_id]
-            if record['processed']:
-                log_with_user('debug', f"扫码登录session {session_id} 已处理过，直接返回", current_user)
-                # 返回简单的成功状态，避免重复处理
-                return {'status': 'already_processed', 'message': '该会话已处理完成'}
-
-        # 获取该session的锁
-        session_lock = qr_check_locks[session_id]
-
-        # 使用非阻塞方式尝试获取锁
-        if session_lock.locked():
+        # 检查是否已经处理过（处理记录保存在共享会话存储中，过期由存储负责清理；在数据库线程池中查询）
+        record = await db_executor.run(session_store.get, SESSION_NS_QR_PROCESSED, session_id)
+        if record and record['processed']:
+            log_with_user('debug', f"扫码登录session {session_id} 已处理过，直接返回", current_user)
+            # 返回简单的成功状态，避免重复处理
+            return {'status': 'already_processed', 'message': '该会话已处理完成'}
+
+        # 使用非阻塞方式尝试获取该session的锁（跨进程）
+        if not await db_executor.run(session_store.add, SESSION_NS_QR_LOCK, session_id,
+                                     {'timestamp': time.time()}, QR_LOCK_EXPIRE_TIME):
             log_with_user('debug', f"扫码登录session {session_id} 正在被其他请求处理，跳过", current_user)
             return {'status': 'processing', 'message': '正在处理中，请稍候...'}
 
-        async with session_lock:
+        try:
             # 再次检查是否已处理（双重检查）
-            if session_id in qr_check_processed and qr_check_processed[session_id]['processed']:
+            record = await db_executor.run(session_store.get, SESSION_NS_QR_PROCESSED, session_id)
+            if record and record['processed']:
                 log_with_user('debug', f"扫码登录session {session_id} 在获取锁后发现已处理，直接返回", current_user)
                 return {'status': 'already_processed', 'message': '该会话已处理完成'}
 
@@ -1370,12 +1378,14 @@ async def check_qr_code_status(session_id: str, current_user: Dict[str, Any] = D
                     log_with_user('info', f"扫码登录处理完成: {session_id}, 账号: {account_info.get('account_id', 'unknown')}", current_user)
 
                     # 标记该session已处理
-                    qr_check_processed[session_id] = {
+                    await db_executor.run(session_store.set, SESSION_NS_QR_PROCESSED, session_id, {
                         'processed': True,
                         'timestamp': time.time()
-                    }
+                    }, QR_PROCESSED_EXPIRE_TIME)
 
             return status_info
+        finally:
+            await db_executor.run(session_store.delete, SESSION_NS_QR_LOCK, session_id)
 
     except Exception as e:
         log_with_user('error', f"检查扫码登录状态异常: {str(e)}", current_user)
@@ -2455,6 +2465,12 @@ def update_keywords_with_item_id(cid: str, body: KeywordWithItemIdIn, current_us
         if not keyword:
             raise HTTPException(status_code=400, detail="关键词不能为空")
 
+        # 正则（re:）/模糊（fuzzy:）关键词格式校验
+        try:
+            validate_keyword(keyword)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         # 检查当前提交的关键词中是否有重复
         keyword_key = f"{keyword}|{item_id or ''}"
         if keyword_key in keyword_set:
@@ -2555,8 +2571,8 @@ def get_items_list(cid: str, current_user: Dict[str, Any] = Depends(get_current_
 
 
 @app.get("/keywords-export/{cid}")
-def export_keywords(cid: str, current_user: Dict[str, Any] = Depends(get_current_user)):
-    """导出指定账号的关键词为Excel文件"""
+def export_keywords(cid: str, format: str = 'xlsx', current_user: Dict[str, Any] = Depends(get_current_user)):
+    """导出指定账号的文本关键词（xlsx/csv/ndjson），无数据时xlsx导出模板"""
     if cookie_manager.manager is None:
         raise HTTPException(status_code=500, detail="CookieManager 未就绪")
 
@@ -2568,69 +2584,27 @@ def export_keywords(cid: str, current_user: Dict[str, Any] = Depends(get_current
     if cid not in user_cookies:
         raise HTTPException(status_code=403, detail="无权限访问该Cookie")
 
-    try:
-        # 获取关键词数据（包含类型信息）
-        keywords = db_manager.get_keywords_with_type(cid)
+    fmt = format.lower()
+    if fmt not in KEYWORD_EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
 
-        # 创建DataFrame，只导出文本类型的关键词
-        data = []
-        for keyword_data in keywords:
-            # 只导出文本类型的关键词
-            if keyword_data.get('type', 'text') == 'text':
-                data.append({
-                    '关键词': keyword_data['keyword'],
-                    '商品ID': keyword_data['item_id'] or '',
-                    '关键词内容': keyword_data['reply']
-                })
+    try:
+        # 只导出文本类型的关键词
+        rows = [(kw['keyword'], kw['item_id'] or '', kw['reply'])
+                for kw in db_manager.get_keywords_with_type(cid)
+                if kw.get('type', 'text') == 'text']
 
-        # 如果没有数据，创建空的DataFrame但保留列名（作为模板）
-        if not data:
-            df = pd.DataFrame(columns=['关键词', '商品ID', '关键词内容'])
-        else:
-            df = pd.DataFrame(data)
-
-        # 创建Excel文件
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='关键词数据', index=False)
-
-            # 如果是空模板，添加一些示例说明
-            if data == []:
-                worksheet = writer.sheets['关键词数据']
-                # 添加示例数据作为注释（从第2行开始）
-                worksheet['A2'] = '你好'
-                worksheet['B2'] = ''
-                worksheet['C2'] = '您好！欢迎咨询，有什么可以帮助您的吗？'
-
-                worksheet['A3'] = '价格'
-                worksheet['B3'] = '123456'
-                worksheet['C3'] = '这个商品的价格是99元，现在有优惠活动哦！'
-
-                worksheet['A4'] = '发货'
-                worksheet['B4'] = ''
-                worksheet['C4'] = '我们会在24小时内发货，请耐心等待。'
-
-                # 设置示例行的样式（浅灰色背景）
-                from openpyxl.styles import PatternFill
-                gray_fill = PatternFill(start_color='F0F0F0', end_color='F0F0F0', fill_type='solid')
-                for row in range(2, 5):
-                    for col in range(1, 4):
-                        worksheet.cell(row=row, column=col).fill = gray_fill
-
-        output.seek(0)
+        content = build_keyword_export(rows, fmt)
 
         # 生成文件名（使用URL编码处理中文）
         from urllib.parse import quote
-        if not data:
-            filename = f"keywords_template_{cid}_{int(time.time())}.xlsx"
-        else:
-            filename = f"keywords_{cid}_{int(time.time())}.xlsx"
+        prefix = "keywords" if rows else "keywords_template"
+        filename = f"{prefix}_{cid}_{int(time.time())}.{fmt}"
         encoded_filename = quote(filename.encode('utf-8'))
 
-        # 返回文件
         return StreamingResponse(
-            io.BytesIO(output.read()),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            io.BytesIO(content),
+            media_type=KEYWORD_EXPORT_FORMATS[fmt],
             headers={
                 "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
             }
@@ -2642,91 +2616,50 @@ def export_keywords(cid: str, current_user: Dict[str, Any] = Depends(get_current
 
 
 @app.post("/keywords-import/{cid}")
-async def import_keywords(cid: str, file: UploadFile = File(...), current_user: Dict[str, Any] = Depends(get_current_user)):
-    """导入Excel文件中的关键词到指定账号"""
+async def import_keywords(cid: str, file: UploadFile = File(...), dry_run: bool = False,
+                          current_user: Dict[str, Any] = Depends(get_current_user)):
+    """导入关键词文件（xlsx/xls/csv/ndjson）到指定账号，只替换文本关键词"""
     if cookie_manager.manager is None:
         raise HTTPException(status_code=500, detail="CookieManager 未就绪")
 
     # 检查cookie是否属于当前用户
     user_id = current_user['user_id']
     from db_manager import db_manager
-    user_cookies = db_manager.get_all_cookies(user_id)
+    user_cookies = await db_executor.run(db_manager.get_all_cookies, user_id)
 
     if cid not in user_cookies:
         raise HTTPException(status_code=403, detail="无权限访问该Cookie")
 
     # 检查文件类型
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="请上传Excel文件(.xlsx或.xls)")
+    if not (file.filename or '').lower().endswith(KEYWORD_IMPORT_EXTENSIONS):
+        raise HTTPException(status_code=400,
+                            detail=f"请上传 {'/'.join(KEYWORD_IMPORT_EXTENSIONS)} 格式的关键词文件")
 
     try:
-        # 读取Excel文件
         contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-
-        # 检查必要的列
-        required_columns = ['关键词', '商品ID', '关键词内容']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise HTTPException(status_code=400, detail=f"Excel文件缺少必要的列: {', '.join(missing_columns)}")
-
-        # 获取现有的文本类型关键词（用于比较更新/新增）
-        existing_keywords = db_manager.get_keywords_with_type(cid)
-        existing_dict = {}
-        for keyword_data in existing_keywords:
-            # 只考虑文本类型的关键词
-            if keyword_data.get('type', 'text') == 'text':
-                keyword = keyword_data['keyword']
-                reply = keyword_data['reply']
-                item_id = keyword_data['item_id']
-                key = f"{keyword}|{item_id or ''}"
-                existing_dict[key] = (keyword, reply, item_id)
-
-        # 处理导入数据
-        import_data = []
-        update_count = 0
-        add_count = 0
-
-        for index, row in df.iterrows():
-            keyword = str(row['关键词']).strip()
-            item_id = str(row['商品ID']).strip() if pd.notna(row['商品ID']) and str(row['商品ID']).strip() else None
-            reply = str(row['关键词内容']).strip()
-
-            if not keyword:
-                continue  # 跳过没有关键词的行
-
-            # 检查是否重复
-            key = f"{keyword}|{item_id or ''}"
-            if key in existing_dict:
-                # 更新现有关键词
-                update_count += 1
-            else:
-                # 新增关键词
-                add_count += 1
-
-            import_data.append((keyword, reply, item_id))
-
+        # 文件解析与写库都是同步CPU/IO操作，放到数据库线程池避免阻塞事件循环
+        import_data = await db_executor.run(parse_keyword_file, file.filename, contents)
         if not import_data:
-            raise HTTPException(status_code=400, detail="Excel文件中没有有效的关键词数据")
+            raise HTTPException(status_code=400, detail="文件中没有有效的关键词数据")
 
-        # 保存到数据库（只影响文本关键词，保留图片关键词）
-        success = db_manager.save_text_keywords_only(cid, import_data)
-        if not success:
-            raise HTTPException(status_code=500, detail="保存关键词到数据库失败")
+        # 集合比较得出新增/更新/未变化，并在单个事务中批量写入（保留图片关键词）
+        stats = await db_executor.run(db_manager.replace_text_keywords, cid, import_data, dry_run)
 
-        log_with_user('info', f"导入关键词成功: {cid}, 新增: {add_count}, 更新: {update_count}", current_user)
+        if not dry_run:
+            log_with_user('info', f"导入关键词成功: {cid}, 新增: {stats['added']}, 更新: {stats['updated']}, "
+                                  f"未变化: {stats['unchanged']}, 删除: {stats['removed']}", current_user)
 
         return {
-            "msg": "导入成功",
-            "total": len(import_data),
-            "added": add_count,
-            "updated": update_count
+            "msg": "预检完成" if dry_run else "导入成功",
+            "dry_run": dry_run,
+            **stats
         }
 
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=400, detail="Excel文件为空")
-    except pd.errors.ParserError:
-        raise HTTPException(status_code=400, detail="Excel文件格式错误")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # 文件格式错误或与图片关键词冲突
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"导入关键词失败: {e}")
         raise HTTPException(status_code=500, detail=f"导入关键词失败: {str(e)}")
@@ -2771,7 +2704,7 @@ async def add_image_keyword(
         logger.info(f"读取图片数据成功，大小: {len(image_data)} bytes")
 
         # 保存图片
-        image_url = image_manager.save_image(image_data, image.filename)
+        image_url = await image_manager.save_image_async(image_data, image.filename)
         if not image_url:
             logger.error("图片保存失败")
             raise HTTPException(status_code=400, detail="图片保存失败")
@@ -2831,7 +2764,7 @@ async def upload_image(
         logger.info(f"读取图片数据成功，大小: {len(image_data)} bytes")
 
         # 保存图片
-        image_url = image_manager.save_image(image_data, image.filename)
+        image_url = await image_manager.save_image_async(image_data, image.filename)
         if not image_url:
             logger.error("图片保存失败")
             raise HTTPException(status_code=400, detail="图片保存失败")
@@ -2949,6 +2882,14 @@ def get_cards(current_user: Dict[str, Any] = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def release_card_image(old_image_url: str, new_image_url: str = None):
+    """卡券图片被替换或卡券被删除时，释放旧的本地图片引用"""
+    if not old_image_url or old_image_url == new_image_url:
+        return
+    if old_image_url.lstrip('/').startswith('static/uploads/'):
+        image_manager.delete_image(old_image_url)
+
+
 @app.post("/cards")
 def create_card(card_data: dict, current_user: Dict[str, Any] = Depends(get_current_user)):
     """创建新卡券"""
@@ -3014,6 +2955,7 @@ def update_card(card_id: int, card_data: dict, _: None = Depends(require_auth)):
             if not card_data.get('spec_name') or not card_data.get('spec_value'):
                 raise HTTPException(status_code=400, detail="多规格卡券必须提供规格名称和规格值")
 
+        old_image_url = db_manager.get_card_image_url(card_id)
         success = db_manager.update_card(
             card_id=card_id,
             name=card_data.get('name'),
@@ -3030,6 +2972,8 @@ def update_card(card_id: int, card_data: dict, _: None = Depends(require_auth)):
             spec_value=card_data.get('spec_value')
         )
         if success:
+            if card_data.get('image_url') is not None:
+                release_card_image(old_image_url, card_data.get('image_url'))
             return {"message": "卡券更新成功"}
         else:
             raise HTTPException(status_code=404, detail="卡券不存在")
@@ -3070,7 +3014,7 @@ async def update_card_with_image(
         logger.info(f"读取图片数据成功，大小: {len(image_data)} bytes")
 
         # 保存图片
-        image_url = image_manager.save_image(image_data, image.filename)
+        image_url = await image_manager.save_image_async(image_data, image.filename)
         if not image_url:
             logger.error("图片保存失败")
             raise HTTPException(status_code=400, detail="图片保存失败")
@@ -3079,6 +3023,7 @@ async def update_card_with_image(
 
         # 更新卡券
         from db_manager import db_manager
+        old_image_url = db_manager.get_card_image_url(card_id)
         success = db_manager.update_card(
             card_id=card_id,
             name=name,
@@ -3093,6 +3038,7 @@ async def update_card_with_image(
         )
 
         if success:
+            release_card_image(old_image_url, image_url)
             logger.info(f"卡券更新成功: {name} (ID: {card_id})")
             return {"message": "卡券更新成功", "image_url": image_url}
         else:
@@ -3182,8 +3128,10 @@ def delete_card(card_id: int, _: None = Depends(require_auth)):
     """删除卡券"""
     try:
         from db_manager import db_manager
+        old_image_url = db_manager.get_card_image_url(card_id)
         success = db_manager.delete_card(card_id)
         if success:
+            release_card_image(old_image_url)
             return {"message": "卡券删除成功"}
         else:
             raise HTTPException(status_code=404, detail="卡券不存在")
@@ -3208,20 +3156,92 @@ def delete_delivery_rule(rule_id: int, current_user: Dict[str, Any] = Depends(ge
 
 # ==================== 备份和恢复 API ====================
 
+def compress_stream(chunks, compression: str):
+    """按指定压缩方式流式压缩字节块（none / gzip / zstd）"""
+    if compression == 'gzip':
+        import zlib
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 生成gzip格式
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    elif compression == 'zstd':
+        import zstandard  # 可选依赖，仅在使用zstd压缩时需要
+        compressor = zstandard.ZstdCompressor().compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+
+def iter_backup_file_records(file_obj, filename: str):
+    """逐行读取上传的NDJSON备份文件（支持.gz/.zst压缩），不把整个文件读入内存"""
+    import gzip
+
+    if filename.endswith('.gz'):
+        stream = gzip.GzipFile(fileobj=file_obj)
+    elif filename.endswith('.zst'):
+        import zstandard  # 可选依赖，仅在导入zstd备份时需要
+        stream = zstandard.ZstdDecompressor().stream_reader(file_obj)
+    else:
+        stream = file_obj
+
+    for line in io.TextIOWrapper(stream, encoding='utf-8'):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
 @app.get("/backup/export")
-def export_backup(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """导出用户备份"""
+async def export_backup(format: str = 'json', compression: str = 'none', since: Optional[str] = None,
+                        current_user: Dict[str, Any] = Depends(get_current_user)):
+    """导出用户备份
+
+    format=json 为旧版整体JSON；format=ndjson 为逐行流式导出，可配合 compression=gzip/zstd 压缩，
+    since 传入上次备份header中的watermark即可导出增量备份（基于updated_at，修改过的行也会导出）。
+    管理员的备份额外包含system_settings等全局表。
+    """
     try:
         from db_manager import db_manager
         user_id = current_user['user_id']
         username = current_user['username']
-
-        # 导出当前用户的数据
-        backup_data = db_manager.export_backup(user_id)
+        include_global = username == ADMIN_USERNAME
 
         # 生成文件名
         import datetime
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if format == 'ndjson':
+            if compression not in ('none', 'gzip', 'zstd'):
+                raise HTTPException(status_code=400, detail="压缩方式仅支持 none、gzip 或 zstd")
+            if compression == 'zstd':
+                try:
+                    import zstandard  # noqa: F401
+                except ImportError:
+                    raise HTTPException(status_code=400, detail="服务器未安装zstandard，无法使用zstd压缩")
+
+            suffix = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+            kind = 'incremental' if since else 'full'
+            filename = f"xianyu_backup_{username}_{kind}_{timestamp}.ndjson{suffix}"
+
+            chunks = (
+                (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+                for record in db_manager.iter_backup_records(user_id, since=since, include_global=include_global)
+            )
+            media_type = 'application/x-ndjson' if compression == 'none' else 'application/octet-stream'
+            # 逐批读取和压缩在数据库线程池中执行
+            return StreamingResponse(
+                db_executor.iterate(compress_stream(chunks, compression)),
+                media_type=media_type,
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
+
+        # 导出当前用户的数据
+        backup_data = await db_executor.run(db_manager.export_backup, user_id, include_global)
         filename = f"xianyu_backup_{username}_{timestamp}.json"
 
         # 返回JSON响应，设置下载头
@@ -3230,26 +3250,37 @@ def export_backup(current_user: Dict[str, Any] = Depends(get_current_user)):
         response.headers["Content-Type"] = "application/json"
 
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出备份失败: {str(e)}")
 
 
 @app.post("/backup/import")
 def import_backup(file: UploadFile = File(...), current_user: Dict[str, Any] = Depends(get_current_user)):
-    """导入用户备份"""
+    """导入用户备份（支持旧版.json以及流式.ndjson/.ndjson.gz/.ndjson.zst）"""
     try:
-        # 验证文件类型
-        if not file.filename.endswith('.json'):
-            raise HTTPException(status_code=400, detail="只支持JSON格式的备份文件")
-
-        # 读取文件内容
-        content = file.file.read()
-        backup_data = json.loads(content.decode('utf-8'))
-
-        # 导入备份到当前用户
         from db_manager import db_manager
         user_id = current_user['user_id']
-        success = db_manager.import_backup(backup_data, user_id)
+        filename = file.filename or ''
+        # 只有管理员可以导入system_settings等全局表，其他行都限定在当前用户范围内
+        include_global = current_user['username'] == ADMIN_USERNAME
+
+        if filename.endswith(('.ndjson', '.ndjson.gz', '.ndjson.zst')):
+            # 流式逐行读取并暂存，校验归属后在一个事务内写入
+            counts = db_manager.import_backup_records(iter_backup_file_records(file.file, filename), user_id,
+                                                      include_global=include_global)
+            success = True
+            logger.info(f"流式备份导入完成: {counts}")
+        elif filename.endswith('.json'):
+            # 读取文件内容
+            content = file.file.read()
+            backup_data = json.loads(content.decode('utf-8'))
+
+            # 导入备份到当前用户
+            success = db_manager.import_backup(backup_data, user_id, include_global)
+        else:
+            raise HTTPException(status_code=400, detail="只支持JSON或NDJSON格式的备份文件")
 
         if success:
             # 备份导入成功后，刷新 CookieManager 的内存缓存
@@ -3265,6 +3296,8 @@ def import_backup(file: UploadFile = File(...), current_user: Dict[str, Any] = D
         else:
             raise HTTPException(status_code=400, detail="备份导入失败")
 
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="备份文件格式无效")
     except Exception as e:
@@ -3315,10 +3348,12 @@ class ItemSearchRequest(BaseModel):
     keyword: str
     page: int = 1
     page_size: int = 20
+    filters: Optional[Dict[str, Any]] = None
 
 class ItemSearchMultipleRequest(BaseModel):
     keyword: str
     total_pages: int = 1
+    filters: Optional[Dict[str, Any]] = None
 
 @app.post("/items/search")
 async def search_items(
@@ -3337,7 +3372,8 @@ async def search_items(
         result = await search_xianyu_items(
             keyword=search_request.keyword,
             page=search_request.page,
-            page_size=search_request.page_size
+            page_size=search_request.page_size,
+            filters=search_request.filters
         )
 
         # 检查是否有错误
@@ -3435,7 +3471,8 @@ async def search_multiple_pages(
         # 执行多页搜索
         result = await search_multiple_pages_xianyu(
             keyword=search_request.keyword,
-            total_pages=search_request.total_pages
+            total_pages=search_request.total_pages,
+            filters=search_request.filters
         )
 
         # 检查是否有错误
@@ -3534,6 +3571,8 @@ def update_item_detail(
 
         success = db_manager.update_item_detail(cookie_id, item_id, update_data.item_detail)
         if success:
+            from XianyuAutoAsync import XianyuLive
+            XianyuLive.invalidate_item_detail(item_id)
             return {"message": "商品详情更新成功"}
         else:
             raise HTTPException(status_code=400, detail="更新失败")
@@ -3561,6 +3600,8 @@ def delete_item_info(
 
         success = db_manager.delete_item_info(cookie_id, item_id)
         if success:
+            from XianyuAutoAsync import XianyuLive
+            XianyuLive.invalidate_item_detail(item_id)
             return {"message": "商品信息删除成功"}
         else:
             raise HTTPException(status_code=404, detail="商品信息不存在")
@@ -3601,6 +3642,11 @@ def batch_delete_items(
         success_count = db_manager.batch_delete_item_info(request.items)
         total_count = len(request.items)
 
+        from XianyuAutoAsync import XianyuLive
+        for item in request.items:
+            if item.get('item_id'):
+                XianyuLive.invalidate_item_detail(item['item_id'])
+
         return {
             "message": f"批量删除完成",
             "success_count": success_count,
@@ -3953,22 +3999,8 @@ def get_all_users(admin_user: Dict[str, Any] = Depends(require_admin)):
     from db_manager import db_manager
     try:
         log_with_user('info', "查询所有用户信息", admin_user)
-        users = db_manager.get_all_users()
-
-        # 为每个用户添加统计信息
-        for user in users:
-            user_id = user['id']
-            # 统计用户的Cookie数量
-            user_cookies = db_manager.get_all_cookies(user_id)
-            user['cookie_count'] = len(user_cookies)
-
-            # 统计用户的卡券数量
-            user_cards = db_manager.get_all_cards(user_id)
-            user['card_count'] = len(user_cards) if user_cards else 0
-
-            # 隐藏密码字段
-            if 'password_hash' in user:
-                del user['password_hash']
+        # 单次查询获取用户列表及每个用户的Cookie/卡券数量（不包含密码字段）
+        users = db_manager.get_all_users_with_stats()
 
         log_with_user('info', f"返回用户信息，共 {len(users)} 个用户", admin_user)
         return {"users": users}
@@ -4073,7 +4105,7 @@ def get_system_logs(admin_user: Dict[str, Any] = Depends(require_admin),
         return {"logs": [], "message": f"获取系统日志失败: {str(e)}", "success": False}
 
 @app.get('/admin/stats')
-def get_system_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
+async def get_system_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
     """获取系统统计信息（管理员专用）"""
     from db_manager import db_manager
     try:
@@ -4098,19 +4130,19 @@ def get_system_stats(admin_user: Dict[str, Any] = Depends(require_admin)):
             }
         }
 
-        # 用户统计
-        all_users = db_manager.get_all_users()
-        stats["users"]["total"] = len(all_users)
+        # 使用COUNT(*)统计，不再加载所有用户、Cookie和卡券数据
+        counts = await db_executor.run(db_manager.get_system_counts)
+        stats["users"]["total"] = counts['users']
+        stats["cookies"]["total"] = counts['cookies']
+        stats["cards"]["total"] = counts['cards']
+        stats["cards"]["enabled"] = counts['cards_enabled']
 
-        # Cookie统计
-        all_cookies = db_manager.get_all_cookies()
-        stats["cookies"]["total"] = len(all_cookies)
+        # 商品详情缓存命中率、进行中的获取数和淘汰统计
+        from XianyuAutoAsync import XianyuLive
+        stats["cache"] = {"item_detail": XianyuLive.get_item_detail_cache_stats()}
 
-        # 卡券统计
-        all_cards = db_manager.get_all_cards()
-        if all_cards:
-            stats["cards"]["total"] = len(all_cards)
-            stats["cards"]["enabled"] = len([card for card in all_cards if card.get('enabled', True)])
+        # 各类路由的并发、排队和拒绝数
+        stats["web"] = admission_controller.snapshot()
 
         log_with_user('info', "系统统计信息查询完成", admin_user)
         return stats
@@ -4273,7 +4305,7 @@ def get_item_reply(cookie_id: str, item_id: str, current_user: Dict[str, Any] =
 # ------------------------- 数据库备份和恢复接口 -------------------------
 
 @app.get('/admin/backup/download')
-def download_database_backup(admin_user: Dict[str, Any] = Depends(require_admin)):
+async def download_database_backup(admin_user: Dict[str, Any] = Depends(require_admin)):
     """下载数据库备份文件（管理员专用）"""
     import os
     from fastapi.responses import FileResponse
@@ -4295,12 +4327,22 @@ def download_database_backup(admin_user: Dict[str, Any] = Depends(require_admin)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         download_filename = f"xianyu_backup_{timestamp}.db"
 
+        # 使用在线备份生成一致的快照，而不是直接复制可能正在写入的数据库文件
+        import tempfile
+        from starlette.background import BackgroundTask
+        fd, snapshot_path = tempfile.mkstemp(suffix='.db', prefix='xianyu_snapshot_')
+        os.close(fd)
+        if not await db_executor.run(db_manager.backup_database, snapshot_path):
+            os.remove(snapshot_path)
+            raise HTTPException(status_code=500, detail="生成数据库快照失败")
+
         log_with_user('info', f"开始下载数据库备份: {download_filename}", admin_user)
 
         return FileResponse(
-            path=db_file_path,
+            path=snapshot_path,
             filename=download_filename,
-            media_type='application/octet-stream'
+            media_type='application/octet-stream',
+            background=BackgroundTask(os.remove, snapshot_path)
         )
 
     except HTTPException:
@@ -4309,12 +4351,25 @@ def download_database_backup(admin_user: Dict[str, Any] = Depends(require_admin)
         log_with_user('error', f"下载数据库备份失败: {str(e)}", admin_user)
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def _list_backup_tables(path: str) -> List[str]:
+    """读取上传的备份文件中的表名，文件无效时抛出 sqlite3.Error"""
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
 @app.post('/admin/backup/upload')
 async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_admin),
                                 backup_file: UploadFile = File(...)):
     """上传并恢复数据库备份文件（管理员专用）"""
     import os
-    import shutil
     import sqlite3
     from datetime import datetime
 
@@ -4326,29 +4381,27 @@ async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_ad
             log_with_user('warning', f"无效的备份文件类型: {backup_file.filename}", admin_user)
             raise HTTPException(status_code=400, detail="只支持.db格式的数据库文件")
 
-        # 验证文件大小（限制100MB）
-        content = await backup_file.read()
-        if len(content) > 100 * 1024 * 1024:  # 100MB
-            log_with_user('warning', f"备份文件过大: {len(content)} bytes", admin_user)
-            raise HTTPException(status_code=400, detail="备份文件大小不能超过100MB")
-
         # 验证是否为有效的SQLite数据库文件
         temp_file_path = f"temp_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
 
         try:
-            # 保存临时文件
+            # 分块保存临时文件，同时验证文件大小（限制100MB）
+            total_size = 0
             with open(temp_file_path, 'wb') as temp_file:
-                temp_file.write(content)
+                while chunk := await backup_file.read(1024 * 1024):
+                    total_size += len(chunk)
+                    if total_size > 100 * 1024 * 1024:  # 100MB
+                        break
+                    temp_file.write(chunk)
+            if total_size > 100 * 1024 * 1024:
+                os.remove(temp_file_path)
+                log_with_user('warning', f"备份文件过大: 超过 {total_size} bytes", admin_user)
+                raise HTTPException(status_code=400, detail="备份文件大小不能超过100MB")
 
-            # 验证数据库文件完整性
-            conn = sqlite3.connect(temp_file_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            conn.close()
+            # 验证数据库文件完整性（在数据库线程池中执行，不阻塞与账号任务共享的事件循环）
+            table_names = await db_executor.run(_list_backup_tables, temp_file_path)
 
             # 检查是否包含必要的表
-            table_names = [table[0] for table in tables]
             required_tables = ['users', 'cookies']  # 最基本的表
 
             missing_tables = [table for table in required_tables if table not in table_names]
@@ -4373,41 +4426,35 @@ async def upload_database_backup(admin_user: Dict[str, Any] = Depends(require_ad
         backup_filename = f"xianyu_data_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
         backup_current_path = os.path.join(db_dir, backup_filename)
 
+        # 在线备份当前数据库（一致快照，不阻塞其他读写）；备份/恢复均在数据库线程池中执行
         if os.path.exists(current_db_path):
-            shutil.copy2(current_db_path, backup_current_path)
+            if not await db_executor.run(db_manager.backup_database, backup_current_path):
+                os.remove(temp_file_path)
+                raise HTTPException(status_code=500, detail="备份当前数据库失败，已取消恢复")
             log_with_user('info', f"当前数据库已备份为: {backup_current_path}", admin_user)
 
-        # 关闭当前数据库连接
-        if hasattr(db_manager, 'conn') and db_manager.conn:
-            db_manager.conn.close()
-            log_with_user('info', "已关闭当前数据库连接", admin_user)
-
-        # 替换数据库文件
-        shutil.move(temp_file_path, current_db_path)
-        log_with_user('info', f"数据库文件已替换: {current_db_path}", admin_user)
-
-        # 重新初始化数据库连接（使用原有的db_path）
-        db_manager.__init__(db_manager.db_path)
-        log_with_user('info', "数据库连接已重新初始化", admin_user)
+        # 通过backup API逐页恢复到当前连接，无需关闭连接和替换文件
+        restored = await db_executor.run(db_manager.restore_database, temp_file_path)
+        os.remove(temp_file_path)
+        log_with_user('info', f"数据库已从上传文件恢复: {current_db_path}", admin_user)
 
         # 验证新数据库
-        try:
-            test_users = db_manager.get_all_users()
-            log_with_user('info', f"数据库恢复成功，包含 {len(test_users)} 个用户", admin_user)
-        except Exception as e:
-            log_with_user('error', f"数据库恢复后验证失败: {str(e)}", admin_user)
+        counts = await db_executor.run(db_manager.get_system_counts) if restored else None
+        if not counts or not counts['users']:
+            log_with_user('error', "数据库恢复后验证失败", admin_user)
             # 如果验证失败，尝试恢复原数据库
             if os.path.exists(backup_current_path):
-                shutil.copy2(backup_current_path, current_db_path)
-                db_manager.__init__()
+                await db_executor.run(db_manager.restore_database, backup_current_path)
                 log_with_user('info', "已恢复原数据库", admin_user)
             raise HTTPException(status_code=500, detail="数据库恢复失败，已回滚到原数据库")
 
+        log_with_user('info', f"数据库恢复成功，包含 {counts['users']} 个用户", admin_user)
+
         return {
             "success": True,
             "message": "数据库恢复成功",
             "backup_file": backup_current_path,
-            "user_count": len(test_users)
+            "user_count": counts['users']
         }
 
     except HTTPException:
@@ -4463,35 +4510,73 @@ def list_backup_files(admin_user: Dict[str, Any] = Depends(require_admin)):
 
 # ------------------------- 数据管理接口 -------------------------
 
+# 管理员可浏览的数据表白名单
+ADMIN_DATA_TABLES = [
+    'users', 'cookies', 'cookie_status', 'keywords', 'default_replies', 'default_reply_records',
+    'ai_reply_settings', 'ai_conversations', 'ai_item_cache', 'item_info',
+    'message_notifications', 'cards', 'delivery_rules', 'notification_channels',
+    'user_settings', 'system_settings', 'email_verifications', 'captcha_codes', 'orders', "item_replay"
+]
+
+
+def parse_table_query_params(columns: Optional[str], filters: Optional[List[str]]) -> Tuple[Optional[List[str]], List[Tuple[str, str, str]]]:
+    """解析表浏览的列投影和过滤参数
+
+    columns: 逗号分隔的列名，如 "id,cookie_id"
+    filters: 形如 "列名:操作符:值" 的列表，如 "status:eq:shipped"、"item_title:like:耳机"
+    """
+    column_list = [col.strip() for col in columns.split(',') if col.strip()] if columns else None
+
+    filter_list = []
+    for item in filters or []:
+        parts = item.split(':', 2)
+        if len(parts) != 3:
+            raise HTTPException(status_code=400, detail=f"过滤条件格式错误: {item}，应为 列名:操作符:值")
+        filter_list.append((parts[0], parts[1].lower(), parts[2]))
+
+    return column_list, filter_list
+
+
 @app.get('/admin/data/{table_name}')
-def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require_admin)):
-    """获取指定表的所有数据（管理员专用）"""
+def get_table_data(table_name: str,
+                   limit: Optional[int] = None,
+                   cursor: Optional[str] = None,
+                   columns: Optional[str] = None,
+                   filter: Optional[List[str]] = Query(None),
+                   sort: Optional[str] = None,
+                   order: str = 'asc',
+                   admin_user: Dict[str, Any] = Depends(require_admin)):
+    """获取指定表的数据（管理员专用）
+
+    按rowid键集分页返回，next_cursor用于获取下一页；不传limit时每页200条
+    （不再一次返回整张表，完整数据请使用 /admin/data/{table_name}/export 流式导出）。
+    """
     from db_manager import db_manager
     try:
         log_with_user('info', f"查询表数据: {table_name}", admin_user)
 
         # 验证表名安全性
-        allowed_tables = [
-            'users', 'cookies', 'cookie_status', 'keywords', 'default_replies', 'default_reply_records',
-            'ai_reply_settings', 'ai_conversations', 'ai_item_cache', 'item_info',
-            'message_notifications', 'cards', 'delivery_rules', 'notification_channels',
-            'user_settings', 'system_settings', 'email_verifications', 'captcha_codes', 'orders', "item_replay"
-        ]
-
-        if table_name not in allowed_tables:
+        if table_name not in ADMIN_DATA_TABLES:
             log_with_user('warning', f"尝试访问不允许的表: {table_name}", admin_user)
             raise HTTPException(status_code=400, detail="不允许访问该表")
 
-        # 获取表数据
-        data, columns = db_manager.get_table_data(table_name)
+        column_list, filter_list = parse_table_query_params(columns, filter)
+        limit = max(1, min(limit or 200, 5000))
+        try:
+            data, column_names, next_cursor = db_manager.get_table_page(
+                table_name, limit=limit, cursor=cursor, columns=column_list,
+                filters=filter_list, sort=sort, order=order)
+        except (ValueError, KeyError) as e:
+            raise HTTPException(status_code=400, detail=f"查询参数错误: {e}")
 
         log_with_user('info', f"表 {table_name} 查询成功，共 {len(data)} 条记录", admin_user)
 
         return {
             "success": True,
             "data": data,
-            "columns": columns,
-            "count": len(data)
+            "columns": column_names,
+            "count": len(data),
+            "next_cursor": next_cursor
         }
 
     except HTTPException:
@@ -4500,6 +4585,72 @@ def get_table_data(table_name: str, admin_user: Dict[str, Any] = Depends(require
         log_with_user('error', f"查询表数据失败: {table_name} - {str(e)}", admin_user)
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.get('/admin/data/{table_name}/export')
+async def export_table_data(table_name: str,
+                            format: str = 'ndjson',
+                            columns: Optional[str] = None,
+                            filter: Optional[List[str]] = Query(None),
+                            sort: Optional[str] = None,
+                            order: str = 'asc',
+                            admin_user: Dict[str, Any] = Depends(require_admin)):
+    """流式导出指定表的数据（管理员专用），支持NDJSON和CSV，逐批读取不构建完整列表"""
+    from db_manager import db_manager
+    import csv
+
+    if table_name not in ADMIN_DATA_TABLES:
+        log_with_user('warning', f"尝试导出不允许的表: {table_name}", admin_user)
+        raise HTTPException(status_code=400, detail="不允许访问该表")
+
+    export_format = format.lower()
+    if export_format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="导出格式仅支持 ndjson 或 csv")
+
+    column_list, filter_list = parse_table_query_params(columns, filter)
+
+    # 先取一行校验参数，参数错误时返回400而不是中断的流
+    try:
+        _, column_names, _ = await db_executor.run(
+            db_manager.get_table_page, table_name, limit=1, columns=column_list, filters=filter_list, sort=sort, order=order)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"查询参数错误: {e}")
+
+    log_with_user('info', f"开始流式导出表: {table_name} ({export_format})", admin_user)
+
+    rows = db_manager.iter_table_rows(table_name, columns=column_list, filters=filter_list, sort=sort, order=order)
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # UTF-8 BOM，方便Excel直接打开
+        buffer.write('\ufeff')
+        writer.writerow(column_names)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([row.get(col) for col in column_names])
+            if count % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+
+    # 逐批读取在数据库线程池中执行
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+    if export_format == 'csv':
+        return StreamingResponse(
+            db_executor.iterate(generate_csv()),
+            media_type='text/csv; charset=utf-8',
+            headers={"Content-Disposition": f"attachment; filename={table_name}_{timestamp}.csv"}
+        )
+    return StreamingResponse(
+        db_executor.iterate(generate_ndjson()),
+        media_type='application/x-ndjson',
+        headers={"Content-Disposition": f"attachment; filename={table_name}_{timestamp}.ndjson"}
+    )
+
 @app.delete('/admin/data/{table_name}/{record_id}')
 def delete_table_record(table_name: str, record_id: str, admin_user: Dict[str, Any] = Depends(require_admin)):
     """删除指定表的指定记录（管理员专用）"""
@@ -4627,50 +4778,63 @@ def update_item_multi_quantity_delivery(cookie_id: str, item_id: str, delivery_d
 # ==================== 订单管理接口 ====================
 
 @app.get('/api/orders')
-def get_user_orders(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """获取当前用户的订单信息"""
+def get_user_orders(limit: int = 1000, cursor: Optional[str] = None, cookie_id: Optional[str] = None,
+                    current_user: Dict[str, Any] = Depends(get_current_user)):
+    """获取当前用户的订单信息（键集分页，next_cursor为空表示没有更多数据）"""
     try:
         from db_manager import db_manager
 
         user_id = current_user['user_id']
         log_with_user('info', "查询用户订单信息", current_user)
 
-        # 获取用户的所有Cookie
-        user_cookies = db_manager.get_all_cookies(user_id)
+        # 限制单页数量，避免一次返回过多数据
+        limit = max(1, min(limit, 5000))
 
-        # 获取所有订单数据
-        all_orders = []
-        # 处理新的列表格式
-        if isinstance(user_cookies, list):
-            # 新格式：列表包含字典 [{'id': 'xxx', 'cookie': 'xxx', 'user_id': xxx}, ...]
-            for cookie_info in user_cookies:
-                if isinstance(cookie_info, dict) and 'id' in cookie_info:
-                    cookie_id = cookie_info['id']
-                    orders = db_manager.get_orders_by_cookie(cookie_id, limit=1000)  # 增加限制数量
-                    # 为每个订单添加cookie_id信息
-                    for order in orders:
-                        order['cookie_id'] = cookie_id
-                        all_orders.append(order)
-        elif isinstance(user_cookies, dict):
-            # 旧格式：字典格式 {'id': 'cookie_value', ...}
-            for cookie_id in user_cookies.keys():
-                orders = db_manager.get_orders_by_cookie(cookie_id, limit=1000)  # 增加限制数量
-                # 为每个订单添加cookie_id信息
-                for order in orders:
-                    order['cookie_id'] = cookie_id
-                    all_orders.append(order)
-
-        # 按创建时间倒序排列
-        all_orders.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-
-        log_with_user('info', f"用户订单查询成功，共 {len(all_orders)} 条记录", current_user)
-        return {"success": True, "data": all_orders}
+        # 单次JOIN查询，按创建时间倒序由数据库完成排序
+        try:
+            orders, next_cursor = db_manager.get_orders_by_user(user_id, limit=limit, cursor=cursor,
+                                                                cookie_id=cookie_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"查询参数错误: {e}")
 
+        log_with_user('info', f"用户订单查询成功，共 {len(orders)} 条记录", current_user)
+        return {"success": True, "data": orders, "next_cursor": next_cursor}
+
+    except HTTPException:
+        raise
     except Exception as e:
         log_with_user('error', f"查询用户订单失败: {str(e)}", current_user)
         raise HTTPException(status_code=500, detail=f"查询订单失败: {str(e)}")
 
 
+@app.get('/api/orders/cookies')
+def get_user_order_cookies(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """获取当前用户有订单的账号ID列表（订单筛选使用）"""
+    try:
+        from db_manager import db_manager
+
+        cookie_ids = db_manager.get_order_cookie_ids(current_user['user_id'])
+        return {"success": True, "data": cookie_ids}
+
+    except Exception as e:
+        log_with_user('error', f"获取订单账号列表失败: {str(e)}", current_user)
+        raise HTTPException(status_code=500, detail=f"获取订单账号列表失败: {str(e)}")
+
+
+@app.get('/api/orders/count')
+def get_user_orders_count(cookie_id: Optional[str] = None, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """获取当前用户的订单总数（不受分页数量限制）"""
+    try:
+        from db_manager import db_manager
+
+        total = db_manager.count_orders_by_user(current_user['user_id'], cookie_id=cookie_id)
+        return {"success": True, "total": total}
+
+    except Exception as e:
+        log_with_user('error', f"统计用户订单失败: {str(e)}", current_user)
+        raise HTTPException(status_code=500, detail=f"统计订单失败: {str(e)}")
+
+
 # ======================== Cookie自动更新API接口 ========================
 
 class CookieAutoUpdateStatusResponse(BaseModel):
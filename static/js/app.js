@@ -32,6 +32,7 @@ let currentOrdersPage = 1; // 当前页码
 let ordersPerPage = 20; // 每页显示数量
 let totalOrdersPages = 0; // 总页数
 let currentOrderSearchKeyword = ''; // 当前搜索关键词
+const ORDER_PAGE_SIZE = 1000; // 按游标逐页获取订单时每页的数量
 
 // ================================
 // 通用功能 - 菜单切换和导航
@@ -233,7 +234,7 @@ async function loadDashboard() {
 async function loadOrdersCount() {
     try {
         const token = localStorage.getItem('auth_token');
-        const response = await fetch('/api/orders', {
+        const response = await fetch('/api/orders/count', {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -241,8 +242,7 @@ async function loadOrdersCount() {
 
         const data = await response.json();
         if (data.success) {
-            const ordersCount = data.data ? data.data.length : 0;
-            document.getElementById('totalOrders').textContent = ordersCount;
+            document.getElementById('totalOrders').textContent = data.total || 0;
         } else {
             console.error('加载订单数量失败:', data.message);
             document.getElementById('totalOrders').textContent = '0';
@@ -3987,6 +3987,8 @@ function clearAddCardForm() {
         setElementValue('apiHeaders', '');
         setElementValue('apiParams', '');
         setElementValue('apiTimeout', '10');
+        setElementValue('apiPrefetchHigh', '0');
+        setElementValue('apiPrefetchLow', '0');
 
         // 重置字段显示
         toggleCardTypeFields();
@@ -4062,7 +4064,9 @@ async function saveCard() {
                     method: document.getElementById('apiMethod').value,
                     timeout: parseInt(document.getElementById('apiTimeout').value),
                     headers: headers,
-                    params: params
+                    params: params,
+                    prefetch_high: parseInt(document.getElementById('apiPrefetchHigh').value) || 0,
+                    prefetch_low: parseInt(document.getElementById('apiPrefetchLow').value) || 0
                 };
                 break;
             case 'text':
@@ -4416,6 +4420,8 @@ async function editCard(cardId) {
                 document.getElementById('editApiTimeout').value = card.api_config.timeout || 10;
                 document.getElementById('editApiHeaders').value = card.api_config.headers || '{}';
                 document.getElementById('editApiParams').value = card.api_config.params || '{}';
+                document.getElementById('editApiPrefetchHigh').value = card.api_config.prefetch_high || 0;
+                document.getElementById('editApiPrefetchLow').value = card.api_config.prefetch_low || 0;
             } else if (card.type === 'text') {
                 document.getElementById('editTextContent').value = card.text_content || '';
             } else if (card.type === 'data') {
@@ -4574,7 +4580,9 @@ async function updateCard() {
                     method: document.getElementById('editApiMethod').value,
                     timeout: parseInt(document.getElementById('editApiTimeout').value),
                     headers: headers,
-                    params: params
+                    params: params,
+                    prefetch_high: parseInt(document.getElementById('editApiPrefetchHigh').value) || 0,
+                    prefetch_low: parseInt(document.getElementById('editApiPrefetchLow').value) || 0
                 };
                 break;
             case 'text':
@@ -5134,20 +5142,18 @@ async function uploadDatabaseBackup() {
     }
 }
 
-// 导出备份（JSON格式，兼容旧版本）
+// 导出备份（流式NDJSON + gzip压缩，由服务端逐批生成）
 async function exportBackup() {
     try {
         showToast('正在导出备份，请稍候...', 'info');
 
-        const response = await fetch(`${apiBase}/backup/export`, {
+        const response = await fetch(`${apiBase}/backup/export?format=ndjson&compression=gzip`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
         });
 
         if (response.ok) {
-            const backupData = await response.json();
-
             // 生成文件名
             const now = new Date();
             const timestamp = now.getFullYear() +
@@ -5156,10 +5162,10 @@ async function exportBackup() {
                 String(now.getHours()).padStart(2, '0') +
                 String(now.getMinutes()).padStart(2, '0') +
                 String(now.getSeconds()).padStart(2, '0');
-            const filename = `xianyu_backup_${timestamp}.json`;
+            const filename = `xianyu_backup_${timestamp}.ndjson.gz`;
 
             // 创建下载链接
-            const blob = new Blob([JSON.stringify(backupData, null, 2)], { type: 'application/json' });
+            const blob = await response.blob();
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
@@ -5190,8 +5196,8 @@ async function importBackup() {
         return;
     }
 
-    if (!file.name.endsWith('.json')) {
-        showToast('只支持JSON格式的备份文件', 'warning');
+    if (!['.json', '.ndjson', '.ndjson.gz', '.ndjson.zst'].some(ext => file.name.endsWith(ext))) {
+        showToast('只支持JSON或NDJSON格式的备份文件', 'warning');
         return;
     }
 
@@ -6952,7 +6958,7 @@ async function importKeywords() {
     const file = fileInput.files[0];
 
     if (!file) {
-        showToast('请选择要导入的Excel文件', 'warning');
+        showToast('请选择要导入的关键词文件', 'warning');
         return;
     }
 
@@ -6994,7 +7000,7 @@ async function importKeywords() {
                 // 重新加载关键词列表
                 loadAccountKeywords(currentCookieId);
 
-                showToast(`导入成功！新增: ${result.added}, 更新: ${result.updated}`, 'success');
+                showToast(`导入成功！新增: ${result.added}, 更新: ${result.updated}, 未变化: ${result.unchanged}`, 'success');
             }, 500);
         } else {
             const error = await response.json();
@@ -8404,7 +8410,8 @@ async function refreshOrdersData() {
 // 加载Cookie筛选选项
 async function loadOrderCookieFilter() {
     try {
-        const response = await fetch(`${apiBase}/admin/data/orders`, {
+        // 只获取有订单的账号ID，不加载整张订单表
+        const response = await fetch(`${apiBase}/api/orders/cookies`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
@@ -8412,8 +8419,7 @@ async function loadOrderCookieFilter() {
 
         const data = await response.json();
         if (data.success && data.data) {
-            // 提取唯一的cookie_id
-            const cookieIds = [...new Set(data.data.map(order => order.cookie_id).filter(id => id))];
+            const cookieIds = data.data.filter(id => id);
 
             const select = document.getElementById('orderCookieFilter');
             if (select) {
@@ -8432,16 +8438,38 @@ async function loadOrderCookieFilter() {
     }
 }
 
-// 加载所有订单
-async function loadAllOrders() {
-    try {
-        const response = await fetch(`${apiBase}/api/orders`, {
+// 按 next_cursor 逐页获取订单，直到没有下一页
+async function fetchAllOrderPages(cookieId = '') {
+    const orders = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ limit: ORDER_PAGE_SIZE });
+        if (cookieId) {
+            params.set('cookie_id', cookieId);
+        }
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`${apiBase}/api/orders?${params.toString()}`, {
             headers: {
                 'Authorization': `Bearer ${authToken}`
             }
         });
 
         const data = await response.json();
+        if (!data.success) {
+            return data;
+        }
+        orders.push(...(data.data || []));
+        cursor = data.next_cursor || null;
+    } while (cursor);
+    return { success: true, data: orders };
+}
+
+// 加载所有订单
+async function loadAllOrders() {
+    try {
+        const data = await fetchAllOrderPages();
         if (data.success) {
             allOrdersData = data.data || [];
             // 按创建时间倒序排列
@@ -8468,16 +8496,10 @@ async function loadOrdersByCookie() {
     }
 
     try {
-        const response = await fetch(`${apiBase}/api/orders`, {
-            headers: {
-                'Authorization': `Bearer ${authToken}`
-            }
-        });
-
-        const data = await response.json();
+        const data = await fetchAllOrderPages(selectedCookie);
         if (data.success) {
-            // 筛选指定Cookie的订单
-            allOrdersData = (data.data || []).filter(order => order.cookie_id === selectedCookie);
+            // 服务端已按Cookie筛选
+            allOrdersData = data.data || [];
             // 按创建时间倒序排列
             allOrdersData.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
 
@@ -9096,28 +9118,17 @@ async function loadUserSystemStats() {
             document.getElementById('totalUsers').textContent = usersData.users.length;
         }
 
-        // 获取Cookie统计
-        const cookiesResponse = await fetch(`${apiBase}/admin/data/cookies`, {
+        // 获取Cookie和卡券统计（服务端COUNT(*)，不加载整张表）
+        const statsResponse = await fetch(`${apiBase}/admin/stats`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
         });
 
-        if (cookiesResponse.ok) {
-            const cookiesData = await cookiesResponse.json();
-            document.getElementById('totalUserCookies').textContent = cookiesData.data ? cookiesData.data.length : 0;
-        }
-
-        // 获取卡券统计
-        const cardsResponse = await fetch(`${apiBase}/admin/data/cards`, {
-            headers: {
-                'Authorization': `Bearer ${token}`
-            }
-        });
-
-        if (cardsResponse.ok) {
-            const cardsData = await cardsResponse.json();
-            document.getElementById('totalUserCards').textContent = cardsData.data ? cardsData.data.length : 0;
+        if (statsResponse.ok) {
+            const stats = await statsResponse.json();
+            document.getElementById('totalUserCookies').textContent = stats.cookies ? stats.cookies.total : 0;
+            document.getElementById('totalUserCards').textContent = stats.cards ? stats.cards.total : 0;
         }
 
     } catch (error) {
@@ -9291,6 +9302,9 @@ async function refreshUsers() {
 // 全局变量
 let currentTable = '';
 let currentData = [];
+let currentColumns = [];
+let currentTableCursor = null;  // 下一页游标，为null表示没有更多数据
+const TABLE_PAGE_SIZE = 200;
 
 // 表的中文描述
 const tableDescriptions = {
@@ -9348,6 +9362,8 @@ async function loadDataManagement() {
     // 重置状态
     currentTable = '';
     currentData = [];
+    currentColumns = [];
+    currentTableCursor = null;
 
     // 重置界面
     showNoTableSelected();
@@ -9390,8 +9406,8 @@ function showNoData() {
     document.getElementById('tableContainer').style.display = 'none';
 }
 
-// 加载表数据
-async function loadTableData() {
+// 加载表数据（分页加载，append为true时追加下一页）
+async function loadTableData(append = false) {
     const tableSelect = document.getElementById('tableSelect');
     const selectedTable = tableSelect.value;
 
@@ -9400,13 +9416,21 @@ async function loadTableData() {
         return;
     }
 
-    currentTable = selectedTable;
-    showLoading();
+    if (!append) {
+        currentTable = selectedTable;
+        currentData = [];
+        currentTableCursor = null;
+        showLoading();
+    }
 
     const token = localStorage.getItem('auth_token');
+    const params = new URLSearchParams({ limit: TABLE_PAGE_SIZE });
+    if (append && currentTableCursor) {
+        params.set('cursor', currentTableCursor);
+    }
 
     try {
-        const response = await fetch(`/admin/data/${selectedTable}`, {
+        const response = await fetch(`/admin/data/${selectedTable}?${params.toString()}`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -9415,9 +9439,11 @@ async function loadTableData() {
         const data = await response.json();
 
         if (data.success) {
-            currentData = data.data;
-            displayTableData(data.data, data.columns);
-            updateTableInfo(selectedTable, data.data.length);
+            currentData = currentData.concat(data.data);
+            currentColumns = data.columns;
+            currentTableCursor = data.next_cursor || null;
+            displayTableData(currentData, currentColumns);
+            updateTableInfo(selectedTable, currentData.length);
         } else {
             showToast('加载数据失败: ' + data.message, 'danger');
             showNoData();
@@ -9472,6 +9498,15 @@ function displayTableData(data, columns) {
 
         return `<tr>${dataCells}${actionCell}</tr>`;
     }).join('');
+
+    // 还有更多数据时显示"加载更多"行
+    if (currentTableCursor) {
+        tableBody.innerHTML += `<tr><td colspan="${columns.length + 1}" class="text-center">
+            <button class="btn btn-outline-primary btn-sm" onclick="loadTableData(true)">
+                <i class="bi bi-chevron-double-down"></i> 加载更多
+            </button>
+        </td></tr>`;
+    }
 }
 
 // HTML转义函数
@@ -9485,7 +9520,7 @@ function escapeHtml(text) {
 function updateTableInfo(tableName, recordCount) {
     const description = tableDescriptions[tableName] || tableName;
     document.getElementById('tableTitle').innerHTML = `<i class="bi bi-table"></i> ${description}`;
-    document.getElementById('recordCount').textContent = recordCount;
+    document.getElementById('recordCount').textContent = currentTableCursor ? `${recordCount}+` : recordCount;
 
     // 启用清空按钮
     document.getElementById('clearBtn').disabled = false;
@@ -9510,7 +9545,7 @@ async function exportTableData() {
 
     try {
         const token = localStorage.getItem('auth_token');
-        const response = await fetch(`/admin/data/${currentTable}/export`, {
+        const response = await fetch(`/admin/data/${currentTable}/export?format=csv`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -9522,7 +9557,7 @@ async function exportTableData() {
             const a = document.createElement('a');
             a.style.display = 'none';
             a.href = url;
-            a.download = `${currentTable}_${new Date().toISOString().slice(0, 10)}.xlsx`;
+            a.download = `${currentTable}_${new Date().toISOString().slice(0, 10)}.csv`;
             document.body.appendChild(a);
             a.click();
             window.URL.revokeObjectURL(url);
@@ -0,0 +1,152 @@
+"""
+访问日志 - 每个请求一条结构化记录，按路由采样，写日志不占用请求处理时间
+
+- 纯 ASGI 中间件，只记录方法、路径、状态码和耗时，不在请求路径上查询登录用户
+- 按路径前缀匹配规则决定采样率：管理后台轮询的接口（日志、扫码状态、统计）默认不记录，
+  但 5xx 错误和超过 slow_threshold_ms 的慢请求总是记录
+- 需要记录的请求放入有界队列，由后台线程解析登录用户并写入 loguru；队列满时丢弃并计数
+"""
+
+import queue
+import random
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from loguru import logger
+
+# 根据 Bearer token 返回用户描述（如 "admin#1"），未登录返回 None
+UserResolver = Callable[[str], Optional[str]]
+
+
+class AccessLogger:
+    """访问日志的采样判断和后台写入"""
+
+    def __init__(self, enabled: bool = True, sample_rate: float = 1.0, slow_threshold_ms: float = 1000,
+                 rules: Optional[List[dict]] = None, queue_size: int = 10000,
+                 resolve_user: Optional[UserResolver] = None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold_ms / 1000
+        # [(路径前缀, 采样率)]，按配置顺序匹配第一条
+        self.rules: List[Tuple[str, float]] = [
+            (rule['prefix'], float(rule.get('sample_rate', 0))) for rule in (rules or []) if rule.get('prefix')
+        ]
+        self.resolve_user = resolve_user
+        self.dropped = 0
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self._rates = {}  # {路径: 采样率}，避免每个请求重复匹配前缀
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def rate_for(self, path: str) -> float:
+        rate = self._rates.get(path)
+        if rate is None:
+            rate = self.sample_rate
+            for prefix, rule_rate in self.rules:
+                if path.startswith(prefix):
+                    rate = rule_rate
+                    break
+            if len(self._rates) < 4096:
+                self._rates[path] = rate
+        return rate
+
+    def record(self, scope: dict, status: int, duration: float):
+        """请求结束时调用（请求路径上只做采样判断和入队）"""
+        if not self.enabled:
+            return
+        slow = duration >= self.slow_threshold
+        if status < 500 and not slow:
+            rate = self.rate_for(scope['path'])
+            if rate <= 0 or (rate < 1 and random.random() >= rate):
+                return
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((time.time(), scope, status, duration, slow))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='access-log', daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: float = 5) -> bool:
+        """等待队列中的记录写完（测试和退出时使用）"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                self._write(*entry)
+            except Exception as e:
+                logger.debug(f"写访问日志失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, timestamp: float, scope: dict, status: int, duration: float, slow: bool):
+        headers = dict(scope.get('headers') or [])
+        user = None
+        authorization = headers.get(b'authorization', b'').decode('latin-1')
+        if authorization.startswith('Bearer ') and self.resolve_user:
+            user = self.resolve_user(authorization[7:])
+        client = scope.get('client')
+        fields = {
+            'method': scope.get('method', ''),
+            'path': scope['path'],
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'user': user or '-',
+            'client': client[0] if client else '-',
+            'ts': round(timestamp, 3),
+        }
+        message = 'access ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        level = 'WARNING' if status >= 500 or slow else 'INFO'
+        logger.bind(access=fields).log(level, message)
+
+
+class AccessLogMiddleware:
+    """纯 ASGI 访问日志中间件：app.add_middleware(AccessLogMiddleware, access_logger=...)"""
+
+    def __init__(self, app, access_logger: AccessLogger):
+        self.app = app
+        self.access_logger = access_logger
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.access_logger.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.access_logger.record(scope, status, time.perf_counter() - started)
+
+
+def create_access_logger(resolve_user: Optional[UserResolver] = None) -> AccessLogger:
+    """按 global_config.yml 的 ACCESS_LOG 配置创建访问日志记录器"""
+    from config import config
+    log_config = config.get('ACCESS_LOG', {}) or {}
+    return AccessLogger(
+        enabled=log_config.get('enabled', True),
+        sample_rate=log_config.get('sample_rate', 1.0),
+        slow_threshold_ms=log_config.get('slow_threshold_ms', 1000),
+        rules=log_config.get('rules', []),
+        queue_size=log_config.get('queue_size', 10000),
+        resolve_user=resolve_user,
+    )
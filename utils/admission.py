@@ -0,0 +1,201 @@
+"""
+Web 准入控制 - 按路由类别限制同时处理的请求数，排队已满或排队超时直接返回 503，
+并为 Web 接口提供专用的有界数据库线程池
+
+- 按路径前缀把请求分为 interactive（登录、验证码等交互接口）、normal（默认）、heavy（导出、备份、统计）
+  和 exempt（健康检查、指标、静态文件，不限制）；每类最多 max_concurrent 个请求同时处理，
+  其余最多 max_queue 个排队，等待超过 queue_timeout 秒或队列已满时返回 503 和 Retry-After
+- 各类并发上限之和小于 Starlette 默认线程池（40个线程），重查询占满自己的名额后，
+  登录等交互接口仍有线程可用，不会一起卡住
+- async 接口中的数据库调用通过 db_executor.run() 在专用线程池中执行，不阻塞 Web 事件循环；
+  流式导出通过 db_executor.iterate() 在同一线程池中逐批读取
+"""
+
+import asyncio
+import functools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from utils.metrics import WEB_ADMISSION_WAIT_SECONDS, WEB_REQUESTS_SHED_TOTAL
+
+# 拒绝原因
+REJECT_QUEUE_FULL = 'queue_full'
+REJECT_QUEUE_TIMEOUT = 'queue_timeout'
+
+DEFAULT_CLASSES = {
+    'interactive': {'max_concurrent': 16, 'max_queue': 64, 'queue_timeout': 5},
+    'normal': {'max_concurrent': 12, 'max_queue': 64, 'queue_timeout': 10},
+    'heavy': {'max_concurrent': 2, 'max_queue': 4, 'queue_timeout': 2},
+}
+
+_END = object()
+
+
+class RouteClassLimiter:
+    """一类路由的并发名额和排队（仅在 Web 事件循环中使用）"""
+
+    def __init__(self, name: str, max_concurrent: int = 8, max_queue: int = 32, queue_timeout: float = 5):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None  # 首次使用时在 Web 事件循环中创建
+
+    async def acquire(self) -> Optional[str]:
+        """获取处理名额，成功返回None，被拒绝时返回原因"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                return REJECT_QUEUE_FULL
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                return REJECT_QUEUE_TIMEOUT
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+        return None
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'shed': self.shed,
+        }
+
+
+class AdmissionController:
+    """按路径前缀把请求分类并限流"""
+
+    def __init__(self, enabled: bool = True, classes: Optional[Dict[str, dict]] = None,
+                 rules: Optional[List[dict]] = None, default_class: str = 'normal'):
+        self.enabled = enabled
+        self.limiters: Dict[str, RouteClassLimiter] = {
+            name: RouteClassLimiter(name, **(settings or {}))
+            for name, settings in (classes or DEFAULT_CLASSES).items()
+        }
+        # [(路径前缀, 类别)]，按配置顺序匹配第一条
+        self.rules: List[Tuple[str, str]] = [
+            (rule['prefix'], rule.get('class', default_class)) for rule in (rules or []) if rule.get('prefix')
+        ]
+        self.default_class = default_class
+        self._classes: Dict[str, str] = {}  # {路径: 类别}，避免每个请求重复匹配前缀
+
+    def class_for(self, path: str) -> str:
+        route_class = self._classes.get(path)
+        if route_class is None:
+            route_class = self.default_class
+            for prefix, rule_class in self.rules:
+                if path.startswith(prefix):
+                    route_class = rule_class
+                    break
+            if len(self._classes) < 4096:
+                self._classes[path] = route_class
+        return route_class
+
+    def limiter_for(self, path: str) -> Optional[RouteClassLimiter]:
+        """请求所属类别的限流器，exempt 或未配置的类别返回None"""
+        return self.limiters.get(self.class_for(path))
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+
+
+class AdmissionMiddleware:
+    """纯 ASGI 准入控制中间件：app.add_middleware(AdmissionMiddleware, controller=...)"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        limiter = self.controller.limiter_for(scope['path'])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        reason = await limiter.acquire()
+        WEB_ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, limiter.name)
+        if reason is not None:
+            WEB_REQUESTS_SHED_TOTAL.inc(limiter.name, reason)
+            response = JSONResponse({"detail": "服务繁忙，请稍后重试"}, status_code=503,
+                                    headers={"Retry-After": str(max(1, math.ceil(limiter.queue_timeout)))})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+class DBExecutor:
+    """Web 接口专用的数据库线程池"""
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='web-db')
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在数据库线程池中执行 func(*args, **kwargs)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def iterate(self, iterable: Iterable) -> AsyncIterator:
+        """在数据库线程池中逐项读取同步迭代器（流式导出）"""
+        iterator = iter(iterable)
+        while True:
+            item = await self.run(next, iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+
+def _web_admission_config() -> dict:
+    from config import config
+    return config.get('WEB_ADMISSION', {}) or {}
+
+
+def create_admission_controller() -> AdmissionController:
+    """按 global_config.yml 的 WEB_ADMISSION 配置创建准入控制"""
+    admission_config = _web_admission_config()
+    return AdmissionController(
+        enabled=admission_config.get('enabled', True),
+        classes=admission_config.get('classes'),
+        rules=admission_config.get('rules', []),
+        default_class=admission_config.get('default_class', 'normal'),
+    )
+
+
+def create_db_executor() -> DBExecutor:
+    """按 global_config.yml 的 WEB_ADMISSION.db_workers 创建 Web 数据库线程池"""
+    return DBExecutor(max_workers=_web_admission_config().get('db_workers', 8))
+
+
+# 全局准入控制和 Web 数据库线程池实例
+admission_controller = create_admission_controller()
+db_executor = create_db_executor()
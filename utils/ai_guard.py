@@ -0,0 +1,233 @@
+"""
+AI回复保护 - 给大模型调用加时间预算、并发上限和熔断，超时后改用关键词/默认回复
+
+- AI回复的同步调用（openai/requests）放到专用线程池执行，不再阻塞所有账号共用的事件循环
+- 每个AI服务（按 base_url + API Key 的哈希区分，一个账号的 Key 失效不影响使用其他 Key 的账号）：
+    时间预算 budget 秒内未返回时调用方立即得到 None，按原有顺序改用默认回复；
+    调用在线程中继续执行，late_reply 开启且在 late_window 秒内完成时通过回调补发AI回复
+    同时进行的调用最多 max_concurrent 个（含超出预算仍在执行的），超出时直接降级，不排队堆积任务
+- 熔断器：最近 window 次调用中失败（超时或异常）比例达到 failure_rate（至少 min_calls 次），
+  或连续 consecutive_failures 次失败时打开，open_seconds 秒内所有调用直接降级；
+  之后放行一次探测调用，成功则关闭，失败则继续打开
+- 鉴权失败、参数错误等 4xx（408/429 除外）和配置错误（AIConfigError）是调用方的问题，服务本身可用，不计入熔断失败率；
+  其他异常（包括响应不是JSON，如网关返回的HTML错误页）都计入
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from utils.metrics import AI_REPLY_SECONDS, AI_REPLY_FALLBACK_TOTAL
+
+# 熔断器状态
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# 降级原因
+FALLBACK_TIMEOUT = 'timeout'
+FALLBACK_ERROR = 'error'
+FALLBACK_CIRCUIT_OPEN = 'circuit_open'
+FALLBACK_SATURATED = 'saturated'
+FALLBACK_CLIENT_ERROR = 'client_error'
+
+# 表示服务繁忙的 4xx，仍计入熔断失败率
+_RETRYABLE_STATUS = (408, 429)
+
+
+def provider_key(base_url: Optional[str], api_key: Optional[str]) -> str:
+    """AI服务的区分键：base_url + API Key 的哈希（不在日志和监控中暴露 Key）"""
+    digest = hashlib.sha256((api_key or '').encode()).hexdigest()[:8]
+    return f"{base_url or 'default'}#{digest}"
+
+
+class AIConfigError(Exception):
+    """AI回复配置错误（如 API 地址缺少必需的参数），不计入熔断失败率"""
+
+
+def is_client_error(error: BaseException) -> bool:
+    """鉴权/参数错误（4xx，408/429 除外）或配置错误"""
+    if isinstance(error, AIConfigError):
+        return True
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in _RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """按失败率和连续失败次数打开的熔断器（只在事件循环线程中使用）"""
+
+    def __init__(self, window: int = 20, min_calls: int = 10, failure_rate: float = 0.5,
+                 consecutive_failures: int = 5, open_seconds: float = 30):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.consecutive_failures = consecutive_failures
+        self.open_seconds = open_seconds
+        self.state = STATE_CLOSED
+        self._results = deque(maxlen=window)  # 最近的调用结果，True 表示失败
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """是否放行一次调用；打开状态超过 open_seconds 后放行一次探测调用"""
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = STATE_HALF_OPEN
+            self._probing = False
+        if self.state == STATE_HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        """放行的调用未实际执行时归还探测名额"""
+        self._probing = False
+
+    def record(self, failed: bool):
+        if self.state == STATE_HALF_OPEN:
+            self._probing = False
+            if failed:
+                self._open()
+            else:
+                self.state = STATE_CLOSED
+                self._results.clear()
+                self._consecutive = 0
+            return
+        self._results.append(failed)
+        self._consecutive = self._consecutive + 1 if failed else 0
+        if self.state != STATE_CLOSED:
+            return
+        failures = sum(self._results)
+        if (self._consecutive >= self.consecutive_failures or
+                (len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate)):
+            self._open()
+
+    def _open(self):
+        self.state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self._consecutive = 0
+
+
+class _Provider:
+    __slots__ = ('breaker', 'inflight')
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.inflight = 0
+
+
+class AIReplyGuard:
+    """AI回复调用保护（所有账号共用，在账号任务所在的事件循环中调用）"""
+
+    def __init__(self, enabled: bool = True, budget: float = 8.0, max_concurrent: int = 4,
+                 late_reply: bool = False, late_window: float = 30.0, max_workers: int = 16,
+                 breaker: Optional[dict] = None):
+        self.enabled = enabled
+        self.budget = budget
+        self.max_concurrent = max(1, max_concurrent)
+        self.late_reply = late_reply
+        self.late_window = late_window
+        self.breaker_config = breaker or {}
+        self._providers: Dict[str, _Provider] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='ai-reply')
+
+    def _provider(self, provider: str) -> _Provider:
+        state = self._providers.get(provider)
+        if state is None:
+            state = self._providers[provider] = _Provider(CircuitBreaker(**self.breaker_config))
+        return state
+
+    def state(self, provider: str) -> str:
+        """熔断器状态（closed/open/half_open）"""
+        return self._provider(provider).breaker.state
+
+    async def call(self, provider: str, func: Callable[..., Any], *args,
+                   on_late: Callable[[Any], Awaitable[None]] = None) -> Any:
+        """在线程池中执行 func(*args)，超出时间预算、并发已满、熔断打开或出错时返回 None
+
+        on_late: 超出预算但在 late_window 秒内完成时以结果调用（需开启 late_reply）
+        """
+        loop = asyncio.get_running_loop()
+        if not self.enabled:
+            return await loop.run_in_executor(self._executor, func, *args)
+
+        state = self._provider(provider)
+        if not state.breaker.allow():
+            AI_REPLY_FALLBACK_TOTAL.inc(provider, FALLBACK_CIRCUIT_OPEN)
+            logger.debug(f"AI服务 {provider} 熔断中，改用默认回复")
+            return None
+        if state.inflight >= self.max_concurrent:
+            state.breaker.release()
+            AI_REPLY_FALLBACK_TOTAL.inc(provider, FALLBACK_SATURATED)
+            logger.warning(f"AI服务 {provider} 同时进行的调用已达上限 {self.max_concurrent}，改用默认回复")
+            return None
+
+        started = time.monotonic()
+        state.inflight += 1
+        future = loop.run_in_executor(self._executor, func, *args)
+        timed_out = False
+
+        def on_done(done_future: asyncio.Future):
+            # 调用真正结束（包括超出预算后才完成）时才释放并发名额
+            state.inflight -= 1
+            elapsed = time.monotonic() - started
+            AI_REPLY_SECONDS.observe(elapsed, provider)
+            if not timed_out:
+                return
+            if done_future.cancelled() or done_future.exception() is not None:
+                return
+            result = done_future.result()
+            if result and on_late is not None and self.late_reply and elapsed <= self.late_window:
+                logger.info(f"AI服务 {provider} 超时的调用在 {elapsed:.1f}秒后返回，补发AI回复")
+                loop.create_task(on_late(result))
+
+        future.add_done_callback(on_done)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.budget)
+        except asyncio.TimeoutError:
+            timed_out = True
+            state.breaker.record(True)
+            AI_REPLY_FALLBACK_TOTAL.inc(provider, FALLBACK_TIMEOUT)
+            logger.warning(f"AI服务 {provider} 超过 {self.budget}秒未返回，改用默认回复")
+            return None
+        except Exception as e:
+            if is_client_error(e):
+                # 服务可用，只是这个 Key 或配置有问题：不计入失败率，半开状态下归还探测名额
+                state.breaker.release()
+                AI_REPLY_FALLBACK_TOTAL.inc(provider, FALLBACK_CLIENT_ERROR)
+                logger.error(f"AI服务 {provider} 拒绝了请求（请检查API Key和配置），改用默认回复: {e}")
+                return None
+            state.breaker.record(True)
+            AI_REPLY_FALLBACK_TOTAL.inc(provider, FALLBACK_ERROR)
+            logger.error(f"AI服务 {provider} 调用失败，改用默认回复: {e}")
+            return None
+        state.breaker.record(False)
+        return result
+
+
+def create_ai_reply_guard() -> AIReplyGuard:
+    """按 global_config.yml 的 AI_REPLY_GUARD 配置创建AI回复保护"""
+    from config import config
+    guard_config = config.get('AI_REPLY_GUARD', {}) or {}
+    return AIReplyGuard(
+        enabled=guard_config.get('enabled', True),
+        budget=guard_config.get('budget', 8.0),
+        max_concurrent=guard_config.get('max_concurrent', 4),
+        late_reply=guard_config.get('late_reply', False),
+        late_window=guard_config.get('late_window', 30.0),
+        max_workers=guard_config.get('max_workers', 16),
+        breaker=guard_config.get('breaker'),
+    )
+
+
+# 全局AI回复保护实例
+ai_reply_guard = create_ai_reply_guard()
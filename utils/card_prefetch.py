@@ -0,0 +1,232 @@
+"""
+API卡券预取池 - 提前调用卡券API取好内容，发货时直接取用，API的延迟和故障不再落在买家身上
+
+- 在卡券API配置中设置 prefetch_high（池上限，0 或不设为关闭）和 prefetch_low（下限，0 或不设为上限的一半）开启
+- 预取的内容保存在数据库 card_prefetch_pool 表中（重启不丢失），发货时在数据库锁内取出并删除最早的一条，
+  同一条内容不会发给两个订单；池为空时调用方照常实时调用API
+- 池中数量低于下限时在后台补充到上限：长连接复用的 aiohttp 会话，失败时指数退避重试，
+  连续失败 max_retries 次后暂停 cooldown 秒再补充
+- 每条内容记录取内容时API配置（地址/方法/请求头/参数）的摘要，修改配置后旧内容不再发出并在下次补充时清除
+- POST 参数中含 {order_id} 等订单相关占位符的卡券需要按订单调用，不做预取
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+from loguru import logger
+
+from utils.metrics import CARD_PREFETCH_TOTAL, CARD_PREFETCH_FETCHES_TOTAL
+
+# 发货时按订单替换的占位符（见 XianyuLive._replace_api_dynamic_params）
+_DYNAMIC_PARAM = re.compile(r'\{(order_id|item_id|buyer_id|cookie_id|spec_name|spec_value|'
+                            r'order_amount|order_quantity|item_detail)\}')
+
+
+def parse_api_config(api_config) -> dict:
+    """解析卡券API配置（数据库中为JSON字符串，headers/params 也可能是JSON字符串）"""
+    if isinstance(api_config, str):
+        api_config = json.loads(api_config) if api_config else {}
+    api_config = dict(api_config or {})
+    for key in ('headers', 'params'):
+        value = api_config.get(key) or '{}'
+        if isinstance(value, str):
+            value = json.loads(value)
+        api_config[key] = value
+    api_config['method'] = (api_config.get('method') or 'GET').upper()
+    return api_config
+
+
+def extract_card_content(response_text: str):
+    """从API响应中提取卡券内容：JSON对象取 data/content/card 字段，否则使用原始文本"""
+    try:
+        result = json.loads(response_text)
+        if isinstance(result, dict):
+            return result.get('data') or result.get('content') or result.get('card') or str(result)
+        return str(result)
+    except Exception:
+        return response_text
+
+
+async def request_api_card(session: aiohttp.ClientSession, method: str, url: str, headers: dict,
+                           params: dict, timeout: float) -> Tuple[int, str]:
+    """发起卡券API请求（GET 参数放在URL中，POST 以JSON发送），返回 (状态码, 响应文本)"""
+    timeout_obj = aiohttp.ClientTimeout(total=timeout)
+    if method == 'POST':
+        request = session.post(url, headers=headers, json=params, timeout=timeout_obj)
+    else:
+        request = session.get(url, headers=headers, params=params, timeout=timeout_obj)
+    async with request as response:
+        return response.status, await response.text()
+
+
+def prefetch_settings(api_config) -> Optional[dict]:
+    """卡券的预取设置 {'api', 'low', 'high', 'hash'}，未开启或不能预取时返回None"""
+    try:
+        api = parse_api_config(api_config)
+        high = int(api.get('prefetch_high') or 0)
+        low = int(api.get('prefetch_low') or 0) or high // 2
+    except (TypeError, ValueError):
+        return None
+    if high <= 0 or not api.get('url') or api['method'] not in ('GET', 'POST'):
+        return None
+    if api['method'] == 'POST' and _DYNAMIC_PARAM.search(json.dumps(api['params'], ensure_ascii=False)):
+        return None
+    identity = json.dumps([api['url'], api['method'], api['headers'], api['params']],
+                          ensure_ascii=False, sort_keys=True)
+    return {
+        'api': api,
+        'low': max(1, min(low, high)),
+        'high': high,
+        'hash': hashlib.sha1(identity.encode('utf-8')).hexdigest(),
+    }
+
+
+class CardPrefetcher:
+    """API卡券预取（所有账号共用，仅在账号任务所在的事件循环中使用）"""
+
+    def __init__(self, enabled: bool = True, max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, cooldown: float = 300.0, pool_size: int = 10, db=None):
+        self.enabled = enabled
+        self.max_retries = max(1, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cooldown = cooldown
+        self.pool_size = pool_size
+        self._db = db
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._refills: Dict[int, asyncio.Task] = {}  # {card_id: 正在进行的补充任务}
+        self._paused_until: Dict[int, float] = {}  # {card_id: 连续失败后暂停补充的截止时间}
+        self._started = False
+        self.stats = {'hits': 0, 'misses': 0, 'fetched': 0, 'fetch_failures': 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            from db_manager import db_manager
+            self._db = db_manager
+        return self._db
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_size, ttl_dns_cache=300,
+                                             keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def start(self):
+        """为所有开启预取的API卡券补充预取池（多个账号启动时只执行一次）"""
+        if not self.enabled or self._started:
+            return
+        self._started = True
+        for card in self.db.get_prefetch_api_cards():
+            settings = prefetch_settings(card['api_config'])
+            if settings:
+                self.schedule_refill(card['id'], settings)
+
+    async def take(self, rule: dict) -> Optional[str]:
+        """发货时从预取池取一条内容，未开启预取或池为空时返回None（由调用方实时调用API）"""
+        if not self.enabled:
+            return None
+        settings = prefetch_settings(rule.get('api_config'))
+        if settings is None:
+            return None
+        card_id = rule['card_id']
+        content = self.db.take_prefetched_card_content(card_id, settings['hash'])
+        if content:
+            self.stats['hits'] += 1
+            CARD_PREFETCH_TOTAL.inc('hit')
+            logger.info(f"从预取池取得API卡券内容: 卡券ID={card_id}")
+        else:
+            self.stats['misses'] += 1
+            CARD_PREFETCH_TOTAL.inc('miss')
+            logger.warning(f"API卡券预取池为空，实时调用API: 卡券ID={card_id}")
+        self.schedule_refill(card_id, settings)
+        return content
+
+    def schedule_refill(self, card_id: int, settings: dict):
+        """池中数量低于下限时在后台补充（同一卡券同时只有一个补充任务）"""
+        task = self._refills.get(card_id)
+        if task is not None and not task.done():
+            return
+        if time.monotonic() < self._paused_until.get(card_id, 0):
+            return
+        self._refills[card_id] = asyncio.get_running_loop().create_task(self._refill(card_id, settings))
+
+    async def _fetch(self, api: dict) -> Optional[str]:
+        """调用一次卡券API，失败返回None"""
+        try:
+            status, text = await request_api_card(self._get_session(), api['method'], api['url'],
+                                                  api['headers'], api['params'], api.get('timeout', 10))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"预取API卡券网络异常: {e}")
+            return None
+        if status != 200:
+            logger.warning(f"预取API卡券失败: {status} - {text[:200]}")
+            return None
+        content = extract_card_content(text)
+        return str(content) if content else None
+
+    async def _refill(self, card_id: int, settings: dict):
+        failures = 0
+        try:
+            count = self.db.count_prefetched_card_contents(card_id, settings['hash'])
+            if count >= settings['low']:
+                return
+            logger.info(f"补充API卡券预取池: 卡券ID={card_id}, 当前 {count} 条, 补充到 {settings['high']} 条")
+            while count < settings['high']:
+                content = await self._fetch(settings['api'])
+                if content:
+                    failures = 0
+                    self.stats['fetched'] += 1
+                    CARD_PREFETCH_FETCHES_TOTAL.inc('success')
+                    count = self.db.add_prefetched_card_content(card_id, settings['hash'], content)
+                    continue
+                failures += 1
+                self.stats['fetch_failures'] += 1
+                CARD_PREFETCH_FETCHES_TOTAL.inc('failure')
+                if failures >= self.max_retries:
+                    self._paused_until[card_id] = time.monotonic() + self.cooldown
+                    logger.error(f"API卡券预取连续失败 {failures} 次，{self.cooldown:.0f}秒后再补充: 卡券ID={card_id}")
+                    return
+                await asyncio.sleep(self._backoff(failures - 1))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"补充API卡券预取池失败: 卡券ID={card_id}, {e}")
+        finally:
+            self._refills.pop(card_id, None)
+
+    async def close(self):
+        for task in list(self._refills.values()):
+            task.cancel()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+def create_card_prefetcher() -> CardPrefetcher:
+    """按 global_config.yml 的 CARD_PREFETCH 配置创建API卡券预取"""
+    from config import config
+    prefetch_config = config.get('CARD_PREFETCH', {}) or {}
+    return CardPrefetcher(
+        enabled=prefetch_config.get('enabled', True),
+        max_retries=prefetch_config.get('max_retries', 5),
+        backoff_base=prefetch_config.get('backoff_base', 1.0),
+        backoff_max=prefetch_config.get('backoff_max', 60.0),
+        cooldown=prefetch_config.get('cooldown', 300.0),
+        pool_size=prefetch_config.get('pool_size', 10),
+    )
+
+
+# 全局API卡券预取实例
+card_prefetcher = create_card_prefetcher()
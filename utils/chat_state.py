@@ -0,0 +1,128 @@
+"""
+会话状态缓存 - 每条买家消息决定如何回复时需要的状态放在内存中，不再每条消息查询数据库
+
+- 账号级：关键词列表、AI回复设置，首次使用时从数据库加载，后台接口修改后由
+  db_manager 的写入方法调用 invalidate_account 失效，下一条消息重新加载
+- 会话级（按 (账号, chat_id)）：议价次数等，首次使用时加载，之后随写入在内存中更新
+  （写入本身经写后队列异步落库）；按 LRU 最多保留 capacity 个会话，记录使用 __slots__
+- 失效与加载并发时（后台线程修改设置、事件循环线程正在加载），按失效次数丢弃加载期间发生过失效的结果
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class ChatState:
+    """单个会话的状态，None 表示尚未从数据库加载"""
+
+    __slots__ = ('bargain_count',)
+
+    def __init__(self):
+        self.bargain_count: Optional[int] = None
+
+
+class ChatStateStore:
+    """账号设置和会话状态的内存缓存（线程安全）"""
+
+    def __init__(self, capacity: int = 10000, enabled: bool = True):
+        self.capacity = max(1, capacity)
+        self.enabled = enabled
+        self._chats: 'OrderedDict[Tuple[str, str], ChatState]' = OrderedDict()
+        self._accounts: Dict[str, Dict[Hashable, Any]] = {}
+        self._epoch = 0  # 失效次数
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def chat(self, cookie_id: str, chat_id: str) -> ChatState:
+        """获取会话状态（不存在时创建），并标记为最近使用"""
+        key = (cookie_id, chat_id)
+        with self._lock:
+            state = self._chats.get(key)
+            if state is None:
+                state = self._chats[key] = ChatState()
+                if len(self._chats) > self.capacity:
+                    self._chats.popitem(last=False)
+            else:
+                self._chats.move_to_end(key)
+            return state
+
+    def account_value(self, cookie_id: str, name: Hashable, loader: Callable[[], Any]) -> Any:
+        """获取账号级缓存值，未缓存时调用 loader 从数据库加载"""
+        if not self.enabled:
+            return loader()
+        with self._lock:
+            values = self._accounts.get(cookie_id)
+            if values is not None and name in values:
+                self.hits += 1
+                return values[name]
+            self.misses += 1
+            epoch = self._epoch
+
+        value = loader()
+        with self._lock:
+            # 加载期间发生过失效时不缓存，避免缓存旧数据
+            if self._epoch == epoch:
+                self._accounts.setdefault(cookie_id, {})[name] = value
+        return value
+
+    def bargain_count(self, cookie_id: str, chat_id: str, loader: Callable[[], int]) -> int:
+        """会话的议价次数，未加载时调用 loader 从数据库统计"""
+        if not self.enabled:
+            return loader()
+        state = self.chat(cookie_id, chat_id)
+        if state.bargain_count is None:
+            count = loader()
+            with self._lock:
+                if state.bargain_count is None:
+                    state.bargain_count = count
+        return state.bargain_count
+
+    def add_bargain(self, cookie_id: str, chat_id: str):
+        """保存了一条用户议价消息，已加载的议价次数加一"""
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._chats.get((cookie_id, chat_id))
+            if state is not None and state.bargain_count is not None:
+                state.bargain_count += 1
+
+    def invalidate_account(self, cookie_id: str = None, name: Hashable = None):
+        """账号设置被修改后调用；cookie_id 为空时失效所有账号，name 为空时失效该账号的所有缓存值"""
+        with self._lock:
+            self._epoch += 1
+            if cookie_id is None:
+                self._accounts.clear()
+                return
+            values = self._accounts.get(cookie_id)
+            if values is None:
+                return
+            if name is None:
+                del self._accounts[cookie_id]
+            else:
+                values.pop(name, None)
+
+    def invalidate_chats(self, cookie_id: str = None):
+        """丢弃会话状态（删除账号、恢复备份后调用），下次使用时重新加载"""
+        with self._lock:
+            if cookie_id is None:
+                self._chats.clear()
+            else:
+                for key in [key for key in self._chats if key[0] == cookie_id]:
+                    del self._chats[key]
+
+    def __len__(self):
+        return len(self._chats)
+
+
+def create_chat_state_store() -> ChatStateStore:
+    """按 global_config.yml 的 CHAT_STATE 配置创建会话状态缓存"""
+    from config import config
+    state_config = config.get('CHAT_STATE', {}) or {}
+    return ChatStateStore(capacity=state_config.get('capacity', 10000),
+                          enabled=state_config.get('enabled', True))
+
+
+# 全局会话状态缓存实例
+chat_state_store = create_chat_state_store()
@@ -1,195 +1,273 @@
 import os
-import uuid
+import asyncio
 import hashlib
-from PIL import Image
+import threading
+from io import BytesIO
 from typing import Optional, Tuple
 from loguru import logger
 
 class ImageManager:
-    """图片管理器，负责图片的保存、压缩和访问"""
-    
+    """图片管理器，负责图片的保存、压缩和访问
+
+    图片按内容寻址存储：文件名为上传内容的sha256，相同图片只保存一份；
+    尺寸、格式和缩略图路径记录在数据库 image_store 表中，按引用计数删除。
+    """
+
     def __init__(self, upload_dir: str = "static/uploads/images"):
         """初始化图片管理器
-        
+
         Args:
             upload_dir: 图片上传目录
         """
         self.upload_dir = upload_dir
+        self.thumb_dir = os.path.join(upload_dir, "thumbs")
         self.max_size = 5 * 1024 * 1024  # 5MB
         self.max_width = 1920
         self.max_height = 1080
+        self.max_dimension = 4096  # 输入最大边长（允许手机长截图）
+        self.max_pixels = 8 * 1024 * 1024  # 输入最大像素总数
+        self.max_output_dimension = 2048  # 输出最大边长
+        self.thumb_size = (320, 320)
         self.allowed_formats = {'JPEG', 'PNG', 'GIF', 'WEBP'}
-        
+        # 保护"查重-写文件-登记"以及"释放-删文件"的原子性
+        self._store_lock = threading.Lock()
+        self._ref_counts_synced = False
+
         # 确保上传目录存在
         self._ensure_upload_dir()
-    
+
     def _ensure_upload_dir(self):
         """确保上传目录存在"""
         try:
             os.makedirs(self.upload_dir, exist_ok=True)
+            os.makedirs(self.thumb_dir, exist_ok=True)
             logger.info(f"图片上传目录已准备: {self.upload_dir}")
         except Exception as e:
             logger.error(f"创建图片上传目录失败: {e}")
             raise
-    
+
+    def _get_db(self):
+        """获取数据库管理器，首次使用时按实际引用修正引用计数"""
+        from db_manager import db_manager
+
+        if not self._ref_counts_synced:
+            self._ref_counts_synced = True
+            fixed = db_manager.sync_image_ref_counts()
+            if fixed:
+                logger.info(f"已修正 {fixed} 张图片的引用计数")
+        return db_manager
+
     def save_image(self, image_data: bytes, original_filename: str = None) -> Optional[str]:
-        """保存图片文件
-        
+        """保存图片文件，相同内容的图片只保存一份并增加引用计数
+
         Args:
             image_data: 图片二进制数据
             original_filename: 原始文件名（可选）
-            
+
         Returns:
             保存成功返回相对路径，失败返回None
         """
         try:
             logger.info(f"开始保存图片，数据大小: {len(image_data)} bytes")
 
-            # 验证图片数据
-            if not self._validate_image_data(image_data):
+            if len(image_data) > self.max_size:
+                logger.warning(f"图片文件过大: {len(image_data)} bytes > {self.max_size} bytes")
+                return None
+
+            file_hash = hashlib.sha256(image_data).hexdigest()
+            db = self._get_db()
+
+            # 已存在相同内容的图片时直接复用，无需解码
+            with self._store_lock:
+                record = db.acquire_image(file_hash)
+            if record and os.path.exists(record['path']):
+                logger.info(f"图片已存在，复用: {record['path']} (引用数: {record['ref_count']})")
+                return record['path']
+
+            # 解码、校验、压缩和生成缩略图在锁外进行
+            processed = self._process_image(image_data)
+            if processed is None:
                 logger.error("图片数据验证失败")
+                if record:
+                    self.delete_image(record['path'])
                 return None
-            
-            # 生成唯一文件名
-            file_hash = hashlib.md5(image_data).hexdigest()
-            file_extension = self._get_image_extension(image_data)
-            filename = f"{file_hash}_{uuid.uuid4().hex[:8]}.{file_extension}"
-            
-            # 完整文件路径
-            file_path = os.path.join(self.upload_dir, filename)
-            
-            # 检查文件是否已存在
-            if os.path.exists(file_path):
-                logger.info(f"图片文件已存在，跳过保存: {filename}")
-                return self._get_relative_path(file_path)
-            
-            # 处理和保存图片
-            processed_image_data = self._process_image(image_data)
-            
-            with open(file_path, 'wb') as f:
-                f.write(processed_image_data)
-            
-            logger.info(f"图片保存成功: {filename}")
-            return self._get_relative_path(file_path)
-            
+
+            file_path = self._get_relative_path(os.path.join(self.upload_dir, f"{file_hash}.{processed['ext']}"))
+            thumb_path = ''
+            if processed['thumb_data']:
+                thumb_path = self._get_relative_path(os.path.join(self.thumb_dir, f"{file_hash}.jpg"))
+
+            with self._store_lock:
+                if record is None:
+                    # 处理期间其他请求可能已保存了相同图片
+                    record = db.acquire_image(file_hash)
+                    if record and os.path.exists(record['path']):
+                        return record['path']
+                if record:
+                    # 记录存在但文件丢失，按原路径补写
+                    file_path, thumb_path = record['path'], record['thumb_path']
+
+                self._write_file(file_path, processed['data'])
+                if thumb_path and processed['thumb_data']:
+                    self._write_file(thumb_path, processed['thumb_data'])
+
+                if record is None and not db.add_image(file_hash, file_path, thumb_path, processed['format'],
+                                                       processed['width'], processed['height'], len(processed['data'])):
+                    self._remove_files(file_path, thumb_path)
+                    return None
+
+            logger.info(f"图片保存成功: {file_path}")
+            return file_path
+
         except Exception as e:
             logger.error(f"保存图片失败: {e}")
             return None
-    
-    def _validate_image_data(self, image_data: bytes) -> bool:
-        """验证图片数据"""
+
+    async def save_image_async(self, image_data: bytes, original_filename: str = None) -> Optional[str]:
+        """在线程池中保存图片，避免解码和压缩阻塞事件循环"""
+        return await asyncio.to_thread(self.save_image, image_data, original_filename)
+
+    def _validate_image(self, img) -> bool:
+        """根据已打开图片的头信息校验格式和尺寸（不触发像素解码）"""
+        if img.format not in self.allowed_formats:
+            logger.warning(f"不支持的图片格式: {img.format}")
+            return False
+
+        width, height = img.size
+        if width > self.max_dimension or height > self.max_dimension:
+            logger.warning(f"图片尺寸过大: {width}x{height}，最大允许: {self.max_dimension}x{self.max_dimension}")
+            return False
+
+        # 检查图片像素总数（防止过大的图片占用太多内存）
+        total_pixels = width * height
+        if total_pixels > self.max_pixels:
+            logger.warning(f"图片像素总数过大: {total_pixels}，最大允许: {self.max_pixels}")
+            return False
+
+        return True
+
+    def _process_image(self, image_data: bytes) -> Optional[dict]:
+        """一次解码完成校验、压缩和缩略图生成
+
+        Returns:
+            {'data', 'ext', 'format', 'width', 'height', 'thumb_data'}，校验失败返回None
+        """
         try:
-            # 检查文件大小
-            if len(image_data) > self.max_size:
-                logger.warning(f"图片文件过大: {len(image_data)} bytes > {self.max_size} bytes")
-                return False
-            
-            # 尝试打开图片验证格式
-            from io import BytesIO
+            from PIL import Image  # 按需加载Pillow，减少启动开销
+
             with Image.open(BytesIO(image_data)) as img:
-                if img.format not in self.allowed_formats:
-                    logger.warning(f"不支持的图片格式: {img.format}")
-                    return False
-                
-                # 检查图片尺寸（允许更大的尺寸，特别是手机长截图）
-                width, height = img.size
-                max_dimension = 4096  # 最大边长4096像素
-                if width > max_dimension or height > max_dimension:
-                    logger.warning(f"图片尺寸过大: {width}x{height}，最大允许: {max_dimension}x{max_dimension}")
-                    return False
-
-                # 检查图片像素总数（防止过大的图片占用太多内存）
-                total_pixels = width * height
-                max_pixels = 8 * 1024 * 1024  # 8M像素
-                if total_pixels > max_pixels:
-                    logger.warning(f"图片像素总数过大: {total_pixels}，最大允许: {max_pixels}")
-                    return False
-            
-            return True
-            
+                if not self._validate_image(img):
+                    return None
+                source_format = img.format
+                img.load()
         except Exception as e:
             logger.error(f"图片验证失败: {e}")
-            return False
-    
-    def _get_image_extension(self, image_data: bytes) -> str:
-        """获取图片扩展名"""
-        try:
-            from io import BytesIO
-            with Image.open(BytesIO(image_data)) as img:
-                format_to_ext = {
-                    'JPEG': 'jpg',
-                    'PNG': 'png',
-                    'GIF': 'gif',
-                    'WEBP': 'webp'
-                }
-                return format_to_ext.get(img.format, 'jpg')
-        except:
-            return 'jpg'
-    
-    def _process_image(self, image_data: bytes) -> bytes:
-        """处理图片（压缩、调整尺寸等）"""
+            return None
+
         try:
-            from io import BytesIO
-            
-            with Image.open(BytesIO(image_data)) as img:
-                # 转换为RGB模式（如果需要）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    # 创建白色背景
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # 调整尺寸（如果需要）- 允许更大的尺寸
-                width, height = img.size
-                max_output_dimension = 2048  # 输出最大边长2048像素
-
-                if width > max_output_dimension or height > max_output_dimension:
-                    # 计算缩放比例，保持宽高比
-                    ratio = min(max_output_dimension / width, max_output_dimension / height)
-                    new_width = int(width * ratio)
-                    new_height = int(height * ratio)
-                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    logger.info(f"图片已调整尺寸: {width}x{height} -> {new_width}x{new_height}")
-                else:
-                    logger.info(f"图片尺寸合适，无需调整: {width}x{height}")
-                
-                # 保存为JPEG格式，适度压缩
-                output = BytesIO()
-                img.save(output, format='JPEG', quality=85, optimize=True)
-                return output.getvalue()
-                
+            # 转换为RGB模式（如果需要）
+            if img.mode in ('RGBA', 'LA', 'P'):
+                # 创建白色背景
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            # 调整尺寸（如果需要）
+            width, height = img.size
+            if width > self.max_output_dimension or height > self.max_output_dimension:
+                # 计算缩放比例，保持宽高比
+                ratio = min(self.max_output_dimension / width, self.max_output_dimension / height)
+                new_width = int(width * ratio)
+                new_height = int(height * ratio)
+                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                logger.info(f"图片已调整尺寸: {width}x{height} -> {new_width}x{new_height}")
+
+            # 保存为JPEG格式，适度压缩
+            output = BytesIO()
+            img.save(output, format='JPEG', quality=85, optimize=True)
+
+            thumb = img.copy()
+            thumb.thumbnail(self.thumb_size)
+            thumb_output = BytesIO()
+            thumb.save(thumb_output, format='JPEG', quality=80)
+
+            return {
+                'data': output.getvalue(),
+                'ext': 'jpg',
+                'format': 'JPEG',
+                'width': img.width,
+                'height': img.height,
+                'thumb_data': thumb_output.getvalue(),
+            }
+
         except Exception as e:
             logger.error(f"图片处理失败: {e}")
-            # 如果处理失败，返回原始数据
-            return image_data
-    
+            # 如果处理失败，保存原始数据
+            format_to_ext = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+            return {
+                'data': image_data,
+                'ext': format_to_ext.get(source_format, 'jpg'),
+                'format': source_format,
+                'width': img.width,
+                'height': img.height,
+                'thumb_data': None,
+            }
+
+    def _write_file(self, file_path: str, data: bytes):
+        """先写临时文件再原子替换，避免并发读取到不完整的图片"""
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+
+    def _remove_files(self, *paths: str):
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+
     def _get_relative_path(self, file_path: str) -> str:
         """获取相对于项目根目录的路径"""
         # 将绝对路径转换为相对路径
         rel_path = os.path.relpath(file_path)
         # 统一使用正斜杠
         return rel_path.replace('\\', '/')
-    
+
+    def _normalize_path(self, image_path: str) -> str:
+        """统一图片路径格式（去掉URL前导斜杠）"""
+        return image_path.replace('\\', '/').lstrip('/')
+
     def delete_image(self, image_path: str) -> bool:
-        """删除图片文件
-        
+        """释放一次图片引用，引用数归零时删除图片文件和缩略图
+
         Args:
             image_path: 图片相对路径
-            
+
         Returns:
             删除成功返回True，失败返回False
         """
         try:
-            # 构建完整路径
+            image_path = self._normalize_path(image_path)
+
+            with self._store_lock:
+                record = self._get_db().release_image(image_path)
+                if record is not None:
+                    if record['ref_count'] > 0:
+                        logger.info(f"图片仍被引用，保留文件: {image_path} (剩余引用数: {record['ref_count']})")
+                        return True
+                    self._remove_files(record['path'], record['thumb_path'])
+                    logger.info(f"图片删除成功: {image_path}")
+                    return True
+
+            # 图片库之前保存的旧图片没有引用记录，直接删除文件
             if not image_path.startswith(self.upload_dir):
                 full_path = os.path.join(os.getcwd(), image_path)
             else:
                 full_path = image_path
-            
+
             if os.path.exists(full_path):
                 os.remove(full_path)
                 logger.info(f"图片删除成功: {image_path}")
@@ -197,30 +275,45 @@ class ImageManager:
             else:
                 logger.warning(f"图片文件不存在: {image_path}")
                 return False
-                
+
         except Exception as e:
             logger.error(f"删除图片失败: {e}")
             return False
-    
+
     def get_image_info(self, image_path: str) -> Optional[dict]:
-        """获取图片信息
-        
+        """获取图片信息，优先使用保存时记录的元数据
+
         Args:
             image_path: 图片相对路径
-            
+
         Returns:
             图片信息字典或None
         """
         try:
+            image_path = self._normalize_path(image_path)
+            record = self._get_db().get_image_by_path(image_path)
+            if record and os.path.exists(record['path']):
+                return {
+                    'width': record['width'],
+                    'height': record['height'],
+                    'format': record['format'],
+                    'mode': 'RGB' if record['format'] == 'JPEG' else None,
+                    'size': record['size'],
+                    'thumb_path': record['thumb_path'],
+                    'ref_count': record['ref_count']
+                }
+
             # 构建完整路径
             if not image_path.startswith(self.upload_dir):
                 full_path = os.path.join(os.getcwd(), image_path)
             else:
                 full_path = image_path
-            
+
             if not os.path.exists(full_path):
                 return None
-            
+
+            from PIL import Image
+
             with Image.open(full_path) as img:
                 return {
                     'width': img.width,
@@ -229,12 +322,12 @@ class ImageManager:
                     'mode': img.mode,
                     'size': os.path.getsize(full_path)
                 }
-                
+
         except Exception as e:
             logger.error(f"获取图片信息失败: {e}")
             return None
 
-    def get_image_size(self, image_path: str) -> tuple:
+    def get_image_size(self, image_path: str) -> Tuple[Optional[int], Optional[int]]:
         """获取图片尺寸
 
         Args:
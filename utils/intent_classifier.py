@@ -0,0 +1,184 @@
+"""
+本地意图分类 - 在调用大模型之前先用关键词规则和朴素贝叶斯判断 price/tech/default 意图
+
+- 规则：常见的议价、技术咨询、物流/寒暄说法的正则，单独命中一类时直接采用
+- 模型：多项式朴素贝叶斯（字 + 相邻两字特征，数字归一），用 ai_conversations 中已记录的用户消息意图训练，
+  纯 Python 实现，单条分类几十微秒；训练数据不足 min_samples 条时只用规则
+- 每个账号单独训练模型（账号的商品和买家说法不同，也不会学到其他账号自定义分类提示词的判断结果）
+- 置信度低于 threshold、多类规则同时命中且模型不能确定、或规则与模型明确矛盾时返回 None，
+  由调用方继续用大模型判断
+- 已记录的意图包含本分类器自己判断的结果，阈值和规则用于限制误判被反复学习
+"""
+
+import math
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+INTENTS = ('price', 'tech', 'default')
+
+# 单独命中一类规则时的置信度
+RULE_CONFIDENCE = 0.95
+
+RULES = [
+    # “刀”只在议价语境中算（50刀、少两刀、刀一下、能刀吗），避免“这把刀锋利吗”被判为议价
+    ('price', re.compile(r'便宜|优惠|少点|少一点|最低|底价|多少钱|价格|价钱|砍价|议价|打折|折扣|能少|'
+                         r'\d+\s*刀|少.{0,4}刀|刀一?下|[能可].{0,2}刀[吗么呗]|'
+                         r'\d+\s*(元|块)?\s*(出|卖|行|可以|拿|包邮)')),
+    ('tech', re.compile(r'怎么用|如何使用|参数|型号|配置|兼容|支持.{0,6}吗|故障|坏了|维修|电池|内存|容量|'
+                        r'尺寸|说明书|安装|功能|屏幕|国行|版本')),
+    ('default', re.compile(r'^(在吗|在么|你好|您好|hi|hello)|还在吗|发货|快递|物流|自提|到货|几天到|已付款|拍了|谢谢',
+                           re.IGNORECASE)),
+]
+
+_TOKEN_PATTERN = re.compile(r'[a-z]+|\d+|[^\W\d_a-z]', re.IGNORECASE)
+
+
+def tokenize(text: str) -> List[str]:
+    """字/英文单词/数字（统一为0）及相邻两项组成的特征"""
+    units = []
+    for unit in _TOKEN_PATTERN.findall(text.lower()):
+        units.append('0' if unit.isdigit() else unit)
+    return units + [units[i] + units[i + 1] for i in range(len(units) - 1)]
+
+
+class NaiveBayesModel:
+    """多项式朴素贝叶斯（拉普拉斯平滑）"""
+
+    def __init__(self, samples: Iterable[Tuple[str, str]]):
+        self.doc_counts: Dict[str, int] = {}
+        self.token_counts: Dict[str, Dict[str, int]] = {}
+        self.token_totals: Dict[str, int] = {}
+        vocabulary = set()
+        for text, intent in samples:
+            self.doc_counts[intent] = self.doc_counts.get(intent, 0) + 1
+            counts = self.token_counts.setdefault(intent, {})
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+                vocabulary.add(token)
+        self.samples = sum(self.doc_counts.values())
+        self.vocabulary = vocabulary
+        # 预先计算对数先验和各类的平滑分母
+        size = len(vocabulary) + 1
+        self.log_priors = {intent: math.log(count / self.samples) for intent, count in self.doc_counts.items()}
+        self.log_denominators = {intent: math.log(sum(counts.values()) + size)
+                                 for intent, counts in self.token_counts.items()}
+
+    def predict_proba(self, text: str) -> Optional[Dict[str, float]]:
+        """各意图的后验概率；没有任何已知特征时返回None"""
+        tokens = [token for token in tokenize(text) if token in self.vocabulary]
+        if not tokens or not self.samples:
+            return None
+        scores = {}
+        for intent, log_prior in self.log_priors.items():
+            counts = self.token_counts[intent]
+            denominator = self.log_denominators[intent]
+            score = log_prior
+            for token in tokens:
+                score += math.log(counts.get(token, 0) + 1) - denominator
+            scores[intent] = score
+        top = max(scores.values())
+        exp_scores = {intent: math.exp(score - top) for intent, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {intent: value / total for intent, value in exp_scores.items()}
+
+
+class IntentClassifier:
+    """规则 + 朴素贝叶斯的本地意图分类器（线程安全，每个账号一个模型，定期用新记录重新训练）"""
+
+    def __init__(self, enabled: bool = True, threshold: float = 0.8, min_samples: int = 50,
+                 max_samples: int = 5000, retrain_interval: float = 3600):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.retrain_interval = retrain_interval
+        self._models: Dict[Optional[str], Optional[NaiveBayesModel]] = {}  # {账号: 模型}
+        self._trained_at: Dict[Optional[str], float] = {}
+        self._train_locks: Dict[Optional[str], threading.Lock] = {}
+        self.decided = 0
+        self.deferred = 0
+
+    def model(self, account: str = None) -> Optional[NaiveBayesModel]:
+        return self._models.get(account)
+
+    def train(self, samples: Iterable[Tuple[str, str]], account: str = None) -> int:
+        """用 [(消息, 意图)] 训练账号的模型，返回使用的样本数；样本不足 min_samples 条时不使用模型"""
+        samples = [(text, intent) for text, intent in samples if text and intent in INTENTS]
+        model = NaiveBayesModel(samples) if len(samples) >= self.min_samples else None
+        self._models[account] = model
+        self._trained_at[account] = time.monotonic()
+        return len(samples) if model else 0
+
+    def _maybe_train(self, loader: Callable[[int], List[Tuple[str, str]]], account: str = None):
+        """首次使用或超过 retrain_interval 时重新训练；其他线程正在训练时继续使用旧模型"""
+        trained_at = self._trained_at.get(account)
+        if trained_at is not None and time.monotonic() - trained_at < self.retrain_interval:
+            return
+        lock = self._train_locks.setdefault(account, threading.Lock())
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            count = self.train(loader(self.max_samples), account)
+            logger.info(f"本地意图分类模型已训练（账号: {account}），样本数: {count}")
+        except Exception as e:
+            self._trained_at[account] = time.monotonic()
+            logger.error(f"训练本地意图分类模型失败（账号: {account}）: {e}")
+        finally:
+            lock.release()
+
+    def classify(self, text: str, account: str = None) -> Tuple[Optional[str], float]:
+        """返回 (意图, 置信度)，无法判断时意图为None"""
+        matched = [intent for intent, pattern in RULES if pattern.search(text)]
+        model = self._models.get(account)
+        probs = model.predict_proba(text) if model is not None else None
+        best = max(probs, key=probs.get) if probs else None
+
+        if len(matched) == 1:
+            intent = matched[0]
+            # 模型有把握地给出其他意图时，规则与模型矛盾，交给大模型判断
+            if best is not None and best != intent and probs[best] >= self.threshold:
+                return None, 1 - probs[best]
+            return intent, max(RULE_CONFIDENCE, probs.get(intent, 0) if probs else 0)
+        if best is None:
+            return None, 0.0
+        if matched and best not in matched:
+            return None, 0.0
+        return best, probs[best]
+
+    def predict(self, text: str, loader: Callable[[int], List[Tuple[str, str]]] = None,
+                account: str = None) -> Optional[str]:
+        """置信度达到 threshold 时返回意图，否则返回None（由大模型判断）
+
+        loader(max_samples) 返回该账号的训练样本 [(消息, 意图)]，传入时按需（重新）训练模型
+        """
+        if not self.enabled or not text:
+            return None
+        if loader is not None:
+            self._maybe_train(loader, account)
+        intent, confidence = self.classify(text, account)
+        if intent is not None and confidence >= self.threshold:
+            self.decided += 1
+            return intent
+        self.deferred += 1
+        return None
+
+
+def create_intent_classifier() -> IntentClassifier:
+    """按 global_config.yml 的 INTENT_CLASSIFIER 配置创建本地意图分类器"""
+    from config import config
+    classifier_config = config.get('INTENT_CLASSIFIER', {}) or {}
+    return IntentClassifier(
+        enabled=classifier_config.get('enabled', True),
+        threshold=classifier_config.get('threshold', 0.8),
+        min_samples=classifier_config.get('min_samples', 50),
+        max_samples=classifier_config.get('max_samples', 5000),
+        retrain_interval=classifier_config.get('retrain_interval', 3600),
+    )
+
+
+# 全局本地意图分类器实例
+intent_classifier = create_intent_classifier()
@@ -0,0 +1,175 @@
+"""
+商品详情缓存 - 有界LRU/TTL缓存，合并同一商品的并发获取
+
+- 容量有限，按最近使用顺序淘汰
+- 成功结果按 ttl 过期，获取失败的结果按较短的 negative_ttl 缓存，避免反复打浏览器/外部API
+- 同一 item_id 的并发查询只触发一次上游获取（single-flight），其余请求等待同一结果
+- 启动时可从数据库 item_info.item_detail 预热
+- 商品详情被保存/删除时 invalidate 删除缓存，并丢弃进行中的获取结果，之后的查询重新获取
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+
+class ItemDetailCache:
+    """商品详情缓存（仅在事件循环线程中使用）"""
+
+    def __init__(self, max_size: int = 2000, ttl: float = 24 * 60 * 60, negative_ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # {item_id: (detail, expires_at)}，detail 为空字符串表示获取失败的负缓存
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # {item_id: asyncio.Task}，正在进行的上游获取
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'fetches': 0,
+            'fetch_failures': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'warm_loaded': 0,
+        }
+
+    def _lookup(self, item_id: str) -> Optional[str]:
+        """查询未过期的缓存，命中时移到LRU队尾；未命中返回None"""
+        entry = self._entries.get(item_id)
+        if entry is None:
+            return None
+        detail, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[item_id]
+            self._stats['expirations'] += 1
+            return None
+        self._entries.move_to_end(item_id)
+        return detail
+
+    def _store(self, item_id: str, detail: str, ttl: float):
+        self._entries[item_id] = (detail, time.time() + ttl)
+        self._entries.move_to_end(item_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, item_id: str) -> Optional[str]:
+        """只查缓存不触发获取；负缓存返回空字符串，未命中返回None"""
+        return self._lookup(item_id)
+
+    def put(self, item_id: str, detail: str):
+        """写入成功获取的详情"""
+        if detail:
+            self._store(item_id, detail, self.ttl)
+
+    def invalidate(self, item_id: str):
+        """删除缓存（商品详情被保存或删除时调用），进行中的获取结果不再写入缓存
+
+        只做单次字典删除，Web接口线程中调用也是安全的
+        """
+        self._entries.pop(item_id, None)
+        self._inflight.pop(item_id, None)
+
+    async def get_or_fetch(self, item_id: str, fetcher: Callable[[str], Awaitable[str]]) -> str:
+        """获取商品详情，缓存未命中时调用 fetcher，同一商品的并发请求共享一次获取
+
+        Args:
+            item_id: 商品ID
+            fetcher: 上游获取函数，返回详情文本，失败返回空字符串
+
+        Returns:
+            str: 商品详情，获取失败返回空字符串
+        """
+        detail = self._lookup(item_id)
+        if detail is not None:
+            self._stats['hits' if detail else 'negative_hits'] += 1
+            return detail
+
+        task = self._inflight.get(item_id)
+        if task is not None:
+            self._stats['coalesced'] += 1
+        else:
+            self._stats['misses'] += 1
+            task = asyncio.ensure_future(self._fetch(item_id, fetcher))
+            self._inflight[item_id] = task
+
+        # shield: 单个等待者被取消时不影响其他等待者和上游获取本身
+        return await asyncio.shield(task)
+
+    async def _fetch(self, item_id: str, fetcher: Callable[[str], Awaitable[str]]) -> str:
+        self._stats['fetches'] += 1
+        try:
+            detail = await fetcher(item_id) or ''
+        except Exception as e:
+            logger.error(f"获取商品详情失败: {item_id}, 错误: {e}")
+            detail = ''
+        finally:
+            # 获取期间被 invalidate 时 _inflight 中已不是本任务，结果只返回给当前等待者
+            invalidated = self._inflight.get(item_id) is not asyncio.current_task()
+            if not invalidated:
+                self._inflight.pop(item_id, None)
+
+        if invalidated:
+            return detail
+        if detail:
+            self._store(item_id, detail, self.ttl)
+        else:
+            self._stats['fetch_failures'] += 1
+            self._store(item_id, '', self.negative_ttl)
+        return detail
+
+    def warm_load(self, items: Iterable[Tuple[str, str, Optional[float]]]) -> int:
+        """从持久化数据预热缓存
+
+        Args:
+            items: [(item_id, detail, updated_at时间戳), ...]，按新到旧排列；
+                   已超过 ttl 的条目会被跳过
+
+        Returns:
+            int: 预热的条目数
+        """
+        now = time.time()
+        loaded = 0
+        for item_id, detail, updated_at in items:
+            if not detail or item_id in self._entries:
+                continue
+            expires_at = (updated_at or now) + self.ttl
+            if expires_at <= now:
+                continue
+            if len(self._entries) >= self.max_size:
+                break
+            self._entries[item_id] = (detail, expires_at)
+            # 按新到旧插入，最新的应处于LRU队尾
+            self._entries.move_to_end(item_id, last=False)
+            loaded += 1
+        self._stats['warm_loaded'] += loaded
+        return loaded
+
+    def stats(self) -> dict:
+        """缓存统计：命中率、进行中的获取数、淘汰数等"""
+        lookups = self._stats['hits'] + self._stats['negative_hits'] + self._stats['misses'] + self._stats['coalesced']
+        return {
+            **self._stats,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'inflight': len(self._inflight),
+            'hit_ratio': round((lookups - self._stats['misses']) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_item_detail_cache() -> ItemDetailCache:
+    """根据配置 ITEM_DETAIL.cache 创建商品详情缓存"""
+    from config import config
+
+    cache_config = config.get('ITEM_DETAIL', {}).get('cache', {}) or {}
+    return ItemDetailCache(
+        max_size=int(cache_config.get('max_size', 2000)),
+        ttl=float(cache_config.get('ttl', 24 * 60 * 60)),
+        negative_ttl=float(cache_config.get('negative_ttl', 300)),
+    )
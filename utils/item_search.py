@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 闲鱼商品搜索模块
-基于 Playwright 实现真实的闲鱼商品搜索功能
+优先直接调用搜索接口（utils.item_search_api），签名失效或触发验证码时
+回退到基于 Playwright 的浏览器搜索
 """
 
 import asyncio
@@ -874,9 +875,64 @@ class XianyuSearcher:
 
 # 搜索器工具函数
 
-async def search_xianyu_items(keyword: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+async def search_xianyu_items(keyword: str, page: int = 1, page_size: int = 20,
+                              filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    搜索闲鱼商品的便捷函数，带重试机制
+    搜索闲鱼商品的便捷函数，优先直接调用搜索接口，签名失效或触发验证码时回退到浏览器
+
+    Args:
+        keyword: 搜索关键词
+        page: 页码
+        page_size: 每页数量
+        filters: 搜索筛选条件（排序、价格区间等，仅接口搜索支持）
+
+    Returns:
+        搜索结果
+    """
+    from utils.item_search_api import get_search_backend, SearchFallbackRequired
+
+    backend = get_search_backend()
+    if backend is not None:
+        try:
+            return await backend.search_items(keyword, page, page_size, filters)
+        except SearchFallbackRequired as e:
+            logger.warning(f"接口搜索需要验证，回退到浏览器搜索: {e}")
+        except Exception as e:
+            logger.error(f"接口搜索异常，回退到浏览器搜索: {e}")
+
+    return await _browser_search_xianyu_items(keyword, page, page_size)
+
+
+async def search_multiple_pages_xianyu(keyword: str, total_pages: int = 1,
+                                       filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    搜索多页闲鱼商品的便捷函数，优先并发调用搜索接口，签名失效或触发验证码时回退到浏览器
+
+    Args:
+        keyword: 搜索关键词
+        total_pages: 总页数
+        filters: 搜索筛选条件（仅接口搜索支持）
+
+    Returns:
+        搜索结果
+    """
+    from utils.item_search_api import get_search_backend, SearchFallbackRequired
+
+    backend = get_search_backend()
+    if backend is not None:
+        try:
+            return await backend.search_multiple_pages(keyword, total_pages, filters)
+        except SearchFallbackRequired as e:
+            logger.warning(f"接口多页搜索需要验证，回退到浏览器搜索: {e}")
+        except Exception as e:
+            logger.error(f"接口多页搜索异常，回退到浏览器搜索: {e}")
+
+    return await _browser_search_multiple_pages_xianyu(keyword, total_pages)
+
+
+async def _browser_search_xianyu_items(keyword: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+    """
+    使用浏览器搜索闲鱼商品，带重试机制
 
     Args:
         keyword: 搜索关键词
@@ -935,9 +991,9 @@ async def search_xianyu_items(keyword: str, page: int = 1, page_size: int = 20)
     }
 
 
-async def search_multiple_pages_xianyu(keyword: str, total_pages: int = 1) -> Dict[str, Any]:
+async def _browser_search_multiple_pages_xianyu(keyword: str, total_pages: int = 1) -> Dict[str, Any]:
     """
-    搜索多页闲鱼商品的便捷函数，带重试机制
+    使用浏览器搜索多页闲鱼商品，带重试机制
 
     Args:
         keyword: 搜索关键词
@@ -0,0 +1,265 @@
+"""
+闲鱼商品搜索 - 直接调用搜索mtop接口（无浏览器）
+
+- 复用 MtopClient 的连接池、签名与Cookie维护，不再为每次搜索启动 Chromium
+- 多页搜索按页并发请求（受 max_concurrent_pages 限制），耗时不再随页数线性增长
+- 短TTL结果缓存，按 关键词/页码/每页数量/筛选条件 作为键
+- 仅在签名失效或触发验证码（风控）时抛出 SearchFallbackRequired，由调用方回退到浏览器搜索
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.mtop_client import (MtopClient, classify_mtop_response, RET_SUCCESS, RET_TOKEN_EXPIRED,
+                               RET_THROTTLED, RET_CAPTCHA, RET_AUTH)
+
+SEARCH_API = 'mtop.taobao.idlemtopsearch.pc.search'
+
+# 与网页版搜索请求一致的默认业务参数
+SEARCH_BASE_DATA = {
+    'fromFilter': False,
+    'sortValue': '',
+    'sortField': '',
+    'customDistance': '',
+    'gps': '',
+    'propValueStr': {},
+    'customGps': '',
+    'searchReqFromPage': 'pcSearch',
+    'extraFilterValue': '{}',
+    'userPositionJson': '{}',
+}
+
+# 需要回退到浏览器的返回码分类：签名失效、限流、风控验证码、需要人工验证
+FALLBACK_KINDS = (RET_TOKEN_EXPIRED, RET_THROTTLED, RET_CAPTCHA, RET_AUTH)
+
+
+class SearchFallbackRequired(Exception):
+    """接口搜索因签名失效或验证码无法完成，需要回退到浏览器搜索"""
+
+
+class MtopSearchBackend:
+    """基于mtop接口的商品搜索后端（仅在所属事件循环中使用）"""
+
+    def __init__(self, cache_ttl: float = 60, cache_size: int = 200, max_concurrent_pages: int = 3,
+                 page_size: int = 30, url: Optional[str] = None):
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.max_concurrent_pages = max(1, max_concurrent_pages)
+        self.page_size = page_size
+        # 自定义接口地址（基准测试指向本地桩服务）
+        self.url = url
+        # {cookie_id: (MtopClient, 创建时数据库中的Cookie)}
+        self._clients: Dict[str, Tuple[MtopClient, str]] = {}
+        # {缓存键: (结果, 过期时间)}
+        self._cache: "OrderedDict[tuple, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._parser = None
+        self.stats = {'queries': 0, 'cache_hits': 0, 'pages_fetched': 0, 'fallbacks': 0, 'errors': 0}
+
+    def _get_parser(self):
+        """复用浏览器搜索器的商品解析逻辑（不会启动浏览器）"""
+        if self._parser is None:
+            from utils.item_search import XianyuSearcher
+            self._parser = XianyuSearcher()
+        return self._parser
+
+    def _get_client(self) -> Optional[MtopClient]:
+        """获取第一个有效账号的mtop客户端，数据库中的Cookie变化时重置"""
+        from db_manager import db_manager
+
+        for cookie in db_manager.get_all_cookies():
+            cookie_id, cookie_value = cookie['id'], cookie['cookie'] or ''
+            if len(cookie_value) <= 50:
+                continue
+            cached = self._clients.get(cookie_id)
+            if cached is None:
+                client = MtopClient(cookie_id, cookie_value,
+                                    on_cookies_updated=lambda cookie_id=cookie_id: self._save_cookies(cookie_id))
+                self._clients[cookie_id] = (client, cookie_value)
+                logger.info(f"搜索使用账户: {cookie_id}")
+                return client
+            client, source_value = cached
+            if source_value != cookie_value:
+                client.jar.reset(cookie_value)
+                self._clients[cookie_id] = (client, cookie_value)
+            return client
+        return None
+
+    async def _save_cookies(self, cookie_id: str):
+        """响应刷新了 _m_h5_tk 等Cookie时写回数据库，账号任务重启和下次搜索都使用新的Cookie"""
+        from db_manager import db_manager
+
+        cached = self._clients.get(cookie_id)
+        if cached is None:
+            return
+        client = cached[0]
+        cookies_str = client.cookies_str
+        # 记录为数据库中的值，避免下次 _get_client 误判为外部修改而重置
+        self._clients[cookie_id] = (client, cookies_str)
+        if not db_manager.update_cookie_value(cookie_id, cookies_str):
+            logger.warning(f"搜索账户Cookie写回数据库失败: {cookie_id}")
+
+    @staticmethod
+    def _cache_key(keyword: str, page: int, page_size: int, filters: Optional[dict]) -> tuple:
+        return (keyword, page, page_size, json.dumps(filters or {}, sort_keys=True, ensure_ascii=False))
+
+    def _cache_get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _cache_put(self, key: tuple, result: Dict[str, Any]):
+        if self.cache_ttl <= 0:
+            return
+        self._cache[key] = (result, time.time() + self.cache_ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    async def _fetch_page(self, client: MtopClient, keyword: str, page: int, page_size: int,
+                          filters: Optional[dict]) -> List[Dict[str, Any]]:
+        """请求一页搜索结果并解析，签名失效/验证码时抛出 SearchFallbackRequired"""
+        key = self._cache_key(keyword, page, page_size, filters)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached['items']
+
+        data = {**SEARCH_BASE_DATA, **(filters or {}), 'pageNumber': page, 'keyword': keyword,
+                'rowsPerPage': page_size}
+        # token过期重签一次即可；验证码不会因重试而消失，直接交给浏览器处理
+        res_json = await client.call(SEARCH_API, data, params={'spm_cnt': 'a21ybx.search.0.0'}, url=self.url,
+                                     max_retries=1)
+        self.stats['pages_fetched'] += 1
+
+        kind = classify_mtop_response(res_json)
+        if kind in FALLBACK_KINDS:
+            raise SearchFallbackRequired(f"搜索接口返回 {kind}: {res_json.get('ret')}")
+        if kind != RET_SUCCESS:
+            raise Exception(f"搜索接口调用失败: {res_json.get('ret') if isinstance(res_json, dict) else res_json}")
+
+        parser = self._get_parser()
+        items = []
+        for item in (res_json.get('data') or {}).get('resultList') or []:
+            parsed_item = await parser._parse_real_item(item)
+            if parsed_item:
+                items.append(parsed_item)
+
+        self._cache_put(key, {'items': items})
+        return items
+
+    async def search_items(self, keyword: str, page: int = 1, page_size: int = 20,
+                           filters: Optional[dict] = None) -> Dict[str, Any]:
+        """搜索单页商品，返回格式与 XianyuSearcher.search_items 一致"""
+        return await self.search_pages(keyword, [page], page_size, filters)
+
+    async def search_multiple_pages(self, keyword: str, total_pages: int = 1,
+                                    filters: Optional[dict] = None) -> Dict[str, Any]:
+        """并发搜索第1~total_pages页，返回格式与 XianyuSearcher.search_multiple_pages 一致"""
+        return await self.search_pages(keyword, list(range(1, total_pages + 1)), self.page_size, filters)
+
+    async def search_pages(self, keyword: str, pages: List[int], page_size: int,
+                           filters: Optional[dict] = None) -> Dict[str, Any]:
+        """并发获取指定页码，合并去重后按想要人数倒序
+
+        Raises:
+            SearchFallbackRequired: 任意一页签名失效或触发验证码
+        """
+        self.stats['queries'] += 1
+        client = self._get_client()
+        if client is None:
+            return {
+                'items': [],
+                'total': 0,
+                'error': '搜索失败: 未找到有效的cookies账户，请先在Cookie管理中添加有效的闲鱼账户'
+            }
+
+        logger.info(f"使用接口搜索闲鱼商品: 关键词='{keyword}', 页码={pages}, 每页={page_size}")
+        semaphore = asyncio.Semaphore(self.max_concurrent_pages)
+
+        async def fetch(page: int):
+            async with semaphore:
+                return await self._fetch_page(client, keyword, page, page_size, filters)
+
+        results = await asyncio.gather(*(fetch(page) for page in pages), return_exceptions=True)
+
+        fallback = next((r for r in results if isinstance(r, SearchFallbackRequired)), None)
+        if fallback is not None:
+            self.stats['fallbacks'] += 1
+            raise fallback
+
+        data_list = []
+        seen = set()
+        errors = []
+        for page, result in zip(pages, results):
+            if isinstance(result, BaseException):
+                errors.append(f"第{page}页: {result}")
+                continue
+            for item in result:
+                item_id = item.get('item_id')
+                # 相邻页之间结果可能重叠，按商品ID去重
+                if item_id != '未知ID':
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                data_list.append(item)
+
+        if errors and not data_list:
+            self.stats['errors'] += 1
+            logger.error(f"接口搜索失败: {'; '.join(errors)}")
+            return {
+                'items': [],
+                'total': 0,
+                'error': f"搜索失败: {'; '.join(errors)}"
+            }
+        if errors:
+            logger.warning(f"接口搜索部分页面失败: {'; '.join(errors)}")
+
+        # 根据"人想要"数量进行倒序排列
+        data_list.sort(key=lambda x: x.get('want_count', 0), reverse=True)
+        logger.info(f"接口搜索完成，共获取到 {len(data_list)} 条数据")
+        return {
+            'items': data_list,
+            'total': len(data_list),
+            'is_real_data': True,
+            'source': 'mtop'
+        }
+
+    async def close(self):
+        for client, _ in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+
+_search_backend: Optional[MtopSearchBackend] = None
+
+
+def get_search_backend() -> Optional[MtopSearchBackend]:
+    """根据配置 ITEM_SEARCH 返回接口搜索后端；backend 配置为 browser 时返回None"""
+    global _search_backend
+    from config import config
+
+    search_config = config.get('ITEM_SEARCH', {}) or {}
+    if search_config.get('backend', 'mtop') != 'mtop':
+        return None
+    if _search_backend is None:
+        _search_backend = MtopSearchBackend(
+            cache_ttl=float(search_config.get('cache_ttl', 60)),
+            cache_size=int(search_config.get('cache_size', 200)),
+            max_concurrent_pages=int(search_config.get('max_concurrent_pages', 3)),
+            page_size=int(search_config.get('page_size', 30)),
+        )
+    return _search_backend
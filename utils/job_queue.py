@@ -0,0 +1,181 @@
+"""
+定时任务队列 - 持久化到数据库 scheduled_jobs 表的延时任务，由单个调度协程到期执行
+
+- 延时发货等任务不再在消息处理任务中 sleep 等待：记录写入数据库后立即返回，
+  等待期间不占用协程、订单锁和捕获的上下文，进程重启后任务仍会执行
+- 调度协程按最早到期时间休眠，新任务更早到期时被唤醒；到期任务按 due_at 分批取出，
+  最多 max_concurrent 个同时执行
+- job_key 唯一，同一订单重复触发不会重复排期；已失败（failed）的任务可以用同一 job_key 重新排期
+- 处理函数返回 False 或抛出异常时按指数退避重新排期（retry_delay × 2^(n-1)，最长 max_retry_delay），
+  超过 max_attempts 次后标记为 failed；处理函数抛出 JobDeferred（如账号未连接）时
+  retry_delay 秒后重试，不计入执行次数
+- 执行中进程退出的任务在下次启动时恢复为待执行；处理函数发送消息前调用 mark_sent 记录发送标记，
+  重新执行时 job['sent_at'] 不为空即已发送过，不应再次发送
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+# 任务处理函数：接收任务字典 {id, cookie_id, kind, job_key, payload, due_at, attempts, sent_at}，返回是否执行成功
+JobHandler = Callable[[dict], Awaitable[bool]]
+
+
+class JobDeferred(Exception):
+    """任务暂时无法执行（如账号未连接），稍后重试且不计入执行次数"""
+
+
+class JobScheduler:
+    """定时任务调度器（每个进程一个，运行在账号任务所在的事件循环中）"""
+
+    def __init__(self, poll_interval: float = 30, max_concurrent: int = 5, batch_size: int = 50,
+                 retry_delay: float = 60, max_attempts: int = 5, max_retry_delay: float = 3600):
+        self.poll_interval = poll_interval
+        self.max_concurrent = max_concurrent
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.max_retry_delay = max_retry_delay
+        self._handlers: Dict[str, JobHandler] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_due_at: Optional[float] = None
+
+    @property
+    def _db(self):
+        from db_manager import db_manager
+        return db_manager
+
+    def register(self, kind: str, handler: JobHandler):
+        """注册某类任务的处理函数"""
+        self._handlers[kind] = handler
+
+    def schedule(self, cookie_id: str, kind: str, job_key: str, payload: dict, delay: float) -> bool:
+        """排期一个任务，job_key 已有未完成的任务时返回False"""
+        due_at = time.time() + max(0.0, delay)
+        if not self._db.add_scheduled_job(cookie_id, kind, job_key, payload, due_at):
+            return False
+        # 比调度协程当前等待的任务更早到期时唤醒它重新计算休眠时间
+        if self._wakeup is not None and (self._next_due_at is None or due_at < self._next_due_at):
+            self._wakeup.set()
+        return True
+
+    def is_scheduled(self, job_key: str) -> bool:
+        return self._db.has_scheduled_job(job_key)
+
+    def mark_sent(self, job: dict):
+        """处理函数发送消息前调用，记录发送标记"""
+        self._db.mark_scheduled_job_sent(job['id'])
+        job['sent_at'] = time.time()
+
+    def start(self) -> asyncio.Task:
+        """在当前事件循环中启动调度协程（已在运行时直接返回）"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def run(self):
+        """调度循环：执行到期任务，然后休眠到下一个任务到期"""
+        restored = self._db.reset_running_jobs()
+        if restored:
+            logger.info(f"恢复 {restored} 个上次未执行完的定时任务")
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        running = set()
+
+        while True:
+            try:
+                self._wakeup.clear()
+                jobs = self._db.claim_due_jobs(time.time(), self.batch_size)
+                for job in jobs:
+                    await semaphore.acquire()
+                    task = asyncio.create_task(self._execute(job, semaphore))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                if len(jobs) == self.batch_size:
+                    # 还有积压的到期任务，继续取下一批
+                    continue
+
+                self._next_due_at = self._db.get_next_job_due_at()
+                timeout = self.poll_interval
+                if self._next_due_at is not None:
+                    timeout = min(timeout, max(0.0, self._next_due_at - time.time()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                for task in list(running):
+                    task.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"定时任务调度异常: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, job: dict, semaphore: asyncio.Semaphore):
+        try:
+            handler = self._handlers.get(job['kind'])
+            if handler is None:
+                self._retry(job, f"没有注册 {job['kind']} 类任务的处理函数")
+                return
+            try:
+                success = await handler(job)
+            except asyncio.CancelledError:
+                raise
+            except JobDeferred as e:
+                logger.info(f"定时任务 {job['job_key']} 暂时无法执行，{self.retry_delay} 秒后重试: {e}")
+                self._db.defer_scheduled_job(job['id'], time.time() + self.retry_delay, str(e))
+                return
+            except Exception as e:
+                logger.error(f"定时任务执行异常: {job['job_key']}, {e}")
+                self._retry(job, str(e))
+                return
+            if success:
+                self._db.finish_scheduled_job(job['id'])
+            else:
+                self._retry(job, '处理函数返回失败')
+        finally:
+            semaphore.release()
+
+    def retry_delay_for(self, attempts: int) -> float:
+        """第 attempts 次执行失败后的重试间隔（指数退避）"""
+        return min(self.max_retry_delay, self.retry_delay * 2 ** max(0, attempts - 1))
+
+    def _retry(self, job: dict, error: str):
+        failed = job['attempts'] >= self.max_attempts
+        delay = self.retry_delay_for(job['attempts'])
+        if failed:
+            logger.error(f"定时任务 {job['job_key']} 已失败 {job['attempts']} 次，不再重试: {error}")
+        else:
+            logger.warning(f"定时任务 {job['job_key']} 第 {job['attempts']} 次执行失败，{delay:.0f} 秒后重试: {error}")
+        self._db.retry_scheduled_job(job['id'], time.time() + delay, error, failed=failed)
+
+
+def create_job_scheduler() -> JobScheduler:
+    """按 global_config.yml 的 SCHEDULED_JOBS 配置创建调度器"""
+    from config import config
+    job_config = config.get('SCHEDULED_JOBS', {})
+    return JobScheduler(
+        poll_interval=job_config.get('poll_interval', 30),
+        max_concurrent=job_config.get('max_concurrent', 5),
+        batch_size=job_config.get('batch_size', 50),
+        retry_delay=job_config.get('retry_delay', 60),
+        max_attempts=job_config.get('max_attempts', 5),
+        max_retry_delay=job_config.get('max_retry_delay', 3600),
+    )
+
+
+# 全局调度器实例
+job_scheduler = create_job_scheduler()
@@ -0,0 +1,203 @@
+"""
+关键词导入导出 - 在Excel/CSV/NDJSON与关键词三元组之间转换
+
+导入时按列批量读取并校验，不逐行构造DataFrame；
+xlsx 使用 openpyxl read_only 流式读取，只有旧版 .xls 才按需加载 pandas。
+"""
+
+import csv
+import io
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+KEYWORD_COLUMNS = ['关键词', '商品ID', '关键词内容']
+
+# 英文列名别名，便于脚本生成的CSV/NDJSON直接导入
+COLUMN_ALIASES = {
+    'keyword': '关键词',
+    'item_id': '商品ID',
+    'reply': '关键词内容',
+}
+
+IMPORT_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.ndjson', '.jsonl')
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# 空模板中的示例行
+TEMPLATE_ROWS = [
+    ('你好', '', '您好！欢迎咨询，有什么可以帮助您的吗？'),
+    ('价格', '123456', '这个商品的价格是99元，现在有优惠活动哦！'),
+    ('发货', '', '我们会在24小时内发货，请耐心等待。'),
+]
+
+
+class KeywordFileError(ValueError):
+    """导入文件格式或内容错误"""
+
+
+def _cell_text(value) -> str:
+    """单元格值转文本，None/NaN视为空，整数形式的浮点数去掉 .0（Excel中的商品ID）"""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    return str(value).strip()
+
+
+def _normalize_header(header: Iterable) -> List[str]:
+    names = []
+    for name in header:
+        text = _cell_text(name)
+        names.append(COLUMN_ALIASES.get(text.lower(), text))
+    return names
+
+
+def _rows_from_columns(columns: Dict[str, List]) -> List[Tuple[str, str, Optional[str]]]:
+    """按列校验并组装 (keyword, reply, item_id)，跳过关键词为空的行"""
+    missing = [col for col in KEYWORD_COLUMNS if col not in columns]
+    if missing:
+        raise KeywordFileError(f"文件缺少必要的列: {', '.join(missing)}")
+
+    keywords = [_cell_text(v) for v in columns['关键词']]
+    item_ids = [_cell_text(v) for v in columns['商品ID']]
+    replies = [_cell_text(v) for v in columns['关键词内容']]
+
+    return [(keyword, reply, item_id or None)
+            for keyword, item_id, reply in zip(keywords, item_ids, replies)
+            if keyword]
+
+
+def _columns_from_rows(header: List[str], rows: Iterable[Iterable]) -> Dict[str, List]:
+    index = {name: i for i, name in enumerate(header) if name in KEYWORD_COLUMNS}
+    columns = {name: [] for name in index}
+    for row in rows:
+        row = tuple(row)
+        for name, i in index.items():
+            columns[name].append(row[i] if i < len(row) else None)
+    return columns
+
+
+def _read_xlsx(contents: bytes) -> Dict[str, List]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(contents), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise KeywordFileError("Excel文件为空")
+        return _columns_from_rows(_normalize_header(header), rows)
+    finally:
+        workbook.close()
+
+
+def _read_xls(contents: bytes) -> Dict[str, List]:
+    # 旧版xls只能借助pandas(xlrd)读取，按需导入
+    import pandas as pd
+
+    df = pd.read_excel(io.BytesIO(contents), dtype=object)
+    df.columns = _normalize_header(df.columns)
+    return {name: df[name].tolist() for name in KEYWORD_COLUMNS if name in df.columns}
+
+
+def _read_csv(contents: bytes) -> Dict[str, List]:
+    text = contents.decode('utf-8-sig')
+    rows = csv.reader(io.StringIO(text))
+    header = next(rows, None)
+    if header is None:
+        raise KeywordFileError("CSV文件为空")
+    return _columns_from_rows(_normalize_header(header), rows)
+
+
+def _read_ndjson(contents: bytes) -> Dict[str, List]:
+    columns = {name: [] for name in KEYWORD_COLUMNS}
+    for line_no, line in enumerate(contents.decode('utf-8-sig').splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise KeywordFileError(f"第{line_no}行不是有效的JSON: {e}")
+        if not isinstance(record, dict):
+            raise KeywordFileError(f"第{line_no}行不是JSON对象")
+        record = {COLUMN_ALIASES.get(k, k): v for k, v in record.items()}
+        for name in KEYWORD_COLUMNS:
+            columns[name].append(record.get(name))
+    return columns
+
+
+def parse_keyword_file(filename: str, contents: bytes) -> List[Tuple[str, str, Optional[str]]]:
+    """解析上传的关键词文件，返回 [(keyword, reply, item_id), ...]
+
+    Raises:
+        KeywordFileError: 扩展名不支持、缺少列或内容无法解析
+    """
+    name = (filename or '').lower()
+    if not contents:
+        raise KeywordFileError("文件为空")
+
+    if name.endswith('.xlsx'):
+        columns = _read_xlsx(contents)
+    elif name.endswith('.xls'):
+        columns = _read_xls(contents)
+    elif name.endswith('.csv'):
+        columns = _read_csv(contents)
+    elif name.endswith(('.ndjson', '.jsonl')):
+        columns = _read_ndjson(contents)
+    else:
+        raise KeywordFileError(f"不支持的文件类型，请上传 {', '.join(IMPORT_EXTENSIONS)} 文件")
+
+    return _rows_from_columns(columns)
+
+
+def build_keyword_export(rows: List[Tuple[str, str, str]], fmt: str = 'xlsx') -> bytes:
+    """生成关键词导出文件内容，rows 为空时xlsx导出带示例的模板
+
+    Args:
+        rows: [(keyword, item_id, reply), ...]，与导出列顺序一致
+        fmt: xlsx / csv / ndjson
+    """
+    if fmt == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(KEYWORD_COLUMNS)
+        writer.writerows(rows)
+        # 带BOM便于Excel直接打开中文CSV
+        return output.getvalue().encode('utf-8-sig')
+
+    if fmt == 'ndjson':
+        return ''.join(
+            json.dumps(dict(zip(KEYWORD_COLUMNS, row)), ensure_ascii=False) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = '关键词数据'
+    worksheet.append(KEYWORD_COLUMNS)
+
+    if rows:
+        for row in rows:
+            worksheet.append(list(row))
+    else:
+        # 空模板：添加示例数据（浅灰色背景）
+        from openpyxl.styles import PatternFill
+        gray_fill = PatternFill(start_color='F0F0F0', end_color='F0F0F0', fill_type='solid')
+        for row in TEMPLATE_ROWS:
+            worksheet.append(list(row))
+        for row_cells in worksheet.iter_rows(min_row=2, max_row=len(TEMPLATE_ROWS) + 1, max_col=3):
+            for cell in row_cells:
+                cell.fill = gray_fill
+
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
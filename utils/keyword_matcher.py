@@ -0,0 +1,417 @@
+"""
+关键词匹配器 - 每个账号的关键词编译成一个匹配器，关键词修改后才重新构建
+
+关键词的匹配方式由前缀决定（不需要修改表结构和导入导出格式）：
+    普通关键词       消息包含关键词即命中（不区分大小写），与原有行为一致
+    re:<正则>        正则表达式（不区分大小写），如 re:^\\d+(元|块)?出吗?$
+    fuzzy:<关键词>   模糊匹配：消息中有与关键词编辑距离不超过 1（8个字及以上不超过 2）的片段即命中；
+                     安装了 pypinyin 时同音字（如 包油/包邮）也视为相同
+
+- 普通关键词和模糊关键词的分段放在同一个字典中，按消息的子串查找，耗时只与消息长度有关，
+  与关键词数量无关；模糊关键词按鸽巢原理切成 编辑距离+1 段，至少一段原样出现才在该段附近做编辑距离校验
+- 正则先合并成一个预筛正则，没有任何正则命中时不再逐个匹配
+- 防止灾难性回溯：保存时拒绝嵌套的无上限量词（如 (a+)+、(.*)*）、重复的分支之间首字符有重叠（如 (a|a)*、(\w|\d)+）
+  和 3 个及以上字符集相互重叠的无上限量词（如 .*.*.*），正则只匹配消息的前 MAX_REGEX_INPUT 个字符
+- 多个关键词命中时，与原实现相同：先取该商品的关键词，再取通用关键词，同类中按关键词列表顺序取第一个
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python 3.10 及以下
+    import sre_parse
+    import sre_constants
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+REGEX_PREFIX = 're:'
+FUZZY_PREFIX = 'fuzzy:'
+
+MODE_CONTAINS = 'contains'
+MODE_REGEX = 'regex'
+MODE_FUZZY = 'fuzzy'
+
+MAX_PATTERN_LENGTH = 200
+MAX_REGEX_INPUT = 200
+
+_BACKREF = re.compile(r'\\\d|\(\?P=')
+
+_REPEAT_OPS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) + (
+    (sre_constants.POSSESSIVE_REPEAT,) if hasattr(sre_constants, 'POSSESSIVE_REPEAT') else ())
+
+# 字符集用 [(起始码位, 结束码位)] 表示；\w、\d、\s 的非 ASCII 部分按全部非 ASCII 字符估算（只会多拒绝，不会漏拒）
+_ANY = [(0, 0x10FFFF)]
+_NON_ASCII = (0x80, 0x10FFFF)
+_CATEGORY_RANGES = {
+    sre_constants.CATEGORY_DIGIT: [(0x30, 0x39), _NON_ASCII],
+    sre_constants.CATEGORY_WORD: [(0x30, 0x39), (0x41, 0x5A), (0x5F, 0x5F), (0x61, 0x7A), _NON_ASCII],
+    sre_constants.CATEGORY_SPACE: [(0x09, 0x0D), (0x20, 0x20), _NON_ASCII],
+}
+_ZERO_WIDTH_OPS = (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+
+
+def parse_keyword(keyword: str) -> Tuple[str, str]:
+    """返回 (匹配方式, 去掉前缀的关键词)"""
+    if keyword.startswith(REGEX_PREFIX):
+        return MODE_REGEX, keyword[len(REGEX_PREFIX):]
+    if keyword.startswith(FUZZY_PREFIX):
+        return MODE_FUZZY, keyword[len(FUZZY_PREFIX):].strip()
+    return MODE_CONTAINS, keyword
+
+
+def _has_unbounded_repeat(parsed) -> bool:
+    """是否含有无上限的量词（*、+、{n,}）"""
+    for op, av in parsed:
+        if op in _REPEAT_OPS:
+            if av[1] == sre_constants.MAXREPEAT or _has_unbounded_repeat(av[2]):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _has_unbounded_repeat(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_has_unbounded_repeat(branch) for branch in av[1]):
+                return True
+    return False
+
+
+def _has_nested_repeat(parsed) -> bool:
+    """是否有 “可重复多次的量词内部又有无上限量词” 的结构（灾难性回溯的典型来源）"""
+    for op, av in parsed:
+        if op in _REPEAT_OPS:
+            if av[1] > 1 and _has_unbounded_repeat(av[2]):
+                return True
+            if _has_nested_repeat(av[2]):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _has_nested_repeat(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_has_nested_repeat(branch) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _has_nested_repeat(av[1]):
+                return True
+    return False
+
+
+def _literal_ranges(code: int) -> List[Tuple[int, int]]:
+    """不区分大小写时字母的大小写都算"""
+    char = chr(code)
+    return [(c, c) for c in {code, ord(char.lower()[0]), ord(char.upper()[0])}]
+
+
+def _in_ranges(items) -> List[Tuple[int, int]]:
+    ranges = []
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            return _ANY
+        if op is sre_constants.LITERAL:
+            ranges.extend(_literal_ranges(av))
+        elif op is sre_constants.RANGE:
+            ranges.append(av)
+            ranges.extend(r for bound in av for r in _literal_ranges(bound))
+            if any(chr(bound).isalpha() for bound in av):
+                # 字母区间按大小写两种区间估算
+                ranges.append((ord(chr(av[0]).lower()), ord(chr(av[1]).lower())))
+                ranges.append((ord(chr(av[0]).upper()), ord(chr(av[1]).upper())))
+        elif op is sre_constants.CATEGORY:
+            ranges.extend(_CATEGORY_RANGES.get(av, _ANY))
+        else:
+            return _ANY
+    return ranges
+
+
+def _first_chars(parsed) -> Tuple[List[Tuple[int, int]], bool]:
+    """(匹配的第一个字符可能属于的字符集, 是否可以匹配空串)"""
+    first = []
+    for op, av in parsed:
+        nullable = False
+        if op is sre_constants.LITERAL:
+            chars = _literal_ranges(av)
+        elif op is sre_constants.IN:
+            chars = _in_ranges(av)
+        elif op in _REPEAT_OPS:
+            chars, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        elif op is sre_constants.SUBPATTERN:
+            chars, nullable = _first_chars(av[-1])
+        elif op is sre_constants.BRANCH:
+            chars, nullable = [], False
+            for branch in av[1]:
+                branch_chars, branch_nullable = _first_chars(branch)
+                chars = chars + branch_chars
+                nullable = nullable or branch_nullable
+        elif op in _ZERO_WIDTH_OPS:
+            chars, nullable = [], True
+        else:
+            # 任意字符、反向引用等按任意字符处理
+            chars, nullable = _ANY, op is sre_constants.GROUPREF
+        first.extend(chars)
+        if not nullable:
+            return first, False
+    return first, True
+
+
+def _overlaps(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> bool:
+    return any(lo1 <= hi2 and lo2 <= hi1 for lo1, hi1 in a for lo2, hi2 in b)
+
+
+def _has_ambiguous_branch(parsed) -> bool:
+    """是否有首字符重叠（或可匹配空串）的分支，放在可重复的量词中时回溯次数随消息长度指数增长"""
+    for op, av in parsed:
+        if op is sre_constants.BRANCH:
+            firsts = []
+            for branch in av[1]:
+                chars, nullable = _first_chars(branch)
+                if nullable or any(_overlaps(chars, other) for other in firsts):
+                    return True
+                firsts.append(chars)
+            if any(_has_ambiguous_branch(branch) for branch in av[1]):
+                return True
+        elif op in _REPEAT_OPS:
+            if _has_ambiguous_branch(av[2]):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _has_ambiguous_branch(av[-1]):
+                return True
+    return False
+
+
+def _has_repeated_branch(parsed) -> bool:
+    """可重复多次的量词内部是否有歧义分支，如 (a|a)*、(\w|\d)+"""
+    for op, av in parsed:
+        if op in _REPEAT_OPS:
+            if av[1] > 1 and _has_ambiguous_branch(av[2]):
+                return True
+            if _has_repeated_branch(av[2]):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _has_repeated_branch(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_has_repeated_branch(branch) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _has_repeated_branch(av[1]):
+                return True
+    return False
+
+
+def _unbounded_repeat_chars(parsed, result: List[List[Tuple[int, int]]]):
+    """收集所有无上限量词可匹配的字符集"""
+    for op, av in parsed:
+        if op in _REPEAT_OPS:
+            if av[1] == sre_constants.MAXREPEAT:
+                result.append(_first_chars(av[2])[0])
+            _unbounded_repeat_chars(av[2], result)
+        elif op is sre_constants.SUBPATTERN:
+            _unbounded_repeat_chars(av[-1], result)
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                _unbounded_repeat_chars(branch, result)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _unbounded_repeat_chars(av[1], result)
+
+
+def _has_overlapping_repeats(parsed) -> bool:
+    """是否有 3 个及以上字符集相互重叠的无上限量词（如 .*.*.*x），回溯次数是消息长度的 3 次方以上"""
+    repeats = []
+    _unbounded_repeat_chars(parsed, repeats)
+    for index, chars in enumerate(repeats):
+        others = [other for position, other in enumerate(repeats) if position != index and _overlaps(chars, other)]
+        if any(_overlaps(a, b) for position, a in enumerate(others) for b in others[position + 1:]):
+            return True
+    return False
+
+
+def compile_regex(pattern: str) -> 're.Pattern':
+    """编译正则关键词，格式错误或可能灾难性回溯时抛出 ValueError"""
+    if not pattern:
+        raise ValueError("正则关键词不能为空")
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"正则关键词过长（最多{MAX_PATTERN_LENGTH}个字符）: {pattern[:20]}...")
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+        compiled = re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"正则关键词格式错误 '{pattern}': {e}")
+    if _has_nested_repeat(parsed):
+        raise ValueError(f"正则关键词 '{pattern}' 含有嵌套的重复量词（如 (a+)+），可能导致匹配卡死，请改写")
+    if _has_repeated_branch(parsed):
+        raise ValueError(f"正则关键词 '{pattern}' 的重复分组中有可匹配相同字符的分支（如 (a|ab)*），可能导致匹配卡死，请改写")
+    if _has_overlapping_repeats(parsed):
+        raise ValueError(f"正则关键词 '{pattern}' 含有多个可匹配相同字符的无上限量词（如 .*.*.*），可能导致匹配卡死，请改写")
+    return compiled
+
+
+def validate_keyword(keyword: str):
+    """保存关键词前校验，正则/模糊关键词格式错误时抛出 ValueError"""
+    mode, pattern = parse_keyword(keyword)
+    if mode == MODE_REGEX:
+        compile_regex(pattern)
+    elif mode == MODE_FUZZY and not pattern:
+        raise ValueError("模糊关键词不能为空")
+
+
+def max_distance(length: int) -> int:
+    """模糊关键词允许的编辑距离"""
+    if length >= 8:
+        return 2
+    if length >= 3:
+        return 1
+    return 0
+
+
+def _split_pieces(pattern, pieces: int) -> List[Tuple[int, Any]]:
+    """把 pattern 均分成 pieces 段，返回 [(段在 pattern 中的起始位置, 段)]"""
+    size, extra = divmod(len(pattern), pieces)
+    result, start = [], 0
+    for index in range(pieces):
+        end = start + size + (1 if index < extra else 0)
+        result.append((start, pattern[start:end]))
+        start = end
+    return result
+
+
+def within_distance(pattern, text, limit: int) -> bool:
+    """text 中是否有与 pattern 编辑距离不超过 limit 的片段（Sellers 算法，pattern/text 可为字符串或列表）"""
+    m = len(pattern)
+    previous = list(range(m + 1))
+    if previous[m] <= limit:
+        return True
+    for unit in text:
+        current = [0]
+        for j in range(1, m + 1):
+            cost = 0 if pattern[j - 1] == unit else 1
+            current.append(min(previous[j - 1] + cost, previous[j] + 1, current[j - 1] + 1))
+        if current[m] <= limit:
+            return True
+        previous = current
+    return False
+
+
+def _to_pinyin(text: str) -> List[str]:
+    return lazy_pinyin(text) if lazy_pinyin is not None else list(text)
+
+
+class KeywordMatcher:
+    """一个账号的关键词匹配器，keywords 为 get_keywords_with_type 返回的列表"""
+
+    def __init__(self, keywords: List[dict]):
+        self.keywords = keywords
+        # 子串 -> [(关键词序号, 分段在关键词中的位置)]，普通关键词存整个关键词（位置为 None），模糊关键词存各分段
+        self._pieces: Dict[str, List[Tuple[int, Optional[int]]]] = {}
+        self._fuzzy: Dict[int, Tuple[str, int, Optional[List[str]]]] = {}  # 序号 -> (关键词, 编辑距离, 拼音)
+        self._pinyin_pieces: Dict[Tuple[str, ...], List[Tuple[int, int]]] = {}
+        self._regexes: List[Tuple[int, 're.Pattern']] = []
+        self._prefilter = None
+
+        for index, keyword_data in enumerate(keywords):
+            keyword = keyword_data.get('keyword') or ''
+            mode, pattern = parse_keyword(keyword)
+            if mode == MODE_REGEX:
+                try:
+                    self._regexes.append((index, compile_regex(pattern)))
+                except ValueError as e:
+                    logger.warning(f"跳过无效的正则关键词: {e}")
+            elif mode == MODE_FUZZY:
+                pattern = pattern.lower()
+                if not pattern:
+                    continue
+                limit = max_distance(len(pattern))
+                pinyin = _to_pinyin(pattern) if lazy_pinyin is not None else None
+                self._fuzzy[index] = (pattern, limit, pinyin)
+                for offset, piece in _split_pieces(pattern, limit + 1):
+                    self._pieces.setdefault(piece, []).append((index, offset))
+                if pinyin is not None:
+                    for offset, piece in _split_pieces(pinyin, limit + 1):
+                        self._pinyin_pieces.setdefault(tuple(piece), []).append((index, offset))
+            elif keyword:
+                self._pieces.setdefault(keyword.lower(), []).append((index, None))
+
+        self._lengths = sorted({len(piece) for piece in self._pieces})
+        self._pinyin_lengths = sorted({len(piece) for piece in self._pinyin_pieces})
+        # 含反向引用的正则合并后组号会变化，此时不做预筛，逐个匹配
+        if self._regexes and not any(_BACKREF.search(regex.pattern) for _, regex in self._regexes):
+            try:
+                self._prefilter = re.compile('|'.join(f'(?:{regex.pattern})' for _, regex in self._regexes),
+                                             re.IGNORECASE)
+            except re.error:
+                self._prefilter = None
+
+    @staticmethod
+    def _lookup(units, pieces: dict, lengths: List[int], key=None):
+        """按 (命中位置, [(关键词序号, 分段位置)]) 逐个返回 units 中出现的分段"""
+        size = len(units)
+        for start in range(size):
+            for length in lengths:
+                if start + length > size:
+                    break
+                piece = units[start:start + length]
+                entries = pieces.get(key(piece) if key else piece)
+                if entries:
+                    yield start, entries
+
+    def _verify_fuzzy(self, units, candidates: set, matched: set, use_pinyin: bool):
+        """在分段命中位置附近（关键词长度 + 2 × 编辑距离的窗口）做编辑距离校验"""
+        for index, position in candidates:
+            if index in matched:
+                continue
+            pattern, limit, pinyin = self._fuzzy[index]
+            if use_pinyin:
+                pattern = pinyin
+            window = units[max(0, position - limit):position + len(pattern) + limit]
+            if within_distance(pattern, window, limit):
+                matched.add(index)
+
+    def matches(self, message: str) -> List[int]:
+        """命中的关键词序号（升序）"""
+        text = message.lower()
+        matched = set()
+        candidates = set()  # (模糊关键词序号, 关键词在消息中的预计起始位置)
+        for start, entries in self._lookup(text, self._pieces, self._lengths):
+            for index, offset in entries:
+                if offset is None:
+                    matched.add(index)
+                else:
+                    candidates.add((index, start - offset))
+        self._verify_fuzzy(text, candidates, matched, False)
+
+        if self._pinyin_pieces:
+            text_pinyin = _to_pinyin(text)
+            candidates = set()
+            for start, entries in self._lookup(text_pinyin, self._pinyin_pieces, self._pinyin_lengths, tuple):
+                for index, offset in entries:
+                    if index not in matched:
+                        candidates.add((index, start - offset))
+            self._verify_fuzzy(text_pinyin, candidates, matched, True)
+
+        if self._regexes:
+            regex_text = message[:MAX_REGEX_INPUT]
+            if self._prefilter is None or self._prefilter.search(regex_text):
+                for index, regex in self._regexes:
+                    if index not in matched and regex.search(regex_text):
+                        matched.add(index)
+        return sorted(matched)
+
+    def match(self, message: str, item_id: str = None) -> Optional[dict]:
+        """返回命中的关键词：优先该商品的关键词，其次通用关键词，同类中按列表顺序取第一个"""
+        generic = None
+        for index in self.matches(message):
+            keyword_data = self.keywords[index]
+            keyword_item_id = keyword_data.get('item_id')
+            if item_id and keyword_item_id == item_id:
+                return keyword_data
+            if not keyword_item_id and generic is None:
+                generic = keyword_data
+                if not item_id:
+                    break
+        return generic
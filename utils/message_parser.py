@@ -0,0 +1,309 @@
+"""
+消息解析 - 把解密后的推送消息一次性解析为 ParsedMessage
+
+解密后的消息是以数字字符串为键的嵌套字典，常用字段位于：
+    message['1']['1']            消息ID（xxx.PNM）
+    message['1']['2']            会话ID（chat_id@goofish）
+    message['1']['5']            消息创建时间（毫秒）
+    message['1']['6']['3']['5']  卡片内容JSON（订单卡片、系统卡片）
+    message['1']['10']           发送者、消息文本(reminderContent)、商品链接(reminderUrl)
+    message['3']['redReminder']  订单状态提醒
+消息处理各阶段直接读取 ParsedMessage 的字段，不再重复遍历原始字典、重复解析卡片JSON；
+消息类别通过查表确定，代替逐条字符串比较。解析开销见 benchmarks/message_parse_bench.py。
+"""
+
+import json
+import re
+from typing import Optional
+
+from loguru import logger
+
+# 消息类别
+KIND_OTHER = 'other'        # 非聊天消息（没有 reminderContent）
+KIND_SYSTEM = 'system'      # 无需处理的系统提示
+KIND_DELIVERY = 'delivery'  # 自动发货触发消息
+KIND_CARD = 'card'          # 卡片消息
+KIND_CHAT = 'chat'          # 普通聊天消息
+
+# 无需处理的系统消息：消息文本 -> 日志说明
+SYSTEM_MESSAGES = {
+    '[我已拍下，待付款]': '系统消息不处理',
+    '[你关闭了订单，钱款已原路退返]': '系统消息不处理',
+    '发来一条消息': '系统通知消息不处理',
+    '发来一条新消息': '系统通知消息不处理',
+    '[买家确认收货，交易成功]': '交易完成消息不处理',
+    '快给ta一个评价吧~': '评价提醒消息不处理',
+    '快给ta一个评价吧～': '评价提醒消息不处理',
+    '卖家人不错？送Ta闲鱼小红花': '小红花提醒消息不处理',
+    '[你已确认收货，交易成功]': '买家确认收货消息不处理',
+    '[你已发货]': '发货确认消息不处理',
+}
+
+# 按消息文本精确匹配的类别
+MESSAGE_KINDS = dict.fromkeys(SYSTEM_MESSAGES, KIND_SYSTEM)
+MESSAGE_KINDS['[卡片消息]'] = KIND_CARD
+
+# 自动发货触发关键字，消息文本包含任一关键字即触发
+AUTO_DELIVERY_KEYWORDS = (
+    '[我已付款，等待你发货]',
+    '[已付款，待发货]',
+    '我已付款，等待你发货',
+    '[记得及时发货]',
+)
+
+# 订单状态提醒：redReminder -> (日志说明模板, 是否结束处理)
+RED_REMINDER_STATES = {
+    '等待买家付款': ('等待买家 {user_url} 付款', True),
+    '交易关闭': ('买家 {user_url} 交易关闭', True),
+    '等待卖家发货': ('交易成功 {user_url} 等待卖家发货', False),
+}
+
+_BUTTON_ORDER_ID = re.compile(r'orderId=(\d+)')
+_DETAIL_ORDER_ID = re.compile(r'order_detail\?id=(\d+)')
+_LONG_DIGITS = re.compile(r'(\d{10,})')
+# 卡片中没有订单链接时，在整条消息中搜索的订单ID模式（按优先级）
+_MESSAGE_ORDER_ID_PATTERNS = (
+    re.compile(r'orderId[=:](\d{10,})'),
+    re.compile(r'order_detail\?id=(\d{10,})'),
+    re.compile(r'"id"\s*:\s*"?(\d{10,})"?'),
+    re.compile(r'bizOrderId[=:](\d{10,})'),
+)
+
+
+class ParsedMessage:
+    """解析后的消息，所有字段在 parse_message 中一次性提取"""
+
+    __slots__ = ('raw', 'kind', 'is_chat', 'message_id', 'user_id', 'send_user_id', 'send_user_name', 'send_message',
+                 'chat_id', 'item_id', 'create_time', 'red_reminder', 'card', 'card_title', 'order_id')
+
+    raw: dict                     # 解密后的原始消息
+    kind: str                     # 消息类别，KIND_* 之一
+    is_chat: bool                 # 是否为用户聊天消息
+    message_id: Optional[str]     # 消息ID（去重使用）
+    user_id: str                  # 发送者ID（订单处理使用，未知时为 unknown_user）
+    send_user_id: str             # 聊天消息发送者ID（未知时为 unknown）
+    send_user_name: str           # 聊天消息发送者昵称
+    send_message: str             # 消息文本
+    chat_id: str                  # 会话ID（不含@goofish）
+    item_id: Optional[str]        # 商品ID，无法提取时为None
+    create_time: int              # 消息创建时间（毫秒）
+    red_reminder: Optional[str]   # 订单状态提醒
+    card: Optional[dict]          # 卡片内容
+    card_title: Optional[str]     # 卡片标题
+    order_id: Optional[str]       # 订单ID
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self.kind = KIND_OTHER
+        self.is_chat = False
+        self.message_id = None
+        self.user_id = 'unknown_user'
+        self.send_user_id = 'unknown'
+        self.send_user_name = '未知用户'
+        self.send_message = ''
+        self.chat_id = ''
+        self.item_id = None
+        self.create_time = 0
+        self.red_reminder = None
+        self.card = None
+        self.card_title = None
+        self.order_id = None
+
+    def __repr__(self):
+        return (f"ParsedMessage(kind={self.kind!r}, chat_id={self.chat_id!r}, send_user_id={self.send_user_id!r}, "
+                f"item_id={self.item_id!r}, order_id={self.order_id!r}, send_message={self.send_message!r})")
+
+
+def is_auto_delivery_trigger(text: str) -> bool:
+    """检查消息文本是否为自动发货触发消息"""
+    return any(keyword in text for keyword in AUTO_DELIVERY_KEYWORDS)
+
+
+def classify_message(text: str) -> str:
+    """按聊天消息文本确定类别"""
+    kind = MESSAGE_KINDS.get(text)
+    if kind is not None:
+        return kind
+    if is_auto_delivery_trigger(text):
+        return KIND_DELIVERY
+    return KIND_CHAT
+
+
+def find_item_id(message: dict) -> Optional[str]:
+    """在消息各处查找商品ID（消息中没有商品链接时的兜底方法）"""
+    try:
+        # 方法1: 从message["1"]中提取（如果是字符串格式）
+        message_1 = message.get('1')
+        if isinstance(message_1, str):
+            id_match = _LONG_DIGITS.search(message_1)
+            if id_match:
+                logger.info(f"从message[1]字符串中提取商品ID: {id_match.group(1)}")
+                return id_match.group(1)
+
+        # 方法2: 从message["3"]中提取
+        message_3 = message.get('3', {})
+        if isinstance(message_3, dict):
+            for key in ('extension', 'bizData'):
+                value = message_3.get(key)
+                if isinstance(value, dict):
+                    item_id = value.get('itemId') or value.get('item_id')
+                    if item_id:
+                        logger.info(f"从{key}中提取商品ID: {item_id}")
+                        return item_id
+
+            # 从其他可能的字段中提取
+            for key, value in message_3.items():
+                if isinstance(value, dict):
+                    item_id = value.get('itemId') or value.get('item_id')
+                    if item_id:
+                        logger.info(f"从{key}字段中提取商品ID: {item_id}")
+                        return item_id
+
+            # 从消息内容中提取数字ID
+            content = message_3.get('content', '')
+            if isinstance(content, str) and content:
+                id_match = _LONG_DIGITS.search(content)
+                if id_match:
+                    logger.info(f"从消息内容中提取商品ID: {id_match.group(1)}")
+                    return id_match.group(1)
+
+        # 方法3: 遍历整个消息结构查找可能的商品ID
+        def find_item_id_recursive(obj, path=""):
+            if isinstance(obj, dict):
+                for key in ('itemId', 'item_id', 'id'):
+                    if key in obj and isinstance(obj[key], (str, int)):
+                        value = str(obj[key])
+                        if len(value) >= 10 and value.isdigit():
+                            logger.info(f"从{path}.{key}中提取商品ID: {value}")
+                            return value
+
+                for key, value in obj.items():
+                    result = find_item_id_recursive(value, f"{path}.{key}" if path else key)
+                    if result:
+                        return result
+
+            elif isinstance(obj, str):
+                id_match = _LONG_DIGITS.search(obj)
+                if id_match:
+                    logger.info(f"从{path}字符串中提取商品ID: {id_match.group(1)}")
+                    return id_match.group(1)
+
+            return None
+
+        result = find_item_id_recursive(message)
+        if result:
+            return result
+
+        logger.debug("所有方法都未能提取到商品ID")
+        return None
+
+    except Exception as e:
+        logger.error(f"提取商品ID失败: {e}")
+        return None
+
+
+def _get_path(data, *keys):
+    """按键路径取值，中途不是字典时返回None"""
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def find_order_id(message: dict, card: Optional[dict]) -> Optional[str]:
+    """从卡片按钮/详情链接中提取订单ID，卡片中没有时在整条消息中搜索"""
+    if isinstance(card, dict):
+        # 方法1a: 从button的targetUrl中提取orderId
+        target_url = _get_path(card, 'dxCard', 'item', 'main', 'exContent', 'button', 'targetUrl')
+        if target_url:
+            order_match = _BUTTON_ORDER_ID.search(target_url)
+            if order_match:
+                return order_match.group(1)
+
+        # 方法1b: 从main的targetUrl中提取order_detail的id
+        main_target_url = _get_path(card, 'dxCard', 'item', 'main', 'targetUrl')
+        if main_target_url:
+            order_match = _DETAIL_ORDER_ID.search(main_target_url)
+            if order_match:
+                return order_match.group(1)
+
+        # 方法2: 从dynamicOperation中的order_detail URL提取
+        dynamic_target_url = _get_path(card, 'dynamicOperation', 'changeContent', 'dxCard', 'item', 'main',
+                                       'exContent', 'button', 'targetUrl')
+        if dynamic_target_url:
+            order_match = _DETAIL_ORDER_ID.search(dynamic_target_url)
+            if order_match:
+                return order_match.group(1)
+
+    # 方法3: 在整个消息的字符串形式中搜索订单ID模式
+    try:
+        message_str = str(message)
+        for pattern in _MESSAGE_ORDER_ID_PATTERNS:
+            order_match = pattern.search(message_str)
+            if order_match:
+                return order_match.group(1)
+    except Exception as e:
+        logger.debug(f"在消息字符串中搜索订单ID失败: {e}")
+    return None
+
+
+def parse_message(message: dict) -> ParsedMessage:
+    """一次遍历解析消息的全部字段并确定消息类别"""
+    parsed = ParsedMessage(message)
+    message_1 = message.get('1')
+    message_10 = None
+
+    if isinstance(message_1, dict):
+        message_10 = message_1.get('10')
+        if not isinstance(message_10, dict):
+            message_10 = None
+
+        message_id = message_1.get('1')
+        if isinstance(message_id, str) and message_id:
+            parsed.message_id = message_id
+
+        chat_id_raw = message_1.get('2', '')
+        parsed.chat_id = chat_id_raw.split('@')[0] if '@' in str(chat_id_raw) else str(chat_id_raw)
+        try:
+            parsed.create_time = int(message_1.get('5', 0))
+        except (TypeError, ValueError):
+            parsed.create_time = 0
+
+        content_json = _get_path(message_1, '6', '3', '5')
+        if isinstance(content_json, str) and content_json:
+            try:
+                card = json.loads(content_json)
+            except ValueError as e:
+                logger.debug(f"解析卡片内容失败: {e}")
+            else:
+                if isinstance(card, dict):
+                    parsed.card = card
+                    parsed.card_title = _get_path(card, 'dxCard', 'item', 'main', 'exContent', 'title')
+    elif isinstance(message_1, str) and '@' in message_1:
+        parsed.user_id = message_1.split('@')[0]
+
+    if message_10 is not None:
+        parsed.user_id = message_10.get('senderUserId', 'unknown_user')
+        parsed.send_user_id = message_10.get('senderUserId', 'unknown')
+        parsed.send_user_name = message_10.get('senderNick', message_10.get('reminderTitle', '未知用户'))
+        parsed.send_message = message_10.get('reminderContent', '')
+        parsed.is_chat = 'reminderContent' in message_10
+
+        url_info = message_10.get('reminderUrl', '')
+        if isinstance(url_info, str) and 'itemId=' in url_info:
+            parsed.item_id = url_info.split('itemId=')[1].split('&')[0] or None
+
+    if not parsed.item_id:
+        parsed.item_id = find_item_id(message)
+
+    message_3 = message.get('3')
+    if isinstance(message_3, dict):
+        red_reminder = message_3.get('redReminder')
+        if isinstance(red_reminder, str):
+            parsed.red_reminder = red_reminder
+
+    parsed.order_id = find_order_id(message, parsed.card)
+    if parsed.is_chat:
+        parsed.kind = classify_message(parsed.send_message)
+    return parsed
@@ -0,0 +1,272 @@
+"""
+运行指标 - 轻量的计数器/仪表/直方图，以 Prometheus 文本格式从 /metrics 导出
+
+- 无第三方依赖，记录一次观测只做一次二分查找和几次加法（单次开销约1微秒，
+  见 benchmarks/metrics_bench.py）
+- 标签按位置传入，值为字符串元组作为键，避免每次观测构造字典
+- 指标对象可在事件循环线程和Web线程中同时使用，各自用一把锁保护
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 默认延迟分桶（秒），覆盖从亚毫秒级的解密到数十秒的浏览器订单详情获取
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 数据库锁等待/持有时间分桶（秒）
+LOCK_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape_label_value(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """指标基类"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(Counter):
+    """可增可减的仪表"""
+
+    kind = 'gauge'
+
+    def dec(self, *labelvalues: str, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class _Timer:
+    """直方图计时上下文：with histogram.time('stage'): ..."""
+
+    __slots__ = ('_histogram', '_labelvalues', '_started')
+
+    def __init__(self, histogram: 'Histogram', labelvalues: Tuple[str, ...]):
+        self._histogram = histogram
+        self._labelvalues = labelvalues
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._started, *self._labelvalues)
+        return False
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {标签值: [各桶计数..., +Inf桶计数, 总和]}，各桶计数为非累积值，导出时再累加
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labelvalues: str) -> _Timer:
+        return _Timer(self, labelvalues)
+
+    def snapshot(self, *labelvalues: str) -> Optional[dict]:
+        """返回某组标签的 {'count', 'sum'}，没有观测时返回None"""
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                return None
+            return {'count': sum(series[:-1]), 'sum': series[-1]}
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，负责汇总导出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedLock:
+    """记录等待时间和持有时间的互斥锁，接口与 threading.Lock 一致"""
+
+    def __init__(self, wait_histogram: Histogram, hold_histogram: Histogram):
+        self._lock = threading.Lock()
+        self._wait_histogram = wait_histogram
+        self._hold_histogram = hold_histogram
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        started = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            # 只有持有者会写入，无需额外同步
+            self._acquired_at = time.perf_counter()
+            self._wait_histogram.observe(self._acquired_at - started)
+        return acquired
+
+    def release(self):
+        held = time.perf_counter() - self._acquired_at
+        self._lock.release()
+        self._hold_histogram.observe(held)
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+# 全局指标注册表及各模块使用的指标
+registry = MetricsRegistry()
+
+MESSAGE_STAGE_SECONDS = registry.histogram(
+    'xianyu_message_stage_seconds', '消息处理各阶段耗时（秒）', ('stage',))
+MESSAGE_HANDLE_SECONDS = registry.histogram(
+    'xianyu_message_handle_seconds', 'handle_message 整体耗时（秒）')
+MESSAGES_INFLIGHT = registry.gauge(
+    'xianyu_messages_inflight', '各账号正在处理的 handle_message 任务数', ('account',))
+REPLIES_TOTAL = registry.counter(
+    'xianyu_replies_total', '按来源统计的自动回复次数（none 表示未匹配到回复）', ('source',))
+WS_RECONNECTS_TOTAL = registry.counter(
+    'xianyu_ws_reconnects_total', '各账号WebSocket重连次数', ('account',))
+WS_HEARTBEAT_RTT_SECONDS = registry.histogram(
+    'xianyu_ws_heartbeat_rtt_seconds', '各账号心跳往返时间（秒）', ('account',))
+WS_HEARTBEAT_MISSED_TOTAL = registry.counter(
+    'xianyu_ws_heartbeat_missed_total', '各账号心跳超时未响应次数', ('account',))
+WS_DEAD_DETECT_SECONDS = registry.histogram(
+    'xianyu_ws_dead_detect_seconds', '从最后一次心跳响应到判定连接失效的时间（秒）', ('account',))
+SYNC_BACKFILL_MESSAGES_TOTAL = registry.counter(
+    'xianyu_sync_backfill_messages_total', '各账号重连后补收的断线期间消息数', ('account',))
+SYNC_DUPLICATES_TOTAL = registry.counter(
+    'xianyu_sync_duplicates_total', '各账号去重丢弃的重复消息数', ('account',))
+TOKEN_REFRESHES_TOTAL = registry.counter(
+    'xianyu_token_refreshes_total', '各账号token刷新次数', ('account', 'result'))
+DB_LOCK_WAIT_SECONDS = registry.histogram(
+    'xianyu_db_lock_wait_seconds', '数据库全局锁等待时间（秒）', buckets=LOCK_BUCKETS)
+DB_LOCK_HOLD_SECONDS = registry.histogram(
+    'xianyu_db_lock_hold_seconds', '数据库全局锁持有时间（秒）', buckets=LOCK_BUCKETS)
+AI_REPLY_SECONDS = registry.histogram(
+    'xianyu_ai_reply_seconds', 'AI回复调用耗时（秒，含超出时间预算后继续完成的调用）', ('provider',))
+AI_REPLY_FALLBACK_TOTAL = registry.counter(
+    'xianyu_ai_reply_fallback_total', 'AI回复未在时间预算内返回而改用关键词/默认回复的次数', ('provider', 'reason'))
+CARD_PREFETCH_TOTAL = registry.counter(
+    'xianyu_card_prefetch_total', 'API卡券发货时预取池命中/未命中（实时调用API）次数', ('result',))
+CARD_PREFETCH_FETCHES_TOTAL = registry.counter(
+    'xianyu_card_prefetch_fetches_total', '后台补充预取池时调用卡券API的次数', ('result',))
+WEB_ADMISSION_WAIT_SECONDS = registry.histogram(
+    'xianyu_web_admission_wait_seconds', 'Web请求等待处理名额的时间（秒）', ('route_class',))
+WEB_REQUESTS_SHED_TOTAL = registry.counter(
+    'xianyu_web_requests_shed_total', 'Web请求因排队已满或排队超时返回503的次数', ('route_class', 'reason'))
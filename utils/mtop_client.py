@@ -0,0 +1,302 @@
+"""
+mtop接口客户端 - 每个账号一个，统一签名、Cookie维护、限流与重试
+
+- 长连接复用的 aiohttp 会话（连接池），不再每次请求新建会话和TLS握手
+- 预解析的Cookie（CookieJar），收到 Set-Cookie 时增量合并，Cookie字符串和 _m_h5_tk token 按需缓存
+- 令牌桶限流，避免单账号突发请求触发风控
+- 统一的返回码分类与重试/退避策略（token过期立即重签重试，限流指数退避；RGV587风控验证码重试也不会消失，直接返回）
+- 非幂等接口（如确认发货）请求已发出后超时/断开不重试，避免重复执行
+"""
+
+import asyncio
+import json
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+import aiohttp
+from loguru import logger
+
+from utils.xianyu_utils import generate_sign, trans_cookies
+
+MTOP_BASE_URL = 'https://h5api.m.goofish.com/h5'
+
+# 所有mtop请求共用的基础参数
+MTOP_BASE_PARAMS = {
+    'jsv': '2.7.2',
+    'appKey': '34839810',
+    'type': 'originaljson',
+    'accountSite': 'xianyu',
+    'dataType': 'json',
+    'timeout': '20000',
+    'sessionOption': 'AutoLoginOnly',
+}
+
+# 返回码分类
+RET_SUCCESS = 'success'          # 调用成功
+RET_TOKEN_EXPIRED = 'token'      # token过期/为空，使用新Cookie重签后立即重试
+RET_THROTTLED = 'throttled'      # 限流，指数退避后重试
+RET_CAPTCHA = 'captcha'          # 风控验证码（RGV587），需要人工/滑块验证，不重试
+RET_TRANSIENT = 'transient'      # 服务端临时错误或网络异常，退避后重试
+RET_AUTH = 'auth'                # 会话失效或需要人工验证，不重试
+RET_FAILED = 'failed'            # 业务失败，不重试
+
+TOKEN_EXPIRED_CODES = ('FAIL_SYS_TOKEN_EXOIRED', 'FAIL_SYS_TOKEN_EXPIRED', 'FAIL_SYS_TOKEN_EMPTY',
+                       'FAIL_SYS_ILLEGAL_ACCESS')
+THROTTLED_CODES = ('FAIL_SYS_FLOWLIMIT', 'FAIL_SYS_TRAFFIC_LIMIT')
+CAPTCHA_CODES = ('RGV587_ERROR', 'FAIL_SYS_RGV587')
+TRANSIENT_CODES = ('FAIL_SYS_SERVICE_UNAVAILABLE', 'FAIL_SYS_SERVICE_TIMEOUT', 'FAIL_SYS_SERVICE_FAULT',
+                   'FAIL_SYS_HSF_THROWN_EXCEPTION')
+AUTH_CODES = ('FAIL_SYS_SESSION_EXPIRED', 'FAIL_SYS_USER_VALIDATE')
+
+
+def classify_mtop_response(res_json) -> str:
+    """根据mtop返回的 ret 字段分类结果"""
+    if not isinstance(res_json, dict):
+        return RET_TRANSIENT
+    ret_list = res_json.get('ret') or []
+    ret_text = ' '.join(str(ret) for ret in ret_list)
+    if 'SUCCESS::' in ret_text:
+        return RET_SUCCESS
+    if any(code in ret_text for code in TOKEN_EXPIRED_CODES):
+        return RET_TOKEN_EXPIRED
+    if any(code in ret_text for code in CAPTCHA_CODES):
+        return RET_CAPTCHA
+    if any(code in ret_text for code in THROTTLED_CODES):
+        return RET_THROTTLED
+    if any(code in ret_text for code in AUTH_CODES):
+        return RET_AUTH
+    if not ret_list or any(code in ret_text for code in TRANSIENT_CODES):
+        return RET_TRANSIENT
+    return RET_FAILED
+
+
+class CookieJar(dict):
+    """解析后的Cookie字典，修改时自动失效缓存的Cookie字符串和token"""
+
+    def __init__(self, cookies_str: str = ''):
+        super().__init__(trans_cookies(cookies_str) if cookies_str else {})
+        # 保留原始字符串，未修改前直接复用
+        self._cookies_str = cookies_str or None
+        self._token = None
+
+    def _invalidate(self):
+        self._cookies_str = None
+        self._token = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._invalidate()
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._invalidate()
+        return result
+
+    def setdefault(self, key, default=None):
+        result = super().setdefault(key, default)
+        self._invalidate()
+        return result
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def reset(self, cookies_str: str):
+        """用完整的Cookie字符串替换全部内容"""
+        super().clear()
+        if cookies_str:
+            super().update(trans_cookies(cookies_str))
+        self._cookies_str = cookies_str or None
+        self._token = None
+
+    def to_string(self) -> str:
+        if self._cookies_str is None:
+            self._cookies_str = '; '.join(f"{k}={v}" for k, v in self.items())
+        return self._cookies_str
+
+    @property
+    def token(self) -> str:
+        """_m_h5_tk 中用于签名的token部分"""
+        if self._token is None:
+            self._token = self.get('_m_h5_tk', '').split('_')[0]
+        return self._token
+
+    def merge_set_cookie(self, headers) -> Dict[str, str]:
+        """合并响应中的 Set-Cookie，返回值有变化的Cookie"""
+        changed = {}
+        for cookie in headers.getall('set-cookie', []):
+            if '=' not in cookie:
+                continue
+            name, value = cookie.split(';')[0].split('=', 1)
+            name, value = name.strip(), value.strip()
+            if self.get(name) != value:
+                changed[name] = value
+        if changed:
+            self.update(changed)
+        return changed
+
+
+class TokenBucket:
+    """令牌桶限流器（单事件循环内使用）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class MtopClient:
+    """单个账号的mtop接口客户端"""
+
+    def __init__(self, cookie_id: str, cookies_str: str,
+                 on_cookies_updated: Optional[Callable[[], Awaitable[None]]] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        from config import config
+
+        client_config = config.get('MTOP_CLIENT', {}) or {}
+        self.cookie_id = cookie_id
+        self.jar = CookieJar(cookies_str)
+        self.on_cookies_updated = on_cookies_updated
+        self.headers = dict(headers or {})
+        self.headers.pop('cookie', None)
+        self.max_retries = int(client_config.get('max_retries', 3))
+        self.backoff_base = float(client_config.get('backoff_base', 0.5))
+        self.backoff_max = float(client_config.get('backoff_max', 30))
+        self.pool_size = int(client_config.get('pool_size', 4))
+        self.request_timeout = float(client_config.get('timeout', 30))
+        self.limiter = TokenBucket(float(client_config.get('rate', 2)), float(client_config.get('burst', 5)))
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.stats = {'calls': 0, 'requests': 0, 'retries': 0, 'throttle_wait': 0.0,
+                      **{kind: 0 for kind in (RET_SUCCESS, RET_TOKEN_EXPIRED, RET_THROTTLED, RET_CAPTCHA,
+                                              RET_TRANSIENT, RET_AUTH, RET_FAILED)}}
+
+    @property
+    def cookies_str(self) -> str:
+        return self.jar.to_string()
+
+    @property
+    def token(self) -> str:
+        return self.jar.token
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_size, ttl_dns_cache=300,
+                                             keepalive_timeout=60)
+            # Cookie由CookieJar统一维护，禁用aiohttp自带的cookie存储
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+        return self.session
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    async def call(self, api: str, data: Union[str, dict], version: str = '1.0',
+                   params: Optional[dict] = None, headers: Optional[dict] = None,
+                   url: Optional[str] = None, max_retries: Optional[int] = None, idempotent: bool = True,
+                   **request_kwargs) -> dict:
+        """调用mtop接口，自动签名、合并Set-Cookie并按返回码分类重试
+
+        Args:
+            api: 接口名，如 mtop.taobao.idle.pc.detail
+            data: 业务参数，dict会被序列化为紧凑JSON后参与签名
+            version: 接口版本
+            params: 额外的URL参数（覆盖默认值）
+            headers: 额外的请求头
+            url: 自定义接口地址，默认按 api/version 拼接
+            max_retries: 最大重试次数，默认取配置
+            idempotent: 接口是否可重复调用；为False时请求发出后超时、断开或服务端临时错误都不重试
+                        （服务端可能已执行），只重试连接失败、token过期和限流（请求未被执行）
+            **request_kwargs: 透传给 aiohttp 的参数（如 ssl）
+
+        Returns:
+            dict: 最后一次的响应JSON（调用方可用 classify_mtop_response 判断结果）
+
+        Raises:
+            网络异常在重试用尽后抛出
+        """
+        data_val = data if isinstance(data, str) else json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+        url = url or f"{MTOP_BASE_URL}/{api}/{version}/"
+        retries = self.max_retries if max_retries is None else max_retries
+        self.stats['calls'] += 1
+
+        attempt = 0
+        while True:
+            self.stats['throttle_wait'] += await self.limiter.acquire()
+
+            request_params = {**MTOP_BASE_PARAMS, 'v': version, 'api': api, **(params or {})}
+            request_params['t'] = str(int(time.time() * 1000))
+            request_params['sign'] = generate_sign(request_params['t'], self.token, data_val)
+            request_headers = {**(headers or {}), 'cookie': self.cookies_str}
+
+            self.stats['requests'] += 1
+            try:
+                async with self._get_session().post(url, params=request_params, data={'data': data_val},
+                                                    headers=request_headers, **request_kwargs) as response:
+                    changed = self.jar.merge_set_cookie(response.headers)
+                    res_json = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                self.stats[RET_TRANSIENT] += 1
+                if attempt >= retries or (not idempotent and not isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"【{self.cookie_id}】mtop请求异常({api})，{delay:.1f}秒后重试: {e}")
+                attempt += 1
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+                continue
+
+            if changed:
+                logger.debug(f"【{self.cookie_id}】mtop响应更新Cookie: {list(changed)}")
+                if self.on_cookies_updated:
+                    await self.on_cookies_updated()
+
+            kind = classify_mtop_response(res_json)
+            self.stats[kind] += 1
+            terminal = (RET_SUCCESS, RET_CAPTCHA, RET_AUTH, RET_FAILED) + (() if idempotent else (RET_TRANSIENT,))
+            if kind in terminal or attempt >= retries:
+                if kind != RET_SUCCESS:
+                    logger.warning(f"【{self.cookie_id}】mtop调用失败({api}, {kind}): {res_json.get('ret') if isinstance(res_json, dict) else res_json}")
+                return res_json
+
+            # token过期时响应已带回新的 _m_h5_tk，短暂等待后重签即可；其余情况指数退避
+            delay = 0.2 if kind == RET_TOKEN_EXPIRED else self._backoff(attempt)
+            logger.info(f"【{self.cookie_id}】mtop调用需重试({api}, {kind})，{delay:.1f}秒后第{attempt + 1}次重试")
+            attempt += 1
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -12,8 +12,6 @@ import re
 from random import random
 from typing import Optional, Dict, Any
 import httpx
-import qrcode
-import qrcode.constants
 from loguru import logger
 import hashlib
 
@@ -240,7 +238,9 @@ class QRLoginManager:
                     qr_content = results["content"]["data"]["codeContent"]
                     session.qr_content = qr_content
 
-                    # 生成二维码图片（base64格式）
+                    # 生成二维码图片（base64格式），qrcode会加载Pillow，按需导入
+                    import qrcode
+                    import qrcode.constants
                     qr = qrcode.QRCode(
                         version=5,
                         error_correction=qrcode.constants.ERROR_CORRECT_L,
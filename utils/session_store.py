@@ -0,0 +1,173 @@
+"""
+会话存储 - 为Web接口提供可插拔的会话/临时状态存储
+
+登录token、扫码登录处理状态等数据不再保存在 reply_server 的模块级字典中，
+而是写入共享存储，使多个uvicorn worker可以共享会话，服务重启后也不会让所有人掉线。
+
+支持的后端：
+    sqlite: 默认，使用数据库中的 session_store 表（按过期时间建索引）
+    redis:  可选，使用本地Redis兼容服务（需要安装 redis 包）
+
+所有方法都是同步阻塞的（SQLite后端需要数据库锁），在事件循环中应通过 db_executor.run 调用。
+"""
+
+import os
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+from loguru import logger
+
+
+class SessionStore(ABC):
+    """会话存储基类，所有值按 (namespace, key) 存取并带过期时间"""
+
+    backend = 'base'
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """获取未过期的值，不存在返回None"""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        """写入值（覆盖）"""
+
+    @abstractmethod
+    def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        """仅当键不存在时写入，返回是否写入成功（跨进程互斥）"""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> bool:
+        """删除值"""
+
+    def cleanup(self) -> int:
+        """清理过期数据，返回清理条数"""
+        return 0
+
+
+class SQLiteSessionStore(SessionStore):
+    """基于SQLite session_store 表的会话存储"""
+
+    backend = 'sqlite'
+
+    def __init__(self, cleanup_interval: int = 600):
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+
+    @property
+    def _db(self):
+        from db_manager import db_manager
+        return db_manager
+
+    def _maybe_cleanup(self):
+        """按间隔顺带清理过期记录，避免表无限增长"""
+        now = time.time()
+        if now - self._last_cleanup >= self.cleanup_interval:
+            self._last_cleanup = now
+            self.cleanup()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        return self._db.get_session_value(namespace, key)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        self._maybe_cleanup()
+        return self._db.set_session_value(namespace, key, value, ttl)
+
+    def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        self._maybe_cleanup()
+        return self._db.add_session_value(namespace, key, value, ttl)
+
+    def delete(self, namespace: str, key: str) -> bool:
+        return self._db.delete_session_value(namespace, key)
+
+    def cleanup(self) -> int:
+        deleted = self._db.cleanup_expired_session_values()
+        if deleted:
+            logger.debug(f"清理过期会话记录: {deleted} 条")
+        return deleted
+
+
+class RedisSessionStore(SessionStore):
+    """基于Redis兼容服务的会话存储，过期由服务端TTL处理"""
+
+    backend = 'redis'
+
+    def __init__(self, url: str, key_prefix: str = 'xianyu:session:'):
+        import redis  # 可选依赖，仅在启用redis后端时导入
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.key_prefix = key_prefix
+        # 启动时探测一次，连接失败由调用方回退到SQLite
+        self.client.ping()
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.key_prefix}{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            raw = self.client.get(self._key(namespace, key))
+            return json.loads(raw) if raw is not None else None
+        except Exception as e:
+            logger.error(f"获取会话值失败: {namespace}/{key}, {e}")
+            return None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        try:
+            self.client.set(self._key(namespace, key), json.dumps(value, ensure_ascii=False),
+                            px=max(1, int(ttl * 1000)))
+            return True
+        except Exception as e:
+            logger.error(f"写入会话值失败: {namespace}/{key}, {e}")
+            return False
+
+    def add(self, namespace: str, key: str, value: Any, ttl: float) -> bool:
+        try:
+            return bool(self.client.set(self._key(namespace, key), json.dumps(value, ensure_ascii=False),
+                                        px=max(1, int(ttl * 1000)), nx=True))
+        except Exception as e:
+            logger.error(f"写入会话值失败: {namespace}/{key}, {e}")
+            return False
+
+    def delete(self, namespace: str, key: str) -> bool:
+        try:
+            return self.client.delete(self._key(namespace, key)) > 0
+        except Exception as e:
+            logger.error(f"删除会话值失败: {namespace}/{key}, {e}")
+            return False
+
+
+def create_session_store() -> SessionStore:
+    """根据配置创建会话存储
+
+    配置项 SESSION_STORE（global_config.yml），可被环境变量覆盖：
+        backend:   SESSION_STORE_BACKEND    sqlite / redis
+        redis_url: SESSION_STORE_REDIS_URL  默认 redis://127.0.0.1:6379/0
+        redis_fallback:                     Redis不可用时是否回退到SQLite，为false时启动失败
+
+    Raises:
+        RuntimeError: 配置了redis后端但连接失败，且 redis_fallback 为false
+    """
+    from config import config
+
+    store_config = config.get('SESSION_STORE', {}) or {}
+    backend = os.getenv('SESSION_STORE_BACKEND', store_config.get('backend', 'sqlite')).lower()
+
+    if backend == 'redis':
+        redis_url = os.getenv('SESSION_STORE_REDIS_URL', store_config.get('redis_url', 'redis://127.0.0.1:6379/0'))
+        key_prefix = store_config.get('key_prefix', 'xianyu:session:')
+        try:
+            store = RedisSessionStore(redis_url, key_prefix)
+            logger.info(f"会话存储使用Redis后端: {redis_url}")
+            return store
+        except Exception as e:
+            if not store_config.get('redis_fallback', True):
+                raise RuntimeError(f"Redis会话存储不可用: {redis_url}, {e}") from e
+            # 回退后各worker不再共享会话，登录状态只在本进程的数据库中有效
+            logger.error(f"Redis会话存储不可用，回退到SQLite（多个worker之间不共享会话）: {redis_url}, {e}")
+
+    logger.info("会话存储使用SQLite后端")
+    return SQLiteSessionStore(cleanup_interval=int(store_config.get('cleanup_interval', 600)))
+
+
+# 全局会话存储实例
+session_store = create_session_store()
@@ -0,0 +1,144 @@
+"""
+同步位置 - 记录每个账号已处理到的同步位置(pts)，断线重连后从该位置继续同步
+
+- 推送帧中的每条同步数据带有 pts（微秒），消息并发处理、完成顺序不定，
+  同步位置取仍在处理中的最小 pts 之前（低水位），保证位置之前的消息都已处理完
+- 重连时以保存的位置发送 ackDiff，服务端补发断线期间的消息（hasMore 分批下发，
+  每批处理完再确认下一批）；补发窗口最长 max_backfill_seconds，避免长时间断线后回复过时的消息
+- 补发与实时推送可能重叠，已处理的消息ID记录在有界的滑动窗口中去重
+- 补发进行中时实时推送照常处理，但同步位置最多推进到已处理完的 hasMore 批次（补发高水位），
+  避免重启后漏掉尚未下发的补发消息；收到比已处理消息更早的 hasMore=0 包（最后一批），
+  或 backfill_idle_timeout 秒内没有新的补发批次时补发结束
+- 补发期间按补发开始时的位置（而不是同步位置）跳过已处理的消息，其余重复由去重窗口识别
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class SlidingWindowDedupe:
+    """最近 capacity 个消息ID的去重窗口，只保存ID的哈希值，按插入顺序淘汰"""
+
+    def __init__(self, capacity: int = 5000):
+        self.capacity = max(1, int(capacity))
+        self._seen: 'OrderedDict[int, None]' = OrderedDict()
+        self.duplicates = 0
+
+    def first_seen(self, key: Hashable) -> bool:
+        """首次出现返回True并记录，窗口内已出现过返回False"""
+        digest = hash(key)
+        if digest in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen[digest] = None
+        if len(self._seen) > self.capacity:
+            self._seen.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class SyncCursor:
+    """单个账号的同步位置（仅在事件循环线程中使用）"""
+
+    def __init__(self, pts: int = 0, max_backfill_seconds: float = 3600, backfill_idle_timeout: float = 5):
+        self.pts = int(pts or 0)
+        self.max_backfill_seconds = max_backfill_seconds
+        self.backfill_idle_timeout = backfill_idle_timeout
+        self._inflight: Dict[int, int] = {}  # {pts: 处理中的条数}
+        self._completed_max = self.pts
+        self._backfill_high: Optional[int] = None  # 补发进行中时为已处理完的补发位置，否则为None
+        self._backfill_floor: Optional[int] = None  # 补发开始时的位置
+        self._backfill_seen = 0  # 补发开始后收到的最大 pts
+        self._backfill_deadline = 0.0
+        self.saved_pts = self.pts  # 最近一次写入数据库的位置
+        self.saved_at = 0.0
+
+    def begin(self, pts: Optional[int]):
+        """开始处理一条同步数据"""
+        if pts:
+            self._inflight[pts] = self._inflight.get(pts, 0) + 1
+
+    def complete(self, pts: Optional[int]):
+        """一条同步数据处理完成，推进同步位置"""
+        if not pts:
+            return
+        remaining = self._inflight.get(pts, 0) - 1
+        if remaining > 0:
+            self._inflight[pts] = remaining
+        else:
+            self._inflight.pop(pts, None)
+        if pts > self._completed_max:
+            self._completed_max = pts
+        self._advance()
+
+    def _advance(self):
+        if self._inflight:
+            # 仍有更早的消息在处理，位置只能推进到它之前
+            watermark = min(min(self._inflight) - 1, self._completed_max)
+        else:
+            watermark = self._completed_max
+        if self._backfill_high is not None:
+            if time.monotonic() < self._backfill_deadline:
+                # 补发未结束：不越过已处理完的补发批次
+                watermark = min(watermark, self._backfill_high)
+            else:
+                self._backfill_high = None
+        if watermark > self.pts:
+            self.pts = watermark
+
+    def start_backfill(self):
+        """重连注册时开始补发（ackDiff 的位置早于连接时间时调用）"""
+        if self._backfill_floor is None:
+            self._backfill_floor = self._backfill_seen = self.pts
+        if self._backfill_high is None:
+            self._backfill_high = self.pts
+        self._backfill_deadline = time.monotonic() + self.backfill_idle_timeout
+
+    def package_done(self, low_pts: int, high_pts: int, has_more: bool):
+        """一个同步包全部处理完成，low_pts/high_pts 为包内最小/最大的 pts"""
+        if has_more:
+            self.start_backfill()
+            self._backfill_high = max(self._backfill_high, high_pts)
+        elif self._backfill_high is not None and low_pts <= self._backfill_seen:
+            # 比已收到的消息更早的 hasMore=0 包只能是补发的最后一批，补发结束
+            self._backfill_high = None
+            self._backfill_deadline = time.monotonic() + self.backfill_idle_timeout
+        if self._backfill_floor is not None:
+            self._backfill_seen = max(self._backfill_seen, high_pts)
+        self._advance()
+
+    def expire_backfill(self) -> bool:
+        """补发超时结束时推进同步位置，位置有变化返回True（定期调用）"""
+        if self._backfill_floor is None or time.monotonic() < self._backfill_deadline:
+            return False
+        self._backfill_floor = None
+        pts = self.pts
+        self._advance()
+        return self.pts != pts
+
+    @property
+    def skip_pts(self) -> int:
+        """不大于该值的消息已处理过；补发期间（及结束后 backfill_idle_timeout 秒内）取补发开始时的位置，
+        同步位置越过的补发消息可能尚未下发，由去重窗口识别重复"""
+        if self._backfill_floor is not None and time.monotonic() < self._backfill_deadline:
+            return self._backfill_floor
+        return self.pts
+
+    def resume_pts(self, now_pts: Optional[int] = None) -> int:
+        """重连时 ackDiff 使用的 pts：从保存的位置继续，最多回溯 max_backfill_seconds"""
+        if now_pts is None:
+            now_pts = int(time.time() * 1000000)
+        if not self.pts:
+            return now_pts
+        return min(now_pts, max(self.pts, now_pts - int(self.max_backfill_seconds * 1000000)))
+
+    def should_save(self, min_interval: float) -> bool:
+        """位置有推进且距上次保存超过 min_interval 秒"""
+        return self.pts != self.saved_pts and time.monotonic() - self.saved_at >= min_interval
+
+    def mark_saved(self, pts: int):
+        self.saved_pts = pts
+        self.saved_at = time.monotonic()
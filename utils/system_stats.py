@@ -0,0 +1,69 @@
+"""
+系统状态采样 - 后台线程定期采样 CPU/内存，健康检查直接返回最近一次的快照
+
+psutil.cpu_percent(interval=1) 会阻塞调用方 1 秒，放在健康检查里每次探测都会卡住 Web 服务；
+这里改为 interval=None（返回距上次调用的平均值，不阻塞），由采样线程每 interval 秒调用一次。
+"""
+
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+
+class SystemStatsSampler:
+    """CPU/内存后台采样器"""
+
+    def __init__(self, interval: float = 5):
+        self.interval = max(0.5, float(interval))
+        self._snapshot: dict = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """启动采样线程（已启动时直接返回）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='system-stats', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> dict:
+        """最近一次采样结果（不阻塞；采样线程未启动时先启动）"""
+        if self._thread is None:
+            self.start()
+        return dict(self._snapshot)
+
+    def sample(self):
+        import psutil
+        memory_info = psutil.virtual_memory()
+        self._snapshot = {
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory_info.percent,
+            "memory_available": memory_info.available,
+            "sampled_at": time.time(),
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"采样系统状态失败: {e}")
+            self._stop.wait(self.interval)
+
+
+def create_system_stats_sampler() -> SystemStatsSampler:
+    """按 global_config.yml 的 HEALTH 配置创建采样器"""
+    from config import config
+    return SystemStatsSampler(interval=(config.get('HEALTH', {}) or {}).get('stats_interval', 5))
+
+
+# 全局采样器实例
+system_stats = create_system_stats_sampler()
@@ -0,0 +1,145 @@
+"""
+写后队列 - 把消息/订单处理路径上的非关键写入合并成定期的单个事务
+
+- 每条写入原本各自获取全局数据库锁并 commit（每次 commit 一次 fsync），订单高峰时
+  这些 fsync 串行占用数据库锁，其他读写都在排队；改为先放入内存队列，
+  由后台线程每 flush_interval 秒（或积压达到 batch_size 条时）在一个事务里写入
+- 队列有上限：积压达到 max_pending 条时由写入方同步刷新，不会无限占用内存
+- 同进程读己之写：读取有待写入数据的表之前先调用 flush_table(table)
+- 进程退出时（atexit）刷新剩余写入；每条写入一个保存点，出错的写入单独回滚丢弃
+"""
+
+import atexit
+import threading
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+
+class WriteBehindQueue:
+    """按提交顺序批量执行的 SQL 写入队列"""
+
+    def __init__(self, db, flush_interval: float = 0.2, batch_size: int = 200, max_pending: int = 10000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max(self.batch_size, max_pending)
+        self._pending: List[Tuple[str, str, tuple]] = []  # [(表名, SQL, 参数)]
+        self._pending_tables = set()
+        self._queue_lock = threading.Lock()
+        # 同一时刻只有一个线程在刷新，保证写入按提交顺序落库
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.written = 0
+        atexit.register(self.close)
+
+    def submit(self, table: str, sql: str, params: tuple = ()):
+        """加入一条写入，稍后在批量事务中执行"""
+        if self._closed:
+            self._execute_batch([(table, sql, params)])
+            return
+        with self._queue_lock:
+            self._pending.append((table, sql, params))
+            self._pending_tables.add(table)
+            pending = len(self._pending)
+        if self._thread is None:
+            self._start()
+        if pending >= self.max_pending:
+            # 积压达到上限，由写入方同步刷新（反压）
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def has_pending(self, table: str) -> bool:
+        return table in self._pending_tables
+
+    def flush_table(self, table: str):
+        """读取 table 之前调用：有待写入的数据时先刷新，正在刷新时等待其完成"""
+        if table in self._pending_tables or self._flush_lock.locked():
+            self.flush()
+
+    def flush(self) -> int:
+        """立即写入全部待写入数据，返回写入条数（调用方不能持有数据库锁）
+
+        每个事务最多 batch_size 条，事务之间释放数据库锁，积压较多时其他读写不必等全部写完
+        """
+        total = 0
+        with self._flush_lock:
+            while True:
+                with self._queue_lock:
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:self.batch_size]
+                    if not self._pending:
+                        self._pending_tables = set()
+                if not batch:
+                    return total
+                self._execute_batch(batch)
+                total += len(batch)
+
+    def close(self):
+        """停止后台线程并写入剩余数据"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    def _start(self):
+        with self._queue_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"批量写入数据库失败: {e}")
+
+    def _execute_batch(self, batch: List[Tuple[str, str, tuple]]):
+        """在一个事务中执行整批写入；每条写入一个保存点，出错的那条回滚丢弃，不影响其他写入"""
+        db = self.db
+        with db.lock:
+            if not db.conn:
+                db.init_db()
+            cursor = db.conn.cursor()
+            try:
+                if not db.conn.in_transaction:
+                    cursor.execute('BEGIN')
+                written = 0
+                for table, sql, params in batch:
+                    cursor.execute('SAVEPOINT write_behind')
+                    try:
+                        cursor.execute(sql, params)
+                        written += 1
+                    except Exception as e:
+                        logger.error(f"写入 {table} 失败，已丢弃: {e}")
+                        cursor.execute('ROLLBACK TO write_behind')
+                    cursor.execute('RELEASE write_behind')
+                db.conn.commit()
+                self.flushes += 1
+                self.written += written
+            except Exception as e:
+                logger.error(f"批量写入 {len(batch)} 条失败: {e}")
+                db.conn.rollback()
+
+
+def create_write_behind_queue(db) -> Optional[WriteBehindQueue]:
+    """按 global_config.yml 的 WRITE_BEHIND 配置创建写后队列，未启用时返回None"""
+    from config import config
+    write_config = config.get('WRITE_BEHIND', {}) or {}
+    if not write_config.get('enabled', True):
+        return None
+    return WriteBehindQueue(
+        db,
+        flush_interval=write_config.get('flush_interval', 0.2),
+        batch_size=write_config.get('batch_size', 200),
+        max_pending=write_config.get('max_pending', 10000),
+    )